@@ -11,7 +11,7 @@ from datetime import datetime
 
 # revision identifiers, used by Alembic.
 revision = 'add_user_notification_prefs'
-down_revision = '20251211_171422_initial_migration_create_all_tables'
+down_revision = '30f42b022536'
 branch_labels = None
 depends_on = None
 
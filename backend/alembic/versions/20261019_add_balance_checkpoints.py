@@ -0,0 +1,37 @@
+"""Add balance_checkpoints table and date indexes on expenses
+
+Revision ID: add_balance_checkpoints
+Revises: add_user_notification_prefs
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_balance_checkpoints'
+down_revision = 'add_user_notification_prefs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'balance_checkpoints',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.DateTime(), nullable=False),
+        sa.Column('balances', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'month')
+    )
+
+    # Date-ordered lookups for point-in-time balance aggregates
+    op.create_index('idx_expense_group_date', 'expenses', ['group_id', 'expense_date'], unique=False)
+    op.create_index('idx_expense_paid_by_date', 'expenses', ['paid_by', 'expense_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_expense_paid_by_date', table_name='expenses')
+    op.drop_index('idx_expense_group_date', table_name='expenses')
+    op.drop_table('balance_checkpoints')
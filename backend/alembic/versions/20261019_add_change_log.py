@@ -0,0 +1,37 @@
+"""Add change_log table for delta sync
+
+Revision ID: add_change_log
+Revises: add_version_counters
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_change_log'
+down_revision = 'add_version_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'change_log',
+        sa.Column('seq', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('entity_type', sa.String(length=32), nullable=False),
+        sa.Column('entity_id', sa.String(length=64), nullable=False),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('seq')
+    )
+    op.create_index('idx_change_log_user_seq', 'change_log', ['user_id', 'seq'], unique=False)
+    op.create_index('idx_change_log_group_seq', 'change_log', ['group_id', 'seq'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_change_log_group_seq', table_name='change_log')
+    op.drop_index('idx_change_log_user_seq', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,36 @@
+"""Add the outbox table for background emails and push notifications
+
+Revision ID: add_outbox
+Revises: add_session_metadata
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_outbox'
+down_revision = 'add_session_metadata'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'outbox',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=10), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('available_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_outbox_status_available', 'outbox', ['status', 'available_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_outbox_status_available', table_name='outbox')
+    op.drop_table('outbox')
@@ -0,0 +1,27 @@
+"""Add coalesce_key to the outbox for debounced notifications
+
+Revision ID: add_outbox_coalesce_key
+Revises: multi_device_push
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_outbox_coalesce_key'
+down_revision = 'multi_device_push'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('outbox') as batch_op:
+        batch_op.add_column(sa.Column('coalesce_key', sa.String(length=100), nullable=True))
+        batch_op.create_index('idx_outbox_coalesce_key', ['coalesce_key'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('outbox') as batch_op:
+        batch_op.drop_index('idx_outbox_coalesce_key')
+        batch_op.drop_column('coalesce_key')
@@ -0,0 +1,29 @@
+"""Add device details to sessions
+
+Revision ID: add_session_metadata
+Revises: align_cache_tables
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_session_metadata'
+down_revision = 'align_cache_tables'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.add_column(sa.Column('user_agent', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('last_active_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_column('last_active_at')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('user_agent')
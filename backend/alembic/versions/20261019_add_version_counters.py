@@ -0,0 +1,35 @@
+"""Add version counters to groups and users
+
+Revision ID: add_version_counters
+Revises: add_balance_checkpoints
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_version_counters'
+down_revision = 'add_balance_checkpoints'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('groups', sa.Column(
+        'version',
+        sa.BigInteger(),
+        nullable=False,
+        server_default='0'
+    ))
+    op.add_column('users', sa.Column(
+        'ledger_version',
+        sa.BigInteger(),
+        nullable=False,
+        server_default='0'
+    ))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'ledger_version')
+    op.drop_column('groups', 'version')
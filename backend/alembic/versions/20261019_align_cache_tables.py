@@ -0,0 +1,56 @@
+"""Align cached_currency_rates and cached_bank_data with the models
+
+The initial migration predates the cache columns the services use; databases
+built with create_all already have them, so only missing columns are added.
+
+Revision ID: align_cache_tables
+Revises: add_change_log
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'align_cache_tables'
+down_revision = 'add_change_log'
+branch_labels = None
+depends_on = None
+
+NOW = sa.text('CURRENT_TIMESTAMP')
+
+
+def _columns(table: str) -> set:
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    existing = _columns('cached_currency_rates')
+    with op.batch_alter_table('cached_currency_rates') as batch_op:
+        if 'cached_at' not in existing:
+            batch_op.add_column(sa.Column('cached_at', sa.DateTime(), nullable=False, server_default=NOW))
+        batch_op.alter_column('last_fetched', existing_type=sa.DateTime(), nullable=True)
+
+    existing = _columns('cached_bank_data')
+    with op.batch_alter_table('cached_bank_data') as batch_op:
+        if 'transaction_id' not in existing:
+            batch_op.add_column(sa.Column('transaction_id', sa.String(length=255), nullable=False, server_default=''))
+        if 'account_id' not in existing:
+            batch_op.add_column(sa.Column('account_id', sa.String(length=255), nullable=True))
+        if 'provider' not in existing:
+            batch_op.add_column(sa.Column('provider', sa.String(length=50), nullable=False, server_default=''))
+        if 'cached_at' not in existing:
+            batch_op.add_column(sa.Column('cached_at', sa.DateTime(), nullable=False, server_default=NOW))
+        batch_op.alter_column('obapi_provider_id', existing_type=sa.String(length=255), nullable=True)
+        batch_op.alter_column('last_fetched', existing_type=sa.DateTime(), nullable=True)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('cached_bank_data') as batch_op:
+        batch_op.drop_column('cached_at')
+        batch_op.drop_column('provider')
+        batch_op.drop_column('account_id')
+        batch_op.drop_column('transaction_id')
+
+    with op.batch_alter_table('cached_currency_rates') as batch_op:
+        batch_op.drop_column('cached_at')
@@ -0,0 +1,85 @@
+"""Allow several push subscriptions per user
+
+push_notifications was keyed by user_id, so a user could only get push
+notifications on the device they subscribed on last. Rows are now keyed by
+id and unique per endpoint (by its SHA-256).
+
+Revision ID: multi_device_push
+Revises: add_outbox
+Create Date: 2026-10-19
+
+"""
+import hashlib
+import json
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'multi_device_push'
+down_revision = 'add_outbox'
+branch_labels = None
+depends_on = None
+
+
+def _endpoint_hash(subscription: str):
+    try:
+        endpoint = json.loads(subscription).get('endpoint')
+    except (ValueError, AttributeError):
+        return None
+    return hashlib.sha256(endpoint.encode()).hexdigest() if endpoint else None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    existing = bind.execute(sa.text(
+        'SELECT p.user_id, p.subscription FROM push_notifications p JOIN users u ON u.id = p.user_id'
+    )).fetchall()
+
+    op.drop_table('push_notifications')
+    table = op.create_table(
+        'push_notifications',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('endpoint_hash', sa.String(length=64), nullable=False),
+        sa.Column('subscription', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('endpoint_hash')
+    )
+    op.create_index('idx_push_notifications_user_id', 'push_notifications', ['user_id'], unique=False)
+
+    # Subscriptions without an endpoint could never be sent to
+    now = datetime.utcnow()
+    rows, seen = [], set()
+    for user_id, subscription in existing:
+        endpoint_hash = _endpoint_hash(subscription)
+        if endpoint_hash and endpoint_hash not in seen:
+            seen.add(endpoint_hash)
+            rows.append({'user_id': user_id, 'endpoint_hash': endpoint_hash, 'subscription': subscription,
+                         'created_at': now, 'updated_at': now})
+    if rows:
+        op.bulk_insert(table, rows)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    # Keep each user's most recently registered device
+    latest = bind.execute(sa.text(
+        'SELECT user_id, subscription FROM push_notifications ORDER BY updated_at'
+    )).fetchall()
+
+    op.drop_index('idx_push_notifications_user_id', table_name='push_notifications')
+    op.drop_table('push_notifications')
+    table = op.create_table(
+        'push_notifications',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('subscription', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+    rows = {user_id: subscription for user_id, subscription in latest}
+    if rows:
+        op.bulk_insert(table, [{'user_id': u, 'subscription': s} for u, s in rows.items()])
@@ -1,20 +1,29 @@
 """
 API dependencies - authentication, database sessions, etc.
 """
-from fastapi import Depends, HTTPException, status
+import math
+
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import FrozenSet, Optional
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import USER_KEY, get_db
+from app.core.rate_limit import rate_limiter
 from app.core.security import decode_token
-from app.models.models import User
+from app.models.models import User, Expense, ExpenseParticipant
+from app.services.membership_service import get_group_ids
+from app.services.session_service import session_store
 
 # HTTP Bearer token security
 security = HTTPBearer()
+# Same, for endpoints that only use the token if there is one
+optional_security = HTTPBearer(auto_error=False)
 
 
 def get_current_user(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
@@ -26,6 +35,11 @@ def get_current_user(
         async def get_me(current_user: User = Depends(get_current_user)):
             return current_user
     """
+    # Sub-requests of POST /batch reuse the user authenticated by the batch request
+    batch_user = getattr(request.state, "batch_user", None)
+    if batch_user is not None:
+        return batch_user
+
     token = credentials.credentials
     payload = decode_token(token)
 
@@ -53,6 +67,15 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Tokens issued with a server-side session are only good while it lasts
+    sid = payload.get("sid")
+    if sid is not None and settings.SESSIONS_ENABLED and not session_store.validate(sid, int(user_id), db):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session expired",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
     user = db.query(User).filter(User.id == int(user_id)).first()
 
     if user is None:
@@ -62,10 +85,13 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Writes in this session pin the user's reads to the primary (see get_read_db)
+    db.info[USER_KEY] = user.id
     return user
 
 
 def get_current_user_optional(
+    request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     db: Session = Depends(get_db)
 ) -> Optional[User]:
@@ -76,7 +102,91 @@ def get_current_user_optional(
         return None
 
     try:
-        return get_current_user(credentials, db)
+        return get_current_user(request, credentials, db)
     except HTTPException:
         return None
 
+
+class Authorization:
+    """
+    Access checks for the current user, backed by the cached group memberships
+
+    Usage:
+        @router.get("/{group_id}/totals")
+        async def get_totals(group_id: int, authz: Authorization = Depends(get_authorization)):
+            authz.require_group_member(group_id)
+    """
+
+    def __init__(self, db: Session, user: User):
+        self.db = db
+        self.user = user
+
+    @property
+    def group_ids(self) -> FrozenSet[int]:
+        return get_group_ids(self.db, self.user.id)
+
+    def can_view_group(self, group_id: int) -> bool:
+        return group_id in self.group_ids
+
+    def can_view_expense(self, expense: Expense) -> bool:
+        """Group members, the payer and participants can see an expense"""
+        if expense.paid_by == self.user.id:
+            return True
+        if expense.group_id is not None and self.can_view_group(expense.group_id):
+            return True
+
+        return self.db.query(ExpenseParticipant.user_id).filter(
+            ExpenseParticipant.expense_id == expense.id,
+            ExpenseParticipant.user_id == self.user.id
+        ).first() is not None
+
+    def require_group_member(self, group_id: int) -> None:
+        if not self.can_view_group(group_id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not a member of this group"
+            )
+
+    def require_expense_access(self, expense: Expense) -> None:
+        if not self.can_view_expense(expense):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You don't have access to this expense"
+            )
+
+
+def get_authorization(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> Authorization:
+    """Dependency providing request-scoped access checks for the current user"""
+    return Authorization(db, current_user)
+
+
+def _enforce_rate_limit(name: str, client: str) -> None:
+    wait = rate_limiter.hit(name, client)
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+
+def rate_limit(name: str):
+    """
+    Dependency throttling a route class per client IP (limits in RATE_LIMITS)
+
+    Usage:
+        @router.post("/login", dependencies=[Depends(rate_limit("login"))])
+    """
+    def check(request: Request) -> None:
+        _enforce_rate_limit(name, f"ip:{request.client.host if request.client else 'unknown'}")
+    return check
+
+
+def user_rate_limit(name: str):
+    """Dependency throttling a route class per authenticated user"""
+    def check(current_user: User = Depends(get_current_user)) -> None:
+        _enforce_rate_limit(name, f"user:{current_user.id}")
+    return check
@@ -0,0 +1,93 @@
+"""
+ETag helpers for conditional GETs on versioned resources
+
+ETags are derived from Group.version / User.ledger_version (see version_service),
+so checking If-None-Match costs one small lookup instead of the list queries.
+"""
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+from sqlalchemy import and_
+
+from app.models.models import Group, GroupUser, User
+
+# Clients must revalidate every time, but may reuse the body on 304
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Build a weak ETag from the parts that identify a representation"""
+    digest = hashlib.sha1(":".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match against an ETag using weak comparison"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+
+    if header.strip() == "*":
+        return True
+
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    return opaque(etag) in {opaque(tag) for tag in header.split(",")}
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response carrying the current ETag"""
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
+
+
+def set_etag(response: Response, etag: Optional[str]) -> None:
+    """Attach ETag and revalidation headers to a full response"""
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def get_group_etag(db: Session, group_id: int, user_id: int, *variant) -> Optional[str]:
+    """
+    Get the ETag of a group resource for a member in one query
+
+    Returns None if the group doesn't exist or the user isn't a member, so the
+    endpoint falls through to its normal 404/403 handling.
+
+    Args:
+        db: Database session
+        group_id: Group ID
+        user_id: Requesting user ID
+        variant: Endpoint name and query parameters that change the representation
+    """
+    row = db.query(Group.version, GroupUser.user_id).outerjoin(
+        GroupUser,
+        and_(
+            GroupUser.group_id == Group.id,
+            GroupUser.user_id == user_id
+        )
+    ).filter(Group.id == group_id).first()
+
+    if not row or row.user_id is None:
+        return None
+
+    return make_etag("group", group_id, row.version, *variant)
+
+
+def get_friend_ledger_etag(db: Session, user: User, friend_id: int, *variant) -> Optional[str]:
+    """
+    Get the ETag of the ledger between a user and a friend
+
+    The user's own ledger_version is already loaded, so only the friend's is read.
+    """
+    friend_version = db.query(User.ledger_version).filter(User.id == friend_id).scalar()
+    if friend_version is None:
+        return None
+
+    return make_etag("friend", user.id, user.ledger_version, friend_id, friend_version, *variant)
@@ -0,0 +1,26 @@
+"""
+Sparse fieldsets for list endpoints (`?fields=name,amount,expense_date`)
+"""
+from typing import Iterable, Optional, Set
+from fastapi import HTTPException, status
+
+
+def parse_fields(value: Optional[str], allowed: Iterable[str]) -> Optional[Set[str]]:
+    """
+    Parse a comma-separated `fields` query parameter
+
+    Returns None when the parameter is absent (all fields). Raises 400 for
+    unknown field names so typos don't silently return empty objects.
+    """
+    if value is None or not value.strip():
+        return None
+
+    fields = {f.strip() for f in value.split(",") if f.strip()}
+    unknown = fields - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+
+    return fields
@@ -2,42 +2,56 @@
 Authentication router - handles login, registration, OAuth, magic links
 Replaces NextAuth.js functionality
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from authlib.integrations.starlette_client import OAuth
-from datetime import timedelta
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import List, Optional
 
 from app.core.database import get_db
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, optional_security, rate_limit
 from app.core.security import (
-    verify_password, get_password_hash, create_access_token,
-    create_refresh_token, create_magic_link_token, verify_magic_link_token
+    verify_password_async, get_password_hash_async, password_needs_rehash, create_access_token,
+    create_refresh_token, create_magic_link_token, verify_magic_link_token, revoke_token, decode_token,
+    use_refresh_token
 )
 from app.core.config import settings
 from app.models.models import User, Account
 from app.schemas.user import (
     UserCreate, UserLogin, TokenResponse, UserResponse,
-    MagicLinkRequest, MagicLinkVerify
+    MagicLinkRequest, MagicLinkVerify, SessionResponse
 )
+from app.services.email_service import email_service
+from app.services.oidc_service import OIDCError, OIDCProvider, OIDCUnavailable, get_provider
+from app.services.outbox_service import queue_email
+from app.services.session_service import session_store
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-# OAuth configuration
-oauth = OAuth()
 
-if settings.GOOGLE_CLIENT_ID and settings.GOOGLE_CLIENT_SECRET:
-    oauth.register(
-        name='google',
-        client_id=settings.GOOGLE_CLIENT_ID,
-        client_secret=settings.GOOGLE_CLIENT_SECRET,
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_kwargs={'scope': 'openid email profile'}
-    )
+def _session_claims(user_id: int, http_request: Request) -> dict:
+    """Token claims for a new login, starting a server-side session if enabled"""
+    claims = {"sub": str(user_id)}
+    if settings.SESSIONS_ENABLED:
+        claims["sid"] = session_store.create(user_id, http_request.headers.get("user-agent"))
+    return claims
+
+
+def _current_sid(credentials: Optional[HTTPAuthorizationCredentials]) -> Optional[str]:
+    payload = decode_token(credentials.credentials) if credentials else None
+    return payload.get("sid") if payload else None
+
+
+def _require_sessions() -> None:
+    if not settings.SESSIONS_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Session management not enabled"
+        )
 
 
-@router.post("/register", response_model=TokenResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+@router.post("/register", response_model=TokenResponse, dependencies=[Depends(rate_limit("register"))])
+async def register(user_data: UserCreate, http_request: Request, db: Session = Depends(get_db)):
     """
     Register a new user with email and password
     """
@@ -50,7 +64,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
 
     # Create new user
-    hashed_password = get_password_hash(user_data.password) if user_data.password else None
+    hashed_password = await get_password_hash_async(user_data.password) if user_data.password else None
     user = User(
         email=user_data.email,
         name=user_data.name or user_data.email.split('@')[0],
@@ -75,8 +89,9 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         db.commit()
 
     # Create tokens
-    access_token = create_access_token({"sub": str(user.id)})
-    refresh_token = create_refresh_token({"sub": str(user.id)})
+    claims = _session_claims(user.id, http_request)
+    access_token = create_access_token(claims)
+    refresh_token = create_refresh_token(claims)
 
     return TokenResponse(
         access_token=access_token,
@@ -85,8 +100,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
 
-@router.post("/login", response_model=TokenResponse)
-async def login(login_data: UserLogin, db: Session = Depends(get_db)):
+@router.post("/login", response_model=TokenResponse, dependencies=[Depends(rate_limit("login"))])
+async def login(login_data: UserLogin, http_request: Request, db: Session = Depends(get_db)):
     """
     Login with email and password
     """
@@ -111,15 +126,21 @@ async def login(login_data: UserLogin, db: Session = Depends(get_db)):
         )
 
     # Verify password
-    if not verify_password(login_data.password, account.id_token):
+    if not await verify_password_async(login_data.password, account.id_token):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
 
+    # Upgrade hashes made with an older cost while we have the password
+    if password_needs_rehash(account.id_token):
+        account.id_token = await get_password_hash_async(login_data.password)
+        db.commit()
+
     # Create tokens
-    access_token = create_access_token({"sub": str(user.id)})
-    refresh_token = create_refresh_token({"sub": str(user.id)})
+    claims = _session_claims(user.id, http_request)
+    access_token = create_access_token(claims)
+    refresh_token = create_refresh_token(claims)
 
     return TokenResponse(
         access_token=access_token,
@@ -128,7 +149,7 @@ async def login(login_data: UserLogin, db: Session = Depends(get_db)):
     )
 
 
-@router.post("/magic-link", status_code=status.HTTP_200_OK)
+@router.post("/magic-link", status_code=status.HTTP_200_OK, dependencies=[Depends(rate_limit("magic_link"))])
 async def send_magic_link(request: MagicLinkRequest, db: Session = Depends(get_db)):
     """
     Send a magic link for passwordless login
@@ -143,24 +164,20 @@ async def send_magic_link(request: MagicLinkRequest, db: Session = Depends(get_d
             preferred_language="en",
         )
         db.add(user)
-        db.commit()
 
     # Create magic link token
     token = create_magic_link_token(request.email)
     link = f"{settings.CORS_ORIGINS[0]}/auth/verify?token={token}"
 
-    # TODO: Send email with link
-    # await send_email(
-    #     to=request.email,
-    #     subject="Login to SAHASplit",
-    #     body=f"Click here to login: {link}"
-    # )
+    # Sent in the background, so the response doesn't wait for SMTP
+    queue_email(db, **email_service.build_magic_link_email(request.email, link))
+    db.commit()
 
     return {"message": "Magic link sent to email"}
 
 
 @router.post("/magic-link/verify", response_model=TokenResponse)
-async def verify_magic_link(request: MagicLinkVerify, db: Session = Depends(get_db)):
+async def verify_magic_link(request: MagicLinkVerify, http_request: Request, db: Session = Depends(get_db)):
     """
     Verify magic link token and login user
     """
@@ -181,8 +198,9 @@ async def verify_magic_link(request: MagicLinkVerify, db: Session = Depends(get_
         )
 
     # Create tokens
-    access_token = create_access_token({"sub": str(user.id)})
-    refresh_token = create_refresh_token({"sub": str(user.id)})
+    claims = _session_claims(user.id, http_request)
+    access_token = create_access_token(claims)
+    refresh_token = create_refresh_token(claims)
 
     return TokenResponse(
         access_token=access_token,
@@ -230,6 +248,7 @@ async def google_login(redirect_uri: Optional[str] = Query(None)):
 
 @router.get("/google/callback", response_model=TokenResponse)
 async def google_callback(
+    http_request: Request,
     code: str = Query(..., description="Authorization code from Google"),
     db: Session = Depends(get_db)
 ):
@@ -238,140 +257,173 @@ async def google_callback(
 
     Replaces NextAuth Google provider callback
     """
-    if not settings.GOOGLE_CLIENT_ID or not settings.GOOGLE_CLIENT_SECRET:
+    return await _oidc_login("google", code, http_request, db)
+
+
+@router.get("/authentik")
+async def authentik_login(redirect_uri: Optional[str] = Query(None)):
+    """
+    Redirect to Authentik login
+    """
+    provider = _require_provider("authentik")
+
+    if not redirect_uri:
+        redirect_uri = f"{settings.CORS_ORIGINS[0]}/auth/callback/authentik"
+
+    try:
+        auth_url = await provider.authorization_url(redirect_uri)
+    except OIDCError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"OAuth error: {str(e)}"
+        )
+
+    return {
+        "auth_url": auth_url,
+        "redirect_uri": redirect_uri
+    }
+
+
+@router.get("/authentik/callback", response_model=TokenResponse)
+async def authentik_callback(
+    http_request: Request,
+    code: str = Query(..., description="Authorization code from Authentik"),
+    db: Session = Depends(get_db)
+):
+    """
+    Handle Authentik OAuth callback
+    """
+    return await _oidc_login("authentik", code, http_request, db)
+
+
+def _require_provider(name: str) -> OIDCProvider:
+    provider = get_provider(name)
+    if provider is None:
         raise HTTPException(
             status_code=status.HTTP_501_NOT_IMPLEMENTED,
-            detail="Google OAuth not configured"
+            detail=f"{name.capitalize()} OAuth not configured"
         )
+    return provider
 
-    import httpx
+
+async def _oidc_login(provider_name: str, code: str, http_request: Request, db: Session) -> TokenResponse:
+    """
+    Complete an OpenID Connect login and sign the user in
+
+    The user's details come from the verified ID token, so the only call to
+    the provider is the code exchange.
+    """
+    provider = _require_provider(provider_name)
 
     try:
-        # Exchange code for tokens
-        async with httpx.AsyncClient() as client:
-            token_response = await client.post(
-                "https://oauth2.googleapis.com/token",
-                data={
-                    'code': code,
-                    'client_id': settings.GOOGLE_CLIENT_ID,
-                    'client_secret': settings.GOOGLE_CLIENT_SECRET,
-                    'redirect_uri': f"{settings.CORS_ORIGINS[0]}/auth/callback/google",
-                    'grant_type': 'authorization_code'
-                }
-            )
-
-            if token_response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to exchange code for token"
-                )
-
-            tokens = token_response.json()
-            access_token = tokens.get('access_token')
-            id_token = tokens.get('id_token')
-
-            # Get user info from Google
-            userinfo_response = await client.get(
-                "https://www.googleapis.com/oauth2/v2/userinfo",
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-
-            if userinfo_response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Failed to get user info"
-                )
-
-            userinfo = userinfo_response.json()
-
-            # Extract user data
-            email = userinfo.get('email')
-            name = userinfo.get('name')
-            picture = userinfo.get('picture')
-            google_id = userinfo.get('id')
-
-            if not email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email not provided by Google"
-                )
-
-            # Find or create user
-            user = db.query(User).filter(User.email == email).first()
-
-            if not user:
-                # Create new user
-                user = User(
-                    email=email,
-                    name=name or email.split('@')[0],
-                    image=picture,
-                    currency="USD",
-                    preferred_language="en",
-                    email_verified=True  # Google verifies emails
-                )
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-            else:
-                # Update existing user info
-                if name and not user.name:
-                    user.name = name
-                if picture and not user.image:
-                    user.image = picture
-                if not user.email_verified:
-                    user.email_verified = True
-                db.commit()
-
-            # Create or update Google account record
-            account = db.query(Account).filter(
-                Account.user_id == user.id,
-                Account.provider == "google"
-            ).first()
-
-            if not account:
-                account = Account(
-                    id=f"google_{user.id}",
-                    user_id=user.id,
-                    type="oauth",
-                    provider="google",
-                    provider_account_id=google_id,
-                    access_token=access_token,
-                    id_token=id_token,
-                    scope="openid email profile"
-                )
-                db.add(account)
-            else:
-                account.access_token = access_token
-                account.id_token = id_token
-
-            db.commit()
-
-            # Create JWT tokens
-            jwt_access_token = create_access_token({"sub": str(user.id)})
-            jwt_refresh_token = create_refresh_token({"sub": str(user.id)})
-
-            return TokenResponse(
-                access_token=jwt_access_token,
-                refresh_token=jwt_refresh_token,
-                user=UserResponse.model_validate(user)
-            )
-
-    except httpx.HTTPError as e:
+        tokens = await provider.login(code, f"{settings.CORS_ORIGINS[0]}/auth/callback/{provider_name}")
+    except OIDCUnavailable as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=status.HTTP_502_BAD_GATEWAY,
             detail=f"OAuth error: {str(e)}"
         )
+    except OIDCError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    claims = tokens["claims"]
+    access_token = tokens.get("access_token")
+    id_token = tokens.get("id_token")
+
+    # Extract user data
+    email = claims.get("email")
+    name = claims.get("name")
+    picture = claims.get("picture")
+    subject = claims["sub"]
+
+    if not email:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Email not provided by {provider_name.capitalize()}"
+        )
+
+    # Accounts are matched by email, so it must be one the provider verified
+    if claims.get("email_verified") is not True:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Email not verified by {provider_name.capitalize()}"
+        )
+
+    # Find or create user
+    user = db.query(User).filter(User.email == email).first()
+
+    if not user:
+        # Create new user
+        user = User(
+            email=email,
+            name=name or email.split('@')[0],
+            image=picture,
+            currency="USD",
+            preferred_language="en",
+            email_verified=datetime.utcnow()
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    else:
+        # Update existing user info
+        if name and not user.name:
+            user.name = name
+        if picture and not user.image:
+            user.image = picture
+        if not user.email_verified:
+            user.email_verified = datetime.utcnow()
+        db.commit()
+
+    # Create or update the provider account record
+    account = db.query(Account).filter(
+        Account.user_id == user.id,
+        Account.provider == provider_name
+    ).first()
+
+    if not account:
+        account = Account(
+            id=f"{provider_name}_{user.id}",
+            user_id=user.id,
+            type="oauth",
+            provider=provider_name,
+            provider_account_id=subject,
+            access_token=access_token,
+            id_token=id_token,
+            scope=provider.scope
+        )
+        db.add(account)
+    else:
+        account.access_token = access_token
+        account.id_token = id_token
+
+    db.commit()
+
+    # Create JWT tokens
+    claims = _session_claims(user.id, http_request)
+    jwt_access_token = create_access_token(claims)
+    jwt_refresh_token = create_refresh_token(claims)
+
+    return TokenResponse(
+        access_token=jwt_access_token,
+        refresh_token=jwt_refresh_token,
+        user=UserResponse.model_validate(user)
+    )
 
 
 @router.post("/refresh", response_model=TokenResponse)
 async def refresh_token(
+    http_request: Request,
     refresh_token: str = Query(..., description="Refresh token"),
     db: Session = Depends(get_db)
 ):
     """
     Refresh access token using refresh token
 
-    Returns new access and refresh tokens
+    Returns new access and refresh tokens. The refresh token is rotated: it
+    can be used once.
     """
     from app.core.security import decode_token
 
@@ -401,33 +453,108 @@ async def refresh_token(
             detail="User not found"
         )
 
+    # Stay in the token's session; tokens from before sessions start one
+    sid = payload.get('sid')
+    if sid and settings.SESSIONS_ENABLED and not session_store.validate(sid, user.id, db):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session expired"
+        )
+    claims = {"sub": str(user.id), "sid": sid} if sid else _session_claims(user.id, http_request)
+
     # Create new tokens
-    new_access_token = create_access_token({"sub": str(user.id)})
-    new_refresh_token = create_refresh_token({"sub": str(user.id)})
+    issued = {
+        "access_token": create_access_token(claims),
+        "refresh_token": create_refresh_token(claims),
+    }
+
+    # Single use: concurrent refreshes with the same token (several tabs) all get
+    # the first one's tokens; reuse after the grace period is rejected
+    tokens = use_refresh_token(refresh_token, payload, issued)
+    if tokens is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token already used"
+        )
 
     return TokenResponse(
-        access_token=new_access_token,
-        refresh_token=new_refresh_token,
+        access_token=tokens["access_token"],
+        refresh_token=tokens["refresh_token"],
         user=UserResponse.model_validate(user)
     )
 
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
 async def logout(
+    refresh_token: Optional[str] = Query(None, description="Refresh token to revoke as well"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Logout user
 
-    In JWT-based auth, this is mainly for client-side cleanup.
-    Could implement token blacklisting here if needed.
+    Revokes the access token (and the refresh token, if given) until they
+    expire, and ends the session they belong to.
     """
-    # For now, just return success
-    # Client should delete tokens from storage
+    sid = _current_sid(credentials)
+    if sid and settings.SESSIONS_ENABLED:
+        session_store.revoke(sid, current_user.id, db)
 
-    # Optional: Implement token blacklisting
-    # blacklist_token(access_token, db)
+    if credentials:
+        revoke_token(credentials.credentials)
+    if refresh_token:
+        revoke_token(refresh_token)
 
     return None
 
+
+@router.get("/sessions", response_model=List[SessionResponse])
+async def list_sessions(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    List the user's active sessions (devices), most recently used first
+    """
+    _require_sessions()
+    current = _current_sid(credentials)
+    return [
+        SessionResponse(**session, current=session["id"] == current)
+        for session in session_store.list_sessions(current_user.id, db)
+    ]
+
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Log out one of the user's sessions
+    """
+    _require_sessions()
+    if not session_store.revoke(session_id, current_user.id, db):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Session not found"
+        )
+
+    return None
+
+
+@router.post("/sessions/revoke-others")
+async def revoke_other_sessions(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Log out every other device
+    """
+    _require_sessions()
+    revoked = session_store.revoke_all(current_user.id, db, except_sid=_current_sid(credentials))
+    return {"revoked": revoked}
+
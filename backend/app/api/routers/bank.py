@@ -18,6 +18,7 @@ from app.schemas.bank import (
 from app.services.plaid_service import plaid_service
 from app.services.gocardless_service import gocardless_service
 from app.core.config import settings
+from app.core.metrics import record_cache
 
 router = APIRouter(prefix="/bank", tags=["bank"])
 
@@ -217,6 +218,7 @@ async def get_transactions(
             CachedBankData.cached_at >= datetime.utcnow() - timedelta(hours=24)
         ).all()
 
+        record_cache("bank", bool(cached))
         if cached:
             import json
             return [
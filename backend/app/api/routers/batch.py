@@ -0,0 +1,124 @@
+"""
+Batch router - run several reads in one round trip
+"""
+import json
+import logging
+from urllib.parse import urlencode, urlsplit
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import get_db
+from app.api.deps import get_current_user
+from app.models.models import User
+from app.schemas.batch import BatchRequest, BatchResponse, BatchSubRequest, BatchSubResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+# Streams never finish and nested batches would multiply the work
+EXCLUDED_PATHS = ("/batch", "/sync/stream")
+
+# Response headers passed back per sub-request
+FORWARDED_HEADERS = ("etag", "cache-control")
+
+
+@router.post("", response_model=BatchResponse)
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Run several GET requests in-process and return all results
+
+    Sub-requests share this request's authenticated user and database session,
+    and run one after another, since a Session can't be used from concurrent
+    tasks or threads (some reads commit caches on it). Each result carries its
+    own status, so one failing read doesn't fail the batch. Paths are relative
+    to /api.
+    """
+    if len(batch.requests) > settings.BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.BATCH_MAX_REQUESTS} requests per batch"
+        )
+
+    state = {"batch_user": current_user, "batch_db": db}
+    responses = [await _dispatch(request, sub, state) for sub in batch.requests]
+    return BatchResponse(responses=responses)
+
+
+async def _dispatch(request: Request, sub: BatchSubRequest, state: dict) -> BatchSubResponse:
+    if sub.method.upper() != "GET":
+        return BatchSubResponse(id=sub.id, status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                                body={"detail": "Only GET requests can be batched"})
+
+    url = urlsplit(sub.path)
+    path = url.path
+    if not path.startswith("/") or url.netloc or path.rstrip("/").startswith(EXCLUDED_PATHS):
+        return BatchSubResponse(id=sub.id, status=status.HTTP_400_BAD_REQUEST,
+                                body={"detail": "Invalid batch path"})
+
+    params = {k: str(v).lower() if isinstance(v, bool) else v for k, v in sub.query.items()}
+    query_string = "&".join(part for part in (url.query, urlencode(params, doseq=True)) if part)
+
+    # The bearer header satisfies HTTPBearer; get_current_user then reuses state["batch_user"]
+    headers = [(k, v) for k, v in request.scope["headers"] if k in (b"authorization", b"accept-language")]
+    for name, value in sub.headers.items():
+        if name.lower() == "if-none-match":
+            headers.append((b"if-none-match", value.encode("latin-1")))
+
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": request.url.scheme,
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": f"/api{path}",
+        "raw_path": f"/api{path}".encode(),
+        "query_string": query_string.encode(),
+        "headers": headers,
+        "state": dict(state),
+    }
+
+    result = {"status": status.HTTP_500_INTERNAL_SERVER_ERROR, "headers": {}, "body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["headers"] = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in message["headers"]}
+        elif message["type"] == "http.response.body":
+            result["body"] += message.get("body", b"")
+
+    try:
+        await request.app(scope, receive, send)
+    except Exception:
+        # Don't fail the other reads
+        logger.exception(f"Batch sub-request GET {path} failed")
+        return BatchSubResponse(id=sub.id, status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                body={"detail": "Internal server error"})
+
+    return BatchSubResponse(
+        id=sub.id,
+        status=result["status"],
+        headers={k: v for k, v in result["headers"].items() if k in FORWARDED_HEADERS},
+        body=_decode_body(result["body"], result["headers"].get("content-type", ""))
+    )
+
+
+def _decode_body(body: bytes, content_type: str):
+    if not body:
+        return None
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    return body.decode("utf-8", errors="replace")
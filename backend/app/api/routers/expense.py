@@ -2,14 +2,18 @@
 Expense router - handles expense CRUD operations
 Replaces tRPC expenseRouter
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Request
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 from datetime import datetime
 from uuid import uuid4
 
-from app.core.database import get_db
-from app.api.deps import get_current_user
+from app.core.database import get_db, get_read_db
+from app.api.deps import get_current_user, get_authorization, Authorization
+from app.api.etag import (
+    get_group_etag, get_friend_ledger_etag, etag_matches, not_modified, set_etag
+)
 from app.models.models import User, Expense, ExpenseParticipant, ExpenseRecurrence
 from app.schemas.expense import (
     ExpenseCreate, ExpenseResponse, ExpenseDetailResponse,
@@ -19,11 +23,16 @@ from app.schemas.expense import (
 from app.services.split_service import (
     create_expense, delete_expense, edit_expense, get_user_balances
 )
+from app.api.fields import parse_fields
+from app.services.expense_list_service import list_expenses, EXPENSE_FIELDS, EXPENSE_COLUMN_FIELDS
 from app.services.currency_service import currency_service
 from app.services.storage_service import storage_service
+from app.services.sync_service import record_note_change, OP_DELETE
 
 router = APIRouter(prefix="/expenses", tags=["expenses"])
 
+FIELDS_DESCRIPTION = "Comma-separated fields to return, e.g. name,amount,expense_date,paid_by_name"
+
 
 # ============================================
 # SPECIFIC ROUTES FIRST (before /{expense_id})
@@ -32,7 +41,7 @@ router = APIRouter(prefix="/expenses", tags=["expenses"])
 @router.get("/balances/all", response_model=List[BalanceResponse])
 async def get_balances(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     currency: Optional[str] = Query(None, description="Filter by currency")
 ):
     """Get all balances for current user"""
@@ -150,124 +159,80 @@ async def add_currency_conversion(
 @router.get("/group/{group_id}/details", response_model=List[ExpenseDetailResponse])
 async def get_group_expense_details(
     group_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    include_deleted: bool = Query(False)
+    db: Session = Depends(get_read_db),
+    authz: Authorization = Depends(get_authorization),
+    include_deleted: bool = Query(False),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
 ):
-    """Get all expenses for a group with details"""
-    query = db.query(Expense).filter(Expense.group_id == group_id)
-
-    if not include_deleted:
-        query = query.filter(Expense.deleted_at.is_(None))
-
-    query = query.order_by(Expense.expense_date.desc())
-    expenses = query.all()
-
-    # Collect all user IDs we need
-    all_user_ids = set()
-    for expense in expenses:
-        all_user_ids.add(expense.paid_by)
-
-    # Get all participants
-    expense_ids = [e.id for e in expenses]
-    all_participants = db.query(ExpenseParticipant).filter(
-        ExpenseParticipant.expense_id.in_(expense_ids)
-    ).all() if expense_ids else []
+    """
+    Get all expenses for a group with details
 
-    for p in all_participants:
-        all_user_ids.add(p.user_id)
+    Supports If-None-Match: answers 304 when the group version is unchanged.
+    """
+    selected = parse_fields(fields, EXPENSE_FIELDS)
+    etag = get_group_etag(db, group_id, current_user.id, "expense-details", include_deleted, ",".join(sorted(selected or ())))
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
 
-    # Fetch all users at once
-    users = db.query(User).filter(User.id.in_(all_user_ids)).all() if all_user_ids else []
-    user_map = {u.id: u.name or u.email or f"User {u.id}" for u in users}
+    authz.require_group_member(group_id)
 
-    # Group participants by expense_id
-    participants_by_expense = {}
-    for p in all_participants:
-        if p.expense_id not in participants_by_expense:
-            participants_by_expense[p.expense_id] = []
-        participants_by_expense[p.expense_id].append(p)
-
-    result = []
-    for expense in expenses:
-        participants = participants_by_expense.get(expense.id, [])
-
-        response = ExpenseDetailResponse.model_validate(expense)
-        response.paid_by_name = user_map.get(expense.paid_by, "Unknown")
-        response.participants = [
-            ParticipantResponse(
-                user_id=p.user_id,
-                user_name=user_map.get(p.user_id, "Unknown"),
-                amount=p.amount
-            ) for p in participants
-        ]
-        result.append(response)
+    filters = [Expense.group_id == group_id]
+    if not include_deleted:
+        filters.append(Expense.deleted_at.is_(None))
 
+    result = ORJSONResponse(list_expenses(db, filters, fields=selected))
+    set_etag(result, etag)
     return result
 
 
 @router.get("/friend/{friend_id}", response_model=List[ExpenseDetailResponse])
 async def get_expenses_with_friend(
     friend_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    include_deleted: bool = Query(False)
+    db: Session = Depends(get_read_db),
+    include_deleted: bool = Query(False),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
 ):
-    """Get all expenses between current user and a specific friend"""
-    from sqlalchemy import and_, or_
-
-    query = db.query(Expense).join(ExpenseParticipant).filter(
-        and_(
-            Expense.id.in_(
-                db.query(ExpenseParticipant.expense_id).filter(
-                    ExpenseParticipant.user_id == current_user.id,
-                    ExpenseParticipant.amount != 0
-                )
-            ),
-            Expense.id.in_(
-                db.query(ExpenseParticipant.expense_id).filter(
-                    ExpenseParticipant.user_id == friend_id,
-                    ExpenseParticipant.amount != 0
-                )
-            ),
-            or_(
-                Expense.paid_by == current_user.id,
-                Expense.paid_by == friend_id
-            )
-        )
-    )
-
-    if not include_deleted:
-        query = query.filter(Expense.deleted_at.is_(None))
+    """
+    Get all expenses between current user and a specific friend
 
-    query = query.order_by(Expense.expense_date.desc())
-    expenses = query.all()
+    Supports If-None-Match: answers 304 when neither ledger version changed.
+    """
+    from sqlalchemy import or_
 
-    # Get user names for current user and friend
-    users = db.query(User).filter(User.id.in_([current_user.id, friend_id])).all()
-    user_map = {u.id: u.name or u.email or f"User {u.id}" for u in users}
+    selected = parse_fields(fields, EXPENSE_FIELDS)
+    etag = get_friend_ledger_etag(db, current_user, friend_id, "expenses", include_deleted, ",".join(sorted(selected or ())))
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
 
-    result = []
-    for expense in expenses:
-        participants = db.query(ExpenseParticipant).filter(
-            ExpenseParticipant.expense_id == expense.id,
-            or_(
+    filters = [
+        Expense.id.in_(
+            db.query(ExpenseParticipant.expense_id).filter(
                 ExpenseParticipant.user_id == current_user.id,
-                ExpenseParticipant.user_id == friend_id
+                ExpenseParticipant.amount != 0
+            )
+        ),
+        Expense.id.in_(
+            db.query(ExpenseParticipant.expense_id).filter(
+                ExpenseParticipant.user_id == friend_id,
+                ExpenseParticipant.amount != 0
             )
-        ).all()
-
-        response = ExpenseDetailResponse.model_validate(expense)
-        response.paid_by_name = user_map.get(expense.paid_by, "Unknown")
-        response.participants = [
-            ParticipantResponse(
-                user_id=p.user_id,
-                user_name=user_map.get(p.user_id, "Unknown"),
-                amount=p.amount
-            ) for p in participants
-        ]
-        result.append(response)
+        ),
+        or_(
+            Expense.paid_by == current_user.id,
+            Expense.paid_by == friend_id
+        )
+    ]
+    if not include_deleted:
+        filters.append(Expense.deleted_at.is_(None))
 
+    result = ORJSONResponse(list_expenses(
+        db, filters, participant_user_ids=[current_user.id, friend_id], fields=selected
+    ))
+    set_etag(result, etag)
     return result
 
 
@@ -278,24 +243,26 @@ async def get_expenses_with_friend(
 @router.get("", response_model=List[ExpenseResponse])
 async def get_all_expenses(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     group_id: Optional[int] = Query(None, description="Filter by group ID"),
-    include_deleted: bool = Query(False, description="Include deleted expenses")
+    include_deleted: bool = Query(False, description="Include deleted expenses"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)
 ):
     """Get all expenses for current user"""
-    query = db.query(Expense).join(ExpenseParticipant).filter(
-        ExpenseParticipant.user_id == current_user.id
-    )
+    selected = parse_fields(fields, EXPENSE_COLUMN_FIELDS)
+    filters = [
+        Expense.id.in_(
+            db.query(ExpenseParticipant.expense_id).filter(ExpenseParticipant.user_id == current_user.id)
+        )
+    ]
 
     if group_id:
-        query = query.filter(Expense.group_id == group_id)
+        filters.append(Expense.group_id == group_id)
 
     if not include_deleted:
-        query = query.filter(Expense.deleted_at.is_(None))
+        filters.append(Expense.deleted_at.is_(None))
 
-    query = query.order_by(Expense.expense_date.desc())
-    expenses = query.all()
-    return [ExpenseResponse.model_validate(e) for e in expenses]
+    return ORJSONResponse(list_expenses(db, filters, include_participants=False, fields=selected))
 
 
 @router.post("", response_model=ExpenseResponse)
@@ -313,7 +280,8 @@ async def add_expense(
 async def get_expense(
     expense_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    authz: Authorization = Depends(get_authorization)
 ):
     """Get expense details with participants"""
     expense = db.query(Expense).filter(Expense.id == expense_id).first()
@@ -324,6 +292,8 @@ async def get_expense(
             detail="Expense not found"
         )
 
+    authz.require_expense_access(expense)
+
     # Get payer name
     payer = db.query(User).filter(User.id == expense.paid_by).first()
 
@@ -381,7 +351,8 @@ async def remove_expense(
 async def get_expense_notes(
     expense_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    authz: Authorization = Depends(get_authorization)
 ):
     """
     Get all notes for an expense
@@ -396,17 +367,7 @@ async def get_expense_notes(
             detail="Expense not found"
         )
 
-    # Check user has access (is participant or payer)
-    participant = db.query(ExpenseParticipant).filter(
-        ExpenseParticipant.expense_id == expense_id,
-        ExpenseParticipant.user_id == current_user.id
-    ).first()
-
-    if not participant and expense.paid_by != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this expense"
-        )
+    authz.require_expense_access(expense)
 
     notes = db.query(ExpenseNote).filter(
         ExpenseNote.expense_id == expense_id
@@ -436,7 +397,8 @@ async def add_expense_note(
     expense_id: str,
     note: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    authz: Authorization = Depends(get_authorization)
 ):
     """
     Add a note to an expense
@@ -451,17 +413,7 @@ async def add_expense_note(
             detail="Expense not found"
         )
 
-    # Check user has access (is participant or payer)
-    participant = db.query(ExpenseParticipant).filter(
-        ExpenseParticipant.expense_id == expense_id,
-        ExpenseParticipant.user_id == current_user.id
-    ).first()
-
-    if not participant and expense.paid_by != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to this expense"
-        )
+    authz.require_expense_access(expense)
 
     # Validate note
     if not note or len(note.strip()) == 0:
@@ -485,6 +437,7 @@ async def add_expense_note(
     )
 
     db.add(new_note)
+    record_note_change(db, new_note.id, expense)
     db.commit()
     db.refresh(new_note)
 
@@ -529,6 +482,10 @@ async def delete_expense_note(
             detail="You can only delete your own notes"
         )
 
+    expense = db.query(Expense).filter(Expense.id == expense_id).first()
+    if expense:
+        record_note_change(db, note.id, expense, OP_DELETE)
+
     db.delete(note)
     db.commit()
 
@@ -2,15 +2,18 @@
 Group router - handles group operations
 Replaces tRPC groupRouter
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 from typing import List, Optional, Dict
 from datetime import datetime
 from nanoid import generate as nanoid
 
-from app.core.database import get_db
-from app.api.deps import get_current_user
+from app.core.database import get_db, get_read_db
+from app.api.deps import get_current_user, get_authorization, Authorization
+from app.api.etag import get_group_etag, etag_matches, not_modified, set_etag
+from app.api.fields import parse_fields
 from app.models.models import User, Group, GroupUser, Expense, BalanceView
 from app.schemas.group import (
     GroupCreate, GroupUpdate, GroupResponse, GroupDetailResponse,
@@ -18,11 +21,19 @@ from app.schemas.group import (
     JoinGroupRequest
 )
 from app.schemas.user import UserResponse
-from app.schemas.expense import ExpenseResponse
+from app.schemas.expense import ExpenseResponse, BalanceAsOfResponse
 from app.services.split_service import join_group, recalculate_group_balances
+from app.services.balance_history_service import get_balances_as_of, invalidate_checkpoints
+from app.services.version_service import bump_group_version
+from app.services.sync_service import (
+    record_change, membership_id, ENTITY_GROUP, ENTITY_MEMBERSHIP, OP_DELETE
+)
 
 router = APIRouter(prefix="/groups", tags=["groups"])
 
+# Keys of /groups/with-balances items, in response order
+GROUP_WITH_BALANCES_FIELDS = ("id", "name", "public_id", "default_currency", "balances", "archived_at")
+
 
 @router.post("", response_model=GroupResponse)
 async def create_group(
@@ -55,6 +66,8 @@ async def create_group(
         user_id=current_user.id
     )
     db.add(group_user)
+    record_change(db, ENTITY_GROUP, group.id, group_id=group.id)
+    record_change(db, ENTITY_MEMBERSHIP, membership_id(group.id, current_user.id), group_id=group.id)
     db.commit()
 
     return GroupResponse.model_validate(group)
@@ -63,21 +76,34 @@ async def create_group(
 @router.get("", response_model=List[GroupResponse])
 async def get_all_groups(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    include_archived: bool = Query(False, description="Include archived groups")
+    db: Session = Depends(get_read_db),
+    include_archived: bool = Query(False, description="Include archived groups"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,name")
 ):
     """
     Get all groups for current user
 
     Replaces tRPC: groupRouter.getAllGroups
     """
-    query = db.query(Group).join(GroupUser).filter(
+    selected = parse_fields(fields, GroupResponse.model_fields)
+    if selected is not None:
+        # Only select the requested columns
+        selected.add("id")
+        columns = [getattr(Group, name) for name in GroupResponse.model_fields if name in selected]
+        query = db.query(*columns)
+    else:
+        query = db.query(Group)
+
+    query = query.join(GroupUser, GroupUser.group_id == Group.id).filter(
         GroupUser.user_id == current_user.id
     )
 
     if not include_archived:
         query = query.filter(Group.archived_at.is_(None))
 
+    if selected is not None:
+        return ORJSONResponse([row._asdict() for row in query.all()])
+
     groups = query.all()
     return [GroupResponse.model_validate(g) for g in groups]
 
@@ -85,15 +111,20 @@ async def get_all_groups(
 @router.get("/with-balances", response_model=List[Dict])
 async def get_groups_with_balances(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    include_archived: Optional[bool] = Query(False, description="Include archived groups")
+    db: Session = Depends(get_read_db),
+    include_archived: Optional[bool] = Query(False, description="Include archived groups"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,name,balances")
 ):
     """
     Get all groups with balance summaries
 
     Replaces tRPC: groupRouter.getAllGroupsWithBalances
     """
-    query = db.query(Group).join(GroupUser).filter(
+    selected = parse_fields(fields, GROUP_WITH_BALANCES_FIELDS)
+    selected = set(GROUP_WITH_BALANCES_FIELDS) if selected is None else selected | {"id"}
+
+    columns = [getattr(Group, name) for name in GROUP_WITH_BALANCES_FIELDS if name in selected and name != "balances"]
+    query = db.query(*columns).join(GroupUser, GroupUser.group_id == Group.id).filter(
         GroupUser.user_id == current_user.id
     )
 
@@ -104,26 +135,25 @@ async def get_groups_with_balances(
 
     result = []
     for group in groups:
-        # Get balance summary for this group
-        balances = db.query(BalanceView).filter(
-            BalanceView.group_id == group.id,
-            BalanceView.user_id == current_user.id
-        ).all()
-
-        balance_summary = {}
-        for bal in balances:
-            if bal.currency not in balance_summary:
-                balance_summary[bal.currency] = 0
-            balance_summary[bal.currency] += bal.amount
-
-        result.append({
-            "id": group.id,
-            "name": group.name,
-            "public_id": group.public_id,
-            "default_currency": group.default_currency,
-            "balances": balance_summary,
-            "archived_at": group.archived_at.isoformat() if group.archived_at else None
-        })
+        item = group._asdict()
+        if "archived_at" in item:
+            item["archived_at"] = group.archived_at.isoformat() if group.archived_at else None
+
+        if "balances" in selected:
+            # Get balance summary for this group
+            balances = db.query(BalanceView).filter(
+                BalanceView.group_id == group.id,
+                BalanceView.user_id == current_user.id
+            ).all()
+
+            balance_summary = {}
+            for bal in balances:
+                if bal.currency not in balance_summary:
+                    balance_summary[bal.currency] = 0
+                balance_summary[bal.currency] += bal.amount
+            item["balances"] = balance_summary
+
+        result.append(item)
 
     return result
 
@@ -131,14 +161,23 @@ async def get_groups_with_balances(
 @router.get("/{group_id}", response_model=GroupDetailResponse)
 async def get_group_details(
     group_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    authz: Authorization = Depends(get_authorization)
 ):
     """
     Get detailed group info with members and recent expenses
 
+    Supports If-None-Match: answers 304 when the group version is unchanged.
+
     Replaces tRPC: groupRouter.getGroupDetails
     """
+    etag = get_group_etag(db, group_id, current_user.id, "details")
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+
     group = db.query(Group).filter(Group.id == group_id).first()
 
     if not group:
@@ -147,19 +186,7 @@ async def get_group_details(
             detail="Group not found"
         )
 
-    # Check if user is member
-    is_member = db.query(GroupUser).filter(
-        and_(
-            GroupUser.group_id == group_id,
-            GroupUser.user_id == current_user.id
-        )
-    ).first()
-
-    if not is_member:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not a member of this group"
-        )
+    authz.require_group_member(group_id)
 
     # Get members
     members = db.query(User).join(GroupUser).filter(
@@ -174,11 +201,12 @@ async def get_group_details(
         )
     ).order_by(Expense.expense_date.desc()).limit(50).all()
 
-    response = GroupDetailResponse.model_validate(group)
-    response.members = [UserResponse.model_validate(m) for m in members]
-    response.recent_expenses = [ExpenseResponse.model_validate(e) for e in expenses]
+    result = GroupDetailResponse.model_validate(group)
+    result.members = [UserResponse.model_validate(m) for m in members]
+    result.recent_expenses = [ExpenseResponse.model_validate(e) for e in expenses]
 
-    return response
+    set_etag(response, etag)
+    return result
 
 
 @router.put("/{group_id}", response_model=GroupResponse)
@@ -215,6 +243,8 @@ async def update_group(
     if group_data.simplify_debts is not None:
         group.simplify_debts = group_data.simplify_debts
 
+    bump_group_version(db, group_id)
+    record_change(db, ENTITY_GROUP, group_id, group_id=group_id)
     db.commit()
     db.refresh(group)
 
@@ -241,7 +271,8 @@ async def add_member(
     group_id: int,
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    authz: Authorization = Depends(get_authorization)
 ):
     """
     Add a member to a group
@@ -256,19 +287,7 @@ async def add_member(
             detail="Group not found"
         )
 
-    # Check if requester is member
-    is_member = db.query(GroupUser).filter(
-        and_(
-            GroupUser.group_id == group_id,
-            GroupUser.user_id == current_user.id
-        )
-    ).first()
-
-    if not is_member:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not a member of this group"
-        )
+    authz.require_group_member(group_id)
 
     # Check if user to add exists
     user = db.query(User).filter(User.id == user_id).first()
@@ -295,6 +314,8 @@ async def add_member(
     # Add member
     group_user = GroupUser(group_id=group_id, user_id=user_id)
     db.add(group_user)
+    bump_group_version(db, group_id)
+    record_change(db, ENTITY_MEMBERSHIP, membership_id(group_id, user_id), group_id=group_id)
     db.commit()
 
     return {"message": "Member added successfully"}
@@ -348,6 +369,12 @@ async def remove_member(
             detail="User is not a member"
         )
 
+    bump_group_version(db, group_id)
+    # The removed user can no longer see group-scoped changes, so tell them directly
+    record_change(
+        db, ENTITY_MEMBERSHIP, membership_id(group_id, user_id), OP_DELETE,
+        group_id=group_id, user_ids=[user_id]
+    )
     db.commit()
     return None
 
@@ -392,6 +419,11 @@ async def leave_group(
             detail="Not a member of this group"
         )
 
+    bump_group_version(db, group_id)
+    record_change(
+        db, ENTITY_MEMBERSHIP, membership_id(group_id, current_user.id), OP_DELETE,
+        group_id=group_id, user_ids=[current_user.id]
+    )
     db.commit()
     return None
 
@@ -424,6 +456,8 @@ async def archive_group(
 
     from datetime import datetime
     group.archived_at = datetime.utcnow()
+    bump_group_version(db, group_id)
+    record_change(db, ENTITY_GROUP, group_id, group_id=group_id)
     db.commit()
     db.refresh(group)
 
@@ -463,37 +497,64 @@ async def recalculate_balances(
 @router.get("/{group_id}/balances", response_model=List[GroupBalanceResponse])
 async def get_group_balances(
     group_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    authz: Authorization = Depends(get_authorization)
 ):
     """
     Get all balances within a group
 
+    Supports If-None-Match: answers 304 when the group version is unchanged.
+
     Part of groupRouter.getAllGroupsWithBalances functionality
     """
-    # Check if user is member
-    is_member = db.query(GroupUser).filter(
-        and_(
-            GroupUser.group_id == group_id,
-            GroupUser.user_id == current_user.id
-        )
-    ).first()
+    etag = get_group_etag(db, group_id, current_user.id, "balances")
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
 
-    if not is_member:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not a member of this group"
-        )
+    authz.require_group_member(group_id)
 
     balances = db.query(BalanceView).filter(BalanceView.group_id == group_id).all()
+
+    set_etag(response, etag)
     return [GroupBalanceResponse.model_validate(b) for b in balances]
 
 
+@router.get("/{group_id}/balances/as-of", response_model=List[BalanceAsOfResponse])
+async def get_group_balances_as_of(
+    group_id: int,
+    date_str: str = Query(..., alias="date", description="Date in YYYY-MM-DD format"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    authz: Authorization = Depends(get_authorization)
+):
+    """
+    Get the current user's balances within a group as they stood at the end of a date
+
+    Includes every non-deleted expense dated on or before the given day.
+    """
+    try:
+        as_of = datetime.fromisoformat(date_str).date()
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid date format. Use YYYY-MM-DD"
+        )
+
+    authz.require_group_member(group_id)
+
+    balances = get_balances_as_of(db, current_user.id, as_of, group_id=group_id)
+    return [BalanceAsOfResponse(as_of=as_of, **b) for b in balances]
+
+
 @router.get("/{group_id}/totals", response_model=List[Dict])
 async def get_group_totals(
     group_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    authz: Authorization = Depends(get_authorization)
 ):
     """
     Get total expenses per currency in a group
@@ -502,19 +563,7 @@ async def get_group_totals(
     """
     from sqlalchemy import func
 
-    # Check if user is member
-    is_member = db.query(GroupUser).filter(
-        and_(
-            GroupUser.group_id == group_id,
-            GroupUser.user_id == current_user.id
-        )
-    ).first()
-
-    if not is_member:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not a member of this group"
-        )
+    authz.require_group_member(group_id)
 
     totals = db.query(
         Expense.currency,
@@ -568,6 +617,13 @@ async def delete_group(
             detail="Cannot delete group with outstanding balances"
         )
 
+    # Group expenses disappear from everyone's balance history
+    member_ids = [gu.user_id for gu in db.query(GroupUser).filter(GroupUser.group_id == group_id).all()]
+    invalidate_checkpoints(db, member_ids)
+
+    # Memberships vanish with the group, so deliver the tombstone per user
+    record_change(db, ENTITY_GROUP, group_id, OP_DELETE, user_ids=member_ids)
+
     # Delete group (cascades to members, expenses, etc.)
     db.delete(group)
     db.commit()
@@ -578,7 +634,7 @@ async def delete_group(
 @router.get("/with-balances", response_model=List[Dict])
 async def get_all_groups_with_balances(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     include_archived: bool = Query(False)
 ):
     """
@@ -0,0 +1,111 @@
+"""
+Sync router - delta sync for offline-capable clients
+"""
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import AsyncIterator, Optional
+
+from app.core.config import settings
+from app.core.database import get_db
+from app.api.deps import get_current_user
+from app.models.models import User
+from app.schemas.sync import SyncResponse
+from app.services.sync_service import get_changes, get_current_token, parse_token, SyncTokenExpired
+from app.services.realtime_service import realtime_service, Subscription
+from app.services.membership_service import get_group_ids
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+
+@router.get("", response_model=SyncResponse)
+async def sync_changes(
+    since: Optional[str] = Query(None, description="Token from the previous sync response"),
+    limit: int = Query(settings.SYNC_PAGE_SIZE, ge=1, le=settings.SYNC_MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get expenses, participants, notes, groups, memberships and balances changed since a token
+
+    Without `since`, returns only the current token: take it first, then load the
+    full lists, then keep calling with the returned `next_token`. While `has_more`
+    is true, call again right away.
+    """
+    try:
+        since_seq = parse_token(since)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid sync token"
+        )
+
+    try:
+        return get_changes(db, current_user.id, since_seq, limit)
+    except SyncTokenExpired:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Sync token expired, full resync required"
+        )
+
+
+@router.get("/stream")
+async def stream_changes(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream change events for the user's groups and friends (Server-Sent Events)
+
+    The first `ready` event carries the current sync token. Each `change` event
+    is {seq, type, id, op, group_id}; call /sync with the last token to fetch the
+    changed entities. A `resync` event means events were dropped and the client
+    should sync from its token before continuing.
+    """
+    group_ids = set(get_group_ids(db, current_user.id))
+    token = get_current_token(db)
+    user_id = current_user.id
+
+    # Don't hold a pooled connection for the lifetime of the stream
+    db.close()
+
+    subscription = await realtime_service.subscribe(user_id, group_ids)
+    return StreamingResponse(
+        _event_stream(request, subscription, token),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _event_stream(request: Request, subscription: Subscription, token: int) -> AsyncIterator[str]:
+    try:
+        yield _format_event("ready", {"token": str(token)})
+
+        while not await request.is_disconnected():
+            try:
+                change = await asyncio.wait_for(
+                    subscription.queue.get(),
+                    timeout=settings.REALTIME_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+                continue
+
+            if subscription.overflowed:
+                subscription.overflowed = False
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                yield _format_event("resync", {})
+                continue
+
+            yield _format_event("change", {k: v for k, v in change.items() if k != "user_id"})
+    finally:
+        realtime_service.unsubscribe(subscription)
@@ -2,14 +2,14 @@
 User router - handles user profile and preferences
 Replaces tRPC userRouter
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Body, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, status, Body, File, UploadFile, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, and_
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 
-from app.core.database import get_db
-from app.api.deps import get_current_user
+from app.core.database import get_db, get_read_db
+from app.api.deps import get_current_user, user_rate_limit
 from app.models.models import User, BalanceView, Expense, Group, GroupUser, ExpenseParticipant, Account, Session
 from app.schemas.user import (
     UserResponse, UserUpdate, FriendResponse,
@@ -17,7 +17,14 @@ from app.schemas.user import (
 )
 from app.services.push_service import push_service
 from app.services.email_service import email_service
+from app.services.outbox_service import queue_email
 from app.services.splitwise_import_service import splitwise_import_service
+from app.services.balance_history_service import get_balances_as_of
+from app.services.version_service import bump_group_version, bump_ledger_versions
+from app.services.sync_service import (
+    record_change, record_expense_change, membership_id, ENTITY_MEMBERSHIP, OP_DELETE
+)
+from app.schemas.expense import BalanceAsOfResponse
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -63,7 +70,7 @@ async def update_current_user(
 @router.get("/friends", response_model=List[FriendResponse])
 async def get_friends(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get all friends (users with balances) for current user
@@ -112,7 +119,7 @@ async def get_friends(
     return result
 
 
-@router.get("/search/email", response_model=UserResponse)
+@router.get("/search/email", response_model=UserResponse, dependencies=[Depends(user_rate_limit("user_search"))])
 async def search_user_by_email(
     email: str,
     current_user: User = Depends(get_current_user),
@@ -207,7 +214,7 @@ async def unhide_friend(
 @router.get("/data/export")
 async def export_user_data(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Export all user data as JSON
@@ -281,7 +288,11 @@ async def export_user_data(
     return export_data
 
 
-@router.post("/import/splitwise", status_code=status.HTTP_200_OK)
+@router.post(
+    "/import/splitwise",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(user_rate_limit("splitwise_import"))]
+)
 async def import_from_splitwise(
     file: UploadFile = File(..., description="Splitwise CSV export file"),
     current_user: User = Depends(get_current_user),
@@ -331,7 +342,7 @@ async def import_from_splitwise(
 @router.get("/expenses/own", response_model=List[Dict])
 async def get_own_expenses(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get expenses paid by current user
@@ -382,15 +393,16 @@ async def invite_friend(
         preferred_language="en"
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
 
     # Send invite email if requested
     if request.send_invite_email:
-        await email_service.send_invite_email(
+        queue_email(db, **email_service.build_invite_email(
             to_email=request.email,
             from_name=current_user.name or current_user.email
-        )
+        ))
+
+    db.commit()
+    db.refresh(new_user)
 
     return UserResponse.model_validate(new_user)
 
@@ -422,6 +434,31 @@ async def get_balances_with_friend(
     ]
 
 
+@router.get("/balances/friend/{friend_id}/as-of", response_model=List[BalanceAsOfResponse])
+async def get_balances_with_friend_as_of(
+    friend_id: int,
+    date_str: str = Query(..., alias="date", description="Date in YYYY-MM-DD format"),
+    group_id: Optional[int] = Query(None, description="Only balances within this group"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get balance breakdown with a friend as it stood at the end of a date
+
+    Includes every non-deleted expense dated on or before the given day.
+    """
+    try:
+        as_of = datetime.fromisoformat(date_str).date()
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid date format. Use YYYY-MM-DD"
+        )
+
+    balances = get_balances_as_of(db, current_user.id, as_of, friend_id=friend_id, group_id=group_id)
+    return [BalanceAsOfResponse(as_of=as_of, **b) for b in balances]
+
+
 @router.post("/feedback", status_code=status.HTTP_204_NO_CONTENT)
 async def submit_feedback(
     feedback: str = Body(..., embed=True),
@@ -439,10 +476,11 @@ async def submit_feedback(
             detail="Feedback must be at least 10 characters"
         )
 
-    await email_service.send_feedback_email(
+    queue_email(db, **email_service.build_feedback_email(
         feedback=feedback,
         user=current_user
-    )
+    ))
+    db.commit()
 
     return None
 
@@ -614,7 +652,7 @@ async def change_password(
     """
     Change user's password (for non-OAuth users)
     """
-    from app.core.security import verify_password, get_password_hash
+    from app.core.security import verify_password_async, get_password_hash_async
 
     # Check if user has a password (non-OAuth user)
     account = db.query(Account).filter(
@@ -629,7 +667,7 @@ async def change_password(
         )
 
     # Verify current password
-    if not account.access_token or not verify_password(current_password, account.access_token):
+    if not account.access_token or not await verify_password_async(current_password, account.access_token):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
@@ -643,7 +681,7 @@ async def change_password(
         )
 
     # Update password
-    account.access_token = get_password_hash(new_password)
+    account.access_token = await get_password_hash_async(new_password)
     db.commit()
 
     return None
@@ -730,7 +768,7 @@ async def delete_account(
 
     Requires confirmation text "DELETE MY ACCOUNT" and password for non-OAuth users
     """
-    from app.core.security import verify_password
+    from app.core.security import verify_password_async
 
     # Verify confirmation
     if confirmation != "DELETE MY ACCOUNT":
@@ -751,7 +789,7 @@ async def delete_account(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Password required to delete account"
             )
-        if not verify_password(password, account.access_token):
+        if not await verify_password_async(password, account.access_token):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Incorrect password"
@@ -774,12 +812,32 @@ async def delete_account(
     for expense in expenses:
         expense.deleted_at = datetime.utcnow()
         expense.deleted_by = current_user.id
+        record_expense_change(
+            db, expense.id, expense.group_id,
+            [expense.paid_by, *(p.user_id for p in expense.expense_participants)]
+        )
+
+    # Friends' ledgers lose every expense shared with the user, so their cached views are stale
+    friend_ids = {p.user_id for expense in expenses for p in expense.expense_participants}
+    friend_ids.update(
+        paid_by for (paid_by,) in db.query(Expense.paid_by).join(ExpenseParticipant).filter(
+            ExpenseParticipant.user_id == current_user.id,
+            Expense.deleted_at.is_(None)
+        )
+    )
+    friend_ids.discard(current_user.id)
+    bump_ledger_versions(db, friend_ids)
 
     # Remove user from expense participants
     db.query(ExpenseParticipant).filter(
         ExpenseParticipant.user_id == current_user.id
     ).delete()
 
+    # Groups lose a member, so their cached views are stale
+    for (group_id,) in db.query(GroupUser.group_id).filter(GroupUser.user_id == current_user.id).all():
+        bump_group_version(db, group_id)
+        record_change(db, ENTITY_MEMBERSHIP, membership_id(group_id, current_user.id), OP_DELETE, group_id=group_id)
+
     # Remove from groups
     db.query(GroupUser).filter(
         GroupUser.user_id == current_user.id
@@ -18,11 +18,96 @@ class Settings(BaseSettings):
     DB_PASSWORD: Optional[str] = None
     DB_NAME: Optional[str] = "sahasplit"
 
+    # Connection pool. DB_MAX_CONNECTIONS is the budget for all workers
+    # (WEB_CONCURRENCY, also read by uvicorn); each worker keeps a third of its
+    # share open and may overflow into the rest. DB_POOL_SIZE/DB_MAX_OVERFLOW
+    # override the split. Checkouts waiting longer than DB_POOL_TIMEOUT_SECONDS
+    # are answered with 503 instead of queuing
+    WEB_CONCURRENCY: int = 1
+    DB_MAX_CONNECTIONS: int = 60
+    DB_POOL_SIZE: Optional[int] = None
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_TIMEOUT_SECONDS: float = 5.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_WARMUP: bool = True
+
+    # Refuse to start unless the database is at the latest migration
+    DB_SCHEMA_CHECK: bool = True
+
+    # Read replica for read-only endpoints. After writing, a user reads from the
+    # primary for REPLICA_STICKY_SECONDS; a replica further behind than
+    # REPLICA_MAX_LAG_SECONDS is skipped
+    DATABASE_REPLICA_URL: Optional[str] = None
+    REPLICA_STICKY_SECONDS: int = 5
+    REPLICA_MAX_LAG_SECONDS: int = 5
+    REPLICA_LAG_CHECK_SECONDS: float = 1.0
+
+    # Query instrumentation: statements slower than this are logged with their
+    # parameters (and EXPLAIN plan if enabled); requests running this many
+    # statements are logged as likely N+1s
+    SQL_SLOW_QUERY_MS: int = 200
+    SQL_EXPLAIN_SLOW_QUERIES: bool = False
+    SQL_REQUEST_QUERY_WARNING: int = 100
+
+    # Serve Prometheus metrics at /metrics (set PROMETHEUS_MULTIPROC_DIR with several workers).
+    # nginx proxies it on port 8012 to loopback and private-network scrapers only.
+    METRICS_ENABLED: bool = True
+
+    # Request profiling: send "X-Profile: <PROFILING_TOKEN>" or sample a fraction
+    # of requests; HTML profiles are kept in PROFILING_DIR
+    PROFILING_TOKEN: Optional[str] = None
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_INTERVAL: float = 0.001
+    PROFILING_DIR: str = "/tmp/sahasplit-profiles"
+    PROFILING_MAX_FILES: int = 200
+
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 525600 * 10  # 10 years - never expire
-    REFRESH_TOKEN_EXPIRE_DAYS: int = 3650  # 10 years - never expire
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60  # clients refresh on 401
+    # Refresh tokens are rotated on every use, so only clients unused this long sign in again
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # A refresh token reused this soon after its first use gets the same new tokens
+    # (tabs refreshing at once); later reuses are rejected
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS: float = 10.0
+
+    # Verified tokens are cached by digest (TOKEN_CACHE_SIZE entries). Logout
+    # revokes access tokens and refresh tokens are single-use; with
+    # TOKEN_REVOCATION_BACKEND="redis" both are shared by all workers, which pick
+    # up revocations every TOKEN_REVOCATION_SYNC_SECONDS
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_REVOCATION_BACKEND: str = "memory"
+    TOKEN_REVOCATION_SYNC_SECONDS: float = 2.0
+    TOKEN_REVOCATION_BLOOM_CAPACITY: int = 100000
+
+    # Rate limits per route class, as "<count>/<second|minute|hour|day>", per IP
+    # (or per user on authenticated routes). Buckets are shared through Redis
+    # with RATE_LIMIT_BACKEND="redis", otherwise kept per worker
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMITS: dict[str, str] = {
+        "login": "10/minute",
+        "register": "5/minute",
+        "magic_link": "5/minute",
+        "user_search": "30/minute",
+        "splitwise_import": "5/hour",
+    }
+
+    # Server-side sessions in Redis (REDIS_URL), mirrored to the sessions table.
+    # Sessions end after SESSION_IDLE_DAYS unused; activity is recorded at most
+    # every SESSION_TOUCH_SECONDS and mirrored every SESSION_MIRROR_INTERVAL_SECONDS
+    SESSIONS_ENABLED: bool = False
+    SESSION_IDLE_DAYS: int = 30
+    SESSION_TOUCH_SECONDS: int = 300
+    SESSION_MIRROR_INTERVAL_SECONDS: float = 5.0
+
+    # Password hashing. bcrypt runs on PASSWORD_HASH_WORKERS threads so a burst of
+    # logins queues there instead of blocking the event loop. Hashes made with a
+    # different BCRYPT_ROUNDS are upgraded on the next successful login
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+
+    # Responses smaller than this (bytes) are sent uncompressed
+    COMPRESSION_MINIMUM_SIZE: int = 1024
 
     # CORS
     CORS_ORIGINS: list[str] = ["http://localhost:3000", "http://localhost:5173"]
@@ -31,11 +116,16 @@ class Settings(BaseSettings):
     GOOGLE_CLIENT_ID: Optional[str] = None
     GOOGLE_CLIENT_SECRET: Optional[str] = None
 
-    # OAuth - Authentik
+    # OAuth - Authentik (AUTHENTIK_ISSUER is the application's OpenID issuer URL)
     AUTHENTIK_CLIENT_ID: Optional[str] = None
     AUTHENTIK_CLIENT_SECRET: Optional[str] = None
     AUTHENTIK_ISSUER: Optional[str] = None
 
+    # OpenID discovery documents and signing keys are cached this long; unknown
+    # key ids re-fetch the keys at most every OIDC_JWKS_MIN_REFRESH_SECONDS
+    OIDC_METADATA_TTL_SECONDS: int = 3600
+    OIDC_JWKS_MIN_REFRESH_SECONDS: int = 60
+
     # Email
     SMTP_HOST: Optional[str] = None
     SMTP_PORT: int = 587
@@ -43,6 +133,33 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: Optional[str] = None
     SMTP_FROM_EMAIL: str = "noreply@sahasplit.app"
     SUPPORT_EMAIL: Optional[str] = None
+    SMTP_START_TLS: bool = True
+    SMTP_TIMEOUT_SECONDS: float = 30.0
+
+    # SMTP connections kept open per worker. Connections idle longer than
+    # SMTP_NOOP_AFTER_SECONDS are checked with NOOP before reuse, and closed after
+    # SMTP_POOL_IDLE_SECONDS (relays drop idle clients after a few minutes)
+    SMTP_POOL_SIZE: int = 4
+    SMTP_NOOP_AFTER_SECONDS: int = 30
+    SMTP_POOL_IDLE_SECONDS: int = 240
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = 100
+
+    # Compiled email templates are cached here for other workers and restarts
+    # (defaults to a per-user directory under the system temp dir)
+    EMAIL_TEMPLATE_CACHE_DIR: Optional[str] = None
+
+    # Outbox: emails and push notifications are queued with the change that
+    # caused them and sent in the background, OUTBOX_BATCH_SIZE at a time with up
+    # to OUTBOX_CONCURRENCY in flight. Failed sends are retried after
+    # OUTBOX_RETRY_BASE_SECONDS, doubling up to OUTBOX_RETRY_MAX_SECONDS, and
+    # dead-lettered after OUTBOX_MAX_ATTEMPTS
+    OUTBOX_POLL_SECONDS: float = 5.0
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_CONCURRENCY: int = 10
+    OUTBOX_LEASE_SECONDS: int = 300
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_RETRY_BASE_SECONDS: int = 30
+    OUTBOX_RETRY_MAX_SECONDS: int = 3600
 
     # S3/R2 Storage
     R2_ACCOUNT_ID: Optional[str] = None
@@ -73,6 +190,54 @@ class Settings(BaseSettings):
     WEB_PUSH_PRIVATE_KEY: Optional[str] = None
     WEB_PUSH_EMAIL: Optional[str] = None
 
+    # Notifications go to each of a user's devices, with up to WEB_PUSH_CONCURRENCY
+    # requests in flight over shared HTTP/2 connections. Push services hold a
+    # notification for an offline device for WEB_PUSH_TTL_SECONDS (0: drop it)
+    WEB_PUSH_CONCURRENCY: int = 50
+    WEB_PUSH_TIMEOUT_SECONDS: float = 10.0
+    WEB_PUSH_TTL_SECONDS: int = 0
+
+    # Delta sync. Tokens only pass change_log rows newer than SYNC_SETTLE_SECONDS
+    # (longer than any transaction) while their seqs have no gaps; up to
+    # SYNC_SETTLE_SCAN_ROWS recent rows are checked. History older than
+    # SYNC_RETENTION_DAYS is pruned daily by the scheduler
+    SYNC_PAGE_SIZE: int = 500
+    SYNC_MAX_PAGE_SIZE: int = 2000
+    SYNC_RETENTION_DAYS: int = 30
+    SYNC_SETTLE_SECONDS: int = 60
+    SYNC_SETTLE_SCAN_ROWS: int = 10000
+
+    # Expense notifications wait NOTIFICATION_DEBOUNCE_SECONDS for more changes
+    # (repeated edits, bulk imports) to fold into them, going out at most
+    # NOTIFICATION_MAX_DELAY_SECONDS after the first; each lists up to
+    # NOTIFICATION_MAX_EVENTS expenses
+    NOTIFICATION_DEBOUNCE_SECONDS: int = 30
+    NOTIFICATION_MAX_DELAY_SECONDS: int = 300
+    NOTIFICATION_MAX_EVENTS: int = 10
+
+    # Weekly summary emails, sent by the scheduler process on DIGEST_DAY_OF_WEEK
+    # at DIGEST_HOUR (UTC). Users are processed DIGEST_CHUNK_SIZE at a time; each
+    # email lists at most DIGEST_MAX_EXPENSES expenses
+    DIGEST_DAY_OF_WEEK: str = "mon"
+    DIGEST_HOUR: int = 8
+    DIGEST_CHUNK_SIZE: int = 1000
+    DIGEST_MAX_EXPENSES: int = 10
+
+    # How long a user's group memberships are cached between requests
+    MEMBERSHIP_CACHE_TTL_SECONDS: int = 30
+
+    # Maximum sub-requests per POST /batch
+    BATCH_MAX_REQUESTS: int = 20
+
+    # Realtime events ("memory" for a single worker, "redis" across workers).
+    # Each connection buffers REALTIME_QUEUE_SIZE events; with Redis each worker
+    # queues up to REALTIME_PUBLISH_QUEUE_SIZE committed batches for publishing
+    REALTIME_BACKEND: str = "memory"
+    REALTIME_CHANNEL: str = "sahasplit:changes"
+    REALTIME_QUEUE_SIZE: int = 100
+    REALTIME_PUBLISH_QUEUE_SIZE: int = 1000
+    REALTIME_HEARTBEAT_SECONDS: int = 25
+
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
 
@@ -1,29 +1,141 @@
-from sqlalchemy import create_engine
+import logging
+from typing import Tuple
+
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.core.config import settings
+from app.core.metrics import TimedQueuePool, instrument_pool
+from app.core.query_stats import instrument_engine
+from app.core.replication import ReplicaRouter
+from app.core.security import decode_token
+
+
+logger = logging.getLogger(__name__)
+
+
+def pool_limits() -> Tuple[int, int]:
+    """Get this worker's pool size and overflow from the connection budget"""
+    per_worker = max(2, settings.DB_MAX_CONNECTIONS // max(1, settings.WEB_CONCURRENCY))
+    pool_size = settings.DB_POOL_SIZE if settings.DB_POOL_SIZE is not None else max(1, per_worker // 3)
+    max_overflow = settings.DB_MAX_OVERFLOW if settings.DB_MAX_OVERFLOW is not None else max(0, per_worker - pool_size)
+    return pool_size, max_overflow
+
+
+def _create_engine(url: str, database: str):
+    pool_size, max_overflow = pool_limits()
+    engine = create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        echo=settings.DEBUG,
+    )
+    # Per-request query counts and slow-query logging
+    instrument_engine(engine)
+    instrument_pool(engine, database)
+    return engine
+
 
 # Create SQLAlchemy engine for MariaDB
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
-    echo=settings.DEBUG,
-)
+engine = _create_engine(settings.DATABASE_URL, "primary")
+
+# Optional read replica for read-only endpoints
+replica_engine = _create_engine(settings.DATABASE_REPLICA_URL, "replica") if settings.DATABASE_REPLICA_URL else None
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
+
+# Read-your-writes windows are shared by all workers through Redis
+replica_router = ReplicaRouter(engine, replica_engine, settings.REDIS_URL if replica_engine else None)
 
 # Create Base class for models
 Base = declarative_base()
 
+# Session.info keys: the authenticated user, and whether the transaction wrote anything
+USER_KEY = "user_id"
+WROTE_KEY = "wrote"
+
+
+def warm_up_pool(engine) -> int:
+    """Open the pool's connections up front so the first requests don't pay for connecting"""
+    count = engine.pool.size()
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
 
-def get_db():
+
+def get_db(request: Request = None):
     """Dependency to get database session"""
+    # Sub-requests of POST /batch share the batch request's session
+    shared = getattr(request.state, "batch_db", None) if request is not None else None
+    if shared is not None:
+        yield shared
+        return
+
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+
+def get_read_db(request: Request = None, db: Session = Depends(get_db)):
+    """
+    Dependency to get a session for read-only endpoints
+
+    Uses the read replica when one is configured, it isn't lagging and the
+    user hasn't written recently; otherwise the request's primary session.
+    """
+    # Batch sub-requests keep sharing the batch request's session
+    batched = request is not None and getattr(request.state, "batch_db", None) is not None
+    if batched or not replica_router.use_replica(_request_user_id(request)):
+        yield db
+        return
+
+    replica_db = ReplicaSessionLocal()
+    try:
+        yield replica_db
+    finally:
+        replica_db.close()
+
+
+def _request_user_id(request: Request):
+    # The token is verified again by get_current_user; here it only picks the database
+    authorization = request.headers.get("authorization", "") if request is not None else ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+
+    payload = decode_token(token)
+    try:
+        return int(payload["sub"]) if payload else None
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+@event.listens_for(Session, "after_flush")
+def _note_write(session: Session, flush_context) -> None:
+    session.info[WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_writer(session: Session) -> None:
+    # Read-your-writes: the writer's next reads skip the replica for a while
+    if session.info.pop(WROTE_KEY, False) and session.info.get(USER_KEY) is not None:
+        replica_router.mark_write(session.info[USER_KEY])
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_write(session: Session) -> None:
+    session.info.pop(WROTE_KEY, None)
@@ -0,0 +1,248 @@
+"""
+Prometheus metrics
+
+Request counts and latency per route template, database pool usage and
+checkout wait, password hashing queue depth, outbox deliveries, cache hit/miss
+counts and external API latency. Served at
+/metrics in the Prometheus text format.
+
+Each uvicorn worker is its own process, so with PROMETHEUS_MULTIPROC_DIR set
+(before the app is imported) values are written to per-process files in that
+directory and /metrics aggregates all workers. The directory must be emptied
+before the workers start.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Requests that matched no route share one label, so scanners can't blow up cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+http_requests_total = Counter(
+    "http_requests_total",
+    "HTTP requests by route template, method and status",
+    ["method", "route", "status"]
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time to the end of the response body, by route template",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS
+)
+db_pool_checkout_wait_seconds = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    ["database"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+db_pool_connections_in_use = Gauge(
+    "db_pool_connections_in_use",
+    "Database connections checked out of the pool",
+    ["database"],
+    multiprocess_mode="livesum"
+)
+db_pool_overflow = Gauge(
+    "db_pool_overflow",
+    "Connections open beyond the pool size",
+    ["database"],
+    multiprocess_mode="livesum"
+)
+db_pool_size = Gauge(
+    "db_pool_size",
+    "Configured pool size (without overflow)",
+    ["database"],
+    multiprocess_mode="livesum"
+)
+db_pool_timeouts_total = Counter(
+    "db_pool_timeouts_total",
+    "Checkouts that gave up waiting for a connection (answered with 503)",
+    ["database"]
+)
+password_hash_queue_depth = Gauge(
+    "password_hash_queue_depth",
+    "Password hash/verify jobs waiting for a hashing thread",
+    multiprocess_mode="livesum"
+)
+password_hash_duration_seconds = Histogram(
+    "password_hash_duration_seconds",
+    "Time to hash or verify a password, excluding the wait for a thread",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+rate_limited_total = Counter(
+    "rate_limited_total",
+    "Requests rejected with 429, by rate limit",
+    ["limit"]
+)
+outbox_messages_total = Counter(
+    "outbox_messages_total",
+    "Outbox send attempts by message kind and outcome (sent, retry or dead)",
+    ["kind", "outcome"]
+)
+cache_requests_total = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"]
+)
+external_request_duration_seconds = Histogram(
+    "external_request_duration_seconds",
+    "Latency of calls to external services",
+    ["service", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache lookup"""
+    cache_requests_total.labels(cache, "hit" if hit else "miss").inc()
+
+
+@contextmanager
+def track_external(service: str, operation: str) -> Iterator[None]:
+    """Time a call to an external service, labelled ok or error"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        external_request_duration_seconds.labels(service, operation, outcome).observe(
+            time.perf_counter() - started
+        )
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    # Label for the pool's metrics, set by instrument_pool
+    database = "primary"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            db_pool_timeouts_total.labels(self.database).inc()
+            raise
+        finally:
+            db_pool_checkout_wait_seconds.labels(self.database).observe(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.database = self.database
+        return pool
+
+
+def instrument_pool(engine: Engine, database: str = "primary") -> None:
+    """Track connections in use and overflow on an engine's pool"""
+    engine.pool.database = database
+    pool_size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 0
+    db_pool_size.labels(database).set(pool_size)
+
+    # Checkin events fire before the pool updates its own counters, so count here;
+    # overflow connections are only open while checked out
+    lock = threading.Lock()
+    in_use = 0
+
+    def update(delta: int) -> None:
+        nonlocal in_use
+        with lock:
+            in_use += delta
+            db_pool_connections_in_use.labels(database).set(in_use)
+            db_pool_overflow.labels(database).set(max(in_use - pool_size, 0))
+
+    event.listen(engine, "checkout", lambda *args: update(1))
+    event.listen(engine, "checkin", lambda *args: update(-1))
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Get the exposition for all workers, and its content type"""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges from the aggregate on shutdown"""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """Count requests and time them per route template"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            method = scope["method"]
+            route = route_template(scope)
+            http_requests_total.labels(method, route, str(status_code)).inc()
+            http_request_duration_seconds.labels(method, route).observe(time.perf_counter() - started)
+
+
+_route_templates: Dict[Tuple[object, str], str] = {}
+
+
+def route_template(scope: Scope) -> str:
+    """Get the path template of the route a handled request matched, e.g. /api/groups/{group_id}"""
+    # The router stores the matched endpoint in the (shared) scope
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+
+    key = (endpoint, scope["method"])
+    template = _route_templates.get(key)
+    if template is None:
+        template = _find_template(scope.get("app"), endpoint, scope["method"]) or UNMATCHED_ROUTE
+        _route_templates[key] = template
+    return template
+
+
+def _find_template(app, endpoint, method: str) -> Optional[str]:
+    for route in getattr(app, "routes", []):
+        if getattr(route, "endpoint", None) is endpoint:
+            methods = getattr(route, "methods", None)
+            if not methods or method in methods:
+                return route.path
+    return None
@@ -0,0 +1,94 @@
+"""
+Schema migrations and the startup revision check
+
+Migrations run once per deploy, before the workers start:
+
+    python -m app.core.migrations
+
+Workers then only compare the database's alembic_version with the head of
+alembic/versions (one single-row query) instead of reflecting every table with
+create_all, and refuse to start on an out-of-date schema.
+"""
+import logging
+from pathlib import Path
+from typing import Set
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaOutOfDate(RuntimeError):
+    """The database isn't at the latest migration"""
+
+
+def _alembic_config():
+    from alembic.config import Config
+
+    # No ini file, so env.py leaves the app's logging configuration alone
+    config = Config()
+    config.set_main_option("script_location", str(BACKEND_DIR / "alembic"))
+    return config
+
+
+def head_revisions() -> Set[str]:
+    """Get the head revision(s) of the migration scripts"""
+    from alembic.script import ScriptDirectory
+
+    return set(ScriptDirectory.from_config(_alembic_config()).get_heads())
+
+
+def current_revisions(engine: Engine) -> Set[str]:
+    """Get the revision(s) the database is stamped with (empty if never migrated)"""
+    with engine.connect() as conn:
+        try:
+            return {row[0] for row in conn.execute(text("SELECT version_num FROM alembic_version"))}
+        except DBAPIError:
+            return set()
+
+
+def check_schema_revision(engine: Engine) -> None:
+    """Raise SchemaOutOfDate unless the database is at the head revision"""
+    current = current_revisions(engine)
+    heads = head_revisions()
+    if current != heads:
+        raise SchemaOutOfDate(
+            f"Database is at revision {', '.join(sorted(current)) or 'none'}, expected "
+            f"{', '.join(sorted(heads))}; run `python -m app.core.migrations`"
+        )
+
+
+def upgrade_database(engine: Engine) -> None:
+    """
+    Bring the database to the head revision
+
+    Databases created by the old create_all startup have tables but no
+    alembic_version; they get any missing tables and are stamped at head.
+    """
+    from alembic import command
+
+    config = _alembic_config()
+    legacy = not current_revisions(engine) and inspect(engine).has_table("users")
+
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        if legacy:
+            from app.core.database import Base
+            from app.models import models  # noqa: F401
+
+            logger.warning("Unversioned database: creating missing tables and stamping it at head")
+            Base.metadata.create_all(bind=connection)
+            command.stamp(config, "head")
+        else:
+            command.upgrade(config, "head")
+
+
+if __name__ == "__main__":
+    from app.core.database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    upgrade_database(engine)
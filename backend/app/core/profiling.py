@@ -0,0 +1,123 @@
+"""
+Opt-in request profiling
+
+A request is profiled when it carries `X-Profile: <PROFILING_TOKEN>`, or at
+random for a PROFILING_SAMPLE_RATE fraction of requests. The statistical
+profile (pyinstrument, following async tasks) is saved as an HTML flame graph
+under PROFILING_DIR, named with the route, query count and duration. A
+token-authorized request can instead ask for the profile in place of the
+response with `X-Profile-Output: inline`.
+
+Endpoints here are async and run their database work on the event loop, so
+the profile covers serialization, split calculations and queries alike.
+"""
+import asyncio
+import hmac
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import route_template
+from app.core.query_stats import get_query_stats
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # pragma: no cover - pyinstrument is optional
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+
+def _profile_requested(headers: Headers) -> bool:
+    token = headers.get("x-profile")
+    return bool(token and settings.PROFILING_TOKEN and hmac.compare_digest(token, settings.PROFILING_TOKEN))
+
+
+def _profile_filename(scope: Scope, route: str, queries: int, duration: float) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    return f"{stamp}-{scope['method']}-{slug}-{queries}q-{duration * 1000:.0f}ms.html"
+
+
+def save_profile(html: str, filename: str) -> str:
+    """Write a profile under PROFILING_DIR, dropping the oldest beyond PROFILING_MAX_FILES"""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    path = os.path.join(settings.PROFILING_DIR, filename)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+    profiles = sorted(name for name in os.listdir(settings.PROFILING_DIR) if name.endswith(".html"))
+    for name in profiles[:-settings.PROFILING_MAX_FILES]:
+        os.remove(os.path.join(settings.PROFILING_DIR, name))
+    return path
+
+
+class ProfilingMiddleware:
+    """Profile requests selected by the admin header or sampling"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or Profiler is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        requested = _profile_requested(headers)
+        if not requested and not (settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+
+        inline = requested and headers.get("x-profile-output") == "inline"
+        status_code: Optional[int] = None
+
+        async def send_or_hold(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            if not inline:
+                await send(message)
+
+        profiler = Profiler(interval=settings.PROFILING_INTERVAL, async_mode="enabled")
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_or_hold)
+        finally:
+            profiler.stop()
+
+        duration = time.perf_counter() - started
+        route = route_template(scope)
+        stats = get_query_stats()
+        queries = stats.count if stats is not None else 0
+        html = profiler.output_html()
+
+        if inline:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/html; charset=utf-8"),
+                    (b"x-profile-route", route.encode()),
+                    (b"x-profile-queries", str(queries).encode()),
+                    (b"x-profile-status", str(status_code).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": html.encode("utf-8")})
+            return
+
+        filename = _profile_filename(scope, route, queries, duration)
+        try:
+            path = await asyncio.to_thread(save_profile, html, filename)
+            logger.info(f"Profiled {scope['method']} {route} ({queries} queries, {duration * 1000:.0f} ms): {path}")
+        except OSError as e:
+            logger.warning(f"Failed to save profile {filename}: {e}")
@@ -0,0 +1,161 @@
+"""
+Per-request SQL instrumentation
+
+Engine event hooks count statements and time spent in the database for the
+current request (tracked in a ContextVar, which FastAPI copies into the
+threadpool running sync endpoints), log slow statements with their bound
+parameters and, optionally, their EXPLAIN plan. QueryStatsMiddleware reports
+the totals in a Server-Timing header so they show up in browser devtools.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bound parameters are truncated in slow-query logs
+MAX_LOGGED_PARAMS_LENGTH = 500
+
+
+class QueryStats:
+    """Statement count and database time of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def get_query_stats() -> Optional[QueryStats]:
+    """Get the stats of the request being handled, if any"""
+    return _current.get()
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Collect stats for statements run inside the block"""
+    parent = _current.get()
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        # Batch sub-requests also count towards the batch request
+        if parent is not None:
+            parent.count += stats.count
+            parent.duration += stats.duration
+
+
+@contextmanager
+def capture_queries(engine: Engine) -> Iterator[List[str]]:
+    """Record every statement run on an engine inside the block, from any thread"""
+    statements: List[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attach the counting and slow-query hooks to an engine"""
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+
+    stats = _current.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+
+    if elapsed * 1000 >= settings.SQL_SLOW_QUERY_MS:
+        _log_slow_query(conn, cursor, statement, parameters, executemany, elapsed)
+
+
+def _log_slow_query(conn, cursor, statement, parameters, executemany, elapsed):
+    params = repr(parameters)
+    if len(params) > MAX_LOGGED_PARAMS_LENGTH:
+        params = params[:MAX_LOGGED_PARAMS_LENGTH] + "..."
+    logger.warning(f"Slow query ({elapsed * 1000:.1f} ms): {statement} | params: {params}")
+
+    if settings.SQL_EXPLAIN_SLOW_QUERIES and not executemany and statement.lstrip().upper().startswith("SELECT"):
+        plan = explain(conn, statement, parameters)
+        if plan:
+            logger.warning("Query plan:\n" + "\n".join(plan))
+
+
+def explain(conn, statement: str, parameters) -> List[str]:
+    """Get the plan of a statement as text rows, without firing engine events"""
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [" | ".join(str(value) for value in row) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.debug(f"EXPLAIN failed: {e}")
+        return []
+    finally:
+        cursor.close()
+
+
+def format_server_timing(stats: QueryStats, total: float) -> str:
+    """Format stats as a Server-Timing header value"""
+    return f'db;dur={stats.duration_ms:.1f};desc="{stats.count} queries", app;dur={total * 1000:.1f}'
+
+
+class QueryStatsMiddleware:
+    """Track queries per request and report them in a Server-Timing header"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        with track_queries() as stats:
+            async def send_with_timing(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", format_server_timing(stats, time.perf_counter() - started))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                if stats.count >= settings.SQL_REQUEST_QUERY_WARNING:
+                    logger.warning(
+                        f"{scope['method']} {scope['path']} ran {stats.count} queries "
+                        f"({stats.duration_ms:.1f} ms in the database)"
+                    )
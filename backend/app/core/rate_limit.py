@@ -0,0 +1,129 @@
+"""
+Rate limiting
+
+Expensive routes are throttled per route class (RATE_LIMITS, e.g.
+"login": "10/minute") and client: the user on authenticated routes, the IP
+address otherwise (uvicorn takes it from nginx's X-Forwarded-For). Each pair
+gets a token bucket holding up to N tokens that refills at N per period, so
+short bursts pass but the sustained rate is capped. A request finding the
+bucket empty is answered with 429 and a Retry-After header.
+
+With RATE_LIMIT_BACKEND="redis" the buckets live in Redis, updated atomically
+by a Lua script, so all workers share them. With the default "memory" backend,
+or while Redis is unreachable, each worker keeps its own buckets.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import rate_limited_total
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "sahasplit:ratelimit:"
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Returns {allowed (0/1), seconds to wait}; floats are returned as strings
+# because Lua numbers come back from Redis truncated to integers
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed, wait = 0, 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(wait)}
+"""
+
+
+@lru_cache(maxsize=None)
+def parse_limit(limit: str) -> Tuple[int, float]:
+    """Parse "10/minute" into (capacity, tokens per second)"""
+    count, _, period = limit.partition("/")
+    seconds = PERIODS[period.strip().rstrip("s")]
+    return int(count), int(count) / seconds
+
+
+class RateLimiter:
+    """Token buckets in Redis, or in process"""
+
+    def __init__(self, redis_url: Optional[str] = None):
+        self.redis_url = redis_url
+        self._redis = None
+        self._script = None
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def hit(self, name: str, client: str) -> float:
+        """Take a token from a client's bucket; returns 0, or the seconds to wait if it's empty"""
+        limit = settings.RATE_LIMITS.get(name)
+        if not limit:
+            return 0.0
+
+        capacity, rate = parse_limit(limit)
+        key = f"{KEY_PREFIX}{name}:{client}"
+        wait = None
+        if self.redis_url:
+            wait = self._hit_redis(key, capacity, rate)
+        if wait is None:
+            wait = self._hit_local(key, capacity, rate)
+
+        if wait > 0:
+            rate_limited_total.labels(name).inc()
+        return wait
+
+    def _hit_redis(self, key: str, capacity: int, rate: float) -> Optional[float]:
+        try:
+            if self._script is None:
+                self._script = self._client().register_script(TOKEN_BUCKET_SCRIPT)
+            allowed, wait = self._script(keys=[key], args=[capacity, rate, time.time()])
+        except Exception as e:
+            logger.warning(f"Rate limit check failed, limiting in process: {e}")
+            return None
+        return 0.0 if int(allowed) else float(wait)
+
+    def _hit_local(self, key: str, capacity: int, rate: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+
+            # Drop idle buckets now and then so the map stays small
+            if len(self._buckets) > 10000:
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < 3600}
+        return wait
+
+    def clear(self) -> None:
+        """Forget local buckets (for tests)"""
+        with self._lock:
+            self._buckets.clear()
+
+
+rate_limiter = RateLimiter(settings.REDIS_URL if settings.RATE_LIMIT_BACKEND == "redis" else None)
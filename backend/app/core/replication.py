@@ -0,0 +1,126 @@
+"""
+Read replica routing
+
+Read-only endpoints take their session from get_read_db, which uses the
+replica (DATABASE_REPLICA_URL) unless:
+
+- the user committed a write in the last REPLICA_STICKY_SECONDS, so they read
+  their own writes from the primary. The window is kept in Redis (a key per
+  user expiring with it), so it holds whichever worker serves the next read;
+  if Redis can't be reached, reads go to the primary.
+- the replica is lagging: it must have every change_log row the primary had
+  REPLICA_MAX_LAG_SECONDS ago. This is checked at most every
+  REPLICA_LAG_CHECK_SECONDS per process, and a replica that can't be reached
+  counts as lagging.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_SEQ = text("SELECT MAX(seq) FROM change_log")
+
+RECENT_WRITE_PREFIX = "sahasplit:recent_write:"
+
+
+class ReplicaRouter:
+    """Decide per request whether reads can go to the replica"""
+
+    def __init__(self, primary: Engine, replica: Optional[Engine], redis_url: Optional[str] = None):
+        self.primary = primary
+        self.replica = replica
+        self.redis_url = redis_url
+        self._redis = None
+        self._lock = threading.Lock()
+        # This worker's own writers, answered without a Redis round trip
+        self._recent_writes: Dict[int, float] = {}
+        # (time, primary seq) samples, oldest first
+        self._samples: Deque[Tuple[float, int]] = deque()
+        self._healthy = False
+        self._next_check = 0.0
+
+    def mark_write(self, user_id: int) -> None:
+        """Pin a user's reads to the primary for the sticky window"""
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[user_id] = now + settings.REPLICA_STICKY_SECONDS
+            # Drop expired entries now and then so the map stays small
+            if len(self._recent_writes) > 1000:
+                self._recent_writes = {k: v for k, v in self._recent_writes.items() if v > now}
+
+        sticky_ms = int(settings.REPLICA_STICKY_SECONDS * 1000)
+        if self.redis_url and sticky_ms > 0:
+            try:
+                self._client().set(f"{RECENT_WRITE_PREFIX}{user_id}", 1, px=sticky_ms)
+            except Exception as e:
+                logger.warning(f"Failed to record recent write: {e}")
+
+    def recently_wrote(self, user_id: int) -> bool:
+        until = self._recent_writes.get(user_id)
+        if until is not None and until > time.monotonic():
+            return True
+        if not self.redis_url:
+            return False
+        try:
+            return bool(self._client().exists(f"{RECENT_WRITE_PREFIX}{user_id}"))
+        except Exception as e:
+            # Another worker may have taken the write; don't risk a stale read
+            logger.warning(f"Recent write lookup failed, using the primary: {e}")
+            return True
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def use_replica(self, user_id: Optional[int]) -> bool:
+        if self.replica is None:
+            return False
+        if user_id is not None and self.recently_wrote(user_id):
+            return False
+        return self.replica_healthy()
+
+    def replica_healthy(self) -> bool:
+        """Whether the replica is within the allowed lag (cached between checks)"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_check:
+                return self._healthy
+            self._next_check = now + settings.REPLICA_LAG_CHECK_SECONDS
+
+        healthy = self._check_lag(now)
+        if healthy != self._healthy:
+            logger.warning(f"Read replica {'caught up' if healthy else 'lagging or unreachable'}; "
+                           f"reads go to the {'replica' if healthy else 'primary'}")
+        self._healthy = healthy
+        return healthy
+
+    def _check_lag(self, now: float) -> bool:
+        try:
+            with self.primary.connect() as conn:
+                primary_seq = conn.execute(MAX_SEQ).scalar() or 0
+            with self.replica.connect() as conn:
+                replica_seq = conn.execute(MAX_SEQ).scalar() or 0
+        except Exception as e:
+            logger.warning(f"Replica lag check failed: {e}")
+            return False
+
+        with self._lock:
+            self._samples.append((now, primary_seq))
+            cutoff = now - settings.REPLICA_MAX_LAG_SECONDS
+            while len(self._samples) > 1 and self._samples[1][0] <= cutoff:
+                self._samples.popleft()
+            # Until a sample is old enough, require the oldest one we have
+            required = self._samples[0][1]
+
+        return replica_seq >= required
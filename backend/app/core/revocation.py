@@ -0,0 +1,271 @@
+"""
+Token revocation list
+
+Logging out revokes access tokens by digest until they would have expired
+anyway. Every authenticated request checks the list, so lookups go through a
+local Bloom filter first: a token that isn't in the filter is certainly not
+revoked, and only filter hits (revoked tokens and the rare false positive) are
+confirmed against the list itself.
+
+Refresh tokens are single-use instead: each is claimed by its jti when it's
+used (or on logout), atomically, so of two concurrent refreshes only one wins.
+The winner's result (the new token pair) is kept for a few seconds, and a
+repeated claim in that window gets it too, so tabs refreshing at the same time
+end up with the same tokens instead of one being logged out. Claims expire
+with the token, and don't go through the list or its filter.
+
+With TOKEN_REVOCATION_BACKEND="redis" the list is a sorted set in Redis
+(digest scored by expiry) shared by all workers, with a change log (digest
+scored by revocation time) beside it. When the list's version counter
+changes, checked at most every TOKEN_REVOCATION_SYNC_SECONDS, each worker adds
+the logged changes since its last sync to its filter, so revocations reach
+other workers within that window (and the revoking worker immediately). The
+filter is rebuilt from the whole list every FILTER_REBUILD_SECONDS to drop
+expired tokens.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+REVOKED_KEY = "sahasplit:revoked_tokens"
+CHANGES_KEY = "sahasplit:revoked_tokens:changes"
+VERSION_KEY = "sahasplit:revoked_tokens:version"
+USED_PREFIX = "sahasplit:used_token:"
+RESULT_PREFIX = "sahasplit:used_token_result:"
+
+# The change log keeps an hour of revocations; filters are rebuilt well within that
+CHANGE_LOG_SECONDS = 3600
+FILTER_REBUILD_SECONDS = 1800
+# Each sync re-reads this much of the log before the last one, for revocations
+# in flight and clock differences between hosts
+SYNC_OVERLAP_SECONDS = 60
+
+# Claims a token and keeps what it was exchanged for; a repeated claim gets that instead
+# (an empty string when the first claim recorded no result)
+CLAIM_SCRIPT = """
+if redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    if ARGV[2] ~= '' then
+        redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+    end
+    return {1, ARGV[2]}
+end
+return {0, redis.call('GET', KEYS[2]) or ''}
+"""
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over hex digests"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: str) -> Iterable[int]:
+        # The digest is already uniformly random; derive k positions by double hashing
+        h1, h2 = int(digest[:16], 16), int(digest[16:32], 16) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, digest: str) -> None:
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+def token_digest(token: str) -> str:
+    """Key for a token in the verified-token cache and the revocation list"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class RevocationList:
+    """Revoked token digests, kept in process or in Redis"""
+
+    def __init__(self, redis_url: Optional[str] = None):
+        self.redis_url = redis_url
+        self._redis = None
+        self._lock = threading.Lock()
+        # In-process list (digest -> expiry), used without Redis
+        self._local: Dict[str, float] = {}
+        # In-process single-use claims (token id -> expiry) and their results
+        # (token id -> (result, kept until)), used without Redis
+        self._used: Dict[str, float] = {}
+        self._results: Dict[str, Tuple[str, float]] = {}
+        self._claim_script = None
+        self._filter = self._new_filter()
+        self._version: Optional[bytes] = None
+        self._next_sync = 0.0
+        # Wall-clock times of the last sync and the last full rebuild
+        self._synced_at: Optional[float] = None
+        self._rebuilt_at: Optional[float] = None
+
+    def _new_filter(self) -> BloomFilter:
+        return BloomFilter(settings.TOKEN_REVOCATION_BLOOM_CAPACITY)
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def revoke(self, digest: str, expires_at: float) -> None:
+        """Revoke a token until it expires"""
+        with self._lock:
+            self._filter.add(digest)
+        if expires_at <= time.time():
+            return
+
+        if not self.redis_url:
+            with self._lock:
+                self._local[digest] = expires_at
+                # Drop expired entries now and then so the map stays small
+                if len(self._local) > 10000:
+                    now = time.time()
+                    self._local = {k: v for k, v in self._local.items() if v > now}
+            return
+
+        now = time.time()
+        try:
+            with self._client().pipeline() as pipe:
+                pipe.zadd(REVOKED_KEY, {digest: expires_at})
+                pipe.zadd(CHANGES_KEY, {digest: now})
+                pipe.zremrangebyscore(REVOKED_KEY, "-inf", now)
+                pipe.zremrangebyscore(CHANGES_KEY, "-inf", now - CHANGE_LOG_SECONDS)
+                pipe.incr(VERSION_KEY)
+                pipe.execute()
+        except Exception as e:
+            # Logging out shouldn't fail because Redis is down
+            logger.warning(f"Failed to revoke token: {e}")
+
+    def use_once(self, token_id: str, expires_at: float) -> bool:
+        """
+        Claim a single-use token (a refresh token) until it expires
+
+        Atomic: True for the first claim only. Also False if Redis can't be
+        reached, so a token can't be replayed while claims aren't recorded.
+        """
+        return self.claim(token_id, expires_at) is not None
+
+    def claim(self, token_id: str, expires_at: float, result: str = "",
+              grace_seconds: float = 0) -> Optional[str]:
+        """
+        Claim a single-use token, recording what it was exchanged for
+
+        Returns `result` for the first claim. A repeated claim within
+        grace_seconds of the first gets the first claim's result instead; after
+        that, or if the first claim recorded no result (logout), returns None.
+        Also None if Redis can't be reached.
+        """
+        now = time.time()
+        if expires_at <= now:
+            return None
+
+        if not self.redis_url:
+            with self._lock:
+                if self._used.get(token_id, 0) > now:
+                    replay, kept_until = self._results.get(token_id, ("", 0))
+                    return replay if replay and kept_until > now else None
+                self._used[token_id] = expires_at
+                if result:
+                    self._results[token_id] = (result, now + grace_seconds)
+                if len(self._used) > 10000:
+                    self._used = {k: v for k, v in self._used.items() if v > now}
+                    self._results = {k: v for k, v in self._results.items() if v[1] > now}
+            return result
+
+        try:
+            if self._claim_script is None:
+                self._claim_script = self._client().register_script(CLAIM_SCRIPT)
+            claimed, value = self._claim_script(
+                keys=[f"{USED_PREFIX}{token_id}", f"{RESULT_PREFIX}{token_id}"],
+                args=[max(1, math.ceil(expires_at - now)), result, max(1, math.ceil(grace_seconds * 1000))]
+            )
+        except Exception as e:
+            logger.warning(f"Failed to claim token, rejecting it: {e}")
+            return None
+        value = value.decode() if isinstance(value, bytes) else value
+        if int(claimed):
+            return result
+        return value or None
+
+    def is_revoked(self, digest: str) -> bool:
+        if self.redis_url:
+            self._sync()
+        if digest not in self._filter:
+            return False
+
+        if not self.redis_url:
+            return self._local.get(digest, 0) > time.time()
+
+        try:
+            expires_at = self._client().zscore(REVOKED_KEY, digest)
+        except Exception as e:
+            # Filter hits are almost always real revocations
+            logger.warning(f"Revocation lookup failed, rejecting token: {e}")
+            return True
+        return expires_at is not None and expires_at > time.time()
+
+    def _sync(self) -> None:
+        """Add other workers' revocations to the filter, or rebuild it now and then"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sync:
+                return
+            self._next_sync = now + settings.TOKEN_REVOCATION_SYNC_SECONDS
+
+        started = time.time()
+        rebuild = self._rebuilt_at is None or started - self._rebuilt_at >= FILTER_REBUILD_SECONDS
+        try:
+            client = self._client()
+            # Read the version first, so changes made meanwhile show up again next time
+            version = client.get(VERSION_KEY)
+            if version == self._version and not rebuild:
+                return
+            if rebuild:
+                digests = client.zrangebyscore(REVOKED_KEY, started, "+inf")
+            else:
+                digests = client.zrangebyscore(CHANGES_KEY, self._synced_at - SYNC_OVERLAP_SECONDS, "+inf")
+        except Exception as e:
+            # Keep the filter we have; this worker's own revocations are in it
+            logger.warning(f"Revocation list sync failed: {e}")
+            return
+
+        digests = _decoded(digests)
+        with self._lock:
+            if rebuild:
+                self._filter = self._new_filter()
+                self._rebuilt_at = started
+            for digest in digests:
+                self._filter.add(digest)
+            self._version = version
+            self._synced_at = started
+
+    def clear(self) -> None:
+        """Forget local state (for tests)"""
+        with self._lock:
+            self._local.clear()
+            self._used.clear()
+            self._results.clear()
+            self._filter = self._new_filter()
+            self._version = None
+            self._next_sync = 0.0
+            self._synced_at = None
+            self._rebuilt_at = None
+
+
+def _decoded(digests: list) -> List[str]:
+    return [digest.decode() if isinstance(digest, bytes) else digest for digest in digests]
+
+
+revocation_list = RevocationList(
+    settings.REDIS_URL if settings.TOKEN_REVOCATION_BACKEND == "redis" else None
+)
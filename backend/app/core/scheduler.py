@@ -0,0 +1,114 @@
+"""
+Scheduled jobs
+
+Runs as its own process, next to the web workers, so each job runs once rather
+than once per worker:
+
+    python -m app.core.scheduler
+
+Jobs:
+    weekly_digest       weekly summary emails, DIGEST_DAY_OF_WEEK at DIGEST_HOUR (UTC)
+    prune_change_log    daily, drops delta sync history older than SYNC_RETENTION_DAYS
+
+A job can also be run once by name (a digest run can resume after a user id):
+
+    python -m app.core.scheduler weekly_digest --start-after 41000
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def weekly_digest(start_after: int = 0) -> None:
+    from app.core import database
+    from app.services.digest_service import send_weekly_digests
+
+    db = database.SessionLocal()
+    try:
+        run = await send_weekly_digests(db, start_after=start_after)
+    finally:
+        db.close()
+    logger.info(f"Weekly digest done: {run.emails_sent} sent, {run.emails_queued} queued for retry, "
+                f"{run.users_scanned} users scanned")
+
+
+def _prune_change_log() -> int:
+    from app.core import database
+    from app.services.sync_service import prune_change_log
+
+    db = database.SessionLocal()
+    try:
+        return prune_change_log(db, datetime.utcnow() - timedelta(days=settings.SYNC_RETENTION_DAYS))
+    finally:
+        db.close()
+
+
+async def prune_change_log_job() -> None:
+    deleted = await asyncio.to_thread(_prune_change_log)
+    logger.info(f"Pruned {deleted} change_log rows")
+
+
+JOBS = {
+    "weekly_digest": weekly_digest,
+    "prune_change_log": prune_change_log_job,
+}
+
+
+def build_scheduler():
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
+    # A run missed while the process was down still happens when it comes back (within the grace time)
+    scheduler = AsyncIOScheduler(timezone="UTC", job_defaults={
+        "coalesce": True,
+        "max_instances": 1,
+        "misfire_grace_time": 6 * 3600,
+    })
+    scheduler.add_job(
+        weekly_digest, CronTrigger(day_of_week=settings.DIGEST_DAY_OF_WEEK, hour=settings.DIGEST_HOUR),
+        id="weekly_digest"
+    )
+    scheduler.add_job(prune_change_log_job, CronTrigger(hour=3, minute=30), id="prune_change_log")
+    return scheduler
+
+
+async def _serve() -> None:
+    from app.services.email_service import email_service
+
+    email_service.precompile_templates()
+    scheduler = build_scheduler()
+    scheduler.start()
+    logger.info("Scheduler started")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        scheduler.shutdown(wait=False)
+        await email_service.close()
+
+
+async def _run_once(job: str, start_after: int) -> None:
+    from app.services.email_service import email_service
+
+    try:
+        if job == "weekly_digest":
+            await weekly_digest(start_after)
+        else:
+            await JOBS[job]()
+    finally:
+        await email_service.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[SCHEDULER] %(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Run scheduled jobs")
+    parser.add_argument("job", nargs="?", choices=sorted(JOBS), help="run one job now and exit")
+    parser.add_argument("--start-after", type=int, default=0, help="weekly_digest: resume after this user id")
+    args = parser.parse_args()
+
+    asyncio.run(_run_once(args.job, args.start_after) if args.job else _serve())
@@ -1,8 +1,26 @@
+import asyncio
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Dict, Optional, TypeVar
 from jose import JWTError, jwt
 import bcrypt
 from app.core.config import settings
+from app.core.metrics import password_hash_duration_seconds, password_hash_queue_depth, record_cache
+from app.core.revocation import revocation_list, token_digest
+
+T = TypeVar("T")
+
+_hash_executor: Optional[ThreadPoolExecutor] = None
+_hash_executor_lock = threading.Lock()
+
+# Claims of tokens whose signature was already checked, by token digest (LRU)
+_verified_tokens: "OrderedDict[str, dict]" = OrderedDict()
+_verified_tokens_lock = threading.Lock()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -12,11 +30,62 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Whether a hash was made with a cost other than BCRYPT_ROUNDS"""
+    # bcrypt hashes look like $2b$12$<salt+hash>
+    parts = hashed_password.split('$')
+    return len(parts) < 4 or not parts[2].isdigit() or int(parts[2]) != settings.BCRYPT_ROUNDS
+
+
+def _password_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        with _hash_executor_lock:
+            if _hash_executor is None:
+                _hash_executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS,
+                    thread_name_prefix="password-hash"
+                )
+    return _hash_executor
+
+
+async def _run_password_job(operation: str, fn: Callable[..., T], *args) -> T:
+    """
+    Run a bcrypt call on the password threads (bcrypt releases the GIL)
+
+    At most PASSWORD_HASH_WORKERS calls run at once; the rest wait in the
+    executor's queue, counted by password_hash_queue_depth.
+    """
+    def job() -> T:
+        password_hash_queue_depth.dec()
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            password_hash_duration_seconds.labels(operation).observe(time.perf_counter() - started)
+
+    password_hash_queue_depth.inc()
+    future = _password_executor().submit(job)
+    # A job cancelled while still queued never runs, so it leaves the queue here
+    future.add_done_callback(lambda f: f.cancelled() and password_hash_queue_depth.dec())
+    return await asyncio.wrap_future(future)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password off the event loop"""
+    return await _run_password_job("verify", verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password off the event loop"""
+    return await _run_password_job("hash", get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -26,7 +95,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    to_encode.update({"exp": expire, "type": "access"})
+    # jti keeps tokens unique, so revoking one never revokes an identical twin
+    to_encode.update({"exp": expire, "type": "access", "jti": secrets.token_urlsafe(12)})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
@@ -35,18 +105,88 @@ def create_refresh_token(data: dict) -> str:
     """Create a JWT refresh token"""
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "type": "refresh"})
+    to_encode.update({"exp": expire, "type": "refresh", "jti": secrets.token_urlsafe(12)})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
 def decode_token(token: str) -> Optional[dict]:
-    """Decode and validate a JWT token"""
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
-    except JWTError:
+    """Decode and validate a JWT token (None if invalid, expired or revoked)"""
+    digest = token_digest(token)
+    payload = _cached_claims(digest)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            return None
+        _cache_claims(digest, payload)
+
+    if revocation_list.is_revoked(digest):
         return None
+    return payload
+
+
+def _refresh_token_id(token: str, payload: dict) -> str:
+    return payload.get("jti") or token_digest(token)
+
+
+def use_refresh_token(token: str, payload: dict, issued: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """
+    Claim a decoded refresh token in exchange for newly issued tokens
+
+    Returns `issued` for the first use. A reuse within
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS gets the tokens issued then, so
+    concurrent refreshes (several tabs) agree; later reuses get None, as do
+    tokens that can't be claimed.
+    """
+    result = revocation_list.claim(
+        _refresh_token_id(token, payload), payload.get("exp", 0), json.dumps(issued),
+        settings.REFRESH_TOKEN_REUSE_GRACE_SECONDS
+    )
+    return json.loads(result) if result else None
+
+
+def revoke_token(token: str) -> bool:
+    """Revoke a valid token until it expires; returns False if it wasn't valid"""
+    payload = decode_token(token)
+    if payload is None:
+        return False
+    if payload.get("type") == "refresh":
+        # Refresh tokens are single-use; claiming one retires it without growing the list
+        revocation_list.use_once(_refresh_token_id(token, payload), payload.get("exp", 0))
+        return True
+
+    digest = token_digest(token)
+    revocation_list.revoke(digest, payload.get("exp", 0))
+    with _verified_tokens_lock:
+        _verified_tokens.pop(digest, None)
+    return True
+
+
+def _cached_claims(digest: str) -> Optional[dict]:
+    with _verified_tokens_lock:
+        payload = _verified_tokens.get(digest)
+        if payload is not None:
+            if payload.get("exp", float("inf")) <= time.time():
+                del _verified_tokens[digest]
+                payload = None
+            else:
+                _verified_tokens.move_to_end(digest)
+    record_cache("jwt", payload is not None)
+    return payload
+
+
+def _cache_claims(digest: str, payload: dict) -> None:
+    with _verified_tokens_lock:
+        _verified_tokens[digest] = payload
+        while len(_verified_tokens) > settings.TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+
+
+def clear_token_cache() -> None:
+    """Forget verified tokens (for tests)"""
+    with _verified_tokens_lock:
+        _verified_tokens.clear()
 
 
 def create_magic_link_token(email: str) -> str:
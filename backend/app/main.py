@@ -1,15 +1,29 @@
 """
 Main FastAPI application
 """
+import asyncio
 import logging
 import sys
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import exc as sa_exc
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.core.database import engine, Base
-from app.api.routers import auth, expense, group, user, bank, health
+from app.core.compression import CompressionMiddleware
+from app.core.metrics import MetricsMiddleware, mark_process_dead
+from app.core.profiling import ProfilingMiddleware
+from app.core.query_stats import QueryStatsMiddleware
+from app.core.database import engine, replica_engine, warm_up_pool
+from app.core.migrations import check_schema_revision
+from app.api.routers import auth, expense, group, user, bank, health, sync, batch, metrics
+from app.services.realtime_service import realtime_service
+from app.services.email_service import email_service
+from app.services.oidc_service import close_http_client as close_oidc_client
+from app.services.outbox_service import outbox_dispatcher
+from app.services.push_service import close_http_client as close_push_client
+from app.services.session_service import session_store
 
 # Import all models to ensure they are registered with Base.metadata
 from app.models import models  # noqa: F401
@@ -40,21 +54,51 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """
     Application lifespan handler - runs on startup and shutdown.
-    Creates database tables if they don't exist (like Hibernate's create-if-not-exists).
+    Checks the database is migrated (migrations run before the workers start).
     """
-    # Startup: Create all tables that don't exist
-    logger.info("Starting up - checking database tables...")
+    if settings.DB_SCHEMA_CHECK:
+        logger.info("Starting up - checking database revision...")
+        try:
+            await asyncio.to_thread(check_schema_revision, engine)
+            logger.info("Database schema is up to date")
+        except Exception as e:
+            logger.error(f"Database schema check failed: {e}")
+            raise
+
+    # Pre-open pooled connections
+    if settings.DB_POOL_WARMUP:
+        for pool_engine in filter(None, (engine, replica_engine)):
+            try:
+                opened = await asyncio.to_thread(warm_up_pool, pool_engine)
+                logger.info(f"Opened {opened} pooled database connections")
+            except Exception as e:
+                logger.warning(f"Failed to warm up the connection pool: {e}")
+
+    # Compile email templates now rather than on the first email
     try:
-        Base.metadata.create_all(bind=engine)
-        logger.info("Database tables created/verified successfully")
+        compiled = await asyncio.to_thread(email_service.precompile_templates)
+        logger.info(f"Compiled {compiled} email templates")
     except Exception as e:
-        logger.error(f"Failed to create database tables: {e}")
-        raise
+        logger.warning(f"Failed to compile email templates: {e}")
+
+    # Receive other workers' change events (live streams, membership cache eviction)
+    await realtime_service.start()
+    # Mirror server-side sessions to the database in the background
+    await session_store.start()
+    # Send queued emails and push notifications
+    await outbox_dispatcher.start()
 
     yield  # Application runs here
 
     # Shutdown: cleanup if needed
     logger.info("Shutting down...")
+    await realtime_service.stop()
+    await session_store.stop()
+    await outbox_dispatcher.stop()
+    await email_service.close()
+    await close_oidc_client()
+    await close_push_client()
+    mark_process_dead()
 
 
 # Create FastAPI app
@@ -65,9 +109,22 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
+
+@app.exception_handler(sa_exc.TimeoutError)
+async def pool_exhausted_handler(request: Request, exc: sa_exc.TimeoutError):
+    """Shed load when no pooled connection frees up in time, instead of queuing"""
+    logger.warning(f"Connection pool exhausted: {request.method} {request.url.path}")
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -75,8 +132,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing"],
 )
 
+# Opt-in profiles (inside the query counter, so they're tagged with the query count)
+app.add_middleware(ProfilingMiddleware)
+
+# Query count and database time per request, reported in Server-Timing
+app.add_middleware(QueryStatsMiddleware)
+
+# Request counts and latency per route for /metrics
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Brotli/gzip for responses above the size threshold
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
+
 # Include routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(expense.router, prefix="/api")
@@ -84,6 +155,10 @@ app.include_router(group.router, prefix="/api")
 app.include_router(user.router, prefix="/api")
 app.include_router(bank.router, prefix="/api")
 app.include_router(health.router, prefix="/api")
+app.include_router(sync.router, prefix="/api")
+app.include_router(batch.router, prefix="/api")
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -13,6 +13,8 @@ from app.models.models import (
     Balance,
     GroupBalance,
     BalanceView,
+    BalanceCheckpoint,
+    ChangeLog,
     CachedCurrencyRate,
     CachedBankData,
     PushNotification,
@@ -33,6 +35,8 @@ __all__ = [
     "Balance",
     "GroupBalance",
     "BalanceView",
+    "BalanceCheckpoint",
+    "ChangeLog",
     "CachedCurrencyRate",
     "CachedBankData",
     "PushNotification",
@@ -38,6 +38,8 @@ class User(Base):
     # Notification preferences stored as JSON (nullable for MySQL compatibility)
     notification_preferences = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=True)
+    # Bumped whenever an expense involving this user changes (drives friend-ledger ETags)
+    ledger_version = Column(BigInteger, default=0, server_default="0", nullable=False)
 
     # Relationships
     accounts = relationship("Account", back_populates="user", cascade="all, delete-orphan")
@@ -86,6 +88,10 @@ class Session(Base):
     session_token = Column(String(255), unique=True, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     expires = Column(DateTime, nullable=False)
+    # Device details for the active sessions list
+    user_agent = Column(String(255), nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    last_active_at = Column(DateTime, nullable=True)
 
     # Relationships
     user = relationship("User", back_populates="sessions")
@@ -118,6 +124,8 @@ class Group(Base):
     splitwise_group_id = Column(String(255), unique=True, nullable=True)
     simplify_debts = Column(Boolean, default=False, nullable=False)
     archived_at = Column(DateTime, nullable=True)
+    # Bumped on every write to the group, its members, expenses or balances (drives ETags)
+    version = Column(BigInteger, default=0, server_default="0", nullable=False)
 
     # Relationships
     created_by = relationship("User", back_populates="groups")
@@ -175,6 +183,8 @@ class Expense(Base):
     __table_args__ = (
         Index("idx_expense_group_id", "group_id"),
         Index("idx_expense_paid_by", "paid_by"),
+        Index("idx_expense_group_date", "group_id", "expense_date"),
+        Index("idx_expense_paid_by_date", "paid_by", "expense_date"),
     )
 
 
@@ -259,6 +269,45 @@ class BalanceView(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
 
+class BalanceCheckpoint(Base):
+    """
+    Monthly balance checkpoint - a user's cumulative balances before the start of `month`
+
+    Rows are built lazily by balance_history_service and dropped whenever an expense
+    dated before `month` changes, so they never need to be refreshed in place.
+    """
+    __tablename__ = "balance_checkpoints"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    month = Column(DateTime, primary_key=True)
+    # List of [friend_id, group_id, currency, amount] entries
+    balances = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ChangeLog(Base):
+    """
+    Change sequence for delta sync
+
+    One row per changed entity and audience: group-scoped rows (group_id) are
+    visible to every member, user-scoped rows (user_id) only to that user.
+    """
+    __tablename__ = "change_log"
+
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    entity_type = Column(String(32), nullable=False)  # expense, note, group, membership, balance
+    entity_id = Column(String(64), nullable=False)
+    op = Column(String(10), nullable=False)  # upsert or delete
+    group_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("idx_change_log_user_seq", "user_id", "seq"),
+        Index("idx_change_log_group_seq", "group_id", "seq"),
+    )
+
+
 class CachedCurrencyRate(Base):
     """Cached currency exchange rates - matches Prisma CachedCurrencyRate"""
     __tablename__ = "cached_currency_rates"
@@ -294,9 +343,50 @@ class CachedBankData(Base):
 
 
 class PushNotification(Base):
-    """Push notification subscription - matches Prisma PushNotification"""
+    """
+    Push notification subscription - one per device a user turned notifications on
+
+    The endpoint URL identifies the device's subscription, so registering the
+    same endpoint again (even as another user on the same browser) updates the row.
+    """
     __tablename__ = "push_notifications"
 
-    user_id = Column(Integer, primary_key=True)
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # SHA-256 of the endpoint, which can be too long to index
+    endpoint_hash = Column(String(64), unique=True, nullable=False)
     subscription = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("idx_push_notifications_user_id", "user_id"),
+    )
 
+
+class OutboxMessage(Base):
+    """
+    Email or push notification waiting to be sent
+
+    Written in the same transaction as the change that caused it and sent by
+    the background dispatcher, which deletes it once delivered. Messages that
+    keep failing are kept with status "dead".
+    """
+    __tablename__ = "outbox"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    kind = Column(String(20), nullable=False)  # email, push or expense_activity
+    payload = Column(JSON, nullable=False)
+    status = Column(String(10), default="pending", nullable=False)  # pending or dead
+    attempts = Column(Integer, default=0, nullable=False)
+    # Not sent before this time (retry backoff, or the lease of the worker sending it)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+    # Later messages with the same key are folded into this one until it's first claimed
+    coalesce_key = Column(String(100), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("idx_outbox_status_available", "status", "available_at"),
+        Index("idx_outbox_coalesce_key", "coalesce_key"),
+    )
@@ -0,0 +1,32 @@
+"""
+Pydantic schemas for batched requests
+"""
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+
+class BatchSubRequest(BaseModel):
+    """One read to run inside a batch"""
+    id: Optional[str] = Field(None, description="Client key echoed back in the result")
+    method: str = Field("GET", description="Only GET is supported")
+    path: str = Field(..., description="API path without the /api prefix, e.g. /groups/1/balances")
+    query: Dict[str, Any] = {}
+    headers: Dict[str, str] = Field({}, description="Only If-None-Match is forwarded")
+
+
+class BatchRequest(BaseModel):
+    """Schema for POST /batch"""
+    requests: List[BatchSubRequest]
+
+
+class BatchSubResponse(BaseModel):
+    """Result of one sub-request"""
+    id: Optional[str] = None
+    status: int
+    headers: Dict[str, str] = {}
+    body: Any = None
+
+
+class BatchResponse(BaseModel):
+    """Schema for the combined batch result, in request order"""
+    responses: List[BatchSubResponse]
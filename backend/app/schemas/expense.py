@@ -3,7 +3,7 @@ Pydantic schemas for expense-related requests and responses
 """
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime
 from app.models.models import SplitType
 
 
@@ -106,6 +106,15 @@ class BalanceResponse(BaseModel):
         from_attributes = True
 
 
+class BalanceAsOfResponse(BaseModel):
+    """Schema for a point-in-time balance with one friend"""
+    friend_id: int
+    group_id: Optional[int]
+    currency: str
+    amount: int
+    as_of: date
+
+
 class CurrencyConversionCreate(BaseModel):
     """Schema for creating currency conversion"""
     from_expense: ExpenseCreate
@@ -0,0 +1,40 @@
+"""
+Pydantic schemas for delta sync responses
+"""
+from pydantic import BaseModel, Field
+from typing import List
+from datetime import datetime
+from app.schemas.expense import ExpenseDetailResponse, BalanceResponse
+from app.schemas.group import GroupResponse
+
+
+class SyncNote(BaseModel):
+    """Schema for a changed expense note"""
+    id: str
+    note: str
+    created_by_id: int
+    created_at: datetime
+    expense_id: str
+
+    class Config:
+        from_attributes = True
+
+
+class SyncMembership(BaseModel):
+    """Schema for a group membership change"""
+    group_id: int
+    user_id: int
+
+
+class SyncResponse(BaseModel):
+    """Schema for a page of changes since a sync token"""
+    next_token: str = Field(..., description="Token to pass as `since` on the next call")
+    has_more: bool = Field(..., description="More changes are waiting; call again immediately")
+    expenses: List[ExpenseDetailResponse] = []
+    notes: List[SyncNote] = []
+    deleted_note_ids: List[str] = []
+    groups: List[GroupResponse] = []
+    deleted_group_ids: List[int] = []
+    memberships: List[SyncMembership] = []
+    removed_memberships: List[SyncMembership] = []
+    balances: List[BalanceResponse] = []
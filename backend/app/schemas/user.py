@@ -1,7 +1,7 @@
 """
 Pydantic schemas for user-related requests and responses
 """
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional, List, Dict
 from datetime import datetime
 
@@ -50,6 +50,15 @@ class TokenResponse(BaseModel):
     user: UserResponse
 
 
+class SessionResponse(BaseModel):
+    """Schema for an active login session"""
+    id: str
+    user_agent: Optional[str] = None
+    created_at: Optional[datetime] = None
+    last_active_at: Optional[datetime] = None
+    current: bool = False
+
+
 class MagicLinkRequest(BaseModel):
     """Schema for magic link email request"""
     email: EmailStr
@@ -109,4 +118,11 @@ class PushSubscriptionRequest(BaseModel):
     """Schema for push notification subscription"""
     subscription: str = Field(..., description="Push subscription JSON from browser")
 
+    @field_validator('subscription')
+    def validate_subscription(cls, v):
+        from app.services.push_service import parse_subscription
+
+        parse_subscription(v)
+        return v
+
 
@@ -0,0 +1,181 @@
+"""
+Balance history service - point-in-time ("balance as of date") queries
+
+Balances are aggregated in SQL from expenses.expense_date and expense_participants
+instead of being replayed client-side. Cumulative totals are cached per user at the
+start of each month (BalanceCheckpoint), so a query reads one checkpoint plus at
+most one month of raw expense rows.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, or_, func
+
+from app.models.models import Expense, ExpenseParticipant, BalanceCheckpoint
+
+# (friend_id, group_id, currency)
+BalanceKey = Tuple[int, Optional[int], str]
+
+
+def month_start(value: datetime) -> datetime:
+    """First instant of the month containing `value`"""
+    return datetime(value.year, value.month, 1)
+
+
+def _aggregate_balances(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime],
+    end: datetime
+) -> Dict[BalanceKey, int]:
+    """
+    Sum a user's balance changes for non-deleted expenses dated in [start, end)
+
+    Uses the BalanceView sign convention: positive means the user owes the friend,
+    negative means the friend owes the user.
+    """
+    filters = [
+        Expense.deleted_at.is_(None),
+        Expense.expense_date < end,
+        or_(
+            and_(Expense.paid_by == user_id, ExpenseParticipant.user_id != user_id),
+            and_(ExpenseParticipant.user_id == user_id, Expense.paid_by != user_id)
+        )
+    ]
+    if start is not None:
+        filters.append(Expense.expense_date >= start)
+
+    rows = db.query(
+        Expense.paid_by,
+        ExpenseParticipant.user_id,
+        Expense.group_id,
+        Expense.currency,
+        func.sum(ExpenseParticipant.amount)
+    ).join(
+        ExpenseParticipant, ExpenseParticipant.expense_id == Expense.id
+    ).filter(*filters).group_by(
+        Expense.paid_by, ExpenseParticipant.user_id, Expense.group_id, Expense.currency
+    ).all()
+
+    totals: Dict[BalanceKey, int] = {}
+    for paid_by, participant_id, group_id, currency, amount in rows:
+        if paid_by == user_id:
+            key, delta = (participant_id, group_id, currency), -int(amount)
+        else:
+            key, delta = (paid_by, group_id, currency), int(amount)
+        totals[key] = totals.get(key, 0) + delta
+
+    return totals
+
+
+def _decode(balances: List[list]) -> Dict[BalanceKey, int]:
+    return {(friend_id, group_id, currency): amount for friend_id, group_id, currency, amount in balances}
+
+
+def _encode(totals: Dict[BalanceKey, int]) -> List[list]:
+    return [[friend_id, group_id, currency, amount]
+            for (friend_id, group_id, currency), amount in totals.items() if amount != 0]
+
+
+def get_checkpoint(db: Session, user_id: int, month: datetime) -> Dict[BalanceKey, int]:
+    """
+    Get a user's cumulative balances for all expenses dated before `month`
+
+    Missing checkpoints are built from the nearest earlier cached checkpoint plus
+    an aggregate over the months in between, then cached for past months.
+    """
+    cached = db.query(BalanceCheckpoint).filter(
+        BalanceCheckpoint.user_id == user_id,
+        BalanceCheckpoint.month == month
+    ).first()
+
+    if cached:
+        return _decode(cached.balances)
+
+    previous = db.query(BalanceCheckpoint).filter(
+        BalanceCheckpoint.user_id == user_id,
+        BalanceCheckpoint.month < month
+    ).order_by(BalanceCheckpoint.month.desc()).first()
+
+    totals = _decode(previous.balances) if previous else {}
+    for key, amount in _aggregate_balances(db, user_id, previous.month if previous else None, month).items():
+        totals[key] = totals.get(key, 0) + amount
+
+    # Only checkpoint months that have started - later ones would go stale as soon as
+    # anyone adds an expense for today
+    if month <= month_start(datetime.utcnow()):
+        try:
+            db.add(BalanceCheckpoint(user_id=user_id, month=month, balances=_encode(totals)))
+            db.commit()
+        except IntegrityError:
+            # Another request cached the same checkpoint first
+            db.rollback()
+
+    return totals
+
+
+def get_balances_as_of(
+    db: Session,
+    user_id: int,
+    as_of: date,
+    friend_id: Optional[int] = None,
+    group_id: Optional[int] = None
+) -> List[Dict]:
+    """
+    Get a user's balances including every expense dated on or before `as_of`
+
+    Args:
+        db: Database session
+        user_id: User whose perspective the balances are computed from
+        as_of: Last day (inclusive) to include
+        friend_id: Only return balances with this friend
+        group_id: Only return balances within this group
+
+    Returns:
+        List of {friend_id, group_id, currency, amount} with non-zero amounts
+    """
+    end = datetime.combine(as_of, datetime.min.time()) + timedelta(days=1)
+    month = month_start(end - timedelta(microseconds=1))
+
+    totals = dict(get_checkpoint(db, user_id, month))
+    for key, amount in _aggregate_balances(db, user_id, month, end).items():
+        totals[key] = totals.get(key, 0) + amount
+
+    return [
+        {"friend_id": f_id, "group_id": g_id, "currency": currency, "amount": amount}
+        for (f_id, g_id, currency), amount in sorted(totals.items(), key=lambda item: (item[0][0], item[0][1] or 0, item[0][2]))
+        if amount != 0
+        and (friend_id is None or f_id == friend_id)
+        and (group_id is None or g_id == group_id)
+    ]
+
+
+def invalidate_checkpoints(
+    db: Session,
+    user_ids: Iterable[int],
+    since: Optional[datetime] = None
+) -> None:
+    """
+    Drop cached checkpoints affected by an expense dated `since`
+
+    A checkpoint for month M covers expenses dated before M, so only checkpoints
+    after `since` are stale. Without `since` every checkpoint of the users is dropped.
+    Does not commit; callers commit together with the expense change.
+
+    The DateTime columns are naive. An aware `since` is compared as the earlier
+    of its wall-clock time (what the driver stores) and its UTC time, so no
+    checkpoint it could affect is kept.
+    """
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return
+
+    if since is not None and since.tzinfo is not None:
+        since = min(since.replace(tzinfo=None), since.astimezone(timezone.utc).replace(tzinfo=None))
+
+    query = db.query(BalanceCheckpoint).filter(BalanceCheckpoint.user_id.in_(user_ids))
+    if since is not None:
+        query = query.filter(BalanceCheckpoint.month > since)
+
+    query.delete(synchronize_session=False)
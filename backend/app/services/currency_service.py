@@ -4,10 +4,10 @@ Supports multiple providers: Frankfurter (free), Open Exchange Rates, NBP
 """
 from typing import Optional, Dict
 from datetime import date, datetime, timedelta
-import httpx
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.core.metrics import record_cache, track_external
 from app.models.models import CachedCurrencyRate
 
 
@@ -104,8 +104,10 @@ class CurrencyRateService:
             # Check if cache is still valid
             cache_age = datetime.utcnow() - cached.cached_at
             if cache_age < self.cache_duration:
+                record_cache("currency", True)
                 return cached.rate
 
+        record_cache("currency", False)
         return None
 
     def _cache_rate(
@@ -147,6 +149,8 @@ class CurrencyRateService:
         rate_date: date
     ) -> float:
         """Fetch rate from Frankfurter API"""
+        import httpx
+
         async with httpx.AsyncClient() as client:
             # Format date as YYYY-MM-DD
             date_str = rate_date.strftime("%Y-%m-%d")
@@ -159,8 +163,9 @@ class CurrencyRateService:
             }
 
             try:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
+                with track_external("frankfurter", "rates"):
+                    response = await client.get(url, params=params)
+                    response.raise_for_status()
                 data = response.json()
 
                 # Extract rate from response
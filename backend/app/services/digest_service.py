@@ -0,0 +1,249 @@
+"""
+Digest service - the weekly summary email
+
+Users who turned on email_weekly_summary get a weekly email with the expenses
+added in the past seven days that involve them, how those moved their balance
+with each friend, and what they owe or are owed overall.
+
+The job streams users in id order, DIGEST_CHUNK_SIZE at a time, so memory
+stays flat however many users there are. Each chunk costs the same four
+queries whatever its size (users, the week's expenses, outstanding balances
+and friend names). Emails are rendered from the compiled templates and handed
+to the bulk sender; any the relay rejects are queued in the outbox to be
+retried.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, union
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import BalanceView, Expense, ExpenseParticipant, User
+from app.schemas.user import NotificationPreferences
+from app.services.email_service import email_service
+from app.services.outbox_service import queue_email
+from app.utils.numbers import format_money
+
+logger = logging.getLogger(__name__)
+
+# (user_id, name, email, notification_preferences)
+UserRow = Tuple[int, Optional[str], str, Optional[dict]]
+
+Sender = Callable[[List[Dict[str, str]]], Awaitable[List[Optional[Exception]]]]
+
+
+@dataclass
+class DigestRun:
+    """Counts from one run of the weekly digest job"""
+    users_scanned: int = 0
+    emails_sent: int = 0
+    emails_queued: int = 0
+    last_user_id: int = 0
+
+
+def digest_window(now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """The seven days up to the start of today (UTC)"""
+    now = now or datetime.utcnow()
+    end = datetime(now.year, now.month, now.day)
+    return end - timedelta(days=7), end
+
+
+def wants_digest(preferences: Optional[dict]) -> bool:
+    return NotificationPreferences(**(preferences or {})).email_weekly_summary
+
+
+def _user_chunk(db: Session, after_id: int, limit: int) -> List[UserRow]:
+    return db.query(User.id, User.name, User.email, User.notification_preferences).filter(
+        User.id > after_id,
+        User.email.isnot(None)
+    ).order_by(User.id).limit(limit).all()
+
+
+def _week_expenses(db: Session, user_ids: List[int], start: datetime, end: datetime):
+    """Participant rows of the week's new expenses paid by or shared with the users"""
+    # A union rather than an OR across the join, so each side can use its index
+    involved = union(
+        select(Expense.id).where(Expense.paid_by.in_(user_ids)),
+        select(ExpenseParticipant.expense_id).where(ExpenseParticipant.user_id.in_(user_ids))
+    )
+    return db.query(
+        Expense.id, Expense.name, Expense.amount, Expense.currency, Expense.created_at, Expense.paid_by,
+        ExpenseParticipant.user_id, ExpenseParticipant.amount
+    ).join(
+        ExpenseParticipant, ExpenseParticipant.expense_id == Expense.id
+    ).filter(
+        Expense.created_at >= start,
+        Expense.created_at < end,
+        Expense.deleted_at.is_(None),
+        Expense.id.in_(involved)
+    ).order_by(Expense.created_at).all()
+
+
+def _outstanding_balances(db: Session, user_ids: List[int]):
+    """Balances with each friend, summed over groups (BalanceView sign: positive means the user owes)"""
+    return db.query(
+        BalanceView.user_id, BalanceView.friend_id, BalanceView.currency, func.sum(BalanceView.amount)
+    ).filter(
+        BalanceView.user_id.in_(user_ids)
+    ).group_by(
+        BalanceView.user_id, BalanceView.friend_id, BalanceView.currency
+    ).having(func.sum(BalanceView.amount) != 0).all()
+
+
+def _friend_names(db: Session, friend_ids: Iterable[int]) -> Dict[int, str]:
+    ids = list(set(friend_ids))
+    if not ids:
+        return {}
+    return {
+        friend_id: name or (email or "").split("@")[0] or "A friend"
+        for friend_id, name, email in db.query(User.id, User.name, User.email).filter(User.id.in_(ids)).all()
+    }
+
+
+def _amount_lines(totals: Dict[Tuple[int, str], int], names: Dict[int, str]) -> List[Dict[str, Any]]:
+    """Per-friend amounts as template rows, by friend name"""
+    lines = [
+        {
+            "friend": names.get(friend_id, "A friend"),
+            "amount": format_money(abs(amount), currency),
+            "owes_you": amount < 0,
+        }
+        for (friend_id, currency), amount in totals.items() if amount != 0
+    ]
+    return sorted(lines, key=lambda line: line["friend"])
+
+
+def build_digests(
+    db: Session,
+    users: List[UserRow],
+    start: datetime,
+    end: datetime
+) -> List[Dict[str, Any]]:
+    """
+    Template contexts for a chunk of users' digests
+
+    Users with no new expenses and nothing outstanding get no digest.
+    """
+    by_id = {user_id: (name, email) for user_id, name, email, _ in users}
+    if not by_id:
+        return []
+    user_ids = list(by_id)
+
+    expenses: Dict[int, Dict[str, dict]] = {user_id: {} for user_id in user_ids}
+    changes: Dict[int, Dict[Tuple[int, str], int]] = {user_id: {} for user_id in user_ids}
+    friend_ids = set()
+
+    for expense_id, name, amount, currency, created_at, paid_by, participant_id, share in _week_expenses(
+        db, user_ids, start, end
+    ):
+        for user_id in {paid_by, participant_id} & by_id.keys():
+            entry = expenses[user_id].setdefault(expense_id, {
+                "name": name,
+                "amount": format_money(amount, currency),
+                "date": created_at,
+                "paid_by_you": paid_by == user_id,
+                "your_share": None,
+            })
+            if participant_id == user_id:
+                entry["your_share"] = format_money(share, currency)
+        if paid_by == participant_id or not share:
+            continue
+        # BalanceView sign: positive means the user owes the friend
+        if paid_by in by_id:
+            key = (participant_id, currency)
+            changes[paid_by][key] = changes[paid_by].get(key, 0) - share
+            friend_ids.add(participant_id)
+        if participant_id in by_id:
+            key = (paid_by, currency)
+            changes[participant_id][key] = changes[participant_id].get(key, 0) + share
+            friend_ids.add(paid_by)
+
+    balances: Dict[int, Dict[Tuple[int, str], int]] = {user_id: {} for user_id in user_ids}
+    for user_id, friend_id, currency, amount in _outstanding_balances(db, user_ids):
+        balances[user_id][(friend_id, currency)] = int(amount)
+        friend_ids.add(friend_id)
+
+    names = _friend_names(db, friend_ids)
+
+    digests = []
+    for user_id in user_ids:
+        if not expenses[user_id] and not balances[user_id]:
+            continue
+        name, email = by_id[user_id]
+        week_expenses = list(expenses[user_id].values())
+        digests.append({
+            "user_id": user_id,
+            "email": email,
+            "name": name or email.split("@")[0],
+            "start": start,
+            "end": end - timedelta(days=1),
+            "expenses": week_expenses[:settings.DIGEST_MAX_EXPENSES],
+            "more_expenses": max(0, len(week_expenses) - settings.DIGEST_MAX_EXPENSES),
+            "changes": _amount_lines(changes[user_id], names),
+            "balances": _amount_lines(balances[user_id], names),
+        })
+    return digests
+
+
+def _day(value: datetime) -> str:
+    return f"{value:%b} {value.day}"
+
+
+def render_digest(context: Dict[str, Any]) -> Dict[str, str]:
+    """A digest as send_email arguments"""
+    return {
+        "to_email": context["email"],
+        "subject": f"Your SAHASplit week: {_day(context['start'])} - {_day(context['end'])}",
+        "html_content": email_service.render("weekly_digest.html", **context),
+        "text_content": email_service.render("weekly_digest.txt", **context),
+    }
+
+
+async def send_weekly_digests(
+    db: Session,
+    now: Optional[datetime] = None,
+    start_after: int = 0,
+    sender: Optional[Sender] = None
+) -> DigestRun:
+    """
+    Send the weekly digest to every opted-in user
+
+    Args:
+        db: Database session
+        now: When the run is for (defaults to now); the digest covers the 7 days before that day
+        start_after: Resume after this user id (a run's last_user_id)
+        sender: Bulk sender returning each message's error or None (defaults to the SMTP pool)
+
+    Returns:
+        DigestRun with counts and the last user id processed
+    """
+    sender = sender or email_service.deliver_many
+    start, end = digest_window(now)
+    run = DigestRun(last_user_id=start_after)
+
+    while True:
+        chunk = _user_chunk(db, run.last_user_id, settings.DIGEST_CHUNK_SIZE)
+        if not chunk:
+            break
+        run.users_scanned += len(chunk)
+        run.last_user_id = chunk[-1][0]
+
+        users = [row for row in chunk if wants_digest(row[3])]
+        messages = [render_digest(context) for context in build_digests(db, users, start, end)]
+
+        if messages:
+            errors = await sender(messages)
+            failed = [message for message, error in zip(messages, errors) if error is not None]
+            for message in failed:
+                queue_email(db, **message)
+            db.commit()
+            run.emails_sent += len(messages) - len(failed)
+            run.emails_queued += len(failed)
+
+        logger.info(f"Weekly digest: {run.users_scanned} users scanned, {run.emails_sent} sent, "
+                    f"{run.emails_queued} queued for retry, up to user {run.last_user_id}")
+
+    return run
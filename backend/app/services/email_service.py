@@ -1,16 +1,146 @@
 """
 Email service for sending transactional emails
+
+Messages go out over a per-worker pool of authenticated SMTP connections
+(SMTP_POOL_SIZE), so the TCP, STARTTLS and AUTH handshake is paid once per
+connection rather than once per message. Idle connections are checked with
+NOOP before reuse (after SMTP_NOOP_AFTER_SECONDS) and closed after
+SMTP_POOL_IDLE_SECONDS, before the relay drops them; each is retired after
+SMTP_MAX_MESSAGES_PER_CONNECTION messages. A message whose connection turns
+out to have been dropped is retried once on a fresh one.
+
+Bodies are rendered from the Jinja templates in templates/emails. They are
+compiled once per worker (precompile_templates runs at startup) and the
+compiled bytecode is cached on disk in EMAIL_TEMPLATE_CACHE_DIR.
 """
-import aiosmtplib
+import asyncio
+import time
+from email.message import Message
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional
-from jinja2 import Environment, FileSystemLoader
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlencode
 import os
 
 from app.core.config import settings
+from app.core.metrics import track_external
 from app.models.models import User
 
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), '..', 'templates', 'emails')
+
+
+class _PooledConnection:
+    def __init__(self, client):
+        self.client = client
+        self.messages = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """Authenticated SMTP connections, kept open and reused between messages"""
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        start_tls: bool = True,
+        size: int = 4
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.size = size
+        # Most recently used last, so busy connections stay warm and the rest age out
+        self._idle: List[_PooledConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.connections_opened = 0
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Connections belong to the event loop that opened them
+            self._loop = loop
+            self._idle = []
+            self._slots = asyncio.Semaphore(self.size)
+
+    async def _connect(self) -> _PooledConnection:
+        import aiosmtplib
+
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            start_tls=self.start_tls,
+            timeout=settings.SMTP_TIMEOUT_SECONDS
+        )
+        with track_external("smtp", "connect"):
+            await client.connect()
+        self.connections_opened += 1
+        return _PooledConnection(client)
+
+    async def _close(self, connection: _PooledConnection) -> None:
+        try:
+            if connection.client.is_connected:
+                await connection.client.quit()
+        except Exception:
+            connection.client.close()
+
+    async def _checkout(self) -> _PooledConnection:
+        while self._idle:
+            connection = self._idle.pop()
+            idle = time.monotonic() - connection.last_used
+            if idle > settings.SMTP_POOL_IDLE_SECONDS or not connection.client.is_connected:
+                await self._close(connection)
+                continue
+            if idle > settings.SMTP_NOOP_AFTER_SECONDS:
+                try:
+                    await connection.client.noop()
+                except Exception:
+                    connection.client.close()
+                    continue
+            return connection
+        return await self._connect()
+
+    async def send(self, message: Message) -> None:
+        """Send a message on a pooled connection, raising if it's refused or the relay is unreachable"""
+        import aiosmtplib
+
+        self._bind_loop()
+        async with self._slots:
+            connection = await self._checkout()
+            try:
+                try:
+                    with track_external("smtp", "send"):
+                        await connection.client.send_message(message)
+                except (aiosmtplib.SMTPServerDisconnected, ConnectionError):
+                    # The relay closed the connection while it sat in the pool
+                    connection.client.close()
+                    connection = await self._connect()
+                    with track_external("smtp", "send"):
+                        await connection.client.send_message(message)
+            except BaseException:
+                await self._close(connection)
+                raise
+
+            connection.messages += 1
+            connection.last_used = time.monotonic()
+            if connection.messages >= settings.SMTP_MAX_MESSAGES_PER_CONNECTION:
+                await self._close(connection)
+            else:
+                self._idle.append(connection)
+
+    async def close(self) -> None:
+        """Close the idle connections"""
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await self._close(connection)
+
 
 class EmailService:
     """Service for sending emails via SMTP"""
@@ -21,10 +151,68 @@ class EmailService:
         self.smtp_user = settings.SMTP_USER
         self.smtp_password = settings.SMTP_PASSWORD
         self.from_email = settings.SMTP_FROM_EMAIL or "noreply@sahasplit.app"
+        self.smtp_start_tls = settings.SMTP_START_TLS
+
+        self._jinja_env = None
+        self._pool: Optional[SMTPConnectionPool] = None
+
+    @property
+    def pool(self) -> SMTPConnectionPool:
+        """SMTP connection pool, created on first send"""
+        if self._pool is None:
+            self._pool = SMTPConnectionPool(
+                self.smtp_host,
+                self.smtp_port,
+                username=self.smtp_user,
+                password=self.smtp_password,
+                start_tls=self.smtp_start_tls,
+                size=settings.SMTP_POOL_SIZE
+            )
+        return self._pool
+
+    async def close(self) -> None:
+        """Close pooled SMTP connections"""
+        if self._pool is not None:
+            await self._pool.close()
+
+    @property
+    def jinja_env(self):
+        """Jinja2 environment for the templates in templates/emails, created on first use"""
+        if self._jinja_env is None:
+            from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+            cache_dir = settings.EMAIL_TEMPLATE_CACHE_DIR
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            self._jinja_env = Environment(
+                loader=FileSystemLoader(TEMPLATE_DIR),
+                autoescape=select_autoescape(["html"]),
+                trim_blocks=True,
+                lstrip_blocks=True,
+                # Compiled templates are shared between workers and restarts, so only the first parses them
+                bytecode_cache=FileSystemBytecodeCache(cache_dir),
+                # Templates only change with a deploy; don't stat the file on every render
+                auto_reload=settings.DEBUG
+            )
+            self._jinja_env.globals["app_url"] = settings.CORS_ORIGINS[0]
+        return self._jinja_env
 
-        # Setup Jinja2 for email templates
-        template_dir = os.path.join(os.path.dirname(__file__), '..', 'templates', 'emails')
-        self.jinja_env = Environment(loader=FileSystemLoader(template_dir))
+    def precompile_templates(self) -> int:
+        """
+        Compile every email template now, rather than when the first email is sent
+
+        Returns:
+            Number of templates loaded
+        """
+        env = self.jinja_env
+        names = env.list_templates(extensions=["html", "txt"])
+        for name in names:
+            env.get_template(name)
+        return len(names)
+
+    def render(self, template: str, **context) -> str:
+        """Render an email template (HTML templates are autoescaped)"""
+        return self.jinja_env.get_template(template).render(**context)
 
     async def send_email(
         self,
@@ -50,30 +238,51 @@ class EmailService:
             return False
 
         try:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.from_email
-            msg['To'] = to_email
-
-            if text_content:
-                msg.attach(MIMEText(text_content, 'plain'))
-            msg.attach(MIMEText(html_content, 'html'))
-
-            await aiosmtplib.send(
-                msg,
-                hostname=self.smtp_host,
-                port=self.smtp_port,
-                username=self.smtp_user,
-                password=self.smtp_password,
-                start_tls=True
-            )
-
+            await self.deliver(to_email, subject, html_content, text_content)
             return True
 
         except Exception as e:
             print(f"Error sending email: {e}")
             return False
 
+    async def deliver(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None
+    ) -> None:
+        """
+        Send an email, raising if the SMTP server can't be reached or refuses it
+
+        Used by the outbox dispatcher, which retries failed sends.
+        """
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = self.from_email
+        msg['To'] = to_email
+
+        if text_content:
+            msg.attach(MIMEText(text_content, 'plain'))
+        msg.attach(MIMEText(html_content, 'html'))
+
+        await self.pool.send(msg)
+
+    async def deliver_many(self, messages: Iterable[Dict[str, str]]) -> List[Optional[Exception]]:
+        """
+        Send many emails (each given as deliver arguments) over all pooled connections
+
+        Returns each message's error, or None if it was sent.
+        """
+        async def deliver_one(message: Dict[str, str]) -> Optional[Exception]:
+            try:
+                await self.deliver(**message)
+            except Exception as e:
+                return e
+            return None
+
+        return list(await asyncio.gather(*(deliver_one(m) for m in messages)))
+
     async def send_invite_email(
         self,
         to_email: str,
@@ -89,45 +298,15 @@ class EmailService:
         Returns:
             True if sent successfully
         """
-        subject = f"{from_name} invited you to SAHASplit"
-
-        html_content = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <h2>You're invited to SAHASplit!</h2>
-                <p><strong>{from_name}</strong> has invited you to join SAHASplit to split expenses together.</p>
-                
-                <p>SAHASplit makes it easy to:</p>
-                <ul>
-                    <li>Track shared expenses</li>
-                    <li>Split bills fairly</li>
-                    <li>Settle up with friends</li>
-                </ul>
-                
-                <p style="margin-top: 30px;">
-                    <a href="{settings.CORS_ORIGINS[0]}/auth/register?email={to_email}" 
-                       style="background-color: #4CAF50; color: white; padding: 12px 24px; text-decoration: none; border-radius: 4px; display: inline-block;">
-                        Join SAHASplit
-                    </a>
-                </p>
-                
-                <p style="color: #666; margin-top: 30px;">
-                    If the button doesn't work, copy and paste this link:<br>
-                    {settings.CORS_ORIGINS[0]}/auth/register?email={to_email}
-                </p>
-            </body>
-        </html>
-        """
-
-        text_content = f"""
-        You're invited to SAHASplit!
-        
-        {from_name} has invited you to join SAHASplit to split expenses together.
-        
-        Visit: {settings.CORS_ORIGINS[0]}/auth/register?email={to_email}
-        """
+        return await self.send_email(**self.build_invite_email(to_email, from_name))
 
-        return await self.send_email(to_email, subject, html_content, text_content)
+    def build_invite_email(self, to_email: str, from_name: str) -> Dict[str, str]:
+        """Invitation email, as send_email arguments"""
+        context = {
+            "from_name": from_name,
+            "register_url": f"{settings.CORS_ORIGINS[0]}/auth/register?{urlencode({'email': to_email})}",
+        }
+        return self._render_message(to_email, f"{from_name} invited you to SAHASplit", "invite", context)
 
     async def send_feedback_email(
         self,
@@ -144,34 +323,13 @@ class EmailService:
         Returns:
             True if sent successfully
         """
-        support_email = settings.SUPPORT_EMAIL or self.from_email
-        subject = f"Feedback from {user.name or user.email}"
-
-        html_content = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif;">
-                <h2>New Feedback Received</h2>
-                <p><strong>From:</strong> {user.name} ({user.email})</p>
-                <p><strong>User ID:</strong> {user.id}</p>
-                <p><strong>Feedback:</strong></p>
-                <div style="background-color: #f5f5f5; padding: 15px; border-radius: 4px; margin-top: 10px;">
-                    {feedback}
-                </div>
-            </body>
-        </html>
-        """
-
-        text_content = f"""
-        New Feedback Received
-        
-        From: {user.name} ({user.email})
-        User ID: {user.id}
-        
-        Feedback:
-        {feedback}
-        """
+        return await self.send_email(**self.build_feedback_email(feedback, user))
 
-        return await self.send_email(support_email, subject, html_content, text_content)
+    def build_feedback_email(self, feedback: str, user: User) -> Dict[str, str]:
+        """Feedback email to support, as send_email arguments"""
+        support_email = settings.SUPPORT_EMAIL or self.from_email
+        context = {"feedback": feedback, "user": user}
+        return self._render_message(support_email, f"Feedback from {user.name or user.email}", "feedback", context)
 
     async def send_magic_link_email(
         self,
@@ -188,43 +346,25 @@ class EmailService:
         Returns:
             True if sent successfully
         """
-        subject = "Your SAHASplit Login Link"
-
-        html_content = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <h2>Login to SAHASplit</h2>
-                <p>Click the button below to log in to your SAHASplit account:</p>
-                
-                <p style="margin-top: 30px;">
-                    <a href="{magic_link}" 
-                       style="background-color: #4CAF50; color: white; padding: 12px 24px; text-decoration: none; border-radius: 4px; display: inline-block;">
-                        Log In to SAHASplit
-                    </a>
-                </p>
-                
-                <p style="color: #666; margin-top: 30px;">
-                    This link will expire in 1 hour.
-                </p>
-                
-                <p style="color: #666;">
-                    If you didn't request this link, you can safely ignore this email.
-                </p>
-            </body>
-        </html>
-        """
+        return await self.send_email(**self.build_magic_link_email(to_email, magic_link))
+
+    def build_magic_link_email(self, to_email: str, magic_link: str) -> Dict[str, str]:
+        """Magic link email, as send_email arguments"""
+        context = {"magic_link": magic_link}
+        return self._render_message(to_email, "Your SAHASplit Login Link", "magic_link", context)
+
+    def _render_message(self, to_email: str, subject: str, template: str, context: dict) -> Dict[str, str]:
+        """send_email arguments with the bodies rendered from <template>.html and <template>.txt"""
+        return _message(
+            to_email,
+            subject,
+            self.render(f"{template}.html", **context),
+            self.render(f"{template}.txt", **context)
+        )
 
-        text_content = f"""
-        Login to SAHASplit
-        
-        Click this link to log in: {magic_link}
-        
-        This link will expire in 1 hour.
-        
-        If you didn't request this link, you can safely ignore this email.
-        """
 
-        return await self.send_email(to_email, subject, html_content, text_content)
+def _message(to_email: str, subject: str, html_content: str, text_content: Optional[str]) -> Dict[str, str]:
+    return {"to_email": to_email, "subject": subject, "html_content": html_content, "text_content": text_content}
 
 
 # Global service instance
@@ -0,0 +1,119 @@
+"""
+Expense list service - bulk projections for the expense list endpoints
+
+Large lists skip ORM hydration and per-row pydantic models: expenses, participants
+and payer names are selected as plain column tuples and assembled into dicts that
+already have the ExpenseDetailResponse shape, ready for ORJSONResponse. A `fields`
+set narrows both the SELECT list and the dicts.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy.orm import Session
+
+from app.models.models import Expense, ExpenseParticipant, User
+
+# Column order of ExpenseResponse
+EXPENSE_COLUMNS = (
+    Expense.id,
+    Expense.group_id,
+    Expense.paid_by,
+    Expense.name,
+    Expense.category,
+    Expense.amount,
+    Expense.split_type,
+    Expense.currency,
+    Expense.expense_date,
+    Expense.created_at,
+    Expense.updated_at,
+    Expense.file_key,
+    Expense.deleted_at,
+    Expense.conversion_to_id,
+)
+
+EXPENSE_COLUMN_FIELDS = tuple(c.key for c in EXPENSE_COLUMNS)
+EXPENSE_FIELDS = EXPENSE_COLUMN_FIELDS + ("paid_by_name", "participants")
+
+
+def list_expenses(
+    db: Session,
+    filters: Iterable,
+    include_participants: bool = True,
+    participant_user_ids: Optional[List[int]] = None,
+    fields: Optional[Set[str]] = None
+) -> List[Dict]:
+    """
+    Load expenses matching `filters`, newest first, as response dicts
+
+    Args:
+        db: Database session
+        filters: SQLAlchemy criteria on Expense
+        include_participants: Add paid_by_name and participants (ExpenseDetailResponse)
+        participant_user_ids: Only include these participants
+        fields: Only select and return these keys (see EXPENSE_FIELDS); id is always included
+
+    Returns:
+        List of dicts in ExpenseResponse / ExpenseDetailResponse shape
+    """
+    filters = list(filters)
+    if fields is None:
+        fields = set(EXPENSE_FIELDS)
+        if not include_participants:
+            fields.discard("participants")
+    else:
+        fields = set(fields) | {"id"}
+        if not include_participants:
+            fields -= {"paid_by_name", "participants"}
+
+    with_names = include_participants and "paid_by_name" in fields
+    with_participants = include_participants and "participants" in fields
+
+    # paid_by is needed to resolve the payer's name even when it isn't returned
+    columns = [c for c in EXPENSE_COLUMNS if c.key in fields or (with_names and c.key == "paid_by")]
+    rows = db.query(*columns).filter(*filters).order_by(Expense.expense_date.desc()).all()
+
+    expenses = []
+    for row in rows:
+        expense = row._asdict()
+        if "split_type" in expense:
+            expense["split_type"] = row.split_type.value
+        if "paid_by_name" in fields:
+            expense["paid_by_name"] = None
+        expenses.append(expense)
+
+    if not (with_names or with_participants) or not expenses:
+        return expenses
+
+    participants = []
+    if with_participants:
+        # Re-use the filters as a subquery rather than sending thousands of ids back
+        participant_query = db.query(
+            ExpenseParticipant.expense_id, ExpenseParticipant.user_id, ExpenseParticipant.amount
+        ).filter(
+            ExpenseParticipant.expense_id.in_(db.query(Expense.id).filter(*filters))
+        )
+        if participant_user_ids is not None:
+            participant_query = participant_query.filter(ExpenseParticipant.user_id.in_(participant_user_ids))
+        participants = participant_query.all()
+
+    user_ids = {p.user_id for p in participants}
+    if with_names:
+        user_ids |= {e["paid_by"] for e in expenses}
+    users = db.query(User.id, User.name, User.email).filter(User.id.in_(user_ids)).all()
+    user_map = {u.id: u.name or u.email or f"User {u.id}" for u in users}
+
+    participants_by_expense: Dict[str, List[Dict]] = {}
+    for p in participants:
+        participants_by_expense.setdefault(p.expense_id, []).append({
+            "user_id": p.user_id,
+            "user_name": user_map.get(p.user_id, "Unknown"),
+            "amount": p.amount,
+        })
+
+    for expense in expenses:
+        if with_names:
+            expense["paid_by_name"] = user_map.get(expense["paid_by"], "Unknown")
+            if "paid_by" not in fields:
+                del expense["paid_by"]
+        if with_participants:
+            expense["participants"] = participants_by_expense.get(expense["id"], [])
+
+    return expenses
@@ -4,11 +4,11 @@ Handles Open Banking API for European banks
 """
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
-import httpx
 from sqlalchemy.orm import Session
 import json
 
 from app.core.config import settings
+from app.core.metrics import track_external
 from app.models.models import User, CachedBankData
 
 
@@ -22,6 +22,12 @@ class GoCardlessService:
         self.access_token = None
         self.token_expires = None
 
+    def _http_client(self):
+        # Imported on first use to keep worker startup fast
+        import httpx
+
+        return httpx.AsyncClient()
+
     async def _get_access_token(self) -> str:
         """Get or refresh access token"""
         # Check if we have a valid token
@@ -30,14 +36,15 @@ class GoCardlessService:
                 return self.access_token
 
         # Get new token
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/token/new/",
-                json={
-                    "secret_id": self.secret_id,
-                    "secret_key": self.secret_key
-                }
-            )
+        async with self._http_client() as client:
+            with track_external("gocardless", "token"):
+                response = await client.post(
+                    f"{self.base_url}/token/new/",
+                    json={
+                        "secret_id": self.secret_id,
+                        "secret_key": self.secret_key
+                    }
+                )
 
             if response.status_code == 200:
                 data = response.json()
@@ -63,12 +70,13 @@ class GoCardlessService:
         """
         token = await self._get_access_token()
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/institutions/",
-                params={"country": country_code},
-                headers={"Authorization": f"Bearer {token}"}
-            )
+        async with self._http_client() as client:
+            with track_external("gocardless", "institutions"):
+                response = await client.get(
+                    f"{self.base_url}/institutions/",
+                    params={"country": country_code},
+                    headers={"Authorization": f"Bearer {token}"}
+                )
 
             if response.status_code == 200:
                 institutions = response.json()
@@ -107,17 +115,18 @@ class GoCardlessService:
 
         redirect_uri = f"{settings.CORS_ORIGINS[0]}/bank/callback"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/requisitions/",
-                headers={"Authorization": f"Bearer {token}"},
-                json={
-                    "redirect": redirect_uri,
-                    "institution_id": institution_id,
-                    "reference": f"user_{user_id}",
-                    "user_language": language.upper()
-                }
-            )
+        async with self._http_client() as client:
+            with track_external("gocardless", "create_requisition"):
+                response = await client.post(
+                    f"{self.base_url}/requisitions/",
+                    headers={"Authorization": f"Bearer {token}"},
+                    json={
+                        "redirect": redirect_uri,
+                        "institution_id": institution_id,
+                        "reference": f"user_{user_id}",
+                        "user_language": language.upper()
+                    }
+                )
 
             if response.status_code in [200, 201]:
                 data = response.json()
@@ -143,11 +152,12 @@ class GoCardlessService:
         """
         token = await self._get_access_token()
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/requisitions/{requisition_id}/",
-                headers={"Authorization": f"Bearer {token}"}
-            )
+        async with self._http_client() as client:
+            with track_external("gocardless", "requisition"):
+                response = await client.get(
+                    f"{self.base_url}/requisitions/{requisition_id}/",
+                    headers={"Authorization": f"Bearer {token}"}
+                )
 
             if response.status_code == 200:
                 data = response.json()
@@ -184,15 +194,16 @@ class GoCardlessService:
         if not date_to:
             date_to = datetime.utcnow()
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/accounts/{account_id}/transactions/",
-                headers={"Authorization": f"Bearer {token}"},
-                params={
-                    "date_from": date_from.strftime("%Y-%m-%d"),
-                    "date_to": date_to.strftime("%Y-%m-%d")
-                }
-            )
+        async with self._http_client() as client:
+            with track_external("gocardless", "transactions"):
+                response = await client.get(
+                    f"{self.base_url}/accounts/{account_id}/transactions/",
+                    headers={"Authorization": f"Bearer {token}"},
+                    params={
+                        "date_from": date_from.strftime("%Y-%m-%d"),
+                        "date_to": date_to.strftime("%Y-%m-%d")
+                    }
+                )
 
             if response.status_code == 200:
                 data = response.json()
@@ -0,0 +1,95 @@
+"""
+Membership service - cached group memberships for authorization checks
+
+A user's group ids are loaded once per request (kept in Session.info, so the
+sub-requests of a batch share them) and kept in a short-TTL process cache across
+requests. Membership change events from change_log (join, add, leave, remove,
+group delete) evict the affected users in every worker via the realtime hub;
+the TTL bounds staleness if an event is ever missed.
+"""
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import record_cache
+from app.models.models import GroupUser
+from app.services.realtime_service import realtime_service
+
+# Session.info key of the per-request cache
+SESSION_KEY = "membership_group_ids"
+
+_lock = threading.Lock()
+_cache: Dict[int, Tuple[float, FrozenSet[int]]] = {}
+# Bumped on every invalidation so a load that raced with one isn't cached
+_generation = 0
+
+
+def get_group_ids(db: Session, user_id: int) -> FrozenSet[int]:
+    """Get the ids of the groups a user belongs to"""
+    request_cache = db.info.setdefault(SESSION_KEY, {})
+    if user_id in request_cache:
+        record_cache("membership", True)
+        return request_cache[user_id]
+
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+        generation = _generation
+
+    record_cache("membership", bool(entry and entry[0] > now))
+    if entry and entry[0] > now:
+        group_ids = entry[1]
+    else:
+        group_ids = frozenset(
+            group_id for (group_id,) in db.query(GroupUser.group_id).filter(GroupUser.user_id == user_id).all()
+        )
+        with _lock:
+            if generation == _generation:
+                _cache[user_id] = (now + settings.MEMBERSHIP_CACHE_TTL_SECONDS, group_ids)
+
+    request_cache[user_id] = group_ids
+    return group_ids
+
+
+def invalidate_memberships(user_ids: Iterable[int]) -> None:
+    """Evict users from the process cache"""
+    global _generation
+
+    with _lock:
+        _generation += 1
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+def clear_membership_cache() -> None:
+    """Drop every cached membership"""
+    global _generation
+
+    with _lock:
+        _generation += 1
+        _cache.clear()
+
+
+def _on_changes(changes: List[dict]) -> None:
+    user_ids = set()
+    for change in changes:
+        if change["type"] == "membership":
+            user_ids.add(int(change["id"].split(":")[1]))
+        elif change["type"] == "group" and change["op"] == "delete" and change.get("user_id") is not None:
+            user_ids.add(change["user_id"])
+
+    if user_ids:
+        invalidate_memberships(user_ids)
+
+
+realtime_service.hub.add_listener(_on_changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_request_cache(session: Session) -> None:
+    # A write in this request may have changed memberships
+    session.info.pop(SESSION_KEY, None)
@@ -0,0 +1,213 @@
+"""
+Notification service - telling people about changes to their expenses
+
+When an expense is added, edited or deleted, everyone involved except the
+person who made the change is notified by push and/or email, as their
+notification preferences allow. Recipients and their preferences are read
+with one query per change.
+
+Notifications are coalesced per recipient and channel in the outbox. The
+first change starts a message that waits NOTIFICATION_DEBOUNCE_SECONDS, and
+changes made meanwhile are folded into it: repeated edits of an expense
+become one entry, an expense added and deleted again drops out, and a bulk
+import becomes a single "N expense updates" notification. A message goes out
+at most NOTIFICATION_MAX_DELAY_SECONDS after its first change and lists up to
+NOTIFICATION_MAX_EVENTS expenses, counting the rest.
+"""
+import asyncio
+from functools import partial
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Expense, User
+from app.schemas.user import NotificationPreferences
+from app.services.outbox_service import KIND_EXPENSE_ACTIVITY, coalesce
+from app.utils.numbers import format_money
+
+ADDED = "added"
+UPDATED = "updated"
+DELETED = "deleted"
+
+CHANNEL_PUSH = "push"
+CHANNEL_EMAIL = "email"
+
+# The push and email preference covering each action
+PREFERENCES = {
+    ADDED: ("push_expense_added", "email_expense_added"),
+    UPDATED: ("push_expense_updated", "email_expense_updated"),
+    DELETED: ("push_expense_updated", "email_expense_updated"),
+}
+
+
+def _display_name(name: Optional[str], email: Optional[str]) -> str:
+    return name or (email or "").split("@")[0] or "Someone"
+
+
+def notify_expense_change(
+    db: Session,
+    expense: Expense,
+    action: str,
+    actor_id: int,
+    user_ids: Iterable[int]
+) -> None:
+    """
+    Queue notifications of a change to an expense for the users involved
+
+    Does not commit; call before the change itself commits, so notifications
+    go out if and only if it does.
+
+    Args:
+        db: Database session
+        expense: The expense added, edited or deleted
+        action: ADDED, UPDATED or DELETED
+        actor_id: User who made the change (not notified)
+        user_ids: Users involved (payer and participants, before and after an edit)
+    """
+    users = db.query(User.id, User.name, User.email, User.notification_preferences).filter(
+        User.id.in_(set(user_ids) | {actor_id})
+    ).all()
+    actor = next((u for u in users if u.id == actor_id), None)
+    event = {
+        "expense_id": expense.id,
+        "action": action,
+        "name": expense.name,
+        "amount": expense.amount,
+        "currency": expense.currency,
+        "actor": _display_name(actor.name, actor.email) if actor else "Someone",
+    }
+
+    push_preference, email_preference = PREFERENCES[action]
+    messages = {}
+    for user_id, _, email, preferences in users:
+        if user_id == actor_id:
+            continue
+        preferences = NotificationPreferences(**(preferences or {}))
+        messages[f"expense:push:{user_id}"] = partial(
+            _fold, {"user_id": user_id, "channel": CHANNEL_PUSH}, event, getattr(preferences, push_preference)
+        )
+        if email:
+            messages[f"expense:email:{user_id}"] = partial(
+                _fold, {"user_id": user_id, "channel": CHANNEL_EMAIL, "email": email}, event,
+                getattr(preferences, email_preference)
+            )
+
+    coalesce(db, KIND_EXPENSE_ACTIVITY, messages,
+             settings.NOTIFICATION_DEBOUNCE_SECONDS, settings.NOTIFICATION_MAX_DELAY_SECONDS)
+
+
+def _fold(recipient: dict, event: dict, wanted: bool, payload: Optional[dict]) -> Optional[dict]:
+    """
+    A recipient's unsent notification with an event folded in
+
+    Events for an expense already listed update its entry even if the
+    recipient doesn't want that kind of event, so a deletion still cancels an
+    addition they haven't been told about.
+    """
+    if payload is None:
+        return {**recipient, "events": [event], "more": 0} if wanted else None
+
+    events = list(payload["events"])
+    for index, listed in enumerate(events):
+        if listed["expense_id"] != event["expense_id"]:
+            continue
+        if listed["action"] == ADDED and event["action"] == DELETED:
+            del events[index]
+        else:
+            # Still news of an addition, with the latest details
+            events[index] = {**event, "action": ADDED if listed["action"] == ADDED else event["action"]}
+        return {**payload, "events": events}
+
+    if not wanted:
+        return payload
+    if len(events) < settings.NOTIFICATION_MAX_EVENTS:
+        return {**payload, "events": events + [event]}
+    return {**payload, "more": payload["more"] + 1}
+
+
+def describe(event: dict) -> str:
+    """One line for an event, e.g. 'Alice added Dinner (USD 30.00)'"""
+    return f"{event['actor']} {event['action']} {event['name']} ({format_money(event['amount'], event['currency'])})"
+
+
+def _count(payload: dict) -> int:
+    return len(payload["events"]) + payload["more"]
+
+
+def render_push(payload: dict) -> dict:
+    """A coalesced notification as PushNotificationService.deliver arguments"""
+    events = payload["events"]
+    count = _count(payload)
+    if count == 1:
+        event = events[0]
+        return {
+            "user_id": payload["user_id"],
+            "title": f"Expense {event['action']}",
+            "body": describe(event),
+            "data": {"expense_id": event["expense_id"]},
+        }
+
+    body = "; ".join(describe(event) for event in events[:3])
+    if count > 3:
+        body += f" and {count - 3} more"
+    return {
+        "user_id": payload["user_id"],
+        "title": f"{count} expense updates",
+        "body": body,
+        "data": {"expense_ids": [event["expense_id"] for event in events]},
+    }
+
+
+def render_email(payload: dict) -> Dict[str, str]:
+    """A coalesced notification as send_email arguments"""
+    from app.services.email_service import email_service
+
+    events = payload["events"]
+    count = _count(payload)
+    subject = describe(events[0]) if count == 1 else f"{count} expense updates on SAHASplit"
+    context = {"lines": [describe(event) for event in events], "more": payload["more"]}
+    return {
+        "to_email": payload["email"],
+        "subject": subject,
+        "html_content": email_service.render("expense_activity.html", **context),
+        "text_content": email_service.render("expense_activity.txt", **context),
+    }
+
+
+async def send_expense_activity(payloads: List[dict]) -> List[Optional[Exception]]:
+    """
+    Render and send a batch of coalesced notifications
+
+    The outbox's sender for KIND_EXPENSE_ACTIVITY. Pushes go out together in one
+    burst and emails over the SMTP pool, at the same time. Messages whose
+    events all cancelled out have nothing to send.
+    """
+    from app.core import database
+    from app.services.email_service import email_service
+    from app.services.push_service import push_service
+
+    errors: List[Optional[Exception]] = [None] * len(payloads)
+    pushes = [i for i, p in enumerate(payloads) if p["channel"] == CHANNEL_PUSH and p["events"]]
+    emails = [i for i, p in enumerate(payloads) if p["channel"] == CHANNEL_EMAIL and p["events"]]
+
+    async def send_pushes() -> None:
+        if not pushes or not push_service.vapid_private_key:
+            return
+        db = database.SessionLocal()
+        try:
+            results = await push_service.deliver_many(db, [render_push(payloads[i]) for i in pushes])
+        finally:
+            db.close()
+        for i, error in zip(pushes, results):
+            errors[i] = error
+
+    async def send_emails() -> None:
+        if not emails or not email_service.smtp_host:
+            return
+        results = await email_service.deliver_many([render_email(payloads[i]) for i in emails])
+        for i, error in zip(emails, results):
+            errors[i] = error
+
+    await asyncio.gather(send_pushes(), send_emails())
+    return errors
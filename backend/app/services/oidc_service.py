@@ -0,0 +1,221 @@
+"""
+OIDC service - OpenID Connect logins (Google, Authentik)
+
+Discovery documents and signing keys (JWKS) are cached per provider for
+OIDC_METADATA_TTL_SECONDS, and ID tokens are verified locally against the
+cached keys. A login is then a single round trip to the provider (the code
+exchange): the user's details come from the verified ID token rather than a
+userinfo call. Keys are re-fetched early when a token names a key id we
+haven't seen (the provider rotated its keys), at most every
+OIDC_JWKS_MIN_REFRESH_SECONDS.
+
+All providers share one pooled HTTP client, closed on shutdown.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlencode
+
+from jose import JWTError, jwt
+
+from app.core.config import settings
+from app.core.metrics import record_cache, track_external
+
+logger = logging.getLogger(__name__)
+
+# Signing algorithms accepted for ID tokens
+ID_TOKEN_ALGORITHMS = ["RS256", "RS384", "RS512", "ES256", "ES384", "ES512"]
+
+
+class OIDCError(Exception):
+    """A login couldn't be completed with the provider"""
+
+
+class OIDCUnavailable(OIDCError):
+    """The provider couldn't be reached"""
+
+
+_client = None
+
+
+def http_client():
+    """The shared HTTP client for provider requests"""
+    global _client
+    if _client is None:
+        # Imported on first use to keep worker startup fast
+        import httpx
+
+        _client = httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_keepalive_connections=10))
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class OIDCProvider:
+    """One OpenID Connect provider, with cached metadata and keys"""
+
+    def __init__(self, name: str, issuer: str, client_id: str, client_secret: str,
+                 scope: str = "openid email profile", issuer_aliases: Iterable[str] = ()):
+        self.name = name
+        self.issuer = issuer.rstrip("/")
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        # Values the ID token's iss may take, with or without the trailing slash
+        # (Authentik's ends in one; Google also uses one without https://)
+        self.issuers = (self.issuer, f"{self.issuer}/", *issuer_aliases)
+        self._metadata: Optional[Dict[str, Any]] = None
+        self._metadata_expires = 0.0
+        self._jwks: Dict[str, dict] = {}
+        self._jwks_expires = 0.0
+        self._jwks_fetched = 0.0
+        self._metadata_lock = asyncio.Lock()
+        self._jwks_lock = asyncio.Lock()
+
+    async def _request(self, method: str, url: str, operation: str, **kwargs):
+        import httpx
+
+        try:
+            with track_external(self.name, operation):
+                return await http_client().request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            raise OIDCUnavailable(f"{self.name} {operation} failed: {e}")
+
+    async def _get_json(self, url: str, operation: str) -> dict:
+        response = await self._request("GET", url, operation)
+        if response.status_code != 200:
+            raise OIDCUnavailable(f"{self.name} {operation} failed with status {response.status_code}")
+        return response.json()
+
+    async def metadata(self) -> Dict[str, Any]:
+        """The provider's discovery document"""
+        if self._metadata is not None and time.monotonic() < self._metadata_expires:
+            record_cache("oidc_metadata", True)
+            return self._metadata
+
+        async with self._metadata_lock:
+            # Another request may have fetched it while we waited
+            if self._metadata is None or time.monotonic() >= self._metadata_expires:
+                record_cache("oidc_metadata", False)
+                self._metadata = await self._get_json(
+                    f"{self.issuer}/.well-known/openid-configuration", "discovery"
+                )
+                self._metadata_expires = time.monotonic() + settings.OIDC_METADATA_TTL_SECONDS
+        return self._metadata
+
+    async def signing_key(self, kid: Optional[str]) -> dict:
+        """The JWK for a key id, re-fetching the key set if it's unknown or stale"""
+        now = time.monotonic()
+        key = self._find_key(kid)
+        if key is not None and now < self._jwks_expires:
+            record_cache("oidc_jwks", True)
+            return key
+
+        async with self._jwks_lock:
+            key = self._find_key(kid)
+            stale = time.monotonic() >= self._jwks_expires
+            may_refresh = time.monotonic() - self._jwks_fetched >= settings.OIDC_JWKS_MIN_REFRESH_SECONDS
+            if stale or (key is None and may_refresh):
+                record_cache("oidc_jwks", False)
+                metadata = await self.metadata()
+                jwks = await self._get_json(metadata["jwks_uri"], "jwks")
+                self._jwks = {k.get("kid"): k for k in jwks.get("keys", [])}
+                self._jwks_fetched = time.monotonic()
+                self._jwks_expires = self._jwks_fetched + settings.OIDC_METADATA_TTL_SECONDS
+                key = self._find_key(kid)
+
+        if key is None:
+            raise OIDCError(f"{self.name} signing key {kid!r} not found")
+        return key
+
+    def _find_key(self, kid: Optional[str]) -> Optional[dict]:
+        if kid is None and len(self._jwks) == 1:
+            return next(iter(self._jwks.values()))
+        return self._jwks.get(kid)
+
+    async def authorization_url(self, redirect_uri: str, **params: str) -> str:
+        metadata = await self.metadata()
+        query = {
+            "client_id": self.client_id,
+            "redirect_uri": redirect_uri,
+            "response_type": "code",
+            "scope": self.scope,
+            **params,
+        }
+        return f"{metadata['authorization_endpoint']}?{urlencode(query)}"
+
+    async def exchange_code(self, code: str, redirect_uri: str) -> Dict[str, Any]:
+        """Trade an authorization code for the provider's tokens"""
+        metadata = await self.metadata()
+        response = await self._request("POST", metadata["token_endpoint"], "token", data={
+            "code": code,
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "redirect_uri": redirect_uri,
+            "grant_type": "authorization_code",
+        })
+        if response.status_code != 200:
+            raise OIDCError("Failed to exchange code for token")
+        return response.json()
+
+    async def verify_id_token(self, id_token: str, access_token: Optional[str] = None) -> Dict[str, Any]:
+        """Check an ID token's signature, issuer, audience and expiry; returns its claims"""
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except JWTError as e:
+            raise OIDCError(f"Malformed ID token: {e}")
+
+        key = await self.signing_key(header.get("kid"))
+        # The discovery document names the exact issuer its tokens carry
+        metadata = await self.metadata()
+        try:
+            return jwt.decode(
+                id_token,
+                key,
+                algorithms=ID_TOKEN_ALGORITHMS,
+                audience=self.client_id,
+                issuer=(metadata.get("issuer"), *self.issuers),
+                access_token=access_token,
+            )
+        except JWTError as e:
+            raise OIDCError(f"Invalid ID token: {e}")
+
+    async def login(self, code: str, redirect_uri: str) -> Dict[str, Any]:
+        """
+        Complete a login: exchange the code and verify the ID token
+
+        Returns the provider's tokens plus `claims` from the ID token.
+        """
+        tokens = await self.exchange_code(code, redirect_uri)
+        if not tokens.get("id_token"):
+            raise OIDCError(f"{self.name} returned no ID token")
+        tokens["claims"] = await self.verify_id_token(tokens["id_token"], tokens.get("access_token"))
+        return tokens
+
+
+def _build_providers() -> Dict[str, OIDCProvider]:
+    providers = {}
+    if settings.GOOGLE_CLIENT_ID and settings.GOOGLE_CLIENT_SECRET:
+        providers["google"] = OIDCProvider(
+            "google", "https://accounts.google.com", settings.GOOGLE_CLIENT_ID, settings.GOOGLE_CLIENT_SECRET,
+            issuer_aliases=["accounts.google.com"]
+        )
+    if settings.AUTHENTIK_ISSUER and settings.AUTHENTIK_CLIENT_ID and settings.AUTHENTIK_CLIENT_SECRET:
+        providers["authentik"] = OIDCProvider(
+            "authentik", settings.AUTHENTIK_ISSUER, settings.AUTHENTIK_CLIENT_ID, settings.AUTHENTIK_CLIENT_SECRET
+        )
+    return providers
+
+
+providers: Dict[str, OIDCProvider] = _build_providers()
+
+
+def get_provider(name: str) -> Optional[OIDCProvider]:
+    """A configured provider by name, or None"""
+    return providers.get(name)
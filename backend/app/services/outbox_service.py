@@ -0,0 +1,346 @@
+"""
+Outbox service - emails and push notifications sent in the background
+
+Routes don't talk to SMTP or push services. They add an outbox row in the same
+transaction as the change that caused it (queue_email / queue_push), so a
+message is sent if and only if the change commits, and the response doesn't
+wait for the send. Messages queued with coalesce() are held back for a
+debounce window, and later messages with the same key are folded into them.
+
+Each worker runs a dispatcher that claims up to OUTBOX_BATCH_SIZE due messages
+at a time and sends them concurrently. Claiming pushes a message's
+available_at forward by OUTBOX_LEASE_SECONDS (rows are locked with SKIP LOCKED
+on PostgreSQL), so workers don't send the same message twice and a message
+claimed by a worker that died is picked up again once the lease runs out.
+Push notifications in a batch are handed to the push service together, so it
+can look up every recipient's devices at once and send in one burst.
+Delivered messages are deleted; failed ones are retried with exponential
+backoff, and after OUTBOX_MAX_ATTEMPTS they're kept with status "dead" for
+inspection. Commits that queue messages wake the local dispatcher, which
+otherwise polls every OUTBOX_POLL_SECONDS.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import outbox_messages_total
+from app.models.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+KIND_EMAIL = "email"
+KIND_PUSH = "push"
+# Coalesced expense notifications, rendered when sent (notification_service)
+KIND_EXPENSE_ACTIVITY = "expense_activity"
+
+STATUS_PENDING = "pending"
+STATUS_DEAD = "dead"
+
+# session.info key marking a transaction that queued messages
+QUEUED_KEY = "outbox_queued"
+
+
+class PermanentDeliveryError(Exception):
+    """A message that will never be delivered, so it's dead-lettered without retrying"""
+
+
+def enqueue(db: Session, kind: str, payload: dict) -> OutboxMessage:
+    """
+    Add a message to the outbox
+
+    Does not commit; callers commit together with the change itself.
+    """
+    message = OutboxMessage(kind=kind, payload=payload, status=STATUS_PENDING, attempts=0,
+                            available_at=datetime.utcnow())
+    db.add(message)
+    db.info[QUEUED_KEY] = True
+    return message
+
+
+def queue_email(
+    db: Session,
+    to_email: str,
+    subject: str,
+    html_content: str,
+    text_content: Optional[str] = None
+) -> OutboxMessage:
+    """Queue an email (the arguments of EmailService.send_email)"""
+    return enqueue(db, KIND_EMAIL, {
+        "to_email": to_email,
+        "subject": subject,
+        "html_content": html_content,
+        "text_content": text_content,
+    })
+
+
+def queue_push(db: Session, user_id: int, title: str, body: str, data: Optional[dict] = None) -> OutboxMessage:
+    """Queue a push notification to a user"""
+    return enqueue(db, KIND_PUSH, {"user_id": user_id, "title": title, "body": body, "data": data})
+
+
+async def _send_email(payload: dict) -> None:
+    from app.services.email_service import email_service
+
+    if not email_service.smtp_host:
+        logger.info(f"SMTP not configured, dropping email to {payload['to_email']}")
+        return
+    await email_service.deliver(**payload)
+
+
+async def _send_pushes(payloads: List[dict]) -> List[Optional[Exception]]:
+    from app.core import database
+    from app.services.push_service import push_service
+
+    if not push_service.vapid_private_key:
+        return [None] * len(payloads)
+    db = database.SessionLocal()
+    try:
+        return await push_service.deliver_many(db, payloads)
+    finally:
+        db.close()
+
+
+async def _send_expense_activity(payloads: List[dict]) -> List[Optional[Exception]]:
+    from app.services.notification_service import send_expense_activity
+
+    return await send_expense_activity(payloads)
+
+
+# Senders by message kind; they raise to have the message retried
+SENDERS: Dict[str, Callable[[dict], Awaitable[None]]] = {
+    KIND_EMAIL: _send_email,
+}
+
+# Senders given all of a batch's messages of their kind at once, returning each one's error or None
+BATCH_SENDERS: Dict[str, Callable[[List[dict]], Awaitable[List[Optional[Exception]]]]] = {
+    KIND_PUSH: _send_pushes,
+    KIND_EXPENSE_ACTIVITY: _send_expense_activity,
+}
+
+
+def coalesce(
+    db: Session,
+    kind: str,
+    messages: Dict[str, Callable[[Optional[dict]], Optional[dict]]],
+    debounce_seconds: float,
+    max_delay_seconds: float
+) -> None:
+    """
+    Queue messages, folding each into the unsent message with the same key if there is one
+
+    messages maps each coalesce key to a function building the payload from the
+    unsent message's payload, or from None if there's no unsent message (it may
+    return None then, to queue nothing). A message goes out once nothing has
+    been folded in for debounce_seconds, and no later than max_delay_seconds
+    after it was first queued. Messages a dispatcher has already claimed are
+    left alone, so later changes start a new message.
+
+    Does not commit; callers commit together with the change itself.
+    """
+    if not messages:
+        return
+    now = datetime.utcnow()
+    unsent = {
+        message.coalesce_key: message
+        for message in db.query(OutboxMessage).filter(
+            OutboxMessage.coalesce_key.in_(list(messages)),
+            OutboxMessage.status == STATUS_PENDING,
+            OutboxMessage.attempts == 0
+        ).with_for_update()
+    }
+    # Sessions don't autoflush, so messages queued earlier in this transaction aren't in the query
+    unsent.update(
+        (obj.coalesce_key, obj) for obj in db.new
+        if isinstance(obj, OutboxMessage) and obj.coalesce_key in messages
+    )
+    send_at = now + timedelta(seconds=debounce_seconds)
+    for key, merge in messages.items():
+        message = unsent.get(key)
+        if message is None:
+            payload = merge(None)
+            if payload is not None:
+                message = enqueue(db, kind, payload)
+                message.coalesce_key = key
+                message.available_at = send_at
+        else:
+            message.payload = merge(message.payload)
+            first_queued = message.created_at or now
+            message.available_at = min(send_at, first_queued + timedelta(seconds=max_delay_seconds))
+
+
+class ClaimedMessage(NamedTuple):
+    id: int
+    kind: str
+    payload: dict
+    attempts: int
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait after a message's nth failed attempt (exponential, with jitter)"""
+    delay = min(settings.OUTBOX_RETRY_MAX_SECONDS, settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class OutboxDispatcher:
+    """Sends outbox messages in batches, in the background of each worker"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def claim(self, db: Session) -> List[ClaimedMessage]:
+        """Lease a batch of due messages to this worker"""
+        now = datetime.utcnow()
+        messages = db.query(OutboxMessage).filter(
+            OutboxMessage.status == STATUS_PENDING,
+            OutboxMessage.available_at <= now
+        ).order_by(OutboxMessage.available_at).limit(
+            settings.OUTBOX_BATCH_SIZE
+        ).with_for_update(skip_locked=True).all()
+
+        lease_until = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        claimed = []
+        for message in messages:
+            message.available_at = lease_until
+            message.attempts += 1
+            claimed.append(ClaimedMessage(message.id, message.kind, message.payload, message.attempts))
+        db.commit()
+        return claimed
+
+    async def dispatch_once(self, db: Session) -> int:
+        """Claim and send one batch; returns how many messages were claimed"""
+        messages = self.claim(db)
+        if not messages:
+            return 0
+
+        semaphore = asyncio.Semaphore(settings.OUTBOX_CONCURRENCY)
+
+        async def send(message: ClaimedMessage) -> Optional[Exception]:
+            sender = SENDERS.get(message.kind)
+            if sender is None:
+                return PermanentDeliveryError(f"Unknown message kind {message.kind!r}")
+            async with semaphore:
+                try:
+                    await sender(message.payload)
+                except Exception as e:
+                    return e
+            return None
+
+        async def send_batch(kind: str, batch: List[ClaimedMessage]) -> List[Optional[Exception]]:
+            try:
+                return await BATCH_SENDERS[kind]([m.payload for m in batch])
+            except Exception as e:
+                return [e] * len(batch)
+
+        single: List[ClaimedMessage] = []
+        batches: Dict[str, List[ClaimedMessage]] = {}
+        for message in messages:
+            if message.kind in BATCH_SENDERS:
+                batches.setdefault(message.kind, []).append(message)
+            else:
+                single.append(message)
+
+        groups = [single, *batches.values()]
+        results = await asyncio.gather(
+            asyncio.gather(*(send(m) for m in single)),
+            *(send_batch(kind, batch) for kind, batch in batches.items())
+        )
+        error_by_id = {
+            message.id: error
+            for group, group_errors in zip(groups, results)
+            for message, error in zip(group, group_errors)
+        }
+        errors = [error_by_id[m.id] for m in messages]
+
+        sent = [m for m, error in zip(messages, errors) if error is None]
+        if sent:
+            db.query(OutboxMessage).filter(
+                OutboxMessage.id.in_([m.id for m in sent])
+            ).delete(synchronize_session=False)
+            for message in sent:
+                outbox_messages_total.labels(message.kind, "sent").inc()
+
+        now = datetime.utcnow()
+        for message, error in zip(messages, errors):
+            if error is None:
+                continue
+            values = {OutboxMessage.last_error: f"{type(error).__name__}: {error}"[:2000]}
+            if isinstance(error, PermanentDeliveryError) or message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                values[OutboxMessage.status] = STATUS_DEAD
+                outbox_messages_total.labels(message.kind, "dead").inc()
+                logger.error(f"Outbox message {message.id} ({message.kind}) failed for good: {error}")
+            else:
+                values[OutboxMessage.available_at] = now + timedelta(seconds=retry_delay(message.attempts))
+                outbox_messages_total.labels(message.kind, "retry").inc()
+                logger.warning(f"Outbox message {message.id} ({message.kind}) failed, will retry: {error}")
+            db.query(OutboxMessage).filter(OutboxMessage.id == message.id).update(values, synchronize_session=False)
+        db.commit()
+        return len(messages)
+
+    async def drain(self, db: Session) -> int:
+        """Send batches until nothing is due; returns how many messages were claimed"""
+        total = 0
+        while True:
+            claimed = await self.dispatch_once(db)
+            total += claimed
+            if claimed < settings.OUTBOX_BATCH_SIZE:
+                return total
+
+    def wake(self) -> None:
+        """Have the dispatcher look for messages now (safe from any thread)"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self) -> None:
+        """Start sending queued messages in the background"""
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._loop = None
+        self._wakeup = None
+
+    async def _run(self) -> None:
+        from app.core import database
+
+        while True:
+            self._wakeup.clear()
+            db = database.SessionLocal()
+            try:
+                await self.drain(db)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Outbox dispatch failed: {e}")
+            finally:
+                db.close()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+outbox_dispatcher = OutboxDispatcher()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session: Session) -> None:
+    if session.info.pop(QUEUED_KEY, None):
+        outbox_dispatcher.wake()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_wakeup(session: Session, previous_transaction) -> None:
+    if not previous_transaction.nested:
+        session.info.pop(QUEUED_KEY, None)
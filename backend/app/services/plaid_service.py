@@ -4,43 +4,55 @@ Handles connecting accounts and fetching transactions
 """
 from typing import List, Optional, Dict
 from datetime import datetime, timedelta
-import plaid
-from plaid.api import plaid_api
-from plaid.model.products import Products
-from plaid.model.country_code import CountryCode
-from plaid.model.link_token_create_request import LinkTokenCreateRequest
-from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
-from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
-from plaid.model.transactions_get_request import TransactionsGetRequest
-from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.core.metrics import track_external
 from app.models.models import User, CachedBankData
 
 
 class PlaidService:
-    """Service for Plaid bank integration"""
+    """
+    Service for Plaid bank integration
+
+    The plaid SDK takes a few hundred milliseconds to import, so it's imported
+    (and the API client built) on first use rather than at worker startup.
+    """
 
     def __init__(self):
-        configuration = plaid.Configuration(
-            host=self._get_plaid_host(),
-            api_key={
-                'clientId': settings.PLAID_CLIENT_ID,
-                'secret': settings.PLAID_SECRET,
-            }
-        )
-        api_client = plaid.ApiClient(configuration)
-        self.client = plaid_api.PlaidApi(api_client)
+        self._client = None
+        self._client_id = settings.PLAID_CLIENT_ID
+        self._secret = settings.PLAID_SECRET
+        self._env = settings.PLAID_ENV
+
+    @property
+    def client(self):
+        if self._client is None:
+            import plaid
+            from plaid.api import plaid_api
+
+            configuration = plaid.Configuration(
+                host=self._get_plaid_host(),
+                api_key={
+                    'clientId': self._client_id,
+                    'secret': self._secret,
+                }
+            )
+            api_client = plaid.ApiClient(configuration)
+            self._client = plaid_api.PlaidApi(api_client)
+        return self._client
 
     def _get_plaid_host(self) -> str:
         """Get Plaid API host based on environment"""
+        import plaid
+
+        # Newer SDKs dropped Development along with the environment itself
         env_map = {
             'sandbox': plaid.Environment.Sandbox,
-            'development': plaid.Environment.Development,
+            'development': getattr(plaid.Environment, 'Development', plaid.Environment.Sandbox),
             'production': plaid.Environment.Production
         }
-        return env_map.get(settings.PLAID_ENV, plaid.Environment.Sandbox)
+        return env_map.get(self._env, plaid.Environment.Sandbox)
 
     async def create_link_token(
         self,
@@ -59,6 +71,12 @@ class PlaidService:
         Returns:
             Dictionary with link_token and expiration
         """
+        import plaid
+        from plaid.model.products import Products
+        from plaid.model.country_code import CountryCode
+        from plaid.model.link_token_create_request import LinkTokenCreateRequest
+        from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
+
         try:
             request = LinkTokenCreateRequest(
                 user=LinkTokenCreateRequestUser(client_user_id=str(user_id)),
@@ -69,7 +87,8 @@ class PlaidService:
                 redirect_uri=f"{settings.CORS_ORIGINS[0]}/bank/oauth-redirect"
             )
 
-            response = self.client.link_token_create(request)
+            with track_external("plaid", "link_token_create"):
+                response = self.client.link_token_create(request)
 
             return {
                 'link_token': response['link_token'],
@@ -97,9 +116,13 @@ class PlaidService:
         Returns:
             Dictionary with access_token and item_id
         """
+        import plaid
+        from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
+
         try:
             request = ItemPublicTokenExchangeRequest(public_token=public_token)
-            response = self.client.item_public_token_exchange(request)
+            with track_external("plaid", "item_public_token_exchange"):
+                response = self.client.item_public_token_exchange(request)
 
             access_token = response['access_token']
             item_id = response['item_id']
@@ -141,6 +164,10 @@ class PlaidService:
         Returns:
             List of transaction dictionaries
         """
+        import plaid
+        from plaid.model.transactions_get_request import TransactionsGetRequest
+        from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
+
         try:
             request = TransactionsGetRequest(
                 access_token=access_token,
@@ -152,13 +179,15 @@ class PlaidService:
                 )
             )
 
-            response = self.client.transactions_get(request)
+            with track_external("plaid", "transactions_get"):
+                response = self.client.transactions_get(request)
             transactions = response['transactions']
 
             # Pagination if needed
             while len(transactions) < response['total_transactions']:
                 request.options.offset = len(transactions)
-                response = self.client.transactions_get(request)
+                with track_external("plaid", "transactions_get"):
+                    response = self.client.transactions_get(request)
                 transactions.extend(response['transactions'])
 
             # Cache transactions
@@ -1,13 +1,90 @@
 """
 Push notification service using Web Push protocol
+
+A user gets notifications on every device they subscribed on, one
+PushNotification row each. Notifications are encrypted for each device
+(aes128gcm) and posted to the push services concurrently, up to
+WEB_PUSH_CONCURRENCY at a time, through one shared HTTP/2 client, so devices
+on the same push service share a connection. The VAPID token for each push
+service is signed once and reused until shortly before it expires.
+Subscriptions the push service reports gone (404/410) are deleted together
+after each batch.
 """
-from pywebpush import webpush, WebPushException
-from sqlalchemy.orm import Session
-from typing import Optional
+import asyncio
+import hashlib
 import json
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.models.models import User, PushNotification
+from app.core.metrics import track_external
+from app.models.models import PushNotification
+from app.services.outbox_service import PermanentDeliveryError
+
+logger = logging.getLogger(__name__)
+
+# VAPID tokens last 12 hours (push services accept up to 24) and are re-signed in their last hour
+VAPID_TOKEN_SECONDS = 12 * 3600
+VAPID_REFRESH_SECONDS = 3600
+
+# Outcome of a send to a subscription the push service no longer knows
+GONE = "gone"
+
+
+class PushServiceError(Exception):
+    """The push service couldn't take the notification now; worth retrying"""
+
+
+class PushResult(NamedTuple):
+    """How one notification went across the user's devices"""
+    delivered: int
+    error: Optional[Exception]
+
+
+_client = None
+
+
+def http_client():
+    """The shared HTTP client for push services"""
+    global _client
+    if _client is None:
+        import httpx
+
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=settings.WEB_PUSH_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=settings.WEB_PUSH_CONCURRENCY)
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def endpoint_hash(endpoint: str) -> str:
+    return hashlib.sha256(endpoint.encode()).hexdigest()
+
+
+def parse_subscription(subscription: str) -> dict:
+    """
+    Subscription JSON from the browser (PushSubscription.toJSON())
+
+    Raises:
+        ValueError: if it isn't a JSON object with an endpoint
+    """
+    info = json.loads(subscription)
+    if not isinstance(info, dict) or not isinstance(info.get("endpoint"), str) or not info["endpoint"]:
+        raise ValueError("Push subscription has no endpoint")
+    return info
 
 
 class PushNotificationService:
@@ -19,6 +96,32 @@ class PushNotificationService:
         self.vapid_claims = {
             "sub": f"mailto:{settings.WEB_PUSH_EMAIL or 'noreply@sahasplit.app'}"
         }
+        self._vapid = None
+        # Authorization header and its expiry, by push service origin
+        self._vapid_tokens: Dict[str, Tuple[str, int]] = {}
+
+    def _vapid_key(self):
+        if self._vapid is None:
+            from py_vapid import Vapid02
+
+            key = self.vapid_private_key
+            self._vapid = Vapid02.from_file(key) if os.path.isfile(key) else Vapid02.from_string(key)
+        return self._vapid
+
+    def vapid_authorization(self, endpoint: str) -> str:
+        """VAPID Authorization header for the push service of an endpoint"""
+        parts = urlsplit(endpoint)
+        audience = f"{parts.scheme}://{parts.netloc}"
+        now = int(time.time())
+
+        cached = self._vapid_tokens.get(audience)
+        if cached and cached[1] - now > VAPID_REFRESH_SECONDS:
+            return cached[0]
+
+        expires = now + VAPID_TOKEN_SECONDS
+        header = self._vapid_key().sign({**self.vapid_claims, "aud": audience, "exp": expires})["Authorization"]
+        self._vapid_tokens[audience] = (header, expires)
+        return header
 
     async def send_notification(
         self,
@@ -41,51 +144,110 @@ class PushNotificationService:
         Returns:
             True if sent successfully
         """
-        # Get user's push subscription
-        subscription = db.query(PushNotification).filter(
-            PushNotification.user_id == user_id
-        ).first()
-
-        if not subscription or not subscription.subscription:
+        try:
+            return await self.deliver(db, user_id, title, body, data)
+        except Exception as e:
+            print(f"Error sending push notification: {e}")
             return False
 
-        try:
-            # Parse subscription JSON
-            subscription_info = json.loads(subscription.subscription)
-
-            # Prepare notification payload
-            payload = {
-                "title": title,
-                "body": body,
-                "icon": "/icon-192x192.png",
-                "badge": "/icon-192x192.png"
-            }
-
-            if data:
-                payload["data"] = data
-
-            # Send web push
-            webpush(
-                subscription_info=subscription_info,
-                data=json.dumps(payload),
-                vapid_private_key=self.vapid_private_key,
-                vapid_claims=self.vapid_claims
-            )
+    async def deliver(
+        self,
+        db: Session,
+        user_id: int,
+        title: str,
+        body: str,
+        data: Optional[dict] = None
+    ) -> bool:
+        """
+        Send a push notification to all of a user's devices, raising if none got it
 
-            return True
+        Returns False without raising when there's nothing to retry: the user has
+        no subscriptions left.
+        """
+        result, = await self._deliver(db, [{"user_id": user_id, "title": title, "body": body, "data": data}])
+        if result.error is not None:
+            raise result.error
+        return result.delivered > 0
 
-        except WebPushException as e:
-            print(f"Error sending push notification: {e}")
+    async def deliver_many(self, db: Session, notifications: Sequence[dict]) -> List[Optional[Exception]]:
+        """
+        Send many notifications (each given as deliver arguments) in one burst
+
+        Used by the outbox dispatcher. Returns each notification's error, or None
+        if a device got it or the user has no devices.
+        """
+        return [result.error for result in await self._deliver(db, notifications)]
 
-            # If subscription is invalid, delete it
-            if e.response and e.response.status_code in [404, 410]:
-                db.delete(subscription)
-                db.commit()
+    async def _deliver(self, db: Session, notifications: Sequence[dict]) -> List[PushResult]:
+        user_ids = {n["user_id"] for n in notifications}
+        devices: Dict[int, List[Tuple[int, dict]]] = {}
+        gone: List[int] = []
+        for subscription_id, user_id, subscription in db.query(
+            PushNotification.id, PushNotification.user_id, PushNotification.subscription
+        ).filter(PushNotification.user_id.in_(user_ids)).all():
+            try:
+                devices.setdefault(user_id, []).append((subscription_id, parse_subscription(subscription)))
+            except ValueError:
+                gone.append(subscription_id)
 
-            return False
-        except Exception as e:
-            print(f"Unexpected error sending push: {e}")
-            return False
+        semaphore = asyncio.Semaphore(settings.WEB_PUSH_CONCURRENCY)
+        sends = []
+        for index, notification in enumerate(notifications):
+            payload = _payload(notification["title"], notification["body"], notification.get("data"))
+            for subscription_id, info in devices.get(notification["user_id"], []):
+                sends.append((index, subscription_id, self._send(semaphore, info, payload)))
+
+        outcomes = await asyncio.gather(*(send for _, _, send in sends))
+
+        by_notification: List[List] = [[] for _ in notifications]
+        for (index, subscription_id, _), outcome in zip(sends, outcomes):
+            if outcome == GONE:
+                gone.append(subscription_id)
+            else:
+                by_notification[index].append(outcome)
+
+        if gone:
+            db.query(PushNotification).filter(
+                PushNotification.id.in_(gone)
+            ).delete(synchronize_session=False)
+            db.commit()
+
+        return [_result(results) for results in by_notification]
+
+    async def _send(self, semaphore: asyncio.Semaphore, info: dict, payload: bytes):
+        """Post a notification to one device; returns None, GONE or the error"""
+        import httpx
+        # pywebpush pulls in aiohttp and cryptography, so it's imported on first send
+        from pywebpush import WebPusher, WebPushException
+
+        try:
+            content = WebPusher(info).encode(payload, "aes128gcm")["body"]
+        except WebPushException:
+            # No usable keys; this subscription can never be sent to
+            return GONE
+
+        endpoint = info["endpoint"]
+        headers = {
+            "Authorization": self.vapid_authorization(endpoint),
+            "Content-Encoding": "aes128gcm",
+            "Content-Type": "application/octet-stream",
+            "TTL": str(settings.WEB_PUSH_TTL_SECONDS),
+        }
+        async with semaphore:
+            try:
+                with track_external("web_push", "send"):
+                    response = await http_client().post(endpoint, content=content, headers=headers)
+            except httpx.HTTPError as e:
+                return PushServiceError(f"{type(e).__name__}: {e}")
+
+        if response.is_success:
+            return None
+        if response.status_code in (404, 410):
+            return GONE
+        if response.status_code == 429 or response.status_code >= 500:
+            return PushServiceError(f"Push service returned {response.status_code}")
+        return PermanentDeliveryError(f"Push service rejected the notification: {response.status_code} "
+                                      f"{response.text[:200]}")
 
     async def register_subscription(
         self,
@@ -94,7 +256,7 @@ class PushNotificationService:
         subscription: str
     ) -> bool:
         """
-        Register or update a user's push subscription
+        Register or update a device's push subscription for a user
 
         Args:
             db: Database session
@@ -103,16 +265,23 @@ class PushNotificationService:
 
         Returns:
             True if registered successfully
+
+        Raises:
+            ValueError: if the subscription has no endpoint
         """
+        key = endpoint_hash(parse_subscription(subscription)["endpoint"])
         existing = db.query(PushNotification).filter(
-            PushNotification.user_id == user_id
+            PushNotification.endpoint_hash == key
         ).first()
 
         if existing:
+            # The same browser may now be signed in as someone else
+            existing.user_id = user_id
             existing.subscription = subscription
         else:
             push_notif = PushNotification(
                 user_id=user_id,
+                endpoint_hash=key,
                 subscription=subscription
             )
             db.add(push_notif)
@@ -125,6 +294,32 @@ class PushNotificationService:
         return self.vapid_public_key or ""
 
 
+def _payload(title: str, body: str, data: Optional[dict]) -> bytes:
+    payload = {
+        "title": title,
+        "body": body,
+        "icon": "/icon-192x192.png",
+        "badge": "/icon-192x192.png"
+    }
+    if data:
+        payload["data"] = data
+    return json.dumps(payload).encode()
+
+
+def _result(outcomes: list) -> PushResult:
+    """
+    A notification counts as sent once any device got it; failures on the
+    other devices are only logged, so a retry doesn't repeat it on the rest
+    """
+    delivered = sum(1 for outcome in outcomes if outcome is None)
+    errors = [outcome for outcome in outcomes if outcome is not None]
+    if delivered or not errors:
+        for error in errors:
+            logger.warning(f"Push notification not delivered to a device: {error}")
+        return PushResult(delivered, None)
+    retryable = [e for e in errors if not isinstance(e, PermanentDeliveryError)]
+    return PushResult(0, (retryable or errors)[0])
+
+
 # Global service instance
 push_service = PushNotificationService()
-
@@ -0,0 +1,298 @@
+"""
+Realtime service - live change events for connected clients
+
+Every change_log row flushed in a transaction is published once the transaction
+commits. Events are small ({seq, type, id, op, group_id}); clients react by
+calling /sync with their last token, so they stop polling the list endpoints.
+
+With REALTIME_BACKEND="redis" events go through one Redis pub/sub channel, and
+each uvicorn worker keeps a single subscription that it fans out to its own
+connections. Commits only queue their events; a background task publishes
+them, so a slow or unreachable Redis never holds up requests. The default
+in-process broker is enough for one worker and tests.
+"""
+import asyncio
+import json
+import logging
+import threading
+from typing import Callable, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import ChangeLog
+
+logger = logging.getLogger(__name__)
+
+# Session.info key holding events flushed in the current transaction
+PENDING_KEY = "realtime_events"
+
+
+class Subscription:
+    """One connected client, fed by the hub from any thread"""
+
+    def __init__(self, user_id: int, group_ids: Set[int], loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.group_ids = set(group_ids)
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.REALTIME_QUEUE_SIZE)
+        # Set when events were dropped; the client has to resync instead
+        self.overflowed = False
+
+    def wants(self, change: dict) -> bool:
+        if change.get("user_id") == self.user_id:
+            return True
+        if change["type"] == "membership" and _membership_user(change) == self.user_id:
+            return True
+        return change.get("group_id") is not None and change["group_id"] in self.group_ids
+
+    def deliver(self, change: dict) -> None:
+        """Queue an event; must run on the subscription's loop"""
+        # Follow membership changes so new groups stream without reconnecting
+        if change["type"] == "membership" and _membership_user(change) == self.user_id:
+            group_id = int(change["id"].split(":")[0])
+            if change["op"] == "delete":
+                self.group_ids.discard(group_id)
+            else:
+                self.group_ids.add(group_id)
+        elif change["type"] == "group" and change["op"] == "delete":
+            self.group_ids.discard(int(change["id"]))
+
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+def _membership_user(change: dict) -> int:
+    return int(change["id"].split(":")[1])
+
+
+class Hub:
+    """Routes events to this process's subscriptions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: Set[Subscription] = set()
+        self._listeners: List[Callable[[List[dict]], None]] = []
+
+    def add_listener(self, listener: Callable[[List[dict]], None]) -> None:
+        """Call `listener` with every batch of events this process sees (e.g. cache invalidation)"""
+        self._listeners.append(listener)
+
+    def notify(self, changes: List[dict]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.warning(f"Realtime listener failed: {e}")
+
+    def add(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.add(subscription)
+
+    def remove(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def dispatch(self, changes: List[dict]) -> None:
+        """Hand events to listeners and matching subscriptions; safe to call from any thread"""
+        self.notify(changes)
+
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+
+        for subscription in subscriptions:
+            for change in changes:
+                if subscription.wants(change):
+                    try:
+                        subscription.loop.call_soon_threadsafe(subscription.deliver, change)
+                    except RuntimeError:
+                        # Loop already closed; the stream is going away
+                        self.remove(subscription)
+                        break
+
+
+class InProcessBroker:
+    """Delivers events straight to the local hub"""
+
+    def __init__(self, hub: Hub):
+        self.hub = hub
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def publish(self, changes: List[dict]) -> None:
+        self.hub.dispatch(changes)
+
+
+class RedisBroker:
+    """Fans events out to every worker through one Redis pub/sub channel"""
+
+    def __init__(self, hub: Hub, url: str, channel: str):
+        self.hub = hub
+        self.url = url
+        self.channel = channel
+        self._publisher = None
+        self._listener: Optional[asyncio.Task] = None
+        self._sender: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outgoing: Optional[asyncio.Queue] = None
+
+    async def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        if self._sender is None or self._sender.done():
+            self._loop = asyncio.get_running_loop()
+            self._outgoing = asyncio.Queue(maxsize=settings.REALTIME_PUBLISH_QUEUE_SIZE)
+            self._sender = asyncio.create_task(self._send())
+
+    async def stop(self) -> None:
+        for task in (self._listener, self._sender):
+            if task:
+                task.cancel()
+        self._listener = self._sender = None
+        self._loop = None
+
+    def publish(self, changes: List[dict]) -> None:
+        """Queue events for publishing; called from commit hooks on any thread"""
+        # Local listeners shouldn't wait for the round trip through Redis
+        self.hub.notify(changes)
+
+        message = json.dumps(changes)
+        loop = self._loop
+        if loop is None:
+            # Not serving (scripts, the scheduler): publish inline, bounded by the client timeouts
+            self._publish_now(message)
+            return
+        try:
+            loop.call_soon_threadsafe(self._enqueue, message)
+        except RuntimeError:
+            # The loop has closed under us (shutdown)
+            self._publish_now(message)
+
+    def _enqueue(self, message: str) -> None:
+        try:
+            self._outgoing.put_nowait(message)
+        except asyncio.QueueFull:
+            # Clients still catch up through /sync on their next reconnect
+            logger.warning("Realtime publish queue full, dropping events")
+
+    def _publish_now(self, message: str) -> None:
+        import redis
+
+        if self._publisher is None:
+            self._publisher = redis.Redis.from_url(self.url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        try:
+            self._publisher.publish(self.channel, message)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to publish realtime events: {e}")
+
+    async def _send(self) -> None:
+        import redis
+        import redis.asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        try:
+            while True:
+                message = await self._outgoing.get()
+                try:
+                    await client.publish(self.channel, message)
+                except redis.RedisError as e:
+                    logger.warning(f"Failed to publish realtime events: {e}")
+        finally:
+            await client.close()
+
+    async def _listen(self) -> None:
+        import redis.asyncio as aioredis
+
+        while True:
+            # No socket_timeout: the subscription waits for messages indefinitely
+            client = aioredis.Redis.from_url(self.url, socket_connect_timeout=0.5)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.hub.dispatch(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Realtime subscription lost, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+                await client.close()
+
+
+class RealtimeService:
+    """Publishes committed changes and manages live subscriptions"""
+
+    def __init__(self):
+        self.hub = Hub()
+        if settings.REALTIME_BACKEND == "redis":
+            self.broker = RedisBroker(self.hub, settings.REDIS_URL, settings.REALTIME_CHANNEL)
+        else:
+            self.broker = InProcessBroker(self.hub)
+
+    async def start(self) -> None:
+        """Start receiving events published by other workers"""
+        await self.broker.start()
+
+    async def subscribe(self, user_id: int, group_ids: Set[int]) -> Subscription:
+        await self.broker.start()
+        subscription = Subscription(user_id, group_ids, asyncio.get_running_loop())
+        self.hub.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.hub.remove(subscription)
+
+    def publish(self, changes: List[dict]) -> None:
+        if changes:
+            self.broker.publish(changes)
+
+    async def stop(self) -> None:
+        await self.broker.stop()
+
+
+realtime_service = RealtimeService()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session: Session, flush_context) -> None:
+    # seq is assigned by now but expires on commit, so snapshot it here
+    changes = [
+        {
+            "seq": obj.seq,
+            "type": obj.entity_type,
+            "id": obj.entity_id,
+            "op": obj.op,
+            "group_id": obj.group_id,
+            "user_id": obj.user_id,
+        }
+        for obj in session.new if isinstance(obj, ChangeLog)
+    ]
+    if changes:
+        session.info.setdefault(PENDING_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session: Session) -> None:
+    changes = session.info.pop(PENDING_KEY, None)
+    if changes:
+        realtime_service.publish(changes)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changes(session: Session, previous_transaction) -> None:
+    # Savepoint rollbacks keep the outer events; a spurious event only costs a /sync call
+    if not previous_transaction.nested:
+        session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,313 @@
+"""
+Session service - server-side login sessions kept in Redis
+
+Every login creates a session, and the tokens it issues carry the session id
+(the `sid` claim). Authenticated requests check the session with a single
+GETEX, which also slides its expiry: sessions end after SESSION_IDLE_DAYS
+without use, or when revoked ("log out other devices").
+
+The sessions table mirrors Redis for durability. Creations and activity
+updates are written behind, batched every SESSION_MIRROR_INTERVAL_SECONDS by
+each worker. Activity is only recorded once per SESSION_TOUCH_SECONDS, and
+only updates rows that exist; rows are inserted for new sessions alone.
+Revocations are written through and leave a tombstone in Redis, so a write
+queued by another worker can't bring a revoked session back from the table.
+If Redis loses a session (or is unreachable), validation falls back to the
+table and restores it.
+
+Redis keys:
+    sahasplit:session:<sid>         JSON details, expiring after the idle window
+    sahasplit:user_sessions:<uid>   set of the user's session ids
+    sahasplit:revoked_session:<sid> tombstone of a revoked session, for the idle window
+"""
+import asyncio
+import json
+import logging
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Session as SessionRecord
+
+logger = logging.getLogger(__name__)
+
+SESSION_PREFIX = "sahasplit:session:"
+USER_SESSIONS_PREFIX = "sahasplit:user_sessions:"
+REVOKED_PREFIX = "sahasplit:revoked_session:"
+
+
+def _session_key(sid: str) -> str:
+    return f"{SESSION_PREFIX}{sid}"
+
+
+def _user_key(user_id: int) -> str:
+    return f"{USER_SESSIONS_PREFIX}{user_id}"
+
+
+def _revoked_key(sid: str) -> str:
+    return f"{REVOKED_PREFIX}{sid}"
+
+
+class SessionStore:
+    """Create, validate, list and revoke sessions"""
+
+    def __init__(self, redis_url: str):
+        self.redis_url = redis_url
+        self._redis = None
+        # Write-behind queue for the sessions table: sid -> row values, with
+        # "new" set for sessions that have no row yet
+        self._pending: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # Held while writing to the table, so a revocation can't interleave with a flush
+        self._mirror_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def idle_seconds(self) -> int:
+        return settings.SESSION_IDLE_DAYS * 86400
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def create(self, user_id: int, user_agent: Optional[str] = None) -> str:
+        """Start a session for a user and get its id"""
+        sid = secrets.token_urlsafe(24)
+        now = time.time()
+        data = {"user_id": user_id, "created_at": now, "touched_at": now, "user_agent": (user_agent or "")[:255]}
+
+        try:
+            with self._client().pipeline() as pipe:
+                pipe.set(_session_key(sid), json.dumps(data), ex=self.idle_seconds)
+                pipe.sadd(_user_key(user_id), sid)
+                pipe.expire(_user_key(user_id), self.idle_seconds)
+                pipe.execute()
+        except Exception as e:
+            # The table still gets it, and validation restores it from there
+            logger.warning(f"Failed to store session in Redis: {e}")
+
+        self._queue(sid, data, new=True)
+        return sid
+
+    def validate(self, sid: str, user_id: int, db: Session) -> bool:
+        """Whether a session is live and belongs to the user; slides its expiry"""
+        try:
+            raw = self._client().getex(_session_key(sid), ex=self.idle_seconds)
+        except Exception as e:
+            logger.warning(f"Session lookup failed, using the database: {e}")
+            return self._validate_from_table(sid, user_id, db, restore=False)
+
+        if raw is None:
+            return self._validate_from_table(sid, user_id, db, restore=True)
+
+        data = json.loads(raw)
+        if data["user_id"] != user_id:
+            return False
+
+        now = time.time()
+        if now - data["touched_at"] >= settings.SESSION_TOUCH_SECONDS:
+            data["touched_at"] = now
+            try:
+                self._client().set(_session_key(sid), json.dumps(data), ex=self.idle_seconds)
+            except Exception as e:
+                logger.warning(f"Failed to record session activity: {e}")
+            self._queue(sid, data)
+        return True
+
+    def _validate_from_table(self, sid: str, user_id: int, db: Session, restore: bool) -> bool:
+        record = db.query(SessionRecord).filter(SessionRecord.id == sid).first()
+        if record is None or record.user_id != user_id or record.expires <= datetime.utcnow():
+            return False
+        if restore and self._tombstoned([sid]):
+            return False
+
+        if restore:
+            now = time.time()
+            created = record.created_at.timestamp() if record.created_at else now
+            data = {"user_id": user_id, "created_at": created, "touched_at": now,
+                    "user_agent": record.user_agent or ""}
+            try:
+                with self._client().pipeline() as pipe:
+                    pipe.set(_session_key(sid), json.dumps(data), ex=self.idle_seconds)
+                    pipe.sadd(_user_key(user_id), sid)
+                    pipe.execute()
+            except Exception as e:
+                logger.warning(f"Failed to restore session to Redis: {e}")
+            self._queue(sid, data)
+        return True
+
+    def list_sessions(self, user_id: int, db: Session) -> List[dict]:
+        """A user's live sessions, most recently used first"""
+        try:
+            client = self._client()
+            sids = sorted(sid.decode() for sid in client.smembers(_user_key(user_id)))
+            values = client.mget([_session_key(sid) for sid in sids]) if sids else []
+        except Exception as e:
+            logger.warning(f"Session listing failed, using the database: {e}")
+            return self._list_from_table(user_id, db)
+
+        sessions, expired = [], []
+        for sid, raw in zip(sids, values):
+            if raw is None:
+                expired.append(sid)
+                continue
+            data = json.loads(raw)
+            sessions.append({
+                "id": sid,
+                "user_agent": data.get("user_agent") or None,
+                "created_at": datetime.utcfromtimestamp(data["created_at"]),
+                "last_active_at": datetime.utcfromtimestamp(data["touched_at"]),
+            })
+        if expired:
+            try:
+                client.srem(_user_key(user_id), *expired)
+            except Exception:
+                pass
+
+        return sorted(sessions, key=lambda s: s["last_active_at"], reverse=True)
+
+    def _list_from_table(self, user_id: int, db: Session) -> List[dict]:
+        records = db.query(SessionRecord).filter(
+            SessionRecord.user_id == user_id,
+            SessionRecord.expires > datetime.utcnow()
+        ).order_by(SessionRecord.last_active_at.desc()).all()
+        return [
+            {"id": r.id, "user_agent": r.user_agent, "created_at": r.created_at, "last_active_at": r.last_active_at}
+            for r in records
+        ]
+
+    def revoke(self, sid: str, user_id: int, db: Session) -> bool:
+        """End one of a user's sessions; returns False if there was no such session"""
+        return self._revoke(user_id, db, [sid]) > 0
+
+    def revoke_all(self, user_id: int, db: Session, except_sid: Optional[str] = None) -> int:
+        """End all of a user's sessions (but `except_sid`); returns how many were live"""
+        sids = {s["id"] for s in self.list_sessions(user_id, db)}
+        sids |= {sid for (sid,) in db.query(SessionRecord.id).filter(SessionRecord.user_id == user_id).all()}
+        with self._lock:
+            sids |= {sid for sid, row in self._pending.items() if row["user_id"] == user_id}
+        sids.discard(except_sid)
+        return self._revoke(user_id, db, sorted(sids))
+
+    def _revoke(self, user_id: int, db: Session, sids: List[str]) -> int:
+        if not sids:
+            return 0
+
+        with self._mirror_lock:
+            with self._lock:
+                revoked = {sid for sid in sids if self._pending.get(sid, {}).get("user_id") == user_id}
+                for sid in revoked:
+                    del self._pending[sid]
+            query = db.query(SessionRecord).filter(SessionRecord.user_id == user_id, SessionRecord.id.in_(sids))
+            revoked |= {record.id for record in query.all()}
+            query.delete(synchronize_session=False)
+            db.commit()
+
+        try:
+            client = self._client()
+            values = client.mget([_session_key(sid) for sid in sids])
+            revoked |= {
+                sid for sid, raw in zip(sids, values)
+                if raw is not None and json.loads(raw)["user_id"] == user_id
+            }
+            with client.pipeline() as pipe:
+                for sid in revoked:
+                    pipe.delete(_session_key(sid))
+                    pipe.set(_revoked_key(sid), 1, ex=self.idle_seconds)
+                pipe.srem(_user_key(user_id), *sids)
+                pipe.execute()
+        except Exception as e:
+            # The table rows are gone, and queued activity only updates rows that exist
+            logger.warning(f"Failed to remove revoked sessions from Redis: {e}")
+        return len(revoked)
+
+    def _tombstoned(self, sids: List[str]) -> set:
+        """Which of these sessions have been revoked, per their Redis tombstones"""
+        if not sids:
+            return set()
+        try:
+            flags = self._client().mget([_revoked_key(sid) for sid in sids])
+        except Exception as e:
+            logger.warning(f"Failed to check revoked sessions: {e}")
+            return set()
+        return {sid for sid, flag in zip(sids, flags) if flag is not None}
+
+    def _queue(self, sid: str, data: dict, new: bool = False) -> None:
+        with self._lock:
+            new = new or self._pending.get(sid, {}).get("new", False)
+            self._pending[sid] = {**data, "new": new}
+
+    def flush(self, db: Optional[Session] = None) -> int:
+        """Write queued session changes to the sessions table; returns how many"""
+        from app.core import database
+
+        with self._mirror_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            revoked = self._tombstoned([sid for sid, data in pending.items() if data["new"]])
+            session = db or database.SessionLocal()
+            try:
+                for sid, data in pending.items():
+                    touched = datetime.utcfromtimestamp(data["touched_at"])
+                    expires = touched + timedelta(seconds=self.idle_seconds)
+                    if not data["new"]:
+                        # A row deleted by a revocation on another worker stays deleted
+                        session.query(SessionRecord).filter(SessionRecord.id == sid).update(
+                            {"expires": expires, "last_active_at": touched}, synchronize_session=False
+                        )
+                    elif sid not in revoked:
+                        session.merge(SessionRecord(
+                            id=sid,
+                            session_token=sid,
+                            user_id=data["user_id"],
+                            expires=expires,
+                            user_agent=data.get("user_agent") or None,
+                            created_at=datetime.utcfromtimestamp(data["created_at"]),
+                            last_active_at=touched,
+                        ))
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.warning(f"Failed to mirror {len(pending)} sessions: {e}")
+                # Keep them for the next flush, unless they changed since
+                with self._lock:
+                    for sid, data in pending.items():
+                        self._pending.setdefault(sid, data)
+                return 0
+            finally:
+                if db is None:
+                    session.close()
+        return len(pending)
+
+    async def start(self) -> None:
+        """Start mirroring sessions to the table in the background"""
+        if settings.SESSIONS_ENABLED and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._mirror_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _mirror_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.SESSION_MIRROR_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.warning(f"Session mirror failed: {e}")
+
+
+session_store = SessionStore(settings.REDIS_URL)
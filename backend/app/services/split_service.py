@@ -13,6 +13,12 @@ from app.models.models import (
     BalanceView, SplitType, ExpenseRecurrence
 )
 from app.schemas.expense import ExpenseCreate, ParticipantCreate
+from app.services.balance_history_service import invalidate_checkpoints
+from app.services.notification_service import ADDED, DELETED, UPDATED, notify_expense_change
+from app.services.version_service import bump_group_version, bump_ledger_versions
+from app.services.sync_service import (
+    record_change, record_expense_change, membership_id, ENTITY_MEMBERSHIP, ENTITY_BALANCE
+)
 
 
 def get_non_zero_participants(participants: List[ParticipantCreate]) -> List[Dict]:
@@ -42,6 +48,8 @@ async def join_group(db: Session, user_id: int, public_group_id: str) -> Group:
     if not existing:
         group_user = GroupUser(group_id=group.id, user_id=user_id)
         db.add(group_user)
+        bump_group_version(db, group.id)
+        record_change(db, ENTITY_MEMBERSHIP, membership_id(group.id, user_id), group_id=group.id)
         db.commit()
 
     return group
@@ -151,12 +159,24 @@ async def create_expense(
                 conversion_from_params.currency, amount
             )
 
+        conversion_user_ids = [conversion_payer_id] + [p["user_id"] for p in conversion_participants]
+        invalidate_checkpoints(db, conversion_user_ids, conversion_expense.expense_date)
+        bump_ledger_versions(db, conversion_user_ids)
+        record_expense_change(db, conversion_expense_id, conversion_from_params.group_id, conversion_user_ids)
+        if conversion_from_params.group_id != expense_data.group_id:
+            bump_group_version(db, conversion_from_params.group_id)
+
+    # Point-in-time balances cached after this expense's date are now stale
+    involved_user_ids = [payer_id] + [p["user_id"] for p in non_zero_participants]
+    invalidate_checkpoints(db, involved_user_ids, expense.expense_date)
+    bump_ledger_versions(db, involved_user_ids)
+    bump_group_version(db, expense_data.group_id)
+    record_expense_change(db, expense_id, expense_data.group_id, involved_user_ids)
+    notify_expense_change(db, expense, ADDED, current_user_id, involved_user_ids)
+
     db.commit()
     db.refresh(expense)
 
-    # Send push notification (async, don't block)
-    # await send_expense_push_notification(expense_id)
-
     return expense
 
 
@@ -228,11 +248,14 @@ async def _update_balance(
 async def delete_expense(
     db: Session,
     expense_id: str,
-    deleted_by: int
+    deleted_by: int,
+    notify: bool = True
 ) -> None:
     """
     Soft-delete an expense by setting deletedAt timestamp
     Also reverses the balance changes made by this expense.
+    Participants are notified unless notify is False (for the conversion
+    half of a currency conversion, which isn't announced on its own).
     """
     expense = db.query(Expense).filter(Expense.id == expense_id).first()
 
@@ -241,7 +264,7 @@ async def delete_expense(
 
     # If this expense has a currency conversion, delete that too
     if expense.conversion_to_id:
-        await delete_expense(db, expense.conversion_to_id, deleted_by)
+        await delete_expense(db, expense.conversion_to_id, deleted_by, notify=False)
 
     # Reverse balance changes before deleting
     participants = db.query(ExpenseParticipant).filter(
@@ -259,6 +282,14 @@ async def delete_expense(
             expense.currency, -participant.amount  # Negative to reverse
         )
 
+    involved_user_ids = [payer_id] + [p.user_id for p in participants]
+    invalidate_checkpoints(db, involved_user_ids, expense.expense_date)
+    bump_ledger_versions(db, involved_user_ids)
+    bump_group_version(db, expense.group_id)
+    record_expense_change(db, expense_id, expense.group_id, involved_user_ids)
+    if notify:
+        notify_expense_change(db, expense, DELETED, deleted_by, involved_user_ids)
+
     # Soft delete the expense
     expense.deleted_at = datetime.utcnow()
     expense.deleted_by = deleted_by
@@ -284,9 +315,6 @@ async def delete_expense(
 
     db.commit()
 
-    # Send push notification
-    # await send_expense_push_notification(expense_id)
-
 
 async def edit_expense(
     db: Session,
@@ -307,6 +335,18 @@ async def edit_expense(
     if not expense:
         raise ValueError("Expense not found")
 
+    # Remember who was involved before the edit for checkpoint invalidation
+    affected_user_ids = {expense.paid_by, expense_data.paid_by}
+    affected_user_ids.update(
+        user_id for (user_id,) in db.query(ExpenseParticipant.user_id).filter(
+            ExpenseParticipant.expense_id.in_(
+                [expense.id, expense.conversion_to_id] if expense.conversion_to_id else [expense.id]
+            )
+        ).all()
+    )
+    affected_user_ids.update(p.user_id for p in expense_data.participants)
+    earliest_date = expense.expense_date
+
     # Delete existing participants for this expense
     db.query(ExpenseParticipant).filter(
         ExpenseParticipant.expense_id == expense_data.expense_id
@@ -348,6 +388,14 @@ async def edit_expense(
         ).first()
 
         if conversion_expense:
+            affected_user_ids.add(conversion_to_params.paid_by)
+            affected_user_ids.update(p.user_id for p in conversion_to_params.participants)
+            earliest_date = min(
+                earliest_date,
+                conversion_expense.expense_date,
+                (conversion_to_params.expense_date or conversion_expense.expense_date).replace(tzinfo=None)
+            )
+
             conversion_expense.paid_by = conversion_to_params.paid_by
             conversion_expense.name = conversion_to_params.name
             conversion_expense.category = conversion_to_params.category
@@ -373,12 +421,20 @@ async def edit_expense(
         # TODO: Unschedule APScheduler job
         pass
 
+    # The DateTime columns are naive, so compare the new date the way it will be stored
+    invalidate_checkpoints(
+        db, affected_user_ids, min(earliest_date, expense.expense_date.replace(tzinfo=None))
+    )
+    bump_ledger_versions(db, affected_user_ids)
+    bump_group_version(db, expense.group_id)
+    record_expense_change(db, expense.id, expense.group_id, affected_user_ids)
+    if conversion_to_params and expense.conversion_to_id:
+        record_expense_change(db, expense.conversion_to_id, expense.group_id, affected_user_ids)
+    notify_expense_change(db, expense, UPDATED, current_user_id, affected_user_ids)
+
     db.commit()
     db.refresh(expense)
 
-    # Send push notification
-    # await send_expense_push_notification(expense_data.expense_id)
-
     return expense
 
 
@@ -466,5 +522,7 @@ async def recalculate_group_balances(db: Session, group_id: int) -> None:
             )
             db.add(balance)
 
+    bump_group_version(db, group_id)
+    record_change(db, ENTITY_BALANCE, group_id, group_id=group_id)
     db.commit()
 
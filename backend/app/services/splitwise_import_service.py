@@ -10,6 +10,9 @@ import io
 
 from app.models.models import User, Group, GroupUser, Balance, Expense, ExpenseParticipant
 from app.core.config import settings
+from app.services.balance_history_service import invalidate_checkpoints
+from app.services.sync_service import record_expense_change
+from app.services.version_service import bump_group_version, bump_ledger_versions
 
 
 class SplitwiseImportService:
@@ -116,6 +119,11 @@ class SplitwiseImportService:
                     db.rollback()  # Rollback on error
                     stats['errors'].append(f"Row {stats['rows_processed']}: {str(e)}")
 
+            # Imported expenses are back-dated, so cached balance checkpoints are stale
+            if stats['expenses_imported']:
+                invalidate_checkpoints(db, [u.id for u in user_map.values()])
+                db.commit()
+
         except Exception as e:
             db.rollback()
             stats['errors'].append(f"CSV parsing error: {str(e)}")
@@ -254,6 +262,10 @@ class SplitwiseImportService:
                 await self._update_balance(db, paid_by_user.id, owe_user.id, currency, -owed_amount)
                 stats['balances_imported'] += 1
 
+        involved_user_ids = [pdata['user'].id for pdata in all_participants]
+        record_expense_change(db, expense.id, None, involved_user_ids)
+        bump_ledger_versions(db, involved_user_ids)
+        bump_group_version(db, expense.group_id)
         stats['expenses_imported'] += 1
 
     async def _update_balance(
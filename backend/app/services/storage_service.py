@@ -2,8 +2,6 @@
 Storage service for handling file uploads to S3/R2
 Supports both AWS S3 and Cloudflare R2
 """
-import boto3
-from botocore.client import Config
 from typing import Optional
 
 from app.core.config import settings
@@ -13,32 +11,49 @@ class StorageService:
     """Service for managing file storage in S3/R2"""
 
     def __init__(self):
-        self.client = None
+        self._client = None
+        self._client_options = None
         self.bucket_name = None
         self._initialize_client()
 
+    @property
+    def client(self):
+        """S3 client, created on first use since importing boto3 is slow"""
+        if self._client is None and self._client_options is not None:
+            import boto3
+            from botocore.client import Config
+
+            options = dict(self._client_options)
+            if 'signature_version' in options:
+                options['config'] = Config(signature_version=options.pop('signature_version'))
+            self._client = boto3.client('s3', **options)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+        self._client_options = None
+
     def _initialize_client(self):
-        """Initialize S3 or R2 client based on configuration"""
+        """Read the S3 or R2 client configuration"""
         # Check for R2 configuration first
         if settings.R2_ACCOUNT_ID and settings.R2_ACCESS_KEY_ID:
-            self.client = boto3.client(
-                's3',
-                endpoint_url=f'https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com',
-                aws_access_key_id=settings.R2_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
-                config=Config(signature_version='s3v4'),
-                region_name='auto'
-            )
+            self._client_options = {
+                'endpoint_url': f'https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com',
+                'aws_access_key_id': settings.R2_ACCESS_KEY_ID,
+                'aws_secret_access_key': settings.R2_SECRET_ACCESS_KEY,
+                'signature_version': 's3v4',
+                'region_name': 'auto',
+            }
             self.bucket_name = settings.R2_BUCKET_NAME
 
         # Fall back to AWS S3
         elif settings.AWS_ACCESS_KEY_ID:
-            self.client = boto3.client(
-                's3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_REGION or 'us-east-1'
-            )
+            self._client_options = {
+                'aws_access_key_id': settings.AWS_ACCESS_KEY_ID,
+                'aws_secret_access_key': settings.AWS_SECRET_ACCESS_KEY,
+                'region_name': settings.AWS_REGION or 'us-east-1',
+            }
             self.bucket_name = settings.AWS_S3_BUCKET_NAME
 
     async def get_upload_url(
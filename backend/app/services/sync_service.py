@@ -0,0 +1,281 @@
+"""
+Sync service - delta sync for offline-capable clients
+
+Every write appends rows to the change_log sequence table. A client keeps the
+last token it saw and asks for changes after it; the response carries the
+current state of each changed entity (soft-deleted expenses keep deleted_at),
+tombstones for hard-deleted ones and the affected balance rows.
+
+Sequence numbers are allocated when a row is inserted but become visible when
+its transaction commits, so a lower seq can appear after a higher one. Tokens
+therefore never pass a seq that may still be written: rows older than
+SYNC_SETTLE_SECONDS are settled (no transaction runs that long), and newer rows
+are only served up to the first gap in the sequence.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, func, select
+
+from app.core.config import settings
+from app.models.models import (
+    ChangeLog, Expense, ExpenseParticipant, ExpenseNote, Group, GroupUser,
+    BalanceView, User
+)
+from app.schemas.expense import ExpenseDetailResponse, ParticipantResponse, BalanceResponse
+from app.schemas.group import GroupResponse
+from app.schemas.sync import SyncResponse, SyncNote, SyncMembership
+# Registers the session hooks that publish committed change_log rows
+from app.services import realtime_service  # noqa: F401
+
+# Entity types recorded in change_log
+ENTITY_EXPENSE = "expense"
+ENTITY_NOTE = "note"
+ENTITY_GROUP = "group"
+ENTITY_MEMBERSHIP = "membership"
+ENTITY_BALANCE = "balance"
+
+OP_UPSERT = "upsert"
+OP_DELETE = "delete"
+
+
+class SyncTokenExpired(Exception):
+    """The requested token predates the retained change log; a full resync is needed"""
+
+
+def record_change(
+    db: Session,
+    entity_type: str,
+    entity_id,
+    op: str = OP_UPSERT,
+    group_id: Optional[int] = None,
+    user_ids: Iterable[int] = ()
+) -> None:
+    """
+    Append change_log rows for an entity's audience
+
+    A group-scoped row is visible to every current member; user-scoped rows reach
+    users who can't see it through a group (non-group ledgers, removed members).
+    Does not commit; callers commit together with the change itself.
+    """
+    if group_id is not None:
+        db.add(ChangeLog(entity_type=entity_type, entity_id=str(entity_id), op=op, group_id=group_id))
+
+    for user_id in set(user_ids):
+        db.add(ChangeLog(entity_type=entity_type, entity_id=str(entity_id), op=op, user_id=user_id))
+
+
+def record_expense_change(
+    db: Session,
+    expense_id: str,
+    group_id: Optional[int],
+    user_ids: Iterable[int]
+) -> None:
+    """Record an expense change for its group, or for its payer and participants"""
+    if group_id is not None:
+        record_change(db, ENTITY_EXPENSE, expense_id, group_id=group_id)
+    else:
+        record_change(db, ENTITY_EXPENSE, expense_id, user_ids=user_ids)
+
+
+def record_note_change(db: Session, note_id: str, expense: Expense, op: str = OP_UPSERT) -> None:
+    """Record a note change with the same audience as its expense"""
+    if expense.group_id is not None:
+        record_change(db, ENTITY_NOTE, note_id, op, group_id=expense.group_id)
+        return
+
+    participant_ids = [p.user_id for p in db.query(ExpenseParticipant.user_id).filter(
+        ExpenseParticipant.expense_id == expense.id
+    ).all()]
+    record_change(db, ENTITY_NOTE, note_id, op, user_ids=[expense.paid_by, *participant_ids])
+
+
+def membership_id(group_id: int, user_id: int) -> str:
+    return f"{group_id}:{user_id}"
+
+
+def parse_token(token: Optional[str]) -> Optional[int]:
+    """Parse an opaque sync token; raises ValueError if it's malformed"""
+    if token is None or token == "":
+        return None
+
+    seq = int(token)
+    if seq < 0:
+        raise ValueError("Negative sync token")
+    return seq
+
+
+def get_current_token(db: Session) -> int:
+    """Latest change sequence number a client can safely hold"""
+    return _settled_seq(db, 0)
+
+
+def _settled_seq(db: Session, since: int) -> int:
+    """
+    Highest seq a token can move to from `since` without skipping a row still being written
+
+    `since` must itself be such a token. Rows are read newest first until a
+    settled one; from there the cursor can follow newer rows while their seqs
+    are consecutive.
+    """
+    settled_before = datetime.utcnow() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    recent = []
+    horizon = since
+    for seq, created_at in db.query(ChangeLog.seq, ChangeLog.created_at).filter(
+        ChangeLog.seq > since
+    ).order_by(ChangeLog.seq.desc()).limit(settings.SYNC_SETTLE_SCAN_ROWS):
+        if created_at < settled_before:
+            horizon = seq
+            break
+        recent.append(seq)
+
+    for seq in reversed(recent):
+        if seq != horizon + 1:
+            break
+        horizon = seq
+    return horizon
+
+
+def prune_change_log(db: Session, older_than: datetime) -> int:
+    """
+    Delete change_log rows created before `older_than`
+
+    Clients holding a token older than the oldest retained row get
+    SyncTokenExpired and must resync from the list endpoints.
+    """
+    deleted = db.query(ChangeLog).filter(ChangeLog.created_at < older_than).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def get_changes(db: Session, user_id: int, since: Optional[int], limit: int) -> SyncResponse:
+    """
+    Get the changes visible to a user after a sync token
+
+    Args:
+        db: Database session
+        user_id: Requesting user ID
+        since: Last token the client processed; None to bootstrap
+        limit: Maximum number of change_log rows to consume
+
+    Returns:
+        SyncResponse with the next token and the changed entities
+    """
+    if since is None:
+        # Bootstrap: clients take a token first, then load the full lists
+        return SyncResponse(next_token=str(get_current_token(db)), has_more=False)
+
+    oldest = db.query(func.min(ChangeLog.seq)).scalar()
+    if oldest is not None and since < oldest - 1:
+        raise SyncTokenExpired()
+
+    horizon = _settled_seq(db, since)
+    member_group_ids = select(GroupUser.group_id).where(GroupUser.user_id == user_id)
+    entries = db.query(ChangeLog).filter(
+        ChangeLog.seq > since,
+        ChangeLog.seq <= horizon,
+        or_(
+            ChangeLog.user_id == user_id,
+            ChangeLog.group_id.in_(member_group_ids)
+        )
+    ).order_by(ChangeLog.seq).limit(limit + 1).all()
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    next_token = entries[-1].seq if entries else since
+
+    ids_by_type: Dict[str, Set[str]] = {}
+    for entry in entries:
+        ids_by_type.setdefault(entry.entity_type, set()).add(entry.entity_id)
+
+    response = SyncResponse(next_token=str(next_token), has_more=has_more)
+
+    balance_group_ids = {int(g) for g in ids_by_type.get(ENTITY_BALANCE, set())}
+    balance_friend_ids: Set[int] = set()
+
+    expense_ids = ids_by_type.get(ENTITY_EXPENSE)
+    if expense_ids:
+        response.expenses = _load_expenses(db, expense_ids)
+        for expense in response.expenses:
+            if expense.group_id is not None:
+                balance_group_ids.add(expense.group_id)
+            else:
+                balance_friend_ids.add(expense.paid_by)
+                balance_friend_ids.update(p.user_id for p in expense.participants)
+
+    note_ids = ids_by_type.get(ENTITY_NOTE)
+    if note_ids:
+        notes = db.query(ExpenseNote).filter(ExpenseNote.id.in_(note_ids)).all()
+        response.notes = [SyncNote.model_validate(n) for n in notes]
+        response.deleted_note_ids = sorted(note_ids - {n.id for n in notes})
+
+    group_ids = {int(g) for g in ids_by_type.get(ENTITY_GROUP, set())}
+    if group_ids:
+        groups = db.query(Group).filter(Group.id.in_(group_ids)).all()
+        response.groups = [GroupResponse.model_validate(g) for g in groups]
+        response.deleted_group_ids = sorted(group_ids - {g.id for g in groups})
+
+    membership_keys = [tuple(int(part) for part in m.split(":")) for m in ids_by_type.get(ENTITY_MEMBERSHIP, set())]
+    if membership_keys:
+        existing = _existing_memberships(db, membership_keys)
+        for group_id, member_id in sorted(membership_keys):
+            membership = SyncMembership(group_id=group_id, user_id=member_id)
+            if (group_id, member_id) in existing:
+                response.memberships.append(membership)
+            else:
+                response.removed_memberships.append(membership)
+
+    balance_friend_ids.discard(user_id)
+    if balance_group_ids or balance_friend_ids:
+        balances = db.query(BalanceView).filter(
+            BalanceView.user_id == user_id,
+            or_(
+                BalanceView.group_id.in_(balance_group_ids),
+                and_(
+                    BalanceView.group_id.is_(None),
+                    BalanceView.friend_id.in_(balance_friend_ids)
+                )
+            )
+        ).all()
+        response.balances = [BalanceResponse.model_validate(b) for b in balances]
+
+    return response
+
+
+def _load_expenses(db: Session, expense_ids: Set[str]) -> List[ExpenseDetailResponse]:
+    """Load expenses with participants and names in three queries"""
+    expenses = db.query(Expense).filter(Expense.id.in_(expense_ids)).all()
+    participants = db.query(ExpenseParticipant).filter(
+        ExpenseParticipant.expense_id.in_(expense_ids)
+    ).all()
+
+    user_ids = {e.paid_by for e in expenses} | {p.user_id for p in participants}
+    users = db.query(User).filter(User.id.in_(user_ids)).all() if user_ids else []
+    user_map = {u.id: u.name or u.email or f"User {u.id}" for u in users}
+
+    participants_by_expense: Dict[str, List[ExpenseParticipant]] = {}
+    for p in participants:
+        participants_by_expense.setdefault(p.expense_id, []).append(p)
+
+    result = []
+    for expense in expenses:
+        detail = ExpenseDetailResponse.model_validate(expense)
+        detail.paid_by_name = user_map.get(expense.paid_by, "Unknown")
+        detail.participants = [
+            ParticipantResponse(
+                user_id=p.user_id,
+                user_name=user_map.get(p.user_id, "Unknown"),
+                amount=p.amount
+            ) for p in participants_by_expense.get(expense.id, [])
+        ]
+        result.append(detail)
+
+    return result
+
+
+def _existing_memberships(db: Session, keys: List[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+    group_ids = {group_id for group_id, _ in keys}
+    rows = db.query(GroupUser.group_id, GroupUser.user_id).filter(
+        GroupUser.group_id.in_(group_ids)
+    ).all()
+    return {(row.group_id, row.user_id) for row in rows} & set(keys)
@@ -0,0 +1,45 @@
+"""
+Version service - monotonically increasing change counters
+
+Group.version changes whenever anything shown on a group screen changes, and
+User.ledger_version whenever an expense involving the user changes. Read
+endpoints derive ETags from these counters, so an unchanged resource can be
+answered with 304 after a single lookup.
+"""
+from typing import Iterable, Optional
+from sqlalchemy.orm import Session
+
+from app.models.models import Group, User
+
+
+def bump_group_version(db: Session, group_id: Optional[int]) -> None:
+    """
+    Increment a group's version in the current transaction
+
+    Uses an in-database increment so concurrent writers never reuse a version.
+    Does not commit; callers commit together with the change itself.
+    """
+    if group_id is None:
+        return
+
+    db.query(Group).filter(Group.id == group_id).update(
+        {Group.version: Group.version + 1},
+        synchronize_session=False
+    )
+
+
+def bump_ledger_versions(db: Session, user_ids: Iterable[int]) -> None:
+    """
+    Increment the ledger version of every given user in the current transaction
+
+    Friend views include group expenses too, so this is bumped for group and
+    non-group expenses alike. Does not commit.
+    """
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return
+
+    db.query(User).filter(User.id.in_(user_ids)).update(
+        {User.ledger_version: User.ledger_version + 1},
+        synchronize_session=False
+    )
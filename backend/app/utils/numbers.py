@@ -5,6 +5,7 @@ Ported from src/utils/numbers.ts
 All amounts are stored as integers (cents) to avoid floating point errors.
 For example: $12.50 = 1250 (cents)
 """
+from functools import lru_cache
 from typing import Union
 
 
@@ -262,3 +263,10 @@ def get_currency_helpers(currency: str = "USD", locale: str = "en-US") -> Curren
     decimal_digits = decimal_digits_map.get(currency.upper(), 2)
     return CurrencyHelpers(currency, locale, decimal_digits)
 
+
+_cached_currency_helpers = lru_cache(maxsize=None)(get_currency_helpers)
+
+
+def format_money(amount: int, currency: str) -> str:
+    """Amount in minor units as display text, e.g. 'USD 12.50' (for emails and notifications)"""
+    return _cached_currency_helpers(currency).to_ui_string(amount)
@@ -0,0 +1,74 @@
+"""
+Benchmark: worker cold start
+
+Times `import app.main` in fresh interpreters (what each uvicorn worker pays
+before serving) and the startup database step: the alembic revision check
+against the create_all it replaced, on a fully migrated SQLite database.
+
+Usage:
+    python benchmarks/cold_start.py [repeats]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from sqlalchemy import create_engine  # noqa: E402
+
+
+def import_time() -> float:
+    """Wall seconds to import the app in a new interpreter, minus interpreter startup"""
+    def run(code: str) -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, check=True)
+        return time.perf_counter() - start
+
+    return run("import app.main") - run("pass")
+
+
+def best(fn, repeats: int) -> float:
+    return min(fn() for _ in range(repeats))
+
+
+def main() -> None:
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    # Warm the bytecode cache so the first run isn't an outlier
+    import_time()
+    app_import = best(import_time, repeats)
+
+    from app.core.database import Base
+    from app.core.migrations import check_schema_revision, upgrade_database
+    from app.models import models  # noqa: F401
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/cold_start.db")
+        upgrade_database(engine)
+
+        def timed(fn):
+            def run():
+                engine.dispose()
+                start = time.perf_counter()
+                fn()
+                return time.perf_counter() - start
+            return run
+
+        create_all = best(timed(lambda: Base.metadata.create_all(bind=engine)), repeats)
+        revision_check = best(timed(lambda: check_schema_revision(engine)), repeats)
+        engine.dispose()
+
+    print(f"best of {repeats}")
+    print(f"  import app.main:       {app_import * 1000:8.1f} ms")
+    print(f"  create_all (no-op):    {create_all * 1000:8.1f} ms")
+    print(f"  revision check:        {revision_check * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: email template compile and render cost
+
+Measures what a new worker pays to get the email templates ready, parsing
+them from source versus loading them from a warm bytecode cache, and then
+how many emails of each kind render per second once compiled.
+
+Usage:
+    python benchmarks/email_render.py [renders]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from app.core.config import settings  # noqa: E402
+from app.services.digest_service import render_digest  # noqa: E402
+from app.services.email_service import EmailService, email_service  # noqa: E402
+
+
+def startup_ms(cache_dir: str) -> float:
+    """Time for a fresh service to compile every template"""
+    settings.EMAIL_TEMPLATE_CACHE_DIR = cache_dir
+    service = EmailService()
+    start = time.perf_counter()
+    service.precompile_templates()
+    return (time.perf_counter() - start) * 1000
+
+
+def digest_context(i: int) -> dict:
+    start = datetime(2024, 6, 3)
+    return {
+        "user_id": i,
+        "email": f"user{i}@example.com",
+        "name": f"User {i}",
+        "start": start,
+        "end": start + timedelta(days=6),
+        "expenses": [
+            {"name": f"Expense {n}", "amount": "USD 30.00", "date": start, "paid_by_you": n % 2 == 0,
+             "your_share": "USD 10.00"}
+            for n in range(settings.DIGEST_MAX_EXPENSES)
+        ],
+        "more_expenses": 3,
+        "changes": [{"friend": f"Friend {n}", "amount": "USD 10.00", "owes_you": n % 2 == 0} for n in range(4)],
+        "balances": [{"friend": f"Friend {n}", "amount": "USD 25.00", "owes_you": n % 2 == 1} for n in range(4)],
+    }
+
+
+def renders_per_second(build, count: int) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        build(i)
+    return count / (time.perf_counter() - start)
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold = startup_ms(cache_dir)
+        warm = startup_ms(cache_dir)
+
+        email_service.precompile_templates()
+        user = SimpleNamespace(id=1, name="Test User", email="test@example.com")
+        digests = [digest_context(i) for i in range(100)]
+
+        print("Compiling all email templates in a new worker")
+        print(f"  from source:          {cold:8.1f} ms")
+        print(f"  from bytecode cache:  {warm:8.1f} ms")
+        print(f"Renders per second (HTML and text), {count} each")
+        for label, build in [
+            ("invite", lambda i: email_service.build_invite_email(f"friend{i}@example.com", "John Doe")),
+            ("feedback", lambda i: email_service.build_feedback_email("The app is great <3", user)),
+            ("magic link", lambda i: email_service.build_magic_link_email("user@example.com", f"https://x/?t={i}")),
+            ("weekly digest", lambda i: render_digest(digests[i % 100])),
+        ]:
+            print(f"  {label:<20} {renders_per_second(build, count):10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
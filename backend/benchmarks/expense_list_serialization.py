@@ -0,0 +1,115 @@
+"""
+Benchmark: CPU time to build the group expense list response
+
+Compares the previous path (ORM entities -> ExpenseDetailResponse per row ->
+jsonable_encoder -> json.dumps) with the projection path (column tuples -> dicts
+-> orjson) for one group with 5,000 expenses and three participants each.
+
+Usage:
+    python benchmarks/expense_list_serialization.py [expenses] [repeats]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# The app engine is never connected; the benchmark uses its own in-memory database
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.core.database import Base  # noqa: E402
+from app.models.models import User, Group, Expense, ExpenseParticipant, SplitType  # noqa: E402
+from app.schemas.expense import ExpenseDetailResponse, ParticipantResponse  # noqa: E402
+from app.services.expense_list_service import list_expenses  # noqa: E402
+
+
+def seed(db, count: int) -> None:
+    users = [User(id=i, email=f"user{i}@example.com", name=f"User {i}") for i in (1, 2, 3)]
+    db.add_all(users)
+    db.add(Group(id=1, public_id="bench", name="Benchmark", user_id=1))
+    db.flush()
+
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        expense_id = f"expense-{i:06d}"
+        db.add(Expense(
+            id=expense_id, paid_by=1 + i % 3, added_by=1, name=f"Expense {i}", category="food",
+            amount=3000, split_type=SplitType.EQUAL, currency="USD", group_id=1,
+            expense_date=start + timedelta(hours=i)
+        ))
+        db.add_all([ExpenseParticipant(expense_id=expense_id, user_id=u, amount=1000) for u in (1, 2, 3)])
+    db.commit()
+
+
+def legacy_response(db) -> bytes:
+    """The list endpoint before the projection path"""
+    expenses = db.query(Expense).filter(
+        Expense.group_id == 1, Expense.deleted_at.is_(None)
+    ).order_by(Expense.expense_date.desc()).all()
+
+    expense_ids = [e.id for e in expenses]
+    participants = db.query(ExpenseParticipant).filter(ExpenseParticipant.expense_id.in_(expense_ids)).all()
+    user_ids = {e.paid_by for e in expenses} | {p.user_id for p in participants}
+    user_map = {u.id: u.name or u.email for u in db.query(User).filter(User.id.in_(user_ids)).all()}
+
+    participants_by_expense = {}
+    for p in participants:
+        participants_by_expense.setdefault(p.expense_id, []).append(p)
+
+    result = []
+    for expense in expenses:
+        detail = ExpenseDetailResponse.model_validate(expense)
+        detail.paid_by_name = user_map.get(expense.paid_by, "Unknown")
+        detail.participants = [
+            ParticipantResponse(user_id=p.user_id, user_name=user_map.get(p.user_id), amount=p.amount)
+            for p in participants_by_expense.get(expense.id, [])
+        ]
+        result.append(detail)
+
+    return JSONResponse(jsonable_encoder(result)).body
+
+
+def projection_response(db) -> bytes:
+    filters = [Expense.group_id == 1, Expense.deleted_at.is_(None)]
+    return ORJSONResponse(list_expenses(db, filters)).body
+
+
+def measure(fn, db, repeats: int) -> float:
+    """Best-of CPU seconds per call, with a fresh identity map each time"""
+    best = float("inf")
+    for _ in range(repeats):
+        db.expunge_all()
+        start = time.process_time()
+        fn(db)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, count)
+
+    legacy = measure(legacy_response, db, repeats)
+    projection = measure(projection_response, db, repeats)
+
+    print(f"{count} expenses, best of {repeats}")
+    print(f"  ORM + pydantic + json: {legacy * 1000:8.1f} ms CPU")
+    print(f"  projection + orjson:   {projection * 1000:8.1f} ms CPU")
+    print(f"  reduction:             {(1 - projection / legacy) * 100:8.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: push notification fan-out for a group expense
+
+Notifies every member of a group on each of their devices, the way the
+outbox hands a batch of push messages to the push service, against a stub
+push service that answers after --latency-ms. Compares sending to one
+device at a time, as the blocking webpush call did, with the concurrent
+burst.
+
+Usage:
+    python benchmarks/push_fanout.py [members] [--devices N] [--latency-ms N]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# The app engine is never connected; the benchmark uses its own in-memory database
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import httpx  # noqa: E402
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import Base  # noqa: E402
+from app.models.models import PushNotification, User  # noqa: E402
+from app.services import push_service as push_module  # noqa: E402
+from app.services.push_service import PushNotificationService, endpoint_hash  # noqa: E402
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def seed(db, members: int, devices: int) -> None:
+    for user_id in range(1, members + 1):
+        db.add(User(id=user_id, email=f"user{user_id}@example.com", name=f"User {user_id}"))
+        for device in range(devices):
+            endpoint = f"https://fcm.googleapis.com/fcm/send/{user_id}-{device}"
+            key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+                serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+            )
+            db.add(PushNotification(user_id=user_id, endpoint_hash=endpoint_hash(endpoint), subscription=json.dumps(
+                {"endpoint": endpoint, "keys": {"p256dh": b64(key), "auth": b64(os.urandom(16))}}
+            )))
+    db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("members", type=int, nargs="?", default=30)
+    parser.add_argument("--devices", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, args.members, args.devices)
+
+    async def push_service_stub(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(args.latency_ms / 1000)
+        return httpx.Response(201)
+
+    service = PushNotificationService()
+    service.vapid_private_key = b64(
+        ec.generate_private_key(ec.SECP256R1()).private_numbers().private_value.to_bytes(32, "big")
+    )
+    concurrency = settings.WEB_PUSH_CONCURRENCY
+    notifications = [
+        {"user_id": user_id, "title": "Dinner", "body": "Alice added an expense", "data": None}
+        for user_id in range(1, args.members + 1)
+    ]
+
+    async def one_at_a_time():
+        settings.WEB_PUSH_CONCURRENCY = 1
+        for notification in notifications:
+            await service.deliver_many(db, [notification])
+
+    async def burst():
+        settings.WEB_PUSH_CONCURRENCY = concurrency
+        await service.deliver_many(db, notifications)
+
+    print(f"{args.members} members x {args.devices} devices, {args.latency_ms:.0f} ms push service latency")
+    for label, run in [("one user at a time", one_at_a_time), ("one burst", burst)]:
+        async def timed():
+            push_module._client = httpx.AsyncClient(transport=httpx.MockTransport(push_service_stub))
+            start = time.perf_counter()
+            await run()
+            elapsed = time.perf_counter() - start
+            await push_module.close_http_client()
+            return elapsed
+
+        print(f"  {label:<20} {asyncio.run(timed()) * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
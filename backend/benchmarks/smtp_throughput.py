@@ -0,0 +1,120 @@
+"""
+Benchmark: bulk email throughput
+
+Sends a batch of emails to a local aiosmtpd server the way EmailService used
+to (aiosmtplib.send, one connection per message) and through the connection
+pool. Real relays spend tens of milliseconds on TCP, STARTTLS and AUTH, which
+a local server doesn't, so the server waits --handshake-ms before answering
+EHLO to stand in for that cost.
+
+Usage:
+    python benchmarks/smtp_throughput.py [messages] [--handshake-ms N]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import aiosmtplib  # noqa: E402
+from aiosmtpd.controller import Controller  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.services.email_service import EmailService  # noqa: E402
+
+
+class SlowHandshakeRelay:
+    def __init__(self, handshake_seconds: float):
+        self.handshake_seconds = handshake_seconds
+        self.connections = 0
+        self.messages = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        await asyncio.sleep(self.handshake_seconds)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def messages(count: int):
+    return [
+        {"to_email": f"user{i}@example.com", "subject": f"Weekly summary {i}", "html_content": "<p>Hi</p>" * 50}
+        for i in range(count)
+    ]
+
+
+async def send_unpooled(service: EmailService, batch) -> None:
+    """One connection per message, as before the pool"""
+    from email.mime.text import MIMEText
+
+    semaphore = asyncio.Semaphore(settings.SMTP_POOL_SIZE)
+
+    async def send(message):
+        msg = MIMEText(message["html_content"], "html")
+        msg["Subject"] = message["subject"]
+        msg["From"] = service.from_email
+        msg["To"] = message["to_email"]
+        async with semaphore:
+            await aiosmtplib.send(msg, hostname=service.smtp_host, port=service.smtp_port, start_tls=False)
+
+    await asyncio.gather(*(send(m) for m in batch))
+
+
+async def send_pooled(service: EmailService, batch) -> None:
+    errors = await service.deliver_many(batch)
+    assert not any(errors), errors
+    await service.close()
+
+
+def run(label: str, send, relay: SlowHandshakeRelay, port: int, batch) -> None:
+    service = EmailService()
+    service.smtp_host = "127.0.0.1"
+    service.smtp_port = port
+    service.smtp_user = None
+    service.smtp_start_tls = False
+
+    relay.connections = relay.messages = 0
+    start = time.perf_counter()
+    asyncio.run(send(service, batch))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:7.2f} s  {len(batch) / elapsed:8.0f} msg/s  {relay.connections:5d} connections")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("messages", type=int, nargs="?", default=500)
+    parser.add_argument("--handshake-ms", type=float, default=40.0)
+    args = parser.parse_args()
+
+    relay = SlowHandshakeRelay(args.handshake_ms / 1000)
+    port = free_port()
+    controller = Controller(relay, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        batch = messages(args.messages)
+        print(f"{args.messages} messages, {args.handshake_ms:.0f} ms handshake, "
+              f"{settings.SMTP_POOL_SIZE} concurrent connections")
+        run("connection per message", send_unpooled, relay, port, batch)
+        run("pooled connections", send_pooled, relay, port, batch)
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: time and memory for one weekly digest run
+
+Seeds users who all opted in to the weekly summary, each sharing a few of the
+week's expenses with friends, then runs send_weekly_digests with a sender that
+discards the messages. Reports wall time, users per second and (from a second,
+traced run) peak Python memory, which should stay flat as the user count grows since users are
+streamed DIGEST_CHUNK_SIZE at a time.
+
+Usage:
+    python benchmarks/weekly_digest.py [users] [--chunk-size N]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# The app engine is never connected; the benchmark uses its own in-memory database
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import Base  # noqa: E402
+from app.models.models import BalanceView, Expense, ExpenseParticipant, SplitType, User  # noqa: E402
+from app.services.digest_service import send_weekly_digests  # noqa: E402
+
+NOW = datetime(2024, 6, 10, 8)
+EXPENSES_PER_USER = 2
+
+
+def seed(db, count: int) -> None:
+    """Users in pairs; each user pays EXPENSES_PER_USER expenses split with their partner"""
+    now = datetime.utcnow()
+    db.execute(insert(User), [
+        {"id": i, "email": f"user{i}@example.com", "name": f"User {i}", "currency": "USD",
+         "preferred_language": "en", "notification_preferences": {"email_weekly_summary": True},
+         "created_at": now, "updated_at": now}
+        for i in range(1, count + 1)
+    ])
+
+    expenses, participants, balances = [], [], []
+    for user_id in range(1, count + 1):
+        friend_id = user_id + 1 if user_id % 2 else user_id - 1
+        for n in range(EXPENSES_PER_USER):
+            expense_id = f"{user_id:07d}-{n}"
+            created = NOW - timedelta(days=1 + (user_id + n) % 6)
+            expenses.append({
+                "id": expense_id, "paid_by": user_id, "added_by": user_id, "name": f"Expense {n}",
+                "category": "food", "amount": 3000, "split_type": SplitType.EQUAL, "currency": "USD",
+                "expense_date": created, "created_at": created, "updated_at": created
+            })
+            participants += [
+                {"expense_id": expense_id, "user_id": user_id, "amount": 1500},
+                {"expense_id": expense_id, "user_id": friend_id, "amount": 1500},
+            ]
+        balances.append({"user_id": user_id, "friend_id": friend_id, "group_id": 0, "currency": "USD",
+                         "amount": 0 if user_id % 3 else 1500, "created_at": now, "updated_at": now})
+    db.execute(insert(Expense), expenses)
+    db.execute(insert(ExpenseParticipant), participants)
+    db.execute(insert(BalanceView), balances)
+    db.commit()
+
+
+async def discard(messages):
+    return [None] * len(messages)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("users", type=int, nargs="?", default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=settings.DIGEST_CHUNK_SIZE)
+    args = parser.parse_args()
+    settings.DIGEST_CHUNK_SIZE = args.chunk_size
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, args.users)
+    db.expunge_all()
+
+    start = time.perf_counter()
+    run = asyncio.run(send_weekly_digests(db, now=NOW, sender=discard))
+    elapsed = time.perf_counter() - start
+
+    # Traced separately since tracemalloc slows the run several times over
+    db.expunge_all()
+    tracemalloc.start()
+    asyncio.run(send_weekly_digests(db, now=NOW, sender=discard))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{run.users_scanned} users, chunks of {args.chunk_size}")
+    print(f"  digests rendered: {run.emails_sent:8d}")
+    print(f"  wall time:        {elapsed:8.2f} s  ({run.users_scanned / elapsed:,.0f} users/s)")
+    print(f"  peak memory:      {peak / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
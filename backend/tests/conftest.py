@@ -9,11 +9,15 @@ backend_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(backend_dir))
 
 import pytest
+from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from app.core.database import Base
+from app.core.query_stats import capture_queries, instrument_engine
+from app.core.rate_limit import rate_limiter
+from app.services.membership_service import clear_membership_cache
 
 
 @pytest.fixture(scope="function")
@@ -25,6 +29,7 @@ def test_db():
         connect_args={"check_same_thread": False},
         poolclass=StaticPool,
     )
+    instrument_engine(engine)
 
     # Create all tables
     Base.metadata.create_all(bind=engine)
@@ -40,6 +45,41 @@ def test_db():
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+def max_queries(test_db):
+    """
+    Assert a block runs at most `limit` statements on the test database
+
+        with max_queries(4):
+            client.get("/api/groups/1")
+    """
+    @contextmanager
+    def _max_queries(limit):
+        with capture_queries(test_db.get_bind()) as statements:
+            yield statements
+        assert len(statements) <= limit, (
+            f"{len(statements)} queries ran, expected at most {limit}:\n" + "\n".join(statements)
+        )
+
+    return _max_queries
+
+
+@pytest.fixture(autouse=True)
+def fresh_membership_cache():
+    """Test databases reuse user ids, so cached memberships must not leak between tests"""
+    clear_membership_cache()
+    yield
+    clear_membership_cache()
+
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limits():
+    """Every test client shares one address, so buckets must not carry over between tests"""
+    rate_limiter.clear()
+    yield
+    rate_limiter.clear()
+
+
 @pytest.fixture(scope="session")
 def event_loop():
     """Create an instance of the default event loop for the test session."""
@@ -0,0 +1,112 @@
+"""
+Tests for cached membership checks
+"""
+import pytest
+from datetime import datetime
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.deps import get_current_user
+from app.core.database import get_db
+from app.core.query_stats import capture_queries
+from app.models.models import User, Group, GroupUser
+from app.schemas.expense import ExpenseCreate, ParticipantCreate
+from app.services.split_service import create_expense
+from app.services.membership_service import get_group_ids
+
+
+@pytest.fixture
+def users(test_db):
+    """Alice and Bob share group 1, Carol is outside it"""
+    test_db.add_all([
+        User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+        User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en"),
+        User(id=3, email="carol@example.com", name="Carol", currency="USD", preferred_language="en"),
+        Group(id=1, public_id="abc123", name="Trip", user_id=1),
+    ])
+    test_db.add_all([GroupUser(group_id=1, user_id=1), GroupUser(group_id=1, user_id=2)])
+    test_db.commit()
+
+
+@pytest.fixture
+def client_as(test_db, users):
+    """Build a client authenticated as the given user"""
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = lambda: test_db
+
+    def _client_as(user_id):
+        app.dependency_overrides[get_current_user] = lambda: test_db.query(User).get(user_id)
+        return TestClient(app)
+
+    try:
+        yield _client_as
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+
+
+class TestMembershipCache:
+    """Test loading and invalidating cached memberships"""
+
+    def test_cached_per_request_and_across_requests(self, test_db, users):
+        """Memberships are read once, then served from the caches"""
+        new_session = sessionmaker(bind=test_db.get_bind())
+
+        with capture_queries(test_db.get_bind()) as statements:
+            assert get_group_ids(test_db, 2) == {1}
+            assert get_group_ids(test_db, 2) == {1}
+            assert get_group_ids(new_session(), 2) == {1}
+
+        assert len([s for s in statements if "group_users" in s]) == 1
+
+    def test_leaving_invalidates(self, test_db, users, client_as):
+        """Leaving a group revokes access on the next request"""
+        bob = client_as(2)
+        assert bob.get("/api/groups/1/totals").status_code == 200
+
+        assert bob.post("/api/groups/1/leave").status_code == 204
+
+        assert get_group_ids(sessionmaker(bind=test_db.get_bind())(), 2) == frozenset()
+        assert bob.get("/api/groups/1/totals").status_code == 403
+
+    def test_adding_member_invalidates(self, test_db, users, client_as):
+        """A new member gets access immediately"""
+        carol = client_as(3)
+        assert carol.get("/api/groups/1/balances").status_code == 403
+
+        assert client_as(1).post("/api/groups/1/members", params={"user_id": 3}).status_code == 201
+
+        assert client_as(3).get("/api/groups/1/balances").status_code == 200
+
+
+class TestAccessChecks:
+    """Test the routers' use of the shared checks"""
+
+    def test_group_expense_list_requires_membership(self, client_as):
+        """Non-members can't list a group's expenses"""
+        assert client_as(3).get("/api/expenses/group/1/details").status_code == 403
+        assert client_as(2).get("/api/expenses/group/1/details").status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_expense_access(self, test_db, client_as):
+        """Group members, payer and participants can see an expense and its notes"""
+        expense = await create_expense(test_db, ExpenseCreate(
+            paid_by=1,
+            name="Dinner",
+            category="food",
+            amount=1000,
+            currency="USD",
+            group_id=1,
+            expense_date=datetime(2025, 1, 10),
+            participants=[ParticipantCreate(user_id=1, amount=1000)]
+        ), 1)
+
+        # Bob isn't a participant but is in the group
+        assert client_as(2).get(f"/api/expenses/{expense.id}/notes").status_code == 200
+        assert client_as(3).get(f"/api/expenses/{expense.id}/notes").status_code == 403
+        assert client_as(3).get(f"/api/expenses/{expense.id}").status_code == 403
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
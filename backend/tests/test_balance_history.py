@@ -0,0 +1,146 @@
+"""
+Tests for point-in-time balance queries
+"""
+import pytest
+from datetime import date, datetime, timedelta, timezone
+
+from app.models.models import User, Expense, ExpenseParticipant, BalanceCheckpoint
+from app.schemas.expense import ExpenseCreate, ParticipantCreate
+from app.services.balance_history_service import get_balances_as_of, get_checkpoint
+from app.services.split_service import create_expense, delete_expense
+
+
+@pytest.fixture
+def users(test_db):
+    """Two users sharing expenses"""
+    alice = User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en")
+    bob = User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en")
+    test_db.add_all([alice, bob])
+    test_db.commit()
+    return alice, bob
+
+
+def expense_data(paid_by: int, amount: int, expense_date: datetime, group_id=7) -> ExpenseCreate:
+    """Equal split between users 1 and 2 in a group"""
+    return ExpenseCreate(
+        paid_by=paid_by,
+        name="Dinner",
+        category="food",
+        amount=amount,
+        currency="USD",
+        group_id=group_id,
+        expense_date=expense_date,
+        participants=[
+            ParticipantCreate(user_id=1, amount=amount // 2),
+            ParticipantCreate(user_id=2, amount=amount // 2),
+        ]
+    )
+
+
+class TestBalancesAsOf:
+    """Test balance-as-of-date aggregation"""
+
+    @pytest.mark.asyncio
+    async def test_balance_as_of_date(self, test_db, users):
+        """Only expenses dated on or before the given day are counted"""
+        await create_expense(test_db, expense_data(1, 1000, datetime(2025, 1, 10)), 1)
+        await create_expense(test_db, expense_data(2, 400, datetime(2025, 2, 15)), 2)
+        await create_expense(test_db, expense_data(1, 600, datetime(2025, 3, 5)), 1)
+
+        # Bob owes Alice 500 after January (negative = friend owes user)
+        assert get_balances_as_of(test_db, 1, date(2025, 1, 31)) == [
+            {"friend_id": 2, "group_id": 7, "currency": "USD", "amount": -500}
+        ]
+        # Alice owes Bob 200 of that back after February
+        assert get_balances_as_of(test_db, 1, date(2025, 2, 15))[0]["amount"] == -300
+        assert get_balances_as_of(test_db, 2, date(2025, 3, 31))[0]["amount"] == 600
+
+    @pytest.mark.asyncio
+    async def test_before_first_expense_is_empty(self, test_db, users):
+        """No balances before any expense"""
+        await create_expense(test_db, expense_data(1, 1000, datetime(2025, 1, 10)), 1)
+
+        assert get_balances_as_of(test_db, 1, date(2024, 12, 31)) == []
+
+    @pytest.mark.asyncio
+    async def test_filters_by_friend_and_group(self, test_db, users):
+        """Friend and group filters narrow the result"""
+        await create_expense(test_db, expense_data(1, 1000, datetime(2025, 1, 10), group_id=None), 1)
+        await create_expense(test_db, expense_data(1, 200, datetime(2025, 1, 11)), 1)
+
+        grouped = get_balances_as_of(test_db, 1, date(2025, 1, 31), group_id=7)
+        assert grouped == [{"friend_id": 2, "group_id": 7, "currency": "USD", "amount": -100}]
+        assert len(get_balances_as_of(test_db, 1, date(2025, 1, 31), friend_id=2)) == 2
+        assert get_balances_as_of(test_db, 1, date(2025, 1, 31), friend_id=3) == []
+
+    @pytest.mark.asyncio
+    async def test_deleted_expenses_are_excluded(self, test_db, users):
+        """Soft-deleted expenses do not count"""
+        expense = await create_expense(test_db, expense_data(1, 1000, datetime(2025, 1, 10)), 1)
+        await delete_expense(test_db, expense.id, 1)
+
+        assert get_balances_as_of(test_db, 1, date(2025, 6, 1)) == []
+
+
+class TestBalanceCheckpoints:
+    """Test monthly checkpoint caching"""
+
+    @pytest.mark.asyncio
+    async def test_checkpoint_is_cached(self, test_db, users):
+        """A query caches the checkpoint at the start of its month"""
+        await create_expense(test_db, expense_data(1, 1000, datetime(2025, 1, 10)), 1)
+
+        get_balances_as_of(test_db, 1, date(2025, 3, 20))
+
+        checkpoint = test_db.query(BalanceCheckpoint).filter(
+            BalanceCheckpoint.user_id == 1,
+            BalanceCheckpoint.month == datetime(2025, 3, 1)
+        ).first()
+        assert checkpoint is not None
+        assert checkpoint.balances == [[2, 7, "USD", -500]]
+
+    @pytest.mark.asyncio
+    async def test_checkpoint_builds_on_earlier_checkpoint(self, test_db, users):
+        """Later checkpoints only aggregate the months after the previous one"""
+        await create_expense(test_db, expense_data(1, 1000, datetime(2025, 1, 10)), 1)
+        get_checkpoint(test_db, 1, datetime(2025, 2, 1))
+
+        # Raw rows before the cached checkpoint are not read again
+        test_db.query(ExpenseParticipant).delete()
+        test_db.query(Expense).delete()
+        test_db.commit()
+
+        assert get_checkpoint(test_db, 1, datetime(2025, 4, 1)) == {(2, 7, "USD"): -500}
+
+    @pytest.mark.asyncio
+    async def test_backdated_expense_invalidates_checkpoints(self, test_db, users):
+        """Adding an expense drops checkpoints after its date"""
+        await create_expense(test_db, expense_data(1, 1000, datetime(2025, 1, 10)), 1)
+        get_balances_as_of(test_db, 1, date(2025, 3, 20))
+
+        await create_expense(test_db, expense_data(2, 400, datetime(2025, 2, 2)), 2)
+
+        assert test_db.query(BalanceCheckpoint).filter(
+            BalanceCheckpoint.month > datetime(2025, 2, 2)
+        ).count() == 0
+        assert get_balances_as_of(test_db, 1, date(2025, 3, 20))[0]["amount"] == -300
+
+    @pytest.mark.asyncio
+    async def test_timezone_aware_date_invalidates_checkpoints(self, test_db, users):
+        """An expense with a UTC offset drops checkpoints from the earlier of its local and UTC dates"""
+        await create_expense(test_db, expense_data(1, 1000, datetime(2025, 1, 10)), 1)
+        get_balances_as_of(test_db, 1, date(2025, 2, 20))
+        get_balances_as_of(test_db, 1, date(2025, 3, 20))
+
+        # Already February where it was entered, still January in UTC
+        early_february = datetime(2025, 2, 1, 2, 0, tzinfo=timezone(timedelta(hours=5)))
+        await create_expense(test_db, expense_data(2, 400, early_february), 2)
+
+        assert test_db.query(BalanceCheckpoint).filter(
+            BalanceCheckpoint.month >= datetime(2025, 2, 1)
+        ).count() == 0
+        assert get_balances_as_of(test_db, 1, date(2025, 3, 20))[0]["amount"] == -300
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
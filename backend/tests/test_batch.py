@@ -0,0 +1,128 @@
+"""
+Tests for POST /batch
+"""
+import pytest
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core import database
+from app.core.security import create_access_token
+from app.models.models import User, Group, GroupUser
+
+
+@pytest.fixture
+def sessions(test_db, monkeypatch):
+    """Count sessions opened by get_db, against the test database"""
+    test_db.add_all([
+        User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+        User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en"),
+        Group(id=1, public_id="abc123", name="Trip", user_id=1),
+        Group(id=2, public_id="def456", name="Other", user_id=2),
+    ])
+    test_db.add_all([GroupUser(group_id=1, user_id=1), GroupUser(group_id=1, user_id=2),
+                     GroupUser(group_id=2, user_id=2)])
+    test_db.commit()
+
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=test_db.get_bind())
+    opened = []
+
+    def session_local():
+        opened.append(1)
+        return factory()
+
+    monkeypatch.setattr(database, "SessionLocal", session_local)
+
+    # Exercise the real get_db/get_current_user, not overrides left by other modules
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides.clear()
+    try:
+        yield opened
+    finally:
+        app.dependency_overrides.update(overrides)
+
+
+@pytest.fixture
+def client():
+    token = create_access_token({"sub": "1"})
+    return TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+
+class TestBatch:
+    """Test batched reads"""
+
+    def test_runs_sub_requests_with_one_session(self, sessions, client):
+        """All sub-requests succeed on the batch request's session"""
+        response = client.post("/api/batch", json={"requests": [
+            {"id": "group", "path": "/groups/1"},
+            {"id": "balances", "path": "/groups/1/balances"},
+            {"id": "expenses", "path": "/expenses/group/1/details", "query": {"include_deleted": False}},
+        ]})
+
+        assert response.status_code == 200
+        results = {r["id"]: r for r in response.json()["responses"]}
+        assert [r["status"] for r in results.values()] == [200, 200, 200]
+        assert results["group"]["body"]["name"] == "Trip"
+        assert results["expenses"]["body"] == []
+        assert results["group"]["headers"]["etag"]
+        assert len(sessions) == 1
+
+    def test_errors_are_per_sub_request(self, sessions, client):
+        """A failing read doesn't fail the batch"""
+        response = client.post("/api/batch", json={"requests": [
+            {"path": "/groups/2"},
+            {"path": "/groups/999"},
+            {"path": "/groups/1"},
+        ]})
+
+        assert [r["status"] for r in response.json()["responses"]] == [403, 404, 200]
+
+    def test_unhandled_error_is_per_sub_request(self, sessions, client, monkeypatch, caplog):
+        """An exception escaping a read is logged and reported as a 500 for that read"""
+        from app.api.routers import group
+
+        def broken(*args, **kwargs):
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(group, "get_group_etag", broken)
+
+        response = client.post("/api/batch", json={"requests": [
+            {"path": "/groups/1"},
+            {"path": "/expenses/group/1/details"},
+        ]})
+
+        assert [r["status"] for r in response.json()["responses"]] == [500, 200]
+        assert "Batch sub-request GET /groups/1 failed" in caplog.text
+
+    def test_conditional_sub_request(self, sessions, client):
+        """If-None-Match is honoured per sub-request"""
+        first = client.post("/api/batch", json={"requests": [{"path": "/groups/1"}]}).json()
+        etag = first["responses"][0]["headers"]["etag"]
+
+        second = client.post("/api/batch", json={"requests": [
+            {"path": "/groups/1", "headers": {"If-None-Match": etag}}
+        ]}).json()
+
+        assert second["responses"][0]["status"] == 304
+        assert second["responses"][0]["body"] is None
+
+    def test_only_reads_are_batched(self, sessions, client):
+        """Writes, streams and nested batches are refused"""
+        response = client.post("/api/batch", json={"requests": [
+            {"method": "DELETE", "path": "/groups/1"},
+            {"path": "/sync/stream"},
+            {"path": "/batch"},
+            {"path": "http://example.com/groups/1"},
+        ]})
+
+        assert [r["status"] for r in response.json()["responses"]] == [405, 400, 400, 400]
+
+    def test_requires_authentication(self, sessions):
+        """The batch itself needs a valid token"""
+        response = TestClient(app).post("/api/batch", json={"requests": [{"path": "/groups/1"}]})
+
+        assert response.status_code == 403
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,97 @@
+"""
+Tests for response compression
+"""
+import gzip
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware, choose_encoding
+
+
+def make_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/large")
+    async def large():
+        return PlainTextResponse("x" * 5000)
+
+    @app.get("/small")
+    async def small():
+        return PlainTextResponse("tiny")
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                yield "y" * 1000
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/events")
+    async def events():
+        async def chunks():
+            yield "data: 1\n\n" * 200
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return TestClient(app)
+
+
+class TestCompressionMiddleware:
+    """Test negotiated compression"""
+
+    def test_gzip_above_threshold(self):
+        """Large responses are gzipped for gzip clients"""
+        response = make_client().get("/large", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.text == "x" * 5000
+
+    def test_small_responses_are_not_compressed(self):
+        """Responses under the threshold are sent as-is"""
+        response = make_client().get("/small", headers={"Accept-Encoding": "gzip"})
+
+        assert "content-encoding" not in response.headers
+
+    def test_identity_when_not_accepted(self):
+        """No compression without a matching Accept-Encoding"""
+        client = make_client()
+
+        assert "content-encoding" not in client.get("/large", headers={"Accept-Encoding": "identity"}).headers
+        assert "content-encoding" not in client.get("/large", headers={"Accept-Encoding": "gzip;q=0"}).headers
+
+    def test_streaming_response(self):
+        """Streamed bodies are compressed chunk by chunk"""
+        with make_client().stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join(response.iter_raw())
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert gzip.decompress(raw) == b"y" * 3000
+
+    def test_event_streams_are_not_compressed(self):
+        """SSE must reach the client message by message"""
+        response = make_client().get("/events", headers={"Accept-Encoding": "gzip"})
+
+        assert "content-encoding" not in response.headers
+
+
+class TestChooseEncoding:
+    """Test Accept-Encoding negotiation"""
+
+    def test_gzip_and_q_values(self):
+        assert choose_encoding("gzip, deflate") == "gzip"
+        assert choose_encoding("deflate") is None
+        assert choose_encoding("") is None
+        assert choose_encoding("*;q=0.5") in ("br", "gzip")
+
+    def test_prefers_brotli_when_available(self):
+        pytest.importorskip("brotli")
+
+        assert choose_encoding("gzip, br") == "br"
+        assert choose_encoding("gzip, br;q=0.5") == "gzip"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
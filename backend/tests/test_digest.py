@@ -0,0 +1,179 @@
+"""
+Tests for the weekly digest job
+"""
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock
+
+from app.core.config import settings
+from app.core.query_stats import capture_queries
+from app.core.scheduler import build_scheduler
+from app.models.models import User, OutboxMessage
+from app.schemas.expense import ExpenseCreate, ParticipantCreate
+from app.services.digest_service import build_digests, digest_window, render_digest, send_weekly_digests
+from app.services.split_service import create_expense
+
+WEEKLY = {"email_weekly_summary": True}
+# Runs the digest for the week including today
+TOMORROW = datetime.utcnow() + timedelta(days=1)
+
+
+def add_user(db, user_id, name, preferences=WEEKLY):
+    db.add(User(id=user_id, email=f"{name.lower()}@example.com", name=name, currency="USD",
+                preferred_language="en", notification_preferences=preferences))
+
+
+@pytest.fixture
+def users(test_db):
+    add_user(test_db, 1, "Alice")
+    add_user(test_db, 2, "Bob", {"email_weekly_summary": False})
+    add_user(test_db, 3, "Carol")
+    add_user(test_db, 4, "Dave", None)
+    test_db.commit()
+
+
+async def add_expense(db, paid_by, amount, participants, name="Dinner"):
+    return await create_expense(db, ExpenseCreate(
+        paid_by=paid_by, name=name, category="food", amount=amount, currency="USD", group_id=7,
+        participants=[ParticipantCreate(user_id=u, amount=amount // len(participants)) for u in participants]
+    ), paid_by)
+
+
+def digests_for(db, user_ids):
+    start, end = digest_window(TOMORROW)
+    rows = db.query(User.id, User.name, User.email, User.notification_preferences).filter(
+        User.id.in_(user_ids)
+    ).order_by(User.id).all()
+    return {d["user_id"]: d for d in build_digests(db, rows, start, end)}
+
+
+class TestBuildDigests:
+    """Test the week's expenses, changes and balances per user"""
+
+    @pytest.mark.asyncio
+    async def test_week_summary(self, test_db, users):
+        await add_expense(test_db, 1, 3000, [1, 2, 3])
+        await add_expense(test_db, 2, 1000, [1, 2], name="Taxi")
+
+        alice = digests_for(test_db, [1])[1]
+
+        assert [(e["name"], e["paid_by_you"], e["your_share"]) for e in alice["expenses"]] == [
+            ("Dinner", True, "USD 10.00"), ("Taxi", False, "USD 5.00")
+        ]
+        assert alice["changes"] == [
+            {"friend": "Bob", "amount": "USD 5.00", "owes_you": True},
+            {"friend": "Carol", "amount": "USD 10.00", "owes_you": True},
+        ]
+        assert alice["balances"] == alice["changes"]
+
+    @pytest.mark.asyncio
+    async def test_old_and_deleted_expenses_left_out(self, test_db, users):
+        old = await add_expense(test_db, 3, 2000, [1, 3], name="Old")
+        old.created_at = datetime.utcnow() - timedelta(days=30)
+        deleted = await add_expense(test_db, 3, 2000, [1, 3], name="Deleted")
+        deleted.deleted_at = datetime.utcnow()
+        test_db.commit()
+
+        alice = digests_for(test_db, [1])[1]
+
+        assert alice["expenses"] == []
+        assert alice["changes"] == []
+        # Still owed from the old expense
+        assert alice["balances"] != []
+
+    def test_nothing_to_report(self, test_db, users):
+        assert digests_for(test_db, [1, 3]) == {}
+
+    @pytest.mark.asyncio
+    async def test_long_weeks_truncated(self, test_db, users, monkeypatch):
+        monkeypatch.setattr(settings, "DIGEST_MAX_EXPENSES", 2)
+        for _ in range(5):
+            await add_expense(test_db, 1, 200, [1, 3])
+
+        carol = digests_for(test_db, [3])[3]
+
+        assert len(carol["expenses"]) == 2
+        assert carol["more_expenses"] == 3
+
+    @pytest.mark.asyncio
+    async def test_rendered_escaped(self, test_db, users):
+        await add_expense(test_db, 1, 3000, [1, 3], name="<b>Pizza</b>")
+
+        message = render_digest(digests_for(test_db, [1])[1])
+
+        assert message["to_email"] == "alice@example.com"
+        assert "&lt;b&gt;Pizza&lt;/b&gt;" in message["html_content"]
+        assert "- <b>Pizza</b>: USD 30.00 (you paid)" in message["text_content"]
+        assert "Carol owes you USD 15.00" in message["text_content"]
+
+
+class TestSendWeeklyDigests:
+    """Test the streaming job"""
+
+    @pytest.fixture
+    def many_users(self, test_db):
+        for user_id in range(1, 8):
+            add_user(test_db, user_id, f"User{user_id}")
+        test_db.commit()
+
+    @pytest.mark.asyncio
+    async def test_only_opted_in_users(self, test_db, users):
+        await add_expense(test_db, 2, 3000, [1, 2, 3, 4])
+        sender = AsyncMock(side_effect=lambda messages: [None] * len(messages))
+
+        run = await send_weekly_digests(test_db, now=TOMORROW, sender=sender)
+
+        sent = [m["to_email"] for call in sender.await_args_list for m in call.args[0]]
+        assert sent == ["alice@example.com", "carol@example.com"]
+        assert (run.users_scanned, run.emails_sent, run.last_user_id) == (4, 2, 4)
+
+    @pytest.mark.asyncio
+    async def test_queries_per_chunk_constant(self, test_db, many_users, monkeypatch):
+        monkeypatch.setattr(settings, "DIGEST_CHUNK_SIZE", 3)
+        for user_id in range(2, 8):
+            await add_expense(test_db, 1, 1000, [1, user_id])
+        sender = AsyncMock(side_effect=lambda messages: [None] * len(messages))
+
+        with capture_queries(test_db.get_bind()) as statements:
+            run = await send_weekly_digests(test_db, now=TOMORROW, sender=sender)
+
+        assert run.emails_sent == 7
+        # 3 chunks of at most 4 queries, plus the empty chunk that ends the run
+        assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) <= 3 * 4 + 1
+
+    @pytest.mark.asyncio
+    async def test_failures_queued_for_retry(self, test_db, users):
+        await add_expense(test_db, 1, 3000, [1, 3])
+        sender = AsyncMock(return_value=[None, ConnectionError("relay down")])
+
+        run = await send_weekly_digests(test_db, now=TOMORROW, sender=sender)
+
+        assert (run.emails_sent, run.emails_queued) == (1, 1)
+        queued = test_db.query(OutboxMessage).filter(OutboxMessage.kind == "email").one()
+        assert queued.payload["to_email"] == "carol@example.com"
+
+    @pytest.mark.asyncio
+    async def test_resume(self, test_db, users):
+        await add_expense(test_db, 1, 3000, [1, 3])
+        sender = AsyncMock(side_effect=lambda messages: [None] * len(messages))
+
+        run = await send_weekly_digests(test_db, now=TOMORROW, start_after=1, sender=sender)
+
+        assert [m["to_email"] for m in sender.await_args.args[0]] == ["carol@example.com"]
+        assert run.users_scanned == 3
+
+
+class TestScheduler:
+    """Test job registration"""
+
+    def test_jobs_scheduled(self):
+        scheduler = build_scheduler()
+
+        jobs = {job.id: job for job in scheduler.get_jobs()}
+
+        assert set(jobs) == {"weekly_digest", "prune_change_log"}
+        assert "day_of_week='mon'" in str(jobs["weekly_digest"].trigger)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
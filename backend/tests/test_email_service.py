@@ -1,10 +1,14 @@
 """
 Tests for email service
 """
+import socket
+
 import pytest
+from aiosmtpd.controller import Controller
 from unittest.mock import AsyncMock, MagicMock, patch
 from email.mime.text import MIMEText
 
+from app.core.config import settings
 from app.services.email_service import EmailService, email_service
 from app.models.models import User
 
@@ -19,6 +23,17 @@ def mock_user():
     return user
 
 
+@pytest.fixture
+def mock_send():
+    """Stands in for the SMTP connection; yields its send_message"""
+    client = MagicMock()
+    client.connect = AsyncMock()
+    client.send_message = AsyncMock()
+    client.quit = AsyncMock()
+    with patch('aiosmtplib.SMTP', return_value=client):
+        yield client.send_message
+
+
 @pytest.fixture
 def email_svc():
     """Email service instance"""
@@ -34,7 +49,6 @@ class TestEmailService:
     """Test email service"""
 
     @pytest.mark.asyncio
-    @patch('aiosmtplib.send')
     async def test_send_email_success(self, mock_send, email_svc):
         """Test sending email successfully"""
         mock_send.return_value = AsyncMock()
@@ -70,7 +84,6 @@ class TestEmailService:
         assert result is False
 
     @pytest.mark.asyncio
-    @patch('aiosmtplib.send')
     async def test_send_email_error(self, mock_send, email_svc):
         """Test error handling when sending email"""
         mock_send.side_effect = Exception("SMTP Error")
@@ -84,7 +97,6 @@ class TestEmailService:
         assert result is False
 
     @pytest.mark.asyncio
-    @patch('aiosmtplib.send')
     async def test_send_invite_email(self, mock_send, email_svc):
         """Test sending invitation email"""
         mock_send.return_value = AsyncMock()
@@ -103,7 +115,6 @@ class TestEmailService:
         assert "invited you to SAHASplit" in msg['Subject']
 
     @pytest.mark.asyncio
-    @patch('aiosmtplib.send')
     async def test_send_feedback_email(self, mock_send, email_svc, mock_user):
         """Test sending feedback email"""
         mock_send.return_value = AsyncMock()
@@ -125,7 +136,6 @@ class TestEmailService:
         assert "test@example.com" in email_body
 
     @pytest.mark.asyncio
-    @patch('aiosmtplib.send')
     async def test_send_magic_link_email(self, mock_send, email_svc):
         """Test sending magic link email"""
         mock_send.return_value = AsyncMock()
@@ -148,7 +158,6 @@ class TestEmailService:
         assert "expire in 1 hour" in email_body
 
     @pytest.mark.asyncio
-    @patch('aiosmtplib.send')
     async def test_send_email_html_only(self, mock_send, email_svc):
         """Test sending HTML-only email"""
         mock_send.return_value = AsyncMock()
@@ -172,6 +181,166 @@ class TestEmailService:
         # Note: multipart structure may still have empty text part
 
 
+class TestTemplates:
+    """Test email bodies rendered from the compiled templates"""
+
+    @pytest.fixture
+    def cached_svc(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(settings, "EMAIL_TEMPLATE_CACHE_DIR", str(tmp_path / "jinja"))
+        return EmailService()
+
+    def test_user_input_escaped_in_html(self, email_svc, mock_user):
+        mock_user.name = "<b>Mallory</b>"
+
+        message = email_svc.build_feedback_email("<script>alert(1)</script>", mock_user)
+
+        assert "&lt;script&gt;alert(1)&lt;/script&gt;" in message["html_content"]
+        assert "<script>" not in message["html_content"]
+        assert "&lt;b&gt;Mallory&lt;/b&gt;" in message["html_content"]
+        # Plain text is left as written
+        assert "<script>alert(1)</script>" in message["text_content"]
+
+    def test_invite_link_encoded(self, email_svc):
+        message = email_svc.build_invite_email("friend+1@test.com", "John Doe")
+
+        assert "/auth/register?email=friend%2B1%40test.com" in message["html_content"]
+        assert "/auth/register?email=friend%2B1%40test.com" in message["text_content"]
+
+    def test_precompile_writes_bytecode_cache(self, cached_svc, tmp_path):
+        assert cached_svc.precompile_templates() >= 8
+
+        assert len(list((tmp_path / "jinja").iterdir())) >= 8
+
+    def test_other_workers_skip_parsing(self, cached_svc, monkeypatch):
+        cached_svc.precompile_templates()
+
+        # A new worker's environment loads every template from the bytecode cache
+        worker = EmailService()
+        monkeypatch.setattr(type(worker.jinja_env), "_parse", MagicMock(side_effect=AssertionError("parsed")))
+        worker.precompile_templates()
+
+        assert "Log In to SAHASplit" in worker.build_magic_link_email("user@test.com", "https://x")["html_content"]
+
+
+class Relay:
+    """aiosmtpd handler recording connections and messages"""
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+    def start(self, port):
+        self.controller = Controller(self, hostname="127.0.0.1", port=port)
+        self.controller.start()
+
+    def restart(self):
+        """Restart the server, dropping client connections"""
+        self.controller.stop()
+        self.start(self.controller.port)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def relay():
+    """A local SMTP server standing in for the relay"""
+    handler = Relay()
+    handler.start(free_port())
+    yield handler
+    handler.controller.stop()
+
+
+@pytest.fixture
+def relay_svc(relay):
+    svc = EmailService()
+    svc.smtp_host = "127.0.0.1"
+    svc.smtp_port = relay.controller.port
+    svc.smtp_user = None
+    svc.smtp_start_tls = False
+    yield svc
+
+
+def message(i):
+    return {"to_email": f"user{i}@test.com", "subject": f"Message {i}", "html_content": "<p>Hi</p>"}
+
+
+class TestSMTPConnectionPool:
+    """Test pooled SMTP connections against a local server"""
+
+    @pytest.mark.asyncio
+    async def test_connection_reused(self, relay, relay_svc):
+        for i in range(5):
+            await relay_svc.deliver(**message(i))
+
+        assert len(relay.messages) == 5
+        assert relay.connections == 1
+        await relay_svc.close()
+
+    @pytest.mark.asyncio
+    async def test_bulk_send_uses_pool(self, relay, relay_svc, monkeypatch):
+        monkeypatch.setattr(settings, "SMTP_POOL_SIZE", 3)
+
+        errors = await relay_svc.deliver_many(message(i) for i in range(30))
+
+        assert errors == [None] * 30
+        assert sorted(e.rcpt_tos[0] for e in relay.messages) == sorted(f"user{i}@test.com" for i in range(30))
+        assert relay.connections <= 3
+        await relay_svc.close()
+
+    @pytest.mark.asyncio
+    async def test_reconnects_after_relay_drops_connection(self, relay, relay_svc):
+        await relay_svc.deliver(**message(1))
+        relay.restart()
+
+        await relay_svc.deliver(**message(2))
+
+        assert len(relay.messages) == 2
+        assert relay_svc.pool.connections_opened == 2
+        await relay_svc.close()
+
+    @pytest.mark.asyncio
+    async def test_connection_retired_after_max_messages(self, relay, relay_svc, monkeypatch):
+        monkeypatch.setattr(settings, "SMTP_MAX_MESSAGES_PER_CONNECTION", 2)
+
+        for i in range(5):
+            await relay_svc.deliver(**message(i))
+
+        assert relay.connections == 3
+
+    @pytest.mark.asyncio
+    async def test_idle_connection_checked(self, relay, relay_svc, monkeypatch):
+        monkeypatch.setattr(settings, "SMTP_NOOP_AFTER_SECONDS", 0)
+        await relay_svc.deliver(**message(1))
+        relay.restart()
+
+        await relay_svc.deliver(**message(2))
+
+        assert len(relay.messages) == 2
+        await relay_svc.close()
+
+    @pytest.mark.asyncio
+    async def test_relay_down(self, relay_svc, relay):
+        relay.controller.stop()
+
+        with pytest.raises(OSError):
+            await relay_svc.deliver(**message(1))
+        assert await relay_svc.send_email(**message(1)) is False
+        relay.start(relay.controller.port)
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
@@ -0,0 +1,151 @@
+"""
+Tests for version counters and ETag/304 handling on read endpoints
+"""
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.deps import get_current_user
+from app.core.database import get_db
+from app.models.models import User, Group, GroupUser
+from app.schemas.expense import ExpenseCreate, ParticipantCreate
+from app.services.split_service import create_expense
+from app.services.splitwise_import_service import splitwise_import_service
+
+
+@pytest.fixture
+def client(test_db):
+    """Client whose requests use the test database as user 1"""
+    alice = User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en")
+    bob = User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en")
+    group = Group(id=1, public_id="abc123", name="Trip", user_id=1)
+    test_db.add_all([alice, bob, group])
+    test_db.add_all([GroupUser(group_id=1, user_id=1), GroupUser(group_id=1, user_id=2)])
+    test_db.commit()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = lambda: test_db
+    app.dependency_overrides[get_current_user] = lambda: test_db.query(User).get(1)
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+
+
+def add_expense(db, group_id=1):
+    return create_expense(db, ExpenseCreate(
+        paid_by=1,
+        name="Dinner",
+        category="food",
+        amount=1000,
+        currency="USD",
+        group_id=group_id,
+        expense_date=datetime(2025, 1, 10),
+        participants=[
+            ParticipantCreate(user_id=1, amount=500),
+            ParticipantCreate(user_id=2, amount=500),
+        ]
+    ), 1)
+
+
+class TestVersionCounters:
+    """Test that writes bump versions"""
+
+    @pytest.mark.asyncio
+    async def test_expense_bumps_group_and_ledger_versions(self, client, test_db):
+        """Creating an expense bumps the group and every involved user"""
+        await add_expense(test_db)
+
+        assert test_db.query(Group).get(1).version == 1
+        assert test_db.query(User).get(1).ledger_version == 1
+        assert test_db.query(User).get(2).ledger_version == 1
+
+    def test_group_update_bumps_version(self, client, test_db):
+        """Group router writes bump the group version"""
+        response = client.put("/api/groups/1", json={"name": "Renamed"})
+
+        assert response.status_code == 200
+        assert test_db.query(Group).get(1).version == 1
+
+    @pytest.mark.asyncio
+    async def test_splitwise_import_bumps_ledger_versions(self, client, test_db):
+        """Imported expenses bump every involved user"""
+        csv_content = "Date,Description,Category,Cost,Currency,Alice,Bob\n2025-01-10,Dinner,Food,10.00,USD,5.00,-5.00\n"
+
+        stats = await splitwise_import_service.import_from_csv(test_db, 1, csv_content)
+
+        assert stats["expenses_imported"] == 1
+        assert test_db.query(User).get(1).ledger_version == 1
+        assert test_db.query(User).get(2).ledger_version == 1
+
+    @pytest.mark.asyncio
+    async def test_account_deletion_bumps_friend_ledgers(self, client, test_db):
+        """Deleting an account bumps everyone it shared expenses with"""
+        test_db.add(User(id=3, email="carol@example.com", name="Carol", currency="USD", preferred_language="en"))
+        test_db.query(Group).get(1).user_id = 2
+        test_db.commit()
+        await create_expense(test_db, ExpenseCreate(
+            paid_by=3, name="Taxi", category="transport", amount=600, currency="USD",
+            participants=[ParticipantCreate(user_id=1, amount=300), ParticipantCreate(user_id=3, amount=300)]
+        ), 3)
+
+        response = client.request("DELETE", "/api/users/account", json={"confirmation": "DELETE MY ACCOUNT"})
+
+        assert response.status_code == 204
+        assert test_db.query(User).get(3).ledger_version == 2
+        assert test_db.query(User).get(2).ledger_version == 0
+
+class TestConditionalGet:
+    """Test ETag and If-None-Match handling"""
+
+    @pytest.mark.parametrize("path", [
+        "/api/groups/1",
+        "/api/groups/1/balances",
+        "/api/expenses/group/1/details",
+        "/api/expenses/friend/2",
+    ])
+    def test_not_modified_when_unchanged(self, client, path):
+        """A matching If-None-Match gets an empty 304"""
+        first = client.get(path)
+        assert first.status_code == 200
+        etag = first.headers["ETag"]
+
+        second = client.get(path, headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == etag
+
+    @pytest.mark.asyncio
+    async def test_etag_changes_after_write(self, client, test_db):
+        """A write invalidates the previous ETag"""
+        etag = client.get("/api/groups/1/balances").headers["ETag"]
+
+        await add_expense(test_db)
+
+        response = client.get("/api/groups/1/balances", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert len(response.json()) == 2
+
+    def test_query_parameters_change_etag(self, client):
+        """Different representations get different ETags"""
+        default = client.get("/api/expenses/group/1/details").headers["ETag"]
+        with_deleted = client.get(
+            "/api/expenses/group/1/details", params={"include_deleted": True}
+        ).headers["ETag"]
+
+        assert default != with_deleted
+
+    def test_non_member_gets_no_304(self, client, test_db):
+        """Membership is still enforced before answering 304"""
+        test_db.add(Group(id=2, public_id="other", name="Other", user_id=2))
+        test_db.commit()
+
+        response = client.get("/api/groups/2/balances", headers={"If-None-Match": "*"})
+        assert response.status_code == 403
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
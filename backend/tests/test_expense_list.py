@@ -0,0 +1,164 @@
+"""
+Tests for the projection-based expense list endpoints
+"""
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.deps import get_current_user
+from app.core.database import get_db
+from app.models.models import User, Group, GroupUser, Expense
+from app.schemas.expense import ExpenseCreate, ExpenseDetailResponse, ParticipantCreate, ParticipantResponse
+from app.services.split_service import create_expense
+from app.services.expense_list_service import list_expenses
+
+
+@pytest.fixture
+def client(test_db):
+    """Client whose requests use the test database as user 1"""
+    test_db.add_all([
+        User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+        User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en"),
+        User(id=3, email="carol@example.com", currency="USD", preferred_language="en"),
+        Group(id=1, public_id="abc123", name="Trip", user_id=1),
+    ])
+    test_db.add_all([GroupUser(group_id=1, user_id=u) for u in (1, 2, 3)])
+    test_db.commit()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = lambda: test_db
+    app.dependency_overrides[get_current_user] = lambda: test_db.query(User).get(1)
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+
+
+def add_expense(db, name, day, group_id=1, participant_ids=(1, 2, 3)):
+    return create_expense(db, ExpenseCreate(
+        paid_by=1,
+        name=name,
+        category="food",
+        amount=900,
+        currency="USD",
+        group_id=group_id,
+        expense_date=datetime(2025, 1, day, 12, 30, 15, 250000),
+        participants=[ParticipantCreate(user_id=u, amount=900 // len(participant_ids)) for u in participant_ids]
+    ), 1)
+
+
+def model_json(db, expense_id):
+    """What the per-row pydantic path produced for an expense"""
+    expense = db.query(Expense).get(expense_id)
+    names = {u.id: u.name or u.email for u in db.query(User).all()}
+    detail = ExpenseDetailResponse.model_validate(expense)
+    detail.paid_by_name = names[expense.paid_by]
+    detail.participants = [
+        ParticipantResponse(user_id=p.user_id, user_name=names[p.user_id], amount=p.amount)
+        for p in expense.expense_participants
+    ]
+    return detail.model_dump(mode="json")
+
+
+class TestListExpenses:
+    """Test the bulk projection"""
+
+    @pytest.mark.asyncio
+    async def test_matches_response_model_shape(self, client, test_db):
+        """Projected dicts serialize exactly like ExpenseDetailResponse"""
+        expense = await add_expense(test_db, "Dinner", 10)
+
+        response = client.get("/api/expenses/group/1/details")
+
+        assert response.status_code == 200
+        assert response.json() == [model_json(test_db, expense.id)]
+
+    @pytest.mark.asyncio
+    async def test_orders_newest_first(self, client, test_db):
+        """Expenses come back by expense_date descending"""
+        await add_expense(test_db, "Older", 10)
+        await add_expense(test_db, "Newer", 20)
+
+        rows = list_expenses(test_db, [Expense.group_id == 1])
+
+        assert [r["name"] for r in rows] == ["Newer", "Older"]
+
+    @pytest.mark.asyncio
+    async def test_participant_filter(self, client, test_db):
+        """Friend lists only carry the two users' shares"""
+        await add_expense(test_db, "Dinner", 10)
+
+        response = client.get("/api/expenses/friend/2")
+
+        assert response.status_code == 200
+        assert [p["user_id"] for p in response.json()[0]["participants"]] == [1, 2]
+        assert response.headers["etag"]
+
+    @pytest.mark.asyncio
+    async def test_all_expenses_without_participants(self, client, test_db):
+        """The flat list keeps the ExpenseResponse shape"""
+        await add_expense(test_db, "Dinner", 10)
+
+        data = client.get("/api/expenses").json()
+
+        assert len(data) == 1
+        assert data[0]["paid_by_name"] is None
+        assert "participants" not in data[0]
+
+
+class TestSparseFieldsets:
+    """Test the fields= projection"""
+
+    @pytest.mark.asyncio
+    async def test_selects_only_requested_fields(self, client, test_db):
+        """Only the requested keys (plus id) are returned"""
+        await add_expense(test_db, "Dinner", 10)
+
+        data = client.get(
+            "/api/expenses/group/1/details", params={"fields": "name,amount,expense_date,paid_by_name"}
+        ).json()
+
+        assert set(data[0]) == {"id", "name", "amount", "expense_date", "paid_by_name"}
+        assert data[0]["paid_by_name"] == "Alice"
+
+    @pytest.mark.asyncio
+    async def test_narrows_select_list(self, client, test_db):
+        """Unrequested columns are not read from the database"""
+        await add_expense(test_db, "Dinner", 10)
+        statements = []
+
+        from sqlalchemy import event
+
+        def capture(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = test_db.get_bind()
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            list_expenses(test_db, [Expense.group_id == 1], fields={"name", "amount"})
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+
+        assert len(statements) == 1
+        assert "file_key" not in statements[0]
+
+    def test_unknown_field_is_rejected(self, client):
+        """Typos in fields= return 400"""
+        response = client.get("/api/expenses/group/1/details", params={"fields": "name,amout"})
+
+        assert response.status_code == 400
+        assert "amout" in response.json()["detail"]
+
+    def test_group_list_fields(self, client):
+        """Group lists accept fields= too"""
+        data = client.get("/api/groups", params={"fields": "name"}).json()
+        assert data == [{"id": 1, "name": "Trip"}]
+
+        data = client.get("/api/groups/with-balances", params={"fields": "name"}).json()
+        assert data == [{"id": 1, "name": "Trip"}]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
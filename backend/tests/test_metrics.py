@@ -0,0 +1,115 @@
+"""
+Tests for Prometheus metrics
+"""
+import os
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+from prometheus_client import REGISTRY
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core.metrics import track_external
+from app.services.currency_service import currency_service
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def client():
+    """Unauthenticated client, without overrides left by other modules"""
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides.clear()
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.update(overrides)
+
+
+class TestRequestMetrics:
+    """Test per-route request counts and latency"""
+
+    def test_counts_by_route_template(self, client):
+        """Requests are labelled with the route template, not the raw path"""
+        before = sample("http_requests_total", method="GET", route="/api/health", status="200")
+        count_before = sample("http_request_duration_seconds_count", method="GET", route="/api/health")
+
+        client.get("/api/health")
+        client.get("/api/health")
+
+        assert sample("http_requests_total", method="GET", route="/api/health", status="200") == before + 2
+        assert sample("http_request_duration_seconds_count", method="GET", route="/api/health") == count_before + 2
+
+    def test_path_parameters_collapse(self, client):
+        """Different ids share one series"""
+        before = sample("http_requests_total", method="GET", route="/api/groups/{group_id}", status="403")
+
+        client.get("/api/groups/1")
+        client.get("/api/groups/2")
+
+        assert sample("http_requests_total", method="GET", route="/api/groups/{group_id}", status="403") == before + 2
+
+    def test_unmatched_paths_share_a_label(self, client):
+        before = sample("http_requests_total", method="GET", route="unmatched", status="404")
+
+        client.get("/no/such/path")
+
+        assert sample("http_requests_total", method="GET", route="unmatched", status="404") == before + 1
+
+    def test_exposition(self, client):
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "http_request_duration_seconds_bucket" in response.text
+        assert "db_pool_connections_in_use" in response.text
+
+
+class TestServiceMetrics:
+    """Test cache and external call metrics"""
+
+    def test_external_outcome(self):
+        """Failed calls are labelled as errors"""
+        before = sample("external_request_duration_seconds_count", service="test", operation="call", outcome="error")
+
+        with pytest.raises(ValueError):
+            with track_external("test", "call"):
+                raise ValueError()
+
+        assert sample(
+            "external_request_duration_seconds_count", service="test", operation="call", outcome="error"
+        ) == before + 1
+
+    def test_currency_cache_miss(self, test_db):
+        before = sample("cache_requests_total", cache="currency", result="miss")
+
+        assert currency_service._get_cached_rate(test_db, "USD", "EUR", None) is None
+
+        assert sample("cache_requests_total", cache="currency", result="miss") == before + 1
+
+
+class TestMultiprocess:
+    """Test aggregation across worker processes"""
+
+    def test_aggregates_workers(self, tmp_path):
+        """Values written by separate processes are summed in one exposition"""
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+        worker = "from app.core.metrics import record_cache; record_cache('test', True)"
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", worker], cwd=BACKEND_DIR, env=env, check=True)
+
+        render = "from app.core.metrics import render_metrics; print(render_metrics()[0].decode())"
+        output = subprocess.run(
+            [sys.executable, "-c", render], cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True
+        ).stdout
+
+        assert 'cache_requests_total{cache="test",result="hit"} 2.0' in output
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
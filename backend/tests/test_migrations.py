@@ -0,0 +1,78 @@
+"""
+Tests for running migrations and the startup revision check
+"""
+import os
+import subprocess
+import sys
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from app.core.database import Base
+from app.core.migrations import (
+    SchemaOutOfDate, check_schema_revision, current_revisions, head_revisions, upgrade_database
+)
+from app.models import models  # noqa: F401
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/migrations.db")
+    yield engine
+    engine.dispose()
+
+
+class TestMigrations:
+    """Test upgrading databases and checking their revision"""
+
+    def test_single_head(self):
+        assert len(head_revisions()) == 1
+
+    def test_empty_database_is_out_of_date(self, engine):
+        with pytest.raises(SchemaOutOfDate):
+            check_schema_revision(engine)
+
+    def test_upgrade_to_head(self, engine):
+        """Migrating from scratch gives the tables the models expect"""
+        upgrade_database(engine)
+
+        check_schema_revision(engine)
+        tables = set(inspect(engine).get_table_names())
+        assert set(Base.metadata.tables) <= tables
+        columns = {c["name"] for c in inspect(engine).get_columns("cached_bank_data")}
+        assert {"transaction_id", "account_id", "provider", "cached_at"} <= columns
+
+    def test_legacy_database_is_stamped(self, engine):
+        """Databases made by create_all are stamped at head rather than migrated"""
+        Base.metadata.create_all(bind=engine)
+        assert current_revisions(engine) == set()
+
+        upgrade_database(engine)
+
+        assert current_revisions(engine) == head_revisions()
+
+    def test_upgrade_is_repeatable(self, engine):
+        upgrade_database(engine)
+        upgrade_database(engine)
+
+        check_schema_revision(engine)
+
+
+class TestLazyImports:
+    """Test heavy SDKs stay out of worker startup"""
+
+    def test_app_import_skips_sdks(self):
+        code = (
+            "import sys, app.main; "
+            "print(','.join(m for m in ('boto3', 'plaid', 'pywebpush', 'authlib', 'aiosmtplib') if m in sys.modules))"
+        )
+        env = dict(os.environ, DATABASE_URL="sqlite://", SECRET_KEY="test")
+        result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+
+        assert result.stdout.strip() == ""
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,212 @@
+"""
+Tests for coalesced expense notifications
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from unittest.mock import AsyncMock
+
+from app.core.config import settings
+from app.core.query_stats import capture_queries
+from app.models.models import Expense, OutboxMessage, User
+from app.schemas.expense import ExpenseCreate, ParticipantCreate
+from app.services.email_service import email_service
+from app.services.notification_service import (
+    ADDED, render_email, render_push, send_expense_activity, notify_expense_change
+)
+from app.services.push_service import push_service
+from app.services.split_service import create_expense, delete_expense, edit_expense
+
+
+def add_user(db, user_id, name, preferences=None):
+    db.add(User(id=user_id, email=f"{name.lower()}@example.com", name=name, currency="USD",
+                preferred_language="en", notification_preferences=preferences))
+
+
+@pytest.fixture
+def users(test_db):
+    add_user(test_db, 1, "Alice")
+    add_user(test_db, 2, "Bob")
+    add_user(test_db, 3, "Carol", {"push_expense_added": False, "push_expense_updated": False,
+                                   "email_expense_updated": False})
+    test_db.commit()
+
+
+def expense_data(name="Dinner", amount=3000, expense_id=None, participants=(1, 2, 3)):
+    return ExpenseCreate(
+        expense_id=expense_id, paid_by=1, name=name, category="food", amount=amount, currency="USD", group_id=7,
+        participants=[ParticipantCreate(user_id=u, amount=amount // len(participants)) for u in participants]
+    )
+
+
+def queued(db):
+    """Unsent notifications by (user, channel)"""
+    return {
+        (m.payload["user_id"], m.payload["channel"]): m
+        for m in db.query(OutboxMessage).filter(OutboxMessage.kind == "expense_activity")
+    }
+
+
+class TestNotifyExpenseChange:
+    """Test who is notified of a change, and on which channels"""
+
+    @pytest.mark.asyncio
+    async def test_participants_notified_by_preference(self, test_db, users):
+        expense = await create_expense(test_db, expense_data(), 1)
+
+        messages = queued(test_db)
+
+        # Alice made the change; Carol doesn't want pushes about new expenses
+        assert set(messages) == {(2, "push"), (2, "email"), (3, "email")}
+        event, = messages[(2, "push")].payload["events"]
+        assert event == {"expense_id": expense.id, "action": "added", "name": "Dinner", "amount": 3000,
+                         "currency": "USD", "actor": "Alice"}
+        assert messages[(3, "email")].payload["email"] == "carol@example.com"
+
+    @pytest.mark.asyncio
+    async def test_held_for_debounce(self, test_db, users):
+        before = datetime.utcnow()
+        await create_expense(test_db, expense_data(), 1)
+
+        message = queued(test_db)[(2, "push")]
+
+        assert message.available_at >= before + timedelta(seconds=settings.NOTIFICATION_DEBOUNCE_SECONDS)
+
+    @pytest.mark.asyncio
+    async def test_edits_fold_into_addition(self, test_db, users):
+        expense = await create_expense(test_db, expense_data(), 1)
+        for amount in (3300, 3600):
+            await edit_expense(test_db, expense_data(amount=amount, expense_id=expense.id), 1)
+
+        messages = queued(test_db)
+
+        assert test_db.query(OutboxMessage).filter(OutboxMessage.kind == "expense_activity").count() == 3
+        event, = messages[(2, "push")].payload["events"]
+        assert (event["action"], event["amount"]) == ("added", 3600)
+
+    @pytest.mark.asyncio
+    async def test_added_then_deleted_cancels(self, test_db, users):
+        expense = await create_expense(test_db, expense_data(), 1)
+        await delete_expense(test_db, expense.id, 1)
+
+        messages = queued(test_db)
+
+        # Carol doesn't want emails about deletions, but the addition is still withdrawn
+        assert all(m.payload["events"] == [] for m in messages.values())
+
+    @pytest.mark.asyncio
+    async def test_claimed_messages_not_folded_into(self, test_db, users):
+        expense = await create_expense(test_db, expense_data(), 1)
+        for message in queued(test_db).values():
+            message.attempts = 1
+        test_db.commit()
+
+        await edit_expense(test_db, expense_data(amount=3300, expense_id=expense.id), 1)
+
+        # Bob gets new messages; Carol doesn't want to hear about edits
+        assert test_db.query(OutboxMessage).filter(OutboxMessage.kind == "expense_activity").count() == 5
+
+    @pytest.mark.asyncio
+    async def test_bulk_import_one_message_per_recipient(self, test_db, users, monkeypatch):
+        monkeypatch.setattr(settings, "NOTIFICATION_MAX_EVENTS", 5)
+        for n in range(25):
+            await create_expense(test_db, expense_data(name=f"Import {n}"), 1)
+
+        messages = queued(test_db)
+
+        assert len(messages) == 3
+        payload = messages[(2, "email")].payload
+        assert [e["name"] for e in payload["events"]] == [f"Import {n}" for n in range(5)]
+        assert payload["more"] == 20
+
+    def test_folds_within_transaction(self, test_db, users):
+        for n in range(3):
+            notify_expense_change(test_db, Expense(id=f"e{n}", name="Dinner", amount=3000, currency="USD"),
+                                  ADDED, 1, [1, 2])
+        test_db.commit()
+
+        messages = queued(test_db)
+
+        assert len(messages) == 2
+        assert len(messages[(2, "push")].payload["events"]) == 3
+
+    def test_max_delay(self, test_db, users):
+        expense = Expense(id="e1", name="Dinner", amount=3000, currency="USD")
+        notify_expense_change(test_db, expense, ADDED, 1, [1, 2])
+        test_db.commit()
+        message = queued(test_db)[(2, "push")]
+        message.created_at = datetime.utcnow() - timedelta(seconds=settings.NOTIFICATION_MAX_DELAY_SECONDS)
+
+        notify_expense_change(test_db, expense, ADDED, 1, [1, 2])
+
+        assert message.available_at <= datetime.utcnow()
+
+    def test_two_queries_per_change(self, test_db, users):
+        expense = Expense(id="e1", name="Dinner", amount=3000, currency="USD")
+
+        with capture_queries(test_db.get_bind()) as statements:
+            notify_expense_change(test_db, expense, ADDED, 1, [1, 2, 3])
+
+        # Recipients with their preferences, then the unsent messages to fold into
+        assert len(statements) == 2
+
+
+class TestSendExpenseActivity:
+    """Test rendering and sending coalesced notifications"""
+
+    def payload(self, channel, count, more=0):
+        events = [{"expense_id": f"e{n}", "action": "added", "name": f"Dinner {n}", "amount": 3000,
+                   "currency": "USD", "actor": "Alice"} for n in range(count)]
+        return {"user_id": 2, "channel": channel, "email": "bob@example.com", "events": events, "more": more}
+
+    def test_render_single(self):
+        push = render_push(self.payload("push", 1))
+        email = render_email(self.payload("email", 1))
+
+        assert (push["title"], push["body"]) == ("Expense added", "Alice added Dinner 0 (USD 30.00)")
+        assert push["data"] == {"expense_id": "e0"}
+        assert email["subject"] == "Alice added Dinner 0 (USD 30.00)"
+        assert "Alice added Dinner 0 (USD 30.00)" in email["text_content"]
+
+    def test_render_many(self):
+        push = render_push(self.payload("push", 5, more=7))
+        email = render_email(self.payload("email", 5, more=7))
+
+        assert push["title"] == "12 expense updates"
+        assert push["body"].endswith("Alice added Dinner 2 (USD 30.00) and 9 more")
+        assert email["subject"] == "12 expense updates on SAHASplit"
+        assert email["html_content"].count("<li>") == 5
+        assert "and 7 more" in email["text_content"]
+
+    @pytest.mark.asyncio
+    async def test_sends_each_channel(self, monkeypatch):
+        pushes = AsyncMock(return_value=[None])
+        emails = AsyncMock(return_value=[RuntimeError("SMTP down")])
+        monkeypatch.setattr(push_service, "deliver_many", pushes)
+        monkeypatch.setattr(push_service, "vapid_private_key", "key")
+        monkeypatch.setattr(email_service, "deliver_many", emails)
+        monkeypatch.setattr(email_service, "smtp_host", "smtp.test.com")
+
+        errors = await send_expense_activity([
+            self.payload("email", 1), self.payload("push", 1), self.payload("push", 0)
+        ])
+
+        assert [type(e).__name__ if e else None for e in errors] == ["RuntimeError", None, None]
+        assert [n["title"] for n in pushes.await_args.args[1]] == ["Expense added"]
+        assert [m["to_email"] for m in emails.await_args.args[0]] == ["bob@example.com"]
+
+    @pytest.mark.asyncio
+    async def test_unconfigured_channels_skipped(self, monkeypatch):
+        pushes = AsyncMock()
+        monkeypatch.setattr(push_service, "deliver_many", pushes)
+        monkeypatch.setattr(push_service, "vapid_private_key", None)
+        monkeypatch.setattr(email_service, "smtp_host", None)
+
+        errors = await send_expense_activity([self.payload("push", 1), self.payload("email", 1)])
+
+        assert errors == [None, None]
+        pushes.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
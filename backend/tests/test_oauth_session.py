@@ -7,6 +7,7 @@ from unittest.mock import patch, AsyncMock, MagicMock
 
 from app.main import app
 from app.api.deps import get_current_user
+from app.core.database import get_db
 from app.models.models import User
 
 
@@ -52,44 +53,42 @@ class TestGoogleOAuth:
         assert "accounts.google.com" in data["auth_url"]
         assert "redirect_uri" in data
 
-    @patch('httpx.AsyncClient')
+    @patch('app.api.routers.auth.get_provider')
     @patch('app.api.routers.auth.settings')
-    def test_google_callback_success(self, mock_settings, mock_client):
+    def test_google_callback_success(self, mock_settings, mock_get_provider, test_db):
         """Test successful Google OAuth callback"""
-        mock_settings.GOOGLE_CLIENT_ID = "test-client-id"
-        mock_settings.GOOGLE_CLIENT_SECRET = "test-secret"
         mock_settings.CORS_ORIGINS = ["http://localhost:3000"]
 
-        # Mock token exchange response
-        token_response = MagicMock()
-        token_response.status_code = 200
-        token_response.json.return_value = {
+        # The provider exchanges the code and verifies the ID token
+        provider = MagicMock()
+        provider.scope = "openid email profile"
+        provider.login = AsyncMock(return_value={
             'access_token': 'google-access-token',
-            'id_token': 'google-id-token'
-        }
-
-        # Mock userinfo response
-        userinfo_response = MagicMock()
-        userinfo_response.status_code = 200
-        userinfo_response.json.return_value = {
-            'email': 'newuser@gmail.com',
-            'name': 'New User',
-            'picture': 'https://example.com/pic.jpg',
-            'id': 'google-user-id-123'
-        }
-
-        mock_client_instance = AsyncMock()
-        mock_client_instance.post.return_value = token_response
-        mock_client_instance.get.return_value = userinfo_response
-        mock_client.return_value.__aenter__.return_value = mock_client_instance
-
-        response = client.get("/api/auth/google/callback?code=test-auth-code")
+            'id_token': 'google-id-token',
+            'claims': {
+                'email': 'newuser@gmail.com',
+                'email_verified': True,
+                'name': 'New User',
+                'picture': 'https://example.com/pic.jpg',
+                'sub': 'google-user-id-123'
+            }
+        })
+        mock_get_provider.return_value = provider
+
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = lambda: test_db
+        try:
+            response = client.get("/api/auth/google/callback?code=test-auth-code")
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
 
         assert response.status_code == 200
         data = response.json()
         assert "access_token" in data
         assert "refresh_token" in data
         assert "user" in data
+        provider.login.assert_awaited_once_with("test-auth-code", "http://localhost:3000/auth/callback/google")
 
 
 class TestSessionManagement:
@@ -0,0 +1,236 @@
+"""
+Tests for OpenID Connect logins with cached discovery and signing keys
+"""
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.testclient import TestClient
+from jose import jwk, jwt
+
+from app.main import app
+from app.core.database import get_db
+from app.models.models import User, Account
+from app.services import oidc_service
+from app.services.oidc_service import OIDCError, OIDCProvider, OIDCUnavailable
+
+ISSUER = "https://auth.example.com/application/o/sahasplit"
+
+
+def make_key(kid):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    public.update(kid=kid, use="sig")
+    return pem, public
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return {kid: make_key(kid) for kid in ("key-1", "key-2")}
+
+
+def id_token(keys, kid="key-1", **claims):
+    now = int(time.time())
+    payload = {
+        "iss": ISSUER + "/", "aud": "client-id", "sub": "user-123", "iat": now, "exp": now + 300,
+        "email": "alice@example.com", "email_verified": True, "name": "Alice",
+        **claims,
+    }
+    return jwt.encode(payload, keys[kid][0], algorithm="RS256", headers={"kid": kid})
+
+
+def response(body, status_code=200):
+    result = MagicMock()
+    result.status_code = status_code
+    result.json.return_value = body
+    return result
+
+
+class FakeProvider:
+    """Stands in for the provider's endpoints, counting requests"""
+
+    def __init__(self, keys, published=("key-1",)):
+        self.keys = keys
+        self.published = list(published)
+        self.next_token = None
+        self.calls = []
+
+    async def request(self, method, url, **kwargs):
+        self.calls.append(url.rsplit("/", 1)[-1])
+        if url.endswith("openid-configuration"):
+            return response({
+                # Authentik's issuer, and so its tokens' iss, ends with a slash
+                "issuer": ISSUER + "/",
+                "authorization_endpoint": f"{ISSUER}/authorize",
+                "token_endpoint": f"{ISSUER}/token",
+                "jwks_uri": f"{ISSUER}/jwks",
+            })
+        if url.endswith("jwks"):
+            return response({"keys": [self.keys[kid][1] for kid in self.published]})
+        if url.endswith("token"):
+            return response({"access_token": "provider-access", "id_token": self.next_token})
+        return response({}, 404)
+
+
+@pytest.fixture
+def remote(keys, monkeypatch):
+    remote = FakeProvider(keys)
+    client = MagicMock()
+    client.request = AsyncMock(side_effect=remote.request)
+    monkeypatch.setattr(oidc_service, "http_client", lambda: client)
+    return remote
+
+
+@pytest.fixture
+def provider():
+    return OIDCProvider("authentik", ISSUER + "/", "client-id", "secret")
+
+
+class TestOIDCProvider:
+    """Test discovery and key caching, and ID token checks"""
+
+    @pytest.mark.asyncio
+    async def test_login_is_one_round_trip_once_cached(self, provider, remote, keys):
+        remote.next_token = id_token(keys)
+        await provider.login("code-1", "http://localhost:3000/cb")
+        assert remote.calls == ["openid-configuration", "token", "jwks"]
+
+        remote.calls.clear()
+        tokens = await provider.login("code-2", "http://localhost:3000/cb")
+
+        assert remote.calls == ["token"]
+        assert tokens["claims"]["email"] == "alice@example.com"
+
+    @pytest.mark.asyncio
+    async def test_metadata_expires(self, provider, remote, monkeypatch):
+        monkeypatch.setattr(oidc_service.settings, "OIDC_METADATA_TTL_SECONDS", 0)
+        await provider.metadata()
+        await provider.metadata()
+
+        assert remote.calls == ["openid-configuration"] * 2
+
+    @pytest.mark.asyncio
+    async def test_rotated_key_refetched(self, provider, remote, keys, monkeypatch):
+        monkeypatch.setattr(oidc_service.settings, "OIDC_JWKS_MIN_REFRESH_SECONDS", 0)
+        remote.next_token = id_token(keys)
+        await provider.login("code-1", "http://localhost:3000/cb")
+
+        remote.published = ["key-1", "key-2"]
+        remote.next_token = id_token(keys, kid="key-2")
+        tokens = await provider.login("code-2", "http://localhost:3000/cb")
+
+        assert tokens["claims"]["sub"] == "user-123"
+        assert remote.calls.count("jwks") == 2
+
+    @pytest.mark.asyncio
+    async def test_unknown_key_refetch_throttled(self, provider, remote, keys):
+        remote.next_token = id_token(keys)
+        await provider.login("code-1", "http://localhost:3000/cb")
+
+        remote.next_token = id_token(keys, kid="key-2")
+        with pytest.raises(OIDCError):
+            await provider.login("code-2", "http://localhost:3000/cb")
+
+        assert remote.calls.count("jwks") == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("configured", [ISSUER, ISSUER + "/"])
+    @pytest.mark.parametrize("iss", [ISSUER, ISSUER + "/"])
+    async def test_issuer_trailing_slash(self, remote, keys, configured, iss):
+        provider = OIDCProvider("authentik", configured, "client-id", "secret")
+        remote.next_token = id_token(keys, iss=iss)
+
+        tokens = await provider.login("code", "http://localhost:3000/cb")
+
+        assert tokens["claims"]["iss"] == iss
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("claims", [{"aud": "someone-else"}, {"iss": "https://evil.example.com"},
+                                        {"exp": int(time.time()) - 60}])
+    async def test_invalid_id_token_rejected(self, provider, remote, keys, claims):
+        remote.next_token = id_token(keys, **claims)
+
+        with pytest.raises(OIDCError, match="Invalid ID token"):
+            await provider.login("code", "http://localhost:3000/cb")
+
+    @pytest.mark.asyncio
+    async def test_forged_signature_rejected(self, provider, remote, keys):
+        header, payload, _ = id_token(keys).split(".")
+        forged = id_token(keys, kid="key-2").split(".")[2]
+        remote.next_token = f"{header}.{payload}.{forged}"
+
+        with pytest.raises(OIDCError, match="Invalid ID token"):
+            await provider.login("code", "http://localhost:3000/cb")
+
+    @pytest.mark.asyncio
+    async def test_provider_down(self, provider, monkeypatch):
+        import httpx
+
+        client = MagicMock()
+        client.request = AsyncMock(side_effect=httpx.ConnectError("refused"))
+        monkeypatch.setattr(oidc_service, "http_client", lambda: client)
+
+        with pytest.raises(OIDCUnavailable):
+            await provider.metadata()
+
+
+class TestAuthentikLogin:
+    """Test the Authentik login routes"""
+
+    @pytest.fixture
+    def client(self, provider, test_db, monkeypatch):
+        monkeypatch.setitem(oidc_service.providers, "authentik", provider)
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = lambda: test_db
+        try:
+            yield TestClient(app)
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
+
+    def test_not_configured(self, monkeypatch):
+        monkeypatch.delitem(oidc_service.providers, "authentik", raising=False)
+
+        response = TestClient(app).get("/api/auth/authentik")
+
+        assert response.status_code == 501
+
+    def test_authorization_url(self, client, remote):
+        response = client.get("/api/auth/authentik")
+
+        assert response.status_code == 200
+        assert response.json()["auth_url"].startswith(f"{ISSUER}/authorize?client_id=client-id")
+
+    def test_callback_creates_user(self, client, remote, keys, test_db):
+        remote.next_token = id_token(keys)
+
+        response = client.get("/api/auth/authentik/callback", params={"code": "abc"})
+
+        assert response.status_code == 200
+        assert response.json()["user"]["email"] == "alice@example.com"
+        account = test_db.query(Account).filter(Account.provider == "authentik").one()
+        assert account.provider_account_id == "user-123"
+        assert test_db.query(User).one().email_verified is not None
+
+    def test_callback_unverified_email(self, client, remote, keys):
+        remote.next_token = id_token(keys, email_verified=False)
+
+        response = client.get("/api/auth/authentik/callback", params={"code": "abc"})
+
+        assert response.status_code == 400
+
+    def test_callback_bad_token(self, client, remote, keys):
+        remote.next_token = id_token(keys, aud="someone-else")
+
+        response = client.get("/api/auth/authentik/callback", params={"code": "abc"})
+
+        assert response.status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
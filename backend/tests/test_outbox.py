@@ -0,0 +1,178 @@
+"""
+Tests for the outbox of background emails and push notifications
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core.config import settings
+from app.core.database import get_db
+from app.models.models import OutboxMessage, User
+from app.services import outbox_service
+from app.services.email_service import email_service
+from app.services.outbox_service import (
+    OutboxDispatcher, PermanentDeliveryError, queue_email, queue_push, retry_delay
+)
+
+
+@pytest.fixture
+def sender(monkeypatch):
+    """Replaces the email sender, recording what it sends"""
+    sender = AsyncMock()
+    monkeypatch.setitem(outbox_service.SENDERS, "email", sender)
+    return sender
+
+
+@pytest.fixture
+def dispatcher():
+    return OutboxDispatcher()
+
+
+def queue(db, count=1):
+    for i in range(count):
+        queue_email(db, f"user{i}@example.com", "Hello", "<p>Hi</p>")
+    db.commit()
+
+
+class TestQueue:
+    """Test messages are written with the change that caused them"""
+
+    def test_committed_with_change(self, test_db, monkeypatch):
+        wake = MagicMock()
+        monkeypatch.setattr(outbox_service.outbox_dispatcher, "wake", wake)
+
+        test_db.add(User(email="alice@example.com", name="Alice", currency="USD", preferred_language="en"))
+        queue_push(test_db, 1, "Title", "Body", {"expense_id": "abc"})
+        test_db.commit()
+
+        message = test_db.query(OutboxMessage).one()
+        assert (message.kind, message.status, message.attempts) == ("push", "pending", 0)
+        assert message.payload["data"] == {"expense_id": "abc"}
+        wake.assert_called_once()
+
+    def test_rolled_back_with_change(self, test_db, monkeypatch):
+        wake = MagicMock()
+        monkeypatch.setattr(outbox_service.outbox_dispatcher, "wake", wake)
+
+        queue_email(test_db, "alice@example.com", "Hello", "<p>Hi</p>")
+        test_db.rollback()
+        test_db.commit()
+
+        assert test_db.query(OutboxMessage).count() == 0
+        wake.assert_not_called()
+
+
+class TestDispatcher:
+    """Test batching, retries and dead-lettering"""
+
+    @pytest.mark.asyncio
+    async def test_sent_and_deleted(self, test_db, dispatcher, sender):
+        queue(test_db, 3)
+
+        assert await dispatcher.dispatch_once(test_db) == 3
+
+        assert sender.await_count == 3
+        assert sender.await_args.args[0]["subject"] == "Hello"
+        assert test_db.query(OutboxMessage).count() == 0
+
+    @pytest.mark.asyncio
+    async def test_drain_in_batches(self, test_db, dispatcher, sender, monkeypatch):
+        monkeypatch.setattr(settings, "OUTBOX_BATCH_SIZE", 2)
+        queue(test_db, 5)
+
+        assert await dispatcher.drain(test_db) == 5
+        assert sender.await_count == 5
+
+    def test_claimed_messages_leased(self, test_db, dispatcher):
+        queue(test_db, 2)
+
+        assert len(dispatcher.claim(test_db)) == 2
+        assert dispatcher.claim(test_db) == []
+
+        # A worker that died mid-send loses its lease
+        test_db.query(OutboxMessage).update({OutboxMessage.available_at: datetime.utcnow() - timedelta(seconds=1)})
+        test_db.commit()
+        assert [m.attempts for m in dispatcher.claim(test_db)] == [2, 2]
+
+    @pytest.mark.asyncio
+    async def test_failure_retried_later(self, test_db, dispatcher, sender):
+        queue(test_db)
+        sender.side_effect = ConnectionError("relay down")
+
+        await dispatcher.dispatch_once(test_db)
+
+        message = test_db.query(OutboxMessage).one()
+        assert message.status == "pending"
+        assert message.attempts == 1
+        assert message.last_error == "ConnectionError: relay down"
+        assert message.available_at > datetime.utcnow() + timedelta(seconds=settings.OUTBOX_RETRY_BASE_SECONDS / 2)
+        assert await dispatcher.dispatch_once(test_db) == 0
+
+    @pytest.mark.asyncio
+    async def test_dead_lettered_after_max_attempts(self, test_db, dispatcher, sender, monkeypatch):
+        monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 2)
+        monkeypatch.setattr(outbox_service, "retry_delay", lambda attempts: 0)
+        queue(test_db)
+        sender.side_effect = ConnectionError("relay down")
+
+        await dispatcher.dispatch_once(test_db)
+        await dispatcher.dispatch_once(test_db)
+
+        message = test_db.query(OutboxMessage).one()
+        assert (message.status, message.attempts) == ("dead", 2)
+        assert await dispatcher.dispatch_once(test_db) == 0
+
+    @pytest.mark.asyncio
+    async def test_permanent_failure_not_retried(self, test_db, dispatcher, sender):
+        queue(test_db, 2)
+        sender.side_effect = [PermanentDeliveryError("mailbox does not exist"), None]
+
+        await dispatcher.dispatch_once(test_db)
+
+        assert test_db.query(OutboxMessage).one().status == "dead"
+
+    def test_backoff_doubles_up_to_max(self, monkeypatch):
+        monkeypatch.setattr(outbox_service.random, "uniform", lambda a, b: 1)
+
+        assert [retry_delay(n) for n in (1, 2, 3)] == [30, 60, 120]
+        assert retry_delay(20) == settings.OUTBOX_RETRY_MAX_SECONDS
+
+    @pytest.mark.asyncio
+    async def test_email_dropped_without_smtp(self, test_db, dispatcher, monkeypatch):
+        monkeypatch.setattr(email_service, "smtp_host", None)
+        deliver = AsyncMock()
+        monkeypatch.setattr(email_service, "deliver", deliver)
+        queue(test_db)
+
+        await dispatcher.dispatch_once(test_db)
+
+        deliver.assert_not_awaited()
+        assert test_db.query(OutboxMessage).count() == 0
+
+
+class TestQueuedRoutes:
+    """Test routes queue emails instead of sending them"""
+
+    def test_magic_link(self, test_db, monkeypatch):
+        deliver = AsyncMock()
+        monkeypatch.setattr(email_service, "deliver", deliver)
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = lambda: test_db
+        try:
+            response = TestClient(app).post("/api/auth/magic-link", json={"email": "alice@example.com"})
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
+
+        assert response.status_code == 200
+        deliver.assert_not_awaited()
+        message = test_db.query(OutboxMessage).one()
+        assert message.payload["to_email"] == "alice@example.com"
+        assert "/auth/verify?token=" in message.payload["html_content"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,100 @@
+"""
+Tests for password hashing off the event loop
+"""
+import asyncio
+import threading
+import bcrypt
+import pytest
+from prometheus_client import REGISTRY
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core import security
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.security import (
+    get_password_hash_async, password_needs_rehash, verify_password_async, _run_password_job
+)
+from app.models.models import User, Account
+
+
+@pytest.fixture(autouse=True)
+def cheap_hashing(monkeypatch):
+    """Low bcrypt cost and a fresh executor for each test"""
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(security, "_hash_executor", None)
+    yield
+    if security._hash_executor is not None:
+        security._hash_executor.shutdown(wait=True)
+
+
+def queue_depth():
+    return REGISTRY.get_sample_value("password_hash_queue_depth") or 0
+
+
+class TestPasswordHashing:
+    """Test hashing and verifying on the password threads"""
+
+    async def test_round_trip(self):
+        hashed = await get_password_hash_async("correct horse")
+
+        assert hashed.startswith("$2b$04$")
+        assert await verify_password_async("correct horse", hashed)
+        assert not await verify_password_async("wrong horse", hashed)
+
+    async def test_runs_on_password_threads(self):
+        name = await _run_password_job("verify", lambda: threading.current_thread().name)
+
+        assert name.startswith("password-hash")
+
+    async def test_bounded_with_queue_depth(self, monkeypatch):
+        """Jobs beyond PASSWORD_HASH_WORKERS wait, and are counted while they do"""
+        monkeypatch.setattr(settings, "PASSWORD_HASH_WORKERS", 1)
+        gate = threading.Event()
+        before = queue_depth()
+
+        first = asyncio.ensure_future(_run_password_job("hash", gate.wait))
+        second = asyncio.ensure_future(_run_password_job("hash", lambda: True))
+        await asyncio.sleep(0.05)
+        assert queue_depth() == before + 1
+        assert not second.done()
+
+        gate.set()
+        assert await asyncio.gather(first, second) == [True, True]
+        assert queue_depth() == before
+
+    def test_needs_rehash(self):
+        assert not password_needs_rehash(bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=4)).decode())
+        assert password_needs_rehash(bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=5)).decode())
+        assert password_needs_rehash("not-a-hash")
+
+
+class TestLoginRehash:
+    """Test upgrading stored hashes on login"""
+
+    def test_login_upgrades_cost(self, test_db):
+        old_hash = bcrypt.hashpw(b"hunter22", bcrypt.gensalt(rounds=5)).decode()
+        test_db.add(User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"))
+        test_db.add(Account(id="email_1", user_id=1, type="email", provider="email",
+                            provider_account_id="alice@example.com", id_token=old_hash))
+        test_db.commit()
+
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = lambda: test_db
+        try:
+            client = TestClient(app)
+            wrong = client.post("/api/auth/login", json={"email": "alice@example.com", "password": "nope"})
+            right = client.post("/api/auth/login", json={"email": "alice@example.com", "password": "hunter22"})
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
+
+        assert wrong.status_code == 401
+        assert right.status_code == 200
+        new_hash = test_db.query(Account).get("email_1").id_token
+        assert new_hash.startswith("$2b$04$")
+        assert bcrypt.checkpw(b"hunter22", new_hash.encode())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
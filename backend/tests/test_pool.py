@@ -0,0 +1,98 @@
+"""
+Tests for connection pool sizing, telemetry and load shedding
+"""
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.database import get_db, pool_limits, warm_up_pool
+from app.core.metrics import TimedQueuePool, instrument_pool
+from app.models.models import User
+
+
+def sample(name, database):
+    return REGISTRY.get_sample_value(name, {"database": database}) or 0
+
+
+@pytest.fixture
+def small_pool(tmp_path):
+    """A one-connection pool that gives up quickly"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path}/pool.db",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+        connect_args={"check_same_thread": False},
+    )
+    instrument_pool(engine, "test")
+    yield engine
+    engine.dispose()
+
+
+class TestPoolLimits:
+    """Test deriving pool settings from the connection budget"""
+
+    def test_split_between_workers(self, monkeypatch):
+        monkeypatch.setattr(settings, "DB_MAX_CONNECTIONS", 60)
+        monkeypatch.setattr(settings, "DB_POOL_SIZE", None)
+        monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", None)
+
+        monkeypatch.setattr(settings, "WEB_CONCURRENCY", 2)
+        assert pool_limits() == (10, 20)
+
+        monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+        assert pool_limits() == (5, 10)
+
+    def test_explicit_settings_win(self, monkeypatch):
+        monkeypatch.setattr(settings, "DB_POOL_SIZE", 3)
+        monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 0)
+
+        assert pool_limits() == (3, 0)
+
+
+class TestPoolTelemetry:
+    """Test pool metrics and warm-up"""
+
+    def test_in_use_and_wait(self, small_pool):
+        waits = sample("db_pool_checkout_wait_seconds_count", "test")
+
+        with small_pool.connect():
+            assert sample("db_pool_connections_in_use", "test") == 1
+        assert sample("db_pool_connections_in_use", "test") == 0
+        assert sample("db_pool_size", "test") == 1
+        assert sample("db_pool_checkout_wait_seconds_count", "test") == waits + 1
+
+    def test_warm_up(self, small_pool):
+        assert warm_up_pool(small_pool) == 1
+        assert small_pool.pool.checkedin() == 1
+
+
+class TestLoadShedding:
+    """Test answering 503 when the pool is exhausted"""
+
+    def test_exhausted_pool_returns_503(self, small_pool):
+        timeouts = sample("db_pool_timeouts_total", "test")
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = lambda: sessionmaker(bind=small_pool)()
+        app.dependency_overrides[get_current_user] = lambda: User(id=1, name="Alice", email="alice@example.com")
+
+        try:
+            with small_pool.connect():
+                response = TestClient(app).get("/api/groups")
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert sample("db_pool_timeouts_total", "test") == timeouts + 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,99 @@
+"""
+Tests for opt-in request profiling
+"""
+import os
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.profiling import save_profile
+from app.models.models import User, Group, GroupUser
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    """Profile into a temporary directory with a known token"""
+    monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+    return tmp_path
+
+
+@pytest.fixture
+def client(test_db):
+    """Client for Alice, a member of group 1"""
+    test_db.add_all([
+        User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+        Group(id=1, public_id="abc123", name="Trip", user_id=1),
+    ])
+    test_db.add(GroupUser(group_id=1, user_id=1))
+    test_db.commit()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = lambda: test_db
+    app.dependency_overrides[get_current_user] = lambda: test_db.query(User).get(1)
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+
+
+class TestProfiling:
+    """Test when and how requests are profiled"""
+
+    def test_off_by_default(self, profiles, client):
+        """Requests without the header aren't profiled"""
+        response = client.get("/api/groups/1")
+
+        assert response.status_code == 200
+        assert os.listdir(profiles) == []
+
+    def test_wrong_token_is_ignored(self, profiles, client):
+        response = client.get("/api/groups/1", headers={"X-Profile": "guess", "X-Profile-Output": "inline"})
+
+        assert response.json()["name"] == "Trip"
+        assert os.listdir(profiles) == []
+
+    def test_inline(self, profiles, client):
+        """The profile replaces the response, tagged with route and query count"""
+        response = client.get("/api/groups/1", headers={"X-Profile": "secret", "X-Profile-Output": "inline"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/html")
+        assert response.headers["x-profile-route"] == "/api/groups/{group_id}"
+        assert int(response.headers["x-profile-queries"]) > 0
+        assert response.headers["x-profile-status"] == "200"
+        assert "pyinstrument" in response.text
+
+    def test_saved_to_disk(self, profiles, client):
+        """By default the response is untouched and the profile is saved"""
+        response = client.get("/api/groups/1", headers={"X-Profile": "secret"})
+
+        assert response.json()["name"] == "Trip"
+        [name] = os.listdir(profiles)
+        assert "-GET-api_groups_group_id-" in name
+        assert name.endswith("ms.html")
+
+    def test_sampling(self, profiles, client, monkeypatch):
+        monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+
+        client.get("/api/groups/1")
+        client.get("/api/groups")
+
+        assert len(os.listdir(profiles)) == 2
+
+    def test_keeps_newest_files(self, profiles, monkeypatch):
+        monkeypatch.setattr(settings, "PROFILING_MAX_FILES", 2)
+
+        for name in ("1.html", "2.html", "3.html"):
+            save_profile("<html></html>", name)
+
+        assert sorted(os.listdir(profiles)) == ["2.html", "3.html"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
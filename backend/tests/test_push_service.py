@@ -1,13 +1,36 @@
 """
 Tests for push notification service
 """
+import base64
+import os
+import time
+
+import httpx
 import pytest
 import json
-from unittest.mock import MagicMock, patch, AsyncMock
+from unittest.mock import MagicMock, patch
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from jose import jwt
 from sqlalchemy.orm import Session
 
-from app.services.push_service import PushNotificationService, push_service
-from app.models.models import PushNotification
+from app.core.config import settings
+from app.models.models import OutboxMessage, PushNotification, User
+from app.services import push_service as push_module
+from app.services.outbox_service import OutboxDispatcher, PermanentDeliveryError, queue_push
+from app.services.push_service import PushNotificationService, PushServiceError, endpoint_hash, push_service
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def subscription(endpoint: str) -> str:
+    """A browser subscription with real encryption keys"""
+    key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    return json.dumps({"endpoint": endpoint, "keys": {"p256dh": b64(key), "auth": b64(os.urandom(16))}})
 
 
 @pytest.fixture
@@ -42,73 +65,6 @@ class TestPushNotificationService:
 
         assert result is False
 
-    @pytest.mark.asyncio
-    @patch('app.services.push_service.webpush')
-    async def test_send_notification_success(self, mock_webpush, push_svc, mock_db):
-        """Test successfully sending notification"""
-        subscription_data = json.dumps({
-            "endpoint": "https://fcm.googleapis.com/fcm/send/...",
-            "keys": {
-                "p256dh": "test-key",
-                "auth": "test-auth"
-            }
-        })
-
-        mock_subscription = MagicMock(spec=PushNotification)
-        mock_subscription.subscription = subscription_data
-        mock_db.query.return_value.filter.return_value.first.return_value = mock_subscription
-
-        mock_webpush.return_value = None
-
-        result = await push_svc.send_notification(
-            mock_db,
-            user_id=1,
-            title="Test Title",
-            body="Test Body",
-            data={"expense_id": "123"}
-        )
-
-        assert result is True
-        mock_webpush.assert_called_once()
-
-        # Verify payload
-        call_args = mock_webpush.call_args
-        assert "subscription_info" in call_args.kwargs
-        assert "data" in call_args.kwargs
-
-        payload = json.loads(call_args.kwargs["data"])
-        assert payload["title"] == "Test Title"
-        assert payload["body"] == "Test Body"
-        assert payload["data"]["expense_id"] == "123"
-
-    @pytest.mark.asyncio
-    @patch('app.services.push_service.webpush')
-    async def test_send_notification_invalid_subscription(self, mock_webpush, push_svc, mock_db):
-        """Test handling invalid subscription (410 Gone)"""
-        from pywebpush import WebPushException
-
-        subscription_data = json.dumps({"endpoint": "https://test.com"})
-        mock_subscription = MagicMock(spec=PushNotification)
-        mock_subscription.subscription = subscription_data
-        mock_db.query.return_value.filter.return_value.first.return_value = mock_subscription
-
-        # Simulate 410 Gone error
-        mock_response = MagicMock()
-        mock_response.status_code = 410
-        error = WebPushException("Gone")
-        error.response = mock_response
-        mock_webpush.side_effect = error
-
-        result = await push_svc.send_notification(
-            mock_db,
-            user_id=1,
-            title="Test",
-            body="Test"
-        )
-
-        assert result is False
-        mock_db.delete.assert_called_once()  # Should delete invalid subscription
-
     @pytest.mark.asyncio
     async def test_register_subscription_new(self, push_svc, mock_db):
         """Test registering new push subscription"""
@@ -133,7 +89,7 @@ class TestPushNotificationService:
         existing.subscription = '{"old": "subscription"}'
         mock_db.query.return_value.filter.return_value.first.return_value = existing
 
-        new_subscription = json.dumps({"new": "subscription"})
+        new_subscription = json.dumps({"endpoint": "https://test.com/new"})
 
         result = await push_svc.register_subscription(
             mock_db,
@@ -160,6 +116,140 @@ class TestPushNotificationService:
         assert key == ""
 
 
+class PushServiceStub:
+    """Answers push requests by endpoint path, recording what was posted"""
+
+    def __init__(self):
+        self.requests = []
+        self.statuses = {}
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return httpx.Response(self.statuses.get(request.url.path, 201))
+
+
+@pytest.fixture
+def push_stub(monkeypatch):
+    stub = PushServiceStub()
+    monkeypatch.setattr(push_module, "_client", httpx.AsyncClient(transport=httpx.MockTransport(stub)))
+    return stub
+
+
+@pytest.fixture
+def vapid_svc():
+    svc = PushNotificationService()
+    private_value = ec.generate_private_key(ec.SECP256R1()).private_numbers().private_value
+    svc.vapid_private_key = b64(private_value.to_bytes(32, "big"))
+    return svc
+
+
+def add_device(db, user_id, endpoint):
+    db.add(PushNotification(user_id=user_id, endpoint_hash=endpoint_hash(endpoint), subscription=subscription(endpoint)))
+
+
+@pytest.fixture
+def devices(test_db):
+    """Alice has a phone and a laptop, Bob one phone"""
+    for user_id, name in [(1, "Alice"), (2, "Bob")]:
+        test_db.add(User(id=user_id, email=f"{name.lower()}@example.com", name=name))
+    add_device(test_db, 1, "https://fcm.googleapis.com/fcm/send/alice-phone")
+    add_device(test_db, 1, "https://updates.push.services.mozilla.com/wpush/v2/alice-laptop")
+    add_device(test_db, 2, "https://fcm.googleapis.com/fcm/send/bob-phone")
+    test_db.commit()
+
+
+class TestPushDelivery:
+    """Test sending to every device over the pooled client"""
+
+    @pytest.mark.asyncio
+    async def test_sent_to_every_device(self, test_db, devices, vapid_svc, push_stub):
+        assert await vapid_svc.deliver(test_db, 1, "Test Title", "Test Body", {"expense_id": "123"}) is True
+
+        assert sorted(r.url.path.rsplit("/", 1)[1] for r in push_stub.requests) == ["alice-laptop", "alice-phone"]
+        request = push_stub.requests[0]
+        assert request.headers["Content-Encoding"] == "aes128gcm"
+        assert request.headers["TTL"] == str(settings.WEB_PUSH_TTL_SECONDS)
+        assert request.headers["Authorization"].startswith("vapid t=")
+
+    @pytest.mark.asyncio
+    async def test_vapid_token_signed_once_per_push_service(self, test_db, devices, vapid_svc, push_stub):
+        await vapid_svc.deliver_many(test_db, [
+            {"user_id": user_id, "title": "Test", "body": "Test", "data": None} for user_id in (1, 2)
+        ])
+        await vapid_svc.deliver(test_db, 2, "Again", "Again")
+
+        tokens = {r.url.host: r.headers["Authorization"] for r in push_stub.requests}
+        assert len(set(r.headers["Authorization"] for r in push_stub.requests)) == 2
+        claims = jwt.get_unverified_claims(tokens["fcm.googleapis.com"].split("t=")[1].split(",")[0])
+        assert claims["aud"] == "https://fcm.googleapis.com"
+        assert claims["exp"] > time.time() + 11 * 3600
+
+    @pytest.mark.asyncio
+    async def test_gone_subscriptions_pruned(self, test_db, devices, vapid_svc, push_stub):
+        push_stub.statuses = {"/fcm/send/alice-phone": 410, "/fcm/send/bob-phone": 404}
+
+        errors = await vapid_svc.deliver_many(test_db, [
+            {"user_id": user_id, "title": "Test", "body": "Test", "data": None} for user_id in (1, 2)
+        ])
+
+        assert errors == [None, None]
+        remaining = [p.user_id for p in test_db.query(PushNotification).all()]
+        assert remaining == [1]
+
+    @pytest.mark.asyncio
+    async def test_retried_only_if_no_device_got_it(self, test_db, devices, vapid_svc, push_stub):
+        push_stub.statuses = {"/fcm/send/alice-phone": 503, "/fcm/send/bob-phone": 503}
+
+        errors = await vapid_svc.deliver_many(test_db, [
+            {"user_id": user_id, "title": "Test", "body": "Test", "data": None} for user_id in (1, 2)
+        ])
+
+        assert errors[0] is None
+        assert isinstance(errors[1], PushServiceError)
+        assert test_db.query(PushNotification).count() == 3
+
+    @pytest.mark.asyncio
+    async def test_rejected_not_retried(self, test_db, devices, vapid_svc, push_stub):
+        push_stub.statuses = {"/fcm/send/bob-phone": 413}
+
+        with pytest.raises(PermanentDeliveryError):
+            await vapid_svc.deliver(test_db, 2, "Test", "x" * 5000)
+
+    @pytest.mark.asyncio
+    async def test_outbox_sends_batch_in_one_burst(self, test_db, devices, vapid_svc, push_stub, monkeypatch):
+        monkeypatch.setattr(push_module, "push_service", vapid_svc)
+        monkeypatch.setattr("app.core.database.SessionLocal", lambda: test_db)
+        monkeypatch.setattr(test_db, "close", lambda: None)
+        for user_id in (1, 2):
+            queue_push(test_db, user_id, "Dinner", "Alice added an expense")
+        test_db.commit()
+
+        with patch.object(PushNotificationService, "_deliver", wraps=vapid_svc._deliver) as deliver:
+            await OutboxDispatcher().dispatch_once(test_db)
+
+        deliver.assert_called_once()
+        assert len(push_stub.requests) == 3
+        assert test_db.query(OutboxMessage).count() == 0
+
+    @pytest.mark.asyncio
+    async def test_register_devices(self, test_db, devices, vapid_svc):
+        phone = subscription("https://fcm.googleapis.com/fcm/send/bob-phone")
+        await vapid_svc.register_subscription(test_db, 2, subscription("https://fcm.googleapis.com/fcm/send/bob-tablet"))
+        # Alice signs in on Bob's phone
+        await vapid_svc.register_subscription(test_db, 1, phone)
+
+        by_user = {}
+        for p in test_db.query(PushNotification).all():
+            by_user.setdefault(p.user_id, []).append(json.loads(p.subscription)["endpoint"].rsplit("/", 1)[1])
+        assert sorted(by_user[1]) == ["alice-laptop", "alice-phone", "bob-phone"]
+        assert by_user[2] == ["bob-tablet"]
+
+    @pytest.mark.asyncio
+    async def test_register_without_endpoint(self, test_db, vapid_svc):
+        with pytest.raises(ValueError):
+            await vapid_svc.register_subscription(test_db, 1, json.dumps({"keys": {}}))
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
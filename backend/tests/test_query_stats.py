@@ -0,0 +1,112 @@
+"""
+Tests for per-request SQL instrumentation
+"""
+import logging
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.query_stats import capture_queries, track_queries
+from app.models.models import User, Group, GroupUser
+
+
+@pytest.fixture
+def client(test_db):
+    """Client for Alice, who is in three groups with Bob"""
+    test_db.add_all([
+        User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+        User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en"),
+    ])
+    for group_id in (1, 2, 3):
+        test_db.add(Group(id=group_id, public_id=f"group{group_id}", name=f"Group {group_id}", user_id=1))
+        test_db.add_all([GroupUser(group_id=group_id, user_id=1), GroupUser(group_id=group_id, user_id=2)])
+    test_db.commit()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = lambda: test_db
+    app.dependency_overrides[get_current_user] = lambda: test_db.query(User).get(1)
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+
+
+class TestServerTiming:
+    """Test the per-request counters"""
+
+    def test_reports_query_count(self, test_db, client):
+        """Server-Timing carries the request's statement count and database time"""
+        with capture_queries(test_db.get_bind()) as statements:
+            response = client.get("/api/groups/1/balances")
+
+        timing = response.headers["server-timing"]
+        assert f'desc="{len(statements)} queries"' in timing
+        assert timing.startswith("db;dur=")
+        assert "app;dur=" in timing
+
+    def test_nested_tracking_adds_to_parent(self, test_db):
+        """Statements in a nested block (a batch sub-request) count for both"""
+        with track_queries() as outer:
+            test_db.execute(User.__table__.select())
+            with track_queries() as inner:
+                test_db.execute(User.__table__.select())
+
+        assert inner.count == 1
+        assert outer.count == 2
+
+
+class TestSlowQueries:
+    """Test slow-query logging"""
+
+    def test_logs_statement_and_params(self, test_db, monkeypatch, caplog):
+        """Slow statements are logged with their bound parameters"""
+        monkeypatch.setattr(settings, "SQL_SLOW_QUERY_MS", 0)
+
+        with caplog.at_level(logging.WARNING, logger="app.core.query_stats"):
+            test_db.query(User).filter(User.email == "nobody@example.com").all()
+
+        assert "Slow query" in caplog.text
+        assert "nobody@example.com" in caplog.text
+        assert "Query plan" not in caplog.text
+
+    def test_explain(self, test_db, monkeypatch, caplog):
+        """The plan is logged when enabled"""
+        monkeypatch.setattr(settings, "SQL_SLOW_QUERY_MS", 0)
+        monkeypatch.setattr(settings, "SQL_EXPLAIN_SLOW_QUERIES", True)
+
+        with caplog.at_level(logging.WARNING, logger="app.core.query_stats"):
+            test_db.query(User).filter(User.email == "nobody@example.com").all()
+
+        assert "Query plan" in caplog.text
+        assert "users" in caplog.text
+
+
+class TestQueryBudgets:
+    """Guard list endpoints against N+1 queries (budgets include loading the current user)"""
+
+    def test_group_list(self, client, max_queries):
+        with max_queries(3):
+            assert client.get("/api/groups").status_code == 200
+
+    def test_groups_with_balances(self, client, max_queries):
+        """Constant in the number of groups"""
+        with max_queries(5):
+            assert client.get("/api/groups/with-balances").status_code == 200
+
+    def test_group_expenses(self, client, max_queries):
+        with max_queries(4):
+            assert client.get("/api/expenses/group/1/details").status_code == 200
+
+    def test_budget_failure_lists_statements(self, client, max_queries):
+        """Exceeding the budget fails with the statements that ran"""
+        with pytest.raises(AssertionError, match="expected at most 1"):
+            with max_queries(1):
+                client.get("/api/groups/with-balances")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
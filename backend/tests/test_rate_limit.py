@@ -0,0 +1,135 @@
+"""
+Tests for token bucket rate limiting
+"""
+import fakeredis
+import pytest
+from unittest.mock import MagicMock
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.deps import get_current_user
+from app.core import rate_limit
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.rate_limit import RateLimiter, parse_limit
+from app.models.models import User
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMITS", {"login": "3/minute", "user_search": "2/minute"})
+
+
+def drain(limiter, count, client="ip:1.2.3.4"):
+    return [limiter.hit("login", client) for _ in range(count)]
+
+
+class TestTokenBucket:
+    """Test the bucket arithmetic, in process and in Redis"""
+
+    def test_parse_limit(self):
+        assert parse_limit("10/minute") == (10, 10 / 60)
+        assert parse_limit("5/hours") == (5, 5 / 3600)
+
+    @pytest.mark.parametrize("backend", ["memory", "redis"])
+    def test_burst_then_refill(self, backend, limits, clock):
+        limiter = RateLimiter("redis://fake" if backend == "redis" else None)
+        limiter._redis = fakeredis.FakeRedis()
+
+        waits = drain(limiter, 4)
+        assert waits[:3] == [0, 0, 0]
+        assert waits[3] == pytest.approx(20)
+
+        clock.now += 20
+        assert limiter.hit("login", "ip:1.2.3.4") == 0
+        assert limiter.hit("login", "ip:1.2.3.4") > 0
+
+    def test_clients_are_separate(self, limits, clock):
+        limiter = RateLimiter()
+        drain(limiter, 3)
+
+        assert limiter.hit("login", "ip:5.6.7.8") == 0
+
+    def test_unlisted_routes_unlimited(self, limits, clock):
+        limiter = RateLimiter()
+
+        assert [limiter.hit("unknown", "ip:1.2.3.4") for _ in range(10)] == [0] * 10
+
+    def test_shared_between_workers(self, limits, clock):
+        redis_client = fakeredis.FakeRedis()
+        workers = [RateLimiter("redis://fake"), RateLimiter("redis://fake")]
+        for worker in workers:
+            worker._redis = redis_client
+
+        assert [workers[i % 2].hit("login", "ip:1.2.3.4") > 0 for i in range(4)] == [False, False, False, True]
+
+    def test_redis_down_limits_in_process(self, limits, clock):
+        limiter = RateLimiter("redis://fake")
+        limiter._redis = MagicMock()
+        limiter._redis.register_script.side_effect = ConnectionError("down")
+
+        assert drain(limiter, 4)[3] > 0
+
+
+class TestRateLimitedRoutes:
+    """Test 429 responses on throttled routes"""
+
+    def test_login(self, limits, test_db):
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = lambda: test_db
+        try:
+            client = TestClient(app)
+            statuses = [
+                client.post("/api/auth/login", json={"email": "nobody@example.com", "password": "guess"})
+                for _ in range(4)
+            ]
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
+
+        assert [r.status_code for r in statuses] == [401, 401, 401, 429]
+        assert int(statuses[3].headers["retry-after"]) >= 1
+
+    def test_per_user(self, limits, test_db):
+        test_db.add_all([
+            User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+            User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en"),
+        ])
+        test_db.commit()
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = lambda: test_db
+        client = TestClient(app)
+
+        def search(user_id, email):
+            app.dependency_overrides[get_current_user] = lambda: test_db.query(User).get(user_id)
+            return client.get("/api/users/search/email", params={"email": email}).status_code
+
+        try:
+            alice = [search(1, "bob@example.com") for _ in range(3)]
+            bob = search(2, "alice@example.com")
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
+
+        assert alice == [200, 200, 429]
+        assert bob == 200
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,179 @@
+"""
+Tests for realtime change events
+"""
+import asyncio
+import json
+import time
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+from app.models.models import User, Group, GroupUser
+from app.schemas.expense import ExpenseCreate, ParticipantCreate
+from app.services.split_service import create_expense
+from app.services.realtime_service import Hub, RedisBroker, realtime_service
+from app.services.sync_service import record_change, membership_id, ENTITY_GROUP, ENTITY_MEMBERSHIP, OP_DELETE
+
+
+@pytest.fixture
+def users(test_db):
+    """Alice and Bob share group 1, Carol is outside it"""
+    test_db.add_all([
+        User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+        User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en"),
+        User(id=3, email="carol@example.com", name="Carol", currency="USD", preferred_language="en"),
+        Group(id=1, public_id="abc123", name="Trip", user_id=1),
+    ])
+    test_db.add_all([GroupUser(group_id=1, user_id=1), GroupUser(group_id=1, user_id=2)])
+    test_db.commit()
+
+
+@pytest.fixture
+async def subscribe():
+    """Subscribe users to the in-process hub and clean up afterwards"""
+    subscriptions = []
+
+    async def _subscribe(user_id, group_ids):
+        subscription = await realtime_service.subscribe(user_id, group_ids)
+        subscriptions.append(subscription)
+        return subscription
+
+    yield _subscribe
+
+    for subscription in subscriptions:
+        realtime_service.unsubscribe(subscription)
+
+
+async def drain(subscription):
+    """Let pending deliveries run and return the queued events"""
+    await asyncio.sleep(0)
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+def group_expense(group_id=1, participant_ids=(1, 2)):
+    return ExpenseCreate(
+        paid_by=1,
+        name="Dinner",
+        category="food",
+        amount=1000,
+        currency="USD",
+        group_id=group_id,
+        expense_date=datetime(2025, 1, 10),
+        participants=[ParticipantCreate(user_id=u, amount=1000 // len(participant_ids)) for u in participant_ids]
+    )
+
+
+class TestRealtimeEvents:
+    """Test publishing committed changes to subscriptions"""
+
+    @pytest.mark.asyncio
+    async def test_group_members_receive_expense_events(self, test_db, users, subscribe):
+        """Members get the expense event after commit, others don't"""
+        bob = await subscribe(2, {1})
+        carol = await subscribe(3, set())
+
+        expense = await create_expense(test_db, group_expense(), 1)
+
+        events = await drain(bob)
+        assert [(e["type"], e["id"]) for e in events] == [("expense", expense.id)]
+        assert all(e["seq"] for e in events)
+        assert await drain(carol) == []
+
+    @pytest.mark.asyncio
+    async def test_non_group_expense_reaches_participants(self, test_db, users, subscribe):
+        """Non-group expense events go to the payer and participants only"""
+        bob = await subscribe(2, set())
+        carol = await subscribe(3, set())
+
+        await create_expense(test_db, group_expense(group_id=None, participant_ids=(1, 3)), 1)
+
+        assert await drain(bob) == []
+        assert [e["type"] for e in await drain(carol)] == ["expense"]
+
+    @pytest.mark.asyncio
+    async def test_rolled_back_changes_are_not_published(self, test_db, users, subscribe):
+        """Nothing is published for a rolled back transaction"""
+        bob = await subscribe(2, {1})
+
+        record_change(test_db, ENTITY_GROUP, 1, group_id=1)
+        test_db.flush()
+        test_db.rollback()
+
+        assert await drain(bob) == []
+
+    @pytest.mark.asyncio
+    async def test_subscription_follows_membership(self, test_db, users, subscribe):
+        """Joining a group starts its events on an open stream, leaving stops them"""
+        carol = await subscribe(3, set())
+
+        record_change(test_db, ENTITY_MEMBERSHIP, membership_id(1, 3), group_id=1)
+        test_db.commit()
+        await drain(carol)
+        assert carol.group_ids == {1}
+
+        record_change(test_db, ENTITY_MEMBERSHIP, membership_id(1, 3), OP_DELETE, group_id=1, user_ids=[3])
+        test_db.commit()
+        await drain(carol)
+        assert carol.group_ids == set()
+
+        record_change(test_db, ENTITY_GROUP, 1, group_id=1)
+        test_db.commit()
+        assert await drain(carol) == []
+
+    @pytest.mark.asyncio
+    async def test_full_queue_marks_overflow(self, test_db, users, subscribe):
+        """Dropped events are flagged so the stream can ask for a resync"""
+        bob = await subscribe(2, {1})
+        bob.queue = asyncio.Queue(maxsize=1)
+
+        for _ in range(3):
+            record_change(test_db, ENTITY_GROUP, 1, group_id=1)
+        test_db.commit()
+
+        assert len(await drain(bob)) == 1
+        assert bob.overflowed
+
+
+class TestRedisBroker:
+    """Test publishing through Redis off the request path"""
+
+    @pytest.mark.asyncio
+    async def test_publish_does_not_wait_for_redis(self, monkeypatch):
+        """A hung Redis doesn't stall the committing request"""
+        import redis.asyncio as aioredis
+
+        hung = asyncio.Event()
+
+        async def hang(*args):
+            await hung.wait()
+
+        client = MagicMock()
+        client.publish = AsyncMock(side_effect=hang)
+        client.close = AsyncMock()
+        from_url = MagicMock(return_value=client)
+        monkeypatch.setattr(aioredis.Redis, "from_url", from_url)
+
+        broker = RedisBroker(Hub(), "redis://localhost", "changes")
+        broker._listener = asyncio.get_running_loop().create_future()
+        await broker.start()
+
+        started = time.monotonic()
+        broker.publish([{"seq": 1}])
+        broker.publish([{"seq": 2}])
+        assert time.monotonic() - started < 0.1
+
+        await asyncio.sleep(0.01)
+        client.publish.assert_awaited_once_with("changes", json.dumps([{"seq": 1}]))
+        assert from_url.call_args.kwargs["socket_timeout"] == 0.5
+
+        hung.set()
+        await asyncio.sleep(0.01)
+        assert client.publish.await_count == 2
+        await broker.stop()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
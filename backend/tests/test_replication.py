@@ -0,0 +1,149 @@
+"""
+Tests for read replica routing, with two SQLite files standing in for primary and replica
+"""
+import fakeredis
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core import database
+from app.core.config import settings
+from app.core.database import Base
+from app.core.replication import ReplicaRouter
+from app.core.security import create_access_token
+from app.models.models import User, Group, GroupUser, ChangeLog
+
+
+def seed(engine, group_name):
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+        User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en"),
+        Group(id=1, public_id="abc123", name=group_name, user_id=1),
+    ])
+    db.add_all([GroupUser(group_id=1, user_id=1), GroupUser(group_id=1, user_id=2)])
+    db.commit()
+    db.close()
+
+
+@pytest.fixture
+def engines(tmp_path, monkeypatch):
+    """Primary and replica databases that differ only in the group's name"""
+    primary = create_engine(f"sqlite:///{tmp_path}/primary.db", connect_args={"check_same_thread": False})
+    replica = create_engine(f"sqlite:///{tmp_path}/replica.db", connect_args={"check_same_thread": False})
+    seed(primary, "Trip")
+    seed(replica, "Trip (replica)")
+
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=primary))
+    monkeypatch.setattr(database, "ReplicaSessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=replica))
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(primary, replica))
+    monkeypatch.setattr(settings, "REPLICA_LAG_CHECK_SECONDS", 0)
+
+    # Exercise the real get_db/get_current_user, not overrides left by other modules
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides.clear()
+    try:
+        yield primary, replica
+    finally:
+        app.dependency_overrides.update(overrides)
+        primary.dispose()
+        replica.dispose()
+
+
+def catch_up(engines):
+    """Replicate the change log (only), so the replica no longer counts as lagging"""
+    primary, replica = engines
+    source, target = sessionmaker(bind=primary)(), sessionmaker(bind=replica)()
+    for change in source.query(ChangeLog).all():
+        target.merge(ChangeLog(seq=change.seq, entity_type=change.entity_type, entity_id=change.entity_id,
+                               op=change.op, group_id=change.group_id, user_id=change.user_id,
+                               created_at=change.created_at))
+    target.commit()
+    source.close()
+    target.close()
+
+
+def client_for(user_id):
+    token = create_access_token({"sub": str(user_id)})
+    return TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+
+def group_name(client):
+    response = client.get("/api/groups/1")
+    assert response.status_code == 200
+    return response.json()["name"]
+
+
+class TestReplicaRouting:
+    """Test which database serves reads"""
+
+    def test_reads_use_replica(self, engines):
+        assert group_name(client_for(1)) == "Trip (replica)"
+
+    def test_no_replica_configured(self, engines, monkeypatch):
+        monkeypatch.setattr(database, "replica_router", ReplicaRouter(engines[0], None))
+
+        assert group_name(client_for(1)) == "Trip"
+
+    def test_read_your_writes(self, engines):
+        """After writing, the writer reads from the primary; others still use the replica"""
+        alice = client_for(1)
+        assert alice.put("/api/groups/1", json={"name": "Renamed"}).status_code == 200
+        catch_up(engines)
+
+        assert group_name(alice) == "Renamed"
+        assert group_name(client_for(2)) == "Trip (replica)"
+
+    def test_read_your_writes_across_workers(self, engines):
+        """A write on one worker pins the writer's reads on every worker"""
+        primary, replica = engines
+        client = fakeredis.FakeRedis()
+        workers = [ReplicaRouter(primary, replica, "redis://localhost") for _ in range(2)]
+        for worker in workers:
+            worker._redis = client
+
+        workers[0].mark_write(1)
+
+        assert not workers[1].use_replica(1)
+        assert 0 < client.pttl("sahasplit:recent_write:1") <= settings.REPLICA_STICKY_SECONDS * 1000
+        catch_up(engines)
+        assert workers[1].use_replica(2)
+
+    def test_sticky_window_expires(self, engines, monkeypatch):
+        monkeypatch.setattr(settings, "REPLICA_STICKY_SECONDS", 0)
+        alice = client_for(1)
+        alice.put("/api/groups/1", json={"name": "Renamed"})
+        catch_up(engines)
+
+        assert group_name(alice) == "Trip (replica)"
+
+    def test_lagging_replica_falls_back(self, engines):
+        """A replica missing changes the primary already had is skipped"""
+        primary, _ = engines
+        db = sessionmaker(bind=primary)()
+        db.add(ChangeLog(entity_type="group", entity_id="1", op="upsert", group_id=1, created_at=datetime.utcnow()))
+        db.commit()
+        db.close()
+
+        assert group_name(client_for(2)) == "Trip"
+
+    def test_unreachable_replica_falls_back(self, engines, tmp_path, monkeypatch):
+        broken = create_engine(f"sqlite:///{tmp_path}/missing/replica.db")
+        monkeypatch.setattr(database, "replica_router", ReplicaRouter(engines[0], broken))
+
+        assert group_name(client_for(2)) == "Trip"
+
+    def test_writes_always_use_primary(self, engines):
+        primary, replica = engines
+        client_for(1).put("/api/groups/1", json={"name": "Renamed"})
+
+        assert sessionmaker(bind=primary)().query(Group).get(1).name == "Renamed"
+        assert sessionmaker(bind=replica)().query(Group).get(1).name == "Trip (replica)"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,253 @@
+"""
+Tests for server-side sessions, with fakeredis standing in for Redis
+"""
+import bcrypt
+import fakeredis
+import pytest
+from unittest.mock import MagicMock
+from fastapi.testclient import TestClient
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.main import app
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.query_stats import capture_queries
+from app.core.revocation import revocation_list
+from app.models.models import User, Account, Session as SessionRecord
+from app.services.session_service import SessionStore, session_store, _session_key
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(session_store, "_redis", client)
+    monkeypatch.setattr(session_store, "_pending", {})
+    monkeypatch.setattr(settings, "SESSIONS_ENABLED", True)
+    return client
+
+
+@pytest.fixture
+def store(redis_client, test_db):
+    test_db.add_all([
+        User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"),
+        User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en"),
+    ])
+    test_db.commit()
+    return session_store
+
+
+@pytest.fixture
+def client(store, test_db, monkeypatch):
+    """Client logging in for real against the test database"""
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    test_db.add(Account(id="email_1", user_id=1, type="email", provider="email",
+                        provider_account_id="alice@example.com",
+                        id_token=bcrypt.hashpw(b"hunter22", bcrypt.gensalt(rounds=4)).decode()))
+    test_db.commit()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides.clear()
+    app.dependency_overrides[get_db] = lambda: test_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+        revocation_list.clear()
+
+
+def login(client, device):
+    response = client.post("/api/auth/login", json={"email": "alice@example.com", "password": "hunter22"},
+                           headers={"User-Agent": device})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestSessionStore:
+    """Test the Redis session store and its table mirror"""
+
+    def test_validate(self, store, test_db):
+        sid = store.create(1, "Firefox")
+
+        assert store.validate(sid, 1, test_db)
+        assert not store.validate(sid, 2, test_db)
+        assert not store.validate("unknown", 1, test_db)
+
+    def test_validate_skips_database(self, store, test_db):
+        sid = store.create(1)
+
+        with capture_queries(test_db.get_bind()) as statements:
+            assert store.validate(sid, 1, test_db)
+
+        assert statements == []
+
+    def test_sliding_expiry(self, store, redis_client, test_db):
+        sid = store.create(1)
+        redis_client.expire(_session_key(sid), 10)
+
+        store.validate(sid, 1, test_db)
+
+        assert redis_client.ttl(_session_key(sid)) > settings.SESSION_IDLE_DAYS * 86400 - 10
+
+    def test_activity_mirrored_at_most_once_per_window(self, store, test_db, monkeypatch):
+        sid = store.create(1)
+        store.flush(test_db)
+
+        store.validate(sid, 1, test_db)
+        assert store.flush(test_db) == 0
+
+        monkeypatch.setattr(settings, "SESSION_TOUCH_SECONDS", 0)
+        store.validate(sid, 1, test_db)
+        assert store.flush(test_db) == 1
+
+    def test_write_behind_mirror(self, store, test_db):
+        sid = store.create(1, "Firefox")
+        assert test_db.query(SessionRecord).count() == 0
+
+        assert store.flush(test_db) == 1
+
+        record = test_db.query(SessionRecord).get(sid)
+        assert record.user_id == 1
+        assert record.user_agent == "Firefox"
+        assert record.expires > record.last_active_at
+
+    def test_restored_from_table(self, store, redis_client, test_db):
+        """A session Redis lost is still valid, and put back"""
+        sid = store.create(1)
+        store.flush(test_db)
+        redis_client.flushall()
+
+        assert store.validate(sid, 1, test_db)
+        assert redis_client.exists(_session_key(sid))
+
+    def test_redis_down_uses_table(self, store, test_db, monkeypatch):
+        sid = store.create(1)
+        store.flush(test_db)
+        broken = MagicMock()
+        broken.getex.side_effect = RedisConnectionError("down")
+        monkeypatch.setattr(session_store, "_redis", broken)
+
+        assert store.validate(sid, 1, test_db)
+
+    def test_list_sessions(self, store, redis_client, test_db):
+        first = store.create(1, "Firefox")
+        second = store.create(1, "Safari")
+        store.create(2, "Chrome")
+        redis_client.delete(_session_key(first))
+
+        sessions = store.list_sessions(1, test_db)
+
+        assert [s["id"] for s in sessions] == [second]
+        assert sessions[0]["user_agent"] == "Safari"
+
+    def test_revoke(self, store, test_db):
+        sid = store.create(1)
+        store.flush(test_db)
+
+        assert not store.revoke(sid, 2, test_db)
+        assert store.revoke(sid, 1, test_db)
+        assert not store.validate(sid, 1, test_db)
+        assert test_db.query(SessionRecord).count() == 0
+
+    def test_revoke_unflushed(self, store, test_db):
+        """A revoked session isn't written to the table afterwards"""
+        sid = store.create(1)
+
+        assert store.revoke(sid, 1, test_db)
+        store.flush(test_db)
+
+        assert test_db.query(SessionRecord).count() == 0
+
+    def test_revoke_not_undone_by_other_worker(self, store, redis_client, test_db, monkeypatch):
+        """Activity queued by another worker doesn't bring a revoked session back"""
+        monkeypatch.setattr(settings, "SESSION_TOUCH_SECONDS", 0)
+        other = SessionStore(settings.REDIS_URL)
+        other._redis = redis_client
+        sid = store.create(1)
+        store.flush(test_db)
+
+        assert other.validate(sid, 1, test_db)
+        assert store.revoke(sid, 1, test_db)
+        other.flush(test_db)
+
+        assert test_db.query(SessionRecord).count() == 0
+        assert not other.validate(sid, 1, test_db)
+
+    def test_revoke_before_other_worker_flushes_creation(self, store, redis_client, test_db):
+        other = SessionStore(settings.REDIS_URL)
+        other._redis = redis_client
+        sid = other.create(1)
+
+        assert store.revoke(sid, 1, test_db)
+        other.flush(test_db)
+
+        assert test_db.query(SessionRecord).count() == 0
+        assert not store.validate(sid, 1, test_db)
+
+    def test_revoke_with_redis_down(self, store, test_db, monkeypatch):
+        sid = store.create(1)
+        store.flush(test_db)
+        broken = MagicMock()
+        broken.mget.side_effect = RedisConnectionError("down")
+        monkeypatch.setattr(session_store, "_redis", broken)
+
+        assert store.revoke(sid, 1, test_db)
+        assert test_db.query(SessionRecord).count() == 0
+
+    def test_revoke_all_but_current(self, store, test_db):
+        current, other, flushed = store.create(1), store.create(1), store.create(1)
+        bobs = store.create(2)
+        store.flush(test_db)
+
+        assert store.revoke_all(1, test_db, except_sid=current) == 2
+
+        assert store.validate(current, 1, test_db)
+        assert not store.validate(other, 1, test_db)
+        assert not store.validate(flushed, 1, test_db)
+        assert store.validate(bobs, 2, test_db)
+
+
+class TestSessionEndpoints:
+    """Test session checks and management through the API"""
+
+    def test_list_marks_current(self, client):
+        phone = login(client, "Phone")
+        login(client, "Laptop")
+
+        sessions = client.get("/api/auth/sessions", headers=phone).json()
+
+        assert [(s["user_agent"], s["current"]) for s in sessions] == [("Laptop", False), ("Phone", True)]
+
+    def test_log_out_other_devices(self, client):
+        phone, laptop = login(client, "Phone"), login(client, "Laptop")
+
+        response = client.post("/api/auth/sessions/revoke-others", headers=phone)
+
+        assert response.json() == {"revoked": 1}
+        assert client.get("/api/users/me", headers=phone).status_code == 200
+        assert client.get("/api/users/me", headers=laptop).status_code == 401
+
+    def test_revoke_one(self, client):
+        phone, laptop = login(client, "Phone"), login(client, "Laptop")
+        laptop_id = next(s["id"] for s in client.get("/api/auth/sessions", headers=phone).json() if not s["current"])
+
+        assert client.delete(f"/api/auth/sessions/{laptop_id}", headers=phone).status_code == 204
+        assert client.delete(f"/api/auth/sessions/{laptop_id}", headers=phone).status_code == 404
+        assert client.get("/api/users/me", headers=laptop).status_code == 401
+
+    def test_refresh_keeps_session(self, client):
+        response = client.post("/api/auth/login", json={"email": "alice@example.com", "password": "hunter22"})
+        refreshed = client.post("/api/auth/refresh", params={"refresh_token": response.json()["refresh_token"]})
+        headers = {"Authorization": f"Bearer {refreshed.json()['access_token']}"}
+
+        assert len(client.get("/api/auth/sessions", headers=headers).json()) == 1
+
+    def test_disabled(self, client, monkeypatch):
+        headers = login(client, "Phone")
+        monkeypatch.setattr(settings, "SESSIONS_ENABLED", False)
+
+        assert client.get("/api/auth/sessions", headers=headers).status_code == 501
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
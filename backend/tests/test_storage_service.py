@@ -142,6 +142,11 @@ class TestStorageService:
         settings.R2_ACCOUNT_ID = original_r2_account
         settings.R2_ACCESS_KEY_ID = original_r2_key
 
+        # The client is only created on first use
+        mock_boto_client.assert_not_called()
+        assert svc.bucket_name == "test-r2-bucket"
+        svc.client
+
         # Should have initialized with R2 endpoint
         mock_boto_client.assert_called()
         call_kwargs = mock_boto_client.call_args.kwargs
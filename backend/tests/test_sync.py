@@ -0,0 +1,205 @@
+"""
+Tests for delta sync
+"""
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.deps import get_current_user
+from app.core.database import get_db
+from app.models.models import User, Group, GroupUser, ChangeLog
+from app.schemas.expense import ExpenseCreate, ParticipantCreate
+from app.services.split_service import create_expense, delete_expense
+from app.services.sync_service import get_changes, prune_change_log, SyncTokenExpired
+
+
+@pytest.fixture
+def client(test_db):
+    """Client whose requests use the test database as user 1"""
+    alice = User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en")
+    bob = User(id=2, email="bob@example.com", name="Bob", currency="USD", preferred_language="en")
+    carol = User(id=3, email="carol@example.com", name="Carol", currency="USD", preferred_language="en")
+    group = Group(id=1, public_id="abc123", name="Trip", user_id=1)
+    test_db.add_all([alice, bob, carol, group])
+    test_db.add_all([GroupUser(group_id=1, user_id=1), GroupUser(group_id=1, user_id=2)])
+    test_db.commit()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides[get_db] = lambda: test_db
+    app.dependency_overrides[get_current_user] = lambda: test_db.query(User).get(1)
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+
+
+def add_expense(db, group_id=1, participant_ids=(1, 2), paid_by=1):
+    return create_expense(db, ExpenseCreate(
+        paid_by=paid_by,
+        name="Dinner",
+        category="food",
+        amount=1000,
+        currency="USD",
+        group_id=group_id,
+        expense_date=datetime(2025, 1, 10),
+        participants=[ParticipantCreate(user_id=u, amount=1000 // len(participant_ids)) for u in participant_ids]
+    ), paid_by)
+
+
+class TestGetChanges:
+    """Test the sync service"""
+
+    @pytest.mark.asyncio
+    async def test_returns_changed_expense_with_balances(self, client, test_db):
+        """A new group expense comes back with participants and balance rows"""
+        await add_expense(test_db)
+
+        changes = get_changes(test_db, 1, 0, 100)
+
+        assert [e.name for e in changes.expenses] == ["Dinner"]
+        assert {p.user_id for p in changes.expenses[0].participants} == {1, 2}
+        assert [(b.friend_id, b.amount) for b in changes.balances] == [(2, -500)]
+        assert not changes.has_more
+
+    @pytest.mark.asyncio
+    async def test_next_token_excludes_seen_changes(self, client, test_db):
+        """Passing next_token back only returns newer changes"""
+        first = await add_expense(test_db)
+        token = int(get_changes(test_db, 1, 0, 100).next_token)
+
+        await delete_expense(test_db, first.id, 1)
+        second = await add_expense(test_db)
+        changes = get_changes(test_db, 1, token, 100)
+
+        by_id = {e.id: e for e in changes.expenses}
+        assert by_id[first.id].deleted_at is not None
+        assert by_id[second.id].deleted_at is None
+
+    @pytest.mark.asyncio
+    async def test_pagination(self, client, test_db):
+        """has_more is set until the log is drained"""
+        for _ in range(3):
+            await add_expense(test_db)
+
+        page = get_changes(test_db, 1, 0, 2)
+        assert page.has_more
+
+        token = int(page.next_token)
+        while page.has_more:
+            page = get_changes(test_db, 1, token, 2)
+            token = int(page.next_token)
+
+        assert get_changes(test_db, 1, token, 2).expenses == []
+
+    @pytest.mark.asyncio
+    async def test_changes_are_scoped_to_visible_entities(self, client, test_db):
+        """Users don't see changes from groups or ledgers they're not part of"""
+        await add_expense(test_db, group_id=None, participant_ids=(2, 3), paid_by=2)
+
+        assert get_changes(test_db, 1, 0, 100).expenses == []
+        assert len(get_changes(test_db, 3, 0, 100).expenses) == 1
+
+    def test_bootstrap_returns_current_token(self, client, test_db):
+        """Without a token only the current position is returned"""
+        test_db.add(ChangeLog(entity_type="group", entity_id="1", op="upsert", group_id=1))
+        test_db.commit()
+
+        changes = get_changes(test_db, 1, None, 100)
+
+        assert changes.next_token == "1"
+        assert changes.groups == []
+
+    def test_pruned_token_expires(self, client, test_db):
+        """Tokens older than the retained log require a full resync"""
+        for _ in range(3):
+            test_db.add(ChangeLog(entity_type="group", entity_id="1", op="upsert", group_id=1,
+                                  created_at=datetime.utcnow() - timedelta(days=60)))
+        test_db.add(ChangeLog(entity_type="group", entity_id="1", op="upsert", group_id=1))
+        test_db.commit()
+
+        assert prune_change_log(test_db, datetime.utcnow() - timedelta(days=30)) == 3
+
+        with pytest.raises(SyncTokenExpired):
+            get_changes(test_db, 1, 1, 100)
+        assert get_changes(test_db, 1, 3, 100).groups[0].id == 1
+
+    def test_token_zero_expires_after_pruning(self, client, test_db):
+        """A client that bootstrapped on an empty log still needs a resync once history is pruned"""
+        test_db.add(ChangeLog(seq=5, entity_type="group", entity_id="1", op="upsert", group_id=1))
+        test_db.commit()
+
+        with pytest.raises(SyncTokenExpired):
+            get_changes(test_db, 1, 0, 100)
+
+    def test_token_stops_at_gap(self, client, test_db):
+        """A seq still being written isn't skipped when a higher one commits first"""
+        for seq in (1, 2, 4):
+            test_db.add(ChangeLog(seq=seq, entity_type="group", entity_id="1", op="upsert", group_id=1))
+        test_db.commit()
+
+        assert get_changes(test_db, 1, 0, 100).next_token == "2"
+        assert get_changes(test_db, 1, None, 100).next_token == "2"
+
+        test_db.add(ChangeLog(seq=3, entity_type="group", entity_id="1", op="upsert", group_id=1))
+        test_db.commit()
+
+        assert get_changes(test_db, 1, 2, 100).next_token == "4"
+
+    def test_settled_gap_is_passed(self, client, test_db):
+        """Gaps older than the settle window (rolled back inserts) don't hold tokens back"""
+        old = datetime.utcnow() - timedelta(minutes=5)
+        for seq in (1, 3):
+            test_db.add(ChangeLog(seq=seq, entity_type="group", entity_id="1", op="upsert", group_id=1,
+                                  created_at=old))
+        test_db.add(ChangeLog(seq=4, entity_type="group", entity_id="1", op="upsert", group_id=1))
+        test_db.commit()
+
+        assert get_changes(test_db, 1, 0, 100).next_token == "4"
+
+    def test_scheduled_prune(self, client, test_db, monkeypatch):
+        """The scheduler's daily job enforces the retention window"""
+        from app.core import database, scheduler
+
+        test_db.add(ChangeLog(entity_type="group", entity_id="1", op="upsert", group_id=1,
+                              created_at=datetime.utcnow() - timedelta(days=60)))
+        test_db.add(ChangeLog(entity_type="group", entity_id="1", op="upsert", group_id=1))
+        test_db.commit()
+        monkeypatch.setattr(database, "SessionLocal", lambda: test_db)
+
+        assert scheduler._prune_change_log() == 1
+        assert test_db.query(ChangeLog).count() == 1
+
+
+class TestSyncEndpoint:
+    """Test GET /sync and the write hooks"""
+
+    def test_membership_changes(self, client, test_db):
+        """Adding and removing a member shows up as membership changes"""
+        token = client.get("/api/sync").json()["next_token"]
+
+        assert client.post("/api/groups/1/members", params={"user_id": 3}).status_code == 201
+        added = client.get("/api/sync", params={"since": token}).json()
+        assert added["memberships"] == [{"group_id": 1, "user_id": 3}]
+
+        assert client.delete("/api/groups/1/members/3").status_code == 204
+        removed = client.get("/api/sync", params={"since": added["next_token"]}).json()
+        assert removed["removed_memberships"] == [{"group_id": 1, "user_id": 3}]
+
+    def test_deleted_group_tombstone(self, client, test_db):
+        """Deleting a group returns its id as a tombstone"""
+        token = client.get("/api/sync").json()["next_token"]
+
+        assert client.delete("/api/groups/1").status_code == 204
+        data = client.get("/api/sync", params={"since": token}).json()
+
+        assert data["deleted_group_ids"] == [1]
+
+    def test_invalid_token(self, client):
+        """Malformed tokens are rejected"""
+        assert client.get("/api/sync", params={"since": "abc"}).status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
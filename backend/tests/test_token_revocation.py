@@ -0,0 +1,253 @@
+"""
+Tests for the verified-token cache and token revocation
+"""
+import secrets
+import time
+
+import fakeredis
+import pytest
+from unittest.mock import MagicMock, patch
+from redis.exceptions import ConnectionError as RedisConnectionError
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core import security
+from app.core.database import get_db
+from app.core.revocation import (
+    CHANGES_KEY, REVOKED_KEY, BloomFilter, RevocationList, revocation_list, token_digest
+)
+from app.core.security import (
+    clear_token_cache, create_access_token, create_refresh_token, decode_token, revoke_token
+)
+from app.models.models import User
+
+
+@pytest.fixture(autouse=True)
+def fresh_tokens():
+    clear_token_cache()
+    revocation_list.clear()
+    yield
+    clear_token_cache()
+    revocation_list.clear()
+
+
+@pytest.fixture
+def client(test_db):
+    """Client using the real token checks against the test database"""
+    test_db.add(User(id=1, email="alice@example.com", name="Alice", currency="USD", preferred_language="en"))
+    test_db.commit()
+
+    overrides = dict(app.dependency_overrides)
+    app.dependency_overrides.clear()
+    app.dependency_overrides[get_db] = lambda: test_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+        app.dependency_overrides.update(overrides)
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+class TestBloomFilter:
+    """Test the local revocation filter"""
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        digests = [token_digest(secrets.token_hex()) for _ in range(1000)]
+        for digest in digests:
+            bloom.add(digest)
+
+        assert all(digest in bloom for digest in digests)
+
+    def test_few_false_positives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for _ in range(1000):
+            bloom.add(token_digest(secrets.token_hex()))
+
+        false_positives = sum(token_digest(secrets.token_hex()) in bloom for _ in range(10000))
+        assert false_positives < 300
+
+
+class TestVerifiedTokenCache:
+    """Test skipping signature checks for tokens seen before"""
+
+    def test_signature_checked_once(self):
+        token = create_access_token({"sub": "1"})
+
+        with patch.object(security.jwt, "decode", wraps=security.jwt.decode) as decode:
+            assert decode_token(token)["sub"] == "1"
+            assert decode_token(token)["sub"] == "1"
+
+        assert decode.call_count == 1
+
+    def test_expired_entries_are_dropped(self, monkeypatch):
+        token = create_access_token({"sub": "1"})
+        exp = decode_token(token)["exp"]
+
+        monkeypatch.setattr(security.time, "time", lambda: exp + 1)
+
+        assert security._cached_claims(token_digest(token)) is None
+
+    def test_invalid_tokens_rejected(self):
+        assert decode_token("not-a-token") is None
+        assert decode_token(create_access_token({"sub": "1"}) + "x") is None
+
+    def test_tokens_are_unique(self):
+        assert create_refresh_token({"sub": "1"}) != create_refresh_token({"sub": "1"})
+
+
+class TestRevocation:
+    """Test revoking tokens on logout and refresh"""
+
+    def test_revoked_token_rejected(self):
+        token = create_access_token({"sub": "1"})
+        other = create_access_token({"sub": "1"})
+
+        assert revoke_token(token)
+        assert decode_token(token) is None
+        assert decode_token(other) is not None
+
+    def test_filter_hit_is_confirmed(self):
+        """A filter false positive doesn't reject a token"""
+        revocations = RevocationList()
+        digest = token_digest("token")
+        revocations._filter.add(digest)
+
+        assert not revocations.is_revoked(digest)
+
+    def test_logout(self, client):
+        access = create_access_token({"sub": "1"})
+        refresh = create_refresh_token({"sub": "1"})
+
+        assert client.get("/api/users/me", headers=bearer(access)).status_code == 200
+        response = client.post("/api/auth/logout", params={"refresh_token": refresh}, headers=bearer(access))
+
+        assert response.status_code == 204
+        assert client.get("/api/users/me", headers=bearer(access)).status_code == 401
+        assert client.post("/api/auth/refresh", params={"refresh_token": refresh}).status_code == 401
+
+    def test_refresh_rotates(self, client, monkeypatch):
+        monkeypatch.setattr(security.settings, "REFRESH_TOKEN_REUSE_GRACE_SECONDS", 0)
+        refresh = create_refresh_token({"sub": "1"})
+
+        first = client.post("/api/auth/refresh", params={"refresh_token": refresh})
+        replay = client.post("/api/auth/refresh", params={"refresh_token": refresh})
+
+        assert first.status_code == 200
+        assert replay.status_code == 401
+        rotated = first.json()["refresh_token"]
+        assert client.post("/api/auth/refresh", params={"refresh_token": rotated}).status_code == 200
+
+    def test_concurrent_refresh_gets_same_tokens(self, client):
+        """A reuse within the grace period (another tab) gets the first refresh's tokens"""
+        refresh = create_refresh_token({"sub": "1"})
+
+        first = client.post("/api/auth/refresh", params={"refresh_token": refresh})
+        second = client.post("/api/auth/refresh", params={"refresh_token": refresh})
+
+        assert first.status_code == second.status_code == 200
+        assert second.json()["access_token"] == first.json()["access_token"]
+        assert second.json()["refresh_token"] == first.json()["refresh_token"]
+
+    def test_logout_refresh_token_not_listed(self):
+        """Refresh tokens are retired by claiming them, not by growing the list"""
+        refresh = create_refresh_token({"sub": "1"})
+
+        assert revoke_token(refresh)
+
+        assert revocation_list._local == {}
+        assert security.use_refresh_token(refresh, decode_token(refresh), {"access_token": "a"}) is None
+
+
+def redis_list(client):
+    revocations = RevocationList("redis://localhost")
+    revocations._redis = client
+    return revocations
+
+
+class TestSingleUse:
+    """Test claiming refresh tokens"""
+
+    def test_first_claim_wins(self):
+        expires = time.time() + 60
+
+        assert revocation_list.use_once("jti", expires)
+        assert not revocation_list.use_once("jti", expires)
+        assert revocation_list.use_once("other", expires)
+
+    def test_shared_between_workers(self):
+        client = fakeredis.FakeRedis()
+        first, second = redis_list(client), redis_list(client)
+        expires = time.time() + 60
+
+        assert first.use_once("jti", expires)
+        assert not second.use_once("jti", expires)
+        assert 0 < client.ttl("sahasplit:used_token:jti") <= 60
+
+    def test_result_replayed_within_grace(self):
+        client = fakeredis.FakeRedis()
+        first, second = redis_list(client), redis_list(client)
+        expires = time.time() + 60
+
+        assert first.claim("jti", expires, "tokens", grace_seconds=10) == "tokens"
+        assert second.claim("jti", expires, "other", grace_seconds=10) == "tokens"
+        assert 0 < client.pttl("sahasplit:used_token_result:jti") <= 10000
+
+        client.delete("sahasplit:used_token_result:jti")
+        assert second.claim("jti", expires, "other", grace_seconds=10) is None
+
+    def test_no_replay_after_claim_without_result(self):
+        """A token retired on logout isn't revived by a later claim"""
+        expires = time.time() + 60
+        for revocations in (RevocationList(), redis_list(fakeredis.FakeRedis())):
+            assert revocations.use_once("jti", expires)
+            assert revocations.claim("jti", expires, "tokens", grace_seconds=10) is None
+            assert revocations.claim("jti", expires, "tokens", grace_seconds=10) is None
+
+    def test_rejected_when_redis_down(self):
+        revocations = RevocationList("redis://localhost")
+        revocations._redis = MagicMock()
+        revocations._redis.register_script.return_value.side_effect = RedisConnectionError("down")
+
+        assert not revocations.use_once("jti", time.time() + 60)
+
+
+class TestRedisSync:
+    """Test other workers' revocations reaching this worker's filter"""
+
+    def test_syncs_only_changes(self, monkeypatch):
+        monkeypatch.setattr(security.settings, "TOKEN_REVOCATION_SYNC_SECONDS", 0)
+        client = fakeredis.FakeRedis()
+        revoker, worker = redis_list(client), redis_list(client)
+        expires = time.time() + 60
+        first, second = token_digest("first"), token_digest("second")
+
+        revoker.revoke(first, expires)
+        assert worker.is_revoked(first)
+
+        revoker.revoke(second, expires)
+        with patch.object(client, "zrangebyscore", wraps=client.zrangebyscore) as reads:
+            assert worker.is_revoked(second)
+
+        assert [c.args[0] for c in reads.call_args_list] == [CHANGES_KEY]
+        assert client.zcard(REVOKED_KEY) == 2
+
+    def test_periodic_rebuild_drops_expired(self, monkeypatch):
+        monkeypatch.setattr(security.settings, "TOKEN_REVOCATION_SYNC_SECONDS", 0)
+        client = fakeredis.FakeRedis()
+        worker = redis_list(client)
+        digest = token_digest("expired")
+        worker.revoke(digest, time.time() + 60)
+        client.zrem(REVOKED_KEY, digest)
+        worker._rebuilt_at = 0
+
+        worker.is_revoked(digest)
+
+        assert digest not in worker._filter
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
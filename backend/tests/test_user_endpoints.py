@@ -7,7 +7,8 @@ from unittest.mock import patch, AsyncMock, MagicMock
 
 from app.main import app
 from app.api.deps import get_current_user
-from app.models.models import User
+from app.core.database import get_db
+from app.models.models import User, OutboxMessage
 
 
 def mock_current_user():
@@ -114,18 +115,23 @@ class TestBalanceWithFriendEndpoint:
 class TestFeedbackEndpoint:
     """Test feedback endpoint"""
 
-    @patch('app.services.email_service.email_service.send_feedback_email')
-    def test_submit_feedback(self, mock_send_email):
-        """Test POST /users/feedback"""
-        mock_send_email.return_value = AsyncMock(return_value=True)
-
-        response = client.post(
-            "/api/users/feedback",
-            json={"feedback": "This is my feedback about the app. It's great!"}
-        )
+    def test_submit_feedback(self, test_db):
+        """Test POST /users/feedback queues an email to support"""
+        overrides = dict(app.dependency_overrides)
+        app.dependency_overrides[get_db] = lambda: test_db
+        try:
+            response = client.post(
+                "/api/users/feedback",
+                json={"feedback": "This is my feedback about the app. It's great!"}
+            )
+        finally:
+            app.dependency_overrides.clear()
+            app.dependency_overrides.update(overrides)
 
         assert response.status_code == 204
-        mock_send_email.assert_called_once()
+        message = test_db.query(OutboxMessage).one()
+        assert message.kind == "email"
+        assert "This is my feedback" in message.payload["text_content"]
 
     def test_submit_feedback_too_short(self):
         """Test feedback that's too short"""